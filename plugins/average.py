@@ -37,6 +37,7 @@ from collections import OrderedDict
 import logging
 import numpy
 from odemis import model, dataio
+from odemis.acq.accumulator import Accumulator
 import odemis.gui
 from odemis.gui.conf import get_acqui_conf
 from odemis.gui.plugin import Plugin, AcquisitionDialog
@@ -47,7 +48,7 @@ import time
 
 class AveragePlugin(Plugin):
     name = "Frame Average"
-    __version__ = "1.0"
+    __version__ = "1.1"
     __author__ = u"Éric Piel"
     __license__ = "Public domain"
 
@@ -179,9 +180,9 @@ class AveragePlugin(Plugin):
             raise ValueError("No EM detector available")
         logging.info("Will acquire frame average on %d detectors", len(dets))
 
-        self._das = [None] * len(dets)  # Data just received
-        sumdas = [None] * len(dets)  # to store accumulated frame (in float)
-        md = [None] * len(dets)  # to store the metadata
+        # The frames are directly added to the sum when received
+        self._accs = [Accumulator(max_count=nb) for d in dets]
+        self._dtypes = [None] * len(dets)  # dtype of the data received
         self._prepare_acq(dets)
 
         end = time.time() + self.expectedDuration.value
@@ -211,21 +212,11 @@ class AveragePlugin(Plugin):
                 dets[0].softwareTrigger.notify()
 
                 # Wait for the acquisition
-                for i, ev in enumerate(self._events):
+                for ev in self._events:
                     if not ev.wait(dur * 3 + 5):
                         raise IOError("Timeout while waiting for frame")
                     ev.clear()
 
-                    # Add the latest frame to the sum
-                    # TODO: do this while waiting for the next frame (to save time)
-                    da = self._das[i]
-                    if sumdas[i] is None:
-                        # Convert to float, to handle very large numbers
-                        sumdas[i] = da.astype(numpy.float64)
-                        md[i] = da.metadata
-                    else:
-                        sumdas[i] += da
-
                 logging.info("Acquired frame %d", i + 1)
 
                 if f.cancelled():
@@ -235,9 +226,7 @@ class AveragePlugin(Plugin):
             self._end_acq(dets)
 
         # Compute the average data
-        fdas = []
-        for sd, md, ld in zip(sumdas, md, self._das):
-            fdas.append(self._average_data(self.accumulations.value, sd, md, ld.dtype))
+        fdas = [acc.getMean(dt) for acc, dt in zip(self._accs, self._dtypes)]
 
         logging.info("Exporting data to %s", self.filename.value)
         exporter = dataio.find_fittest_converter(self.filename.value)
@@ -264,7 +253,8 @@ class AveragePlugin(Plugin):
 
             # Ad-hoc function to receive the data
             def on_data(df, data, i=i, ev=ev):
-                self._das[i] = data
+                self._dtypes[i] = data.dtype
+                self._accs[i].add(data)
                 ev.set()
 
             self._listeners.append(on_data)
@@ -274,21 +264,3 @@ class AveragePlugin(Plugin):
         dets[0].data.synchronizedOn(None)
         for d, l in zip(dets, self._listeners):
             d.data.unsubscribe(l)
-
-    def _average_data(self, nb, sumda, md, dtype):
-        """
-        nb (int): the number of acquisitions
-        sumda (DataArray): the accumulated acquisition from a detector
-        md (dict): the metadata
-        dtype (numpy.dtype): the data type to be converted to
-        return (DataArray): the averaged frame (with the correct metadata)
-        """
-        a = sumda / nb
-        a = model.DataArray(a.astype(dtype), md)
-
-        # The metadata is the on from the first DataArray, which is good for
-        # _almost_ everything
-        if model.MD_DWELL_TIME in a.metadata:
-            a.metadata[model.MD_DWELL_TIME] *= nb
-
-        return a
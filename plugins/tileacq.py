@@ -32,7 +32,9 @@ import logging
 import math
 import numpy
 from odemis import model, acq, dataio, util
-from odemis.acq import stitching
+from odemis.acq import stitching, align
+from odemis.acq.align import focusmap
+from odemis.acq.align.autofocus import MTD_PREDICTIVE
 from odemis.acq.stream import Stream, SEMStream, CameraStream, \
     RepetitionStream, StaticStream, UNDEFINED_ROI, EMStream, ARStream, SpectrumStream, \
     FluoStream, MultipleDetectorStream, MonochromatorSettingsStream
@@ -51,7 +53,7 @@ import wx
 
 class TileAcqPlugin(Plugin):
     name = "Tile acquisition"
-    __version__ = "1.3"
+    __version__ = "1.6"
     __author__ = u"Éric Piel, Philip Winkler"
     __license__ = "GPLv2"
 
@@ -77,6 +79,19 @@ class TileAcqPlugin(Plugin):
         ("stitch", {
             "tooltip": "Use all the tiles to create a large-scale image at the end of the acquisition",
         }),
+        ("focusPoints", {
+            "label": "Focus points",
+            "tooltip": "Number of positions along each axis where the autofocus is run "
+                       "before the acquisition. The focus of each tile is then "
+                       "interpolated from these positions. 0 to not change the focus.",
+            "control_type": odemis.gui.CONTROL_INT,
+        }),
+        ("refocusPeriod", {
+            "label": "Refocus every",
+            "tooltip": "Run the autofocus again every N tiles, to correct the focus "
+                       "interpolation. 0 to never refocus.",
+            "control_type": odemis.gui.CONTROL_INT,
+        }),
         ("expectedDuration", {
         }),
         ("totalArea", {
@@ -107,14 +122,17 @@ class TileAcqPlugin(Plugin):
         self.expectedDuration = model.VigilantAttribute(1, unit="s", readonly=True)
         self.totalArea = model.TupleVA((1, 1), unit="m", readonly=True)
         self.stitch = model.BooleanVA(True)
-        # TODO: manage focus (eg, autofocus or ask to manual focus on the corners
-        # of the ROI and linearly interpolate)
+        # Focus map: autofocus on a sparse grid, and interpolate for each tile
+        self.focusPoints = model.IntContinuous(0, (0, 10))
+        self.refocusPeriod = model.IntContinuous(0, (0, 1000), unit="tiles")
         # TODO: on SECOM allow to do fine alignment for each tile
 
         self.nx.subscribe(self._check_range)
         self.ny.subscribe(self._check_range)
         self.nx.subscribe(self._update_exp_dur)
         self.ny.subscribe(self._update_exp_dur)
+        self.focusPoints.subscribe(self._update_exp_dur)
+        self.refocusPeriod.subscribe(self._update_exp_dur)
         self.nx.subscribe(self._update_total_area)
         self.ny.subscribe(self._update_total_area)
         self.overlap.subscribe(self._update_total_area)
@@ -391,7 +409,105 @@ class TileAcqPlugin(Plugin):
 
             dir *= -1
 
-    def _move_to_tile(self, idx, orig_pos, tile_size, prev_idx):
+    def _get_tile_pos(self, idx, orig_pos, tile_size):
+        """
+        Compute the stage position of a tile
+        idx (int, int): X/Y index of the tile
+        orig_pos (dict str->float): position of the first tile
+        tile_size (float, float): width/height of a tile (m)
+        return (float, float): X/Y position of the stage (m)
+        """
+        overlap = 1 - self.overlap.value / 100
+        return (orig_pos["x"] + idx[0] * tile_size[0] * overlap,
+                orig_pos["y"] - idx[1] * tile_size[1] * overlap)
+
+    def _get_focus_stream(self, ss):
+        """
+        Find the stream to use for focusing
+        ss (list of Streams): the streams acquired
+        return (Stream or None): the first stream which has a focuser, or None
+          if no stream can be focused
+        """
+        for s in ss:
+            if getattr(s, "focuser", None) is not None and s.detector is not None:
+                return s
+        return None
+
+    def _get_focus_indices(self):
+        """
+        Pick the tiles where the focus map is measured, spread over the whole
+        area (ie, the corners are always part of them, if there is more than
+        one point per axis).
+        return (list of (int, int)): X/Y indices of the tiles, in an order
+          which reduces the stage moves
+        """
+        n = self.focusPoints.value
+        if n == 0:
+            return []
+        rep = self.nx.value, self.ny.value
+        axes_idx = []
+        for r in rep:
+            npts = min(n, r)
+            if npts == 1:
+                axes_idx.append([r // 2])  # center
+            else:
+                axes_idx.append(sorted(set(int(round(v)) for v in numpy.linspace(0, r - 1, npts))))
+
+        # Use the same (forward/backward) order as the tiles
+        return [(axes_idx[0][ix], axes_idx[1][iy]) for ix, iy in
+                self._generate_scanning_indices((len(axes_idx[0]), len(axes_idx[1])))]
+
+    def _measure_focus_map(self, fs, orig_pos, tile_size):
+        """
+        Run the autofocus on a sparse grid of tiles, and fit the focus surface
+        fs (Stream): the stream used to focus
+        orig_pos (dict str->float): position of the first tile
+        tile_size (float, float): width/height of a tile (m)
+        return (FocusMap): the focus map
+        """
+        indices = self._get_focus_indices()
+        positions = [self._get_tile_pos(idx, orig_pos, tile_size) for idx in indices]
+        # A plane is more robust when there are few points. With more points,
+        # the spline can follow the sample, and a little bit of smoothing
+        # avoids overfitting the autofocus inaccuracy.
+        if len(positions) >= 9:
+            fmap = focusmap.FocusMap(focusmap.FIT_SPLINE, smoothing=0.01)
+        else:
+            fmap = focusmap.FocusMap(focusmap.FIT_PLANE)
+        logging.info("Measuring focus at %d positions", len(positions))
+        self.ft.running_subf = align.MeasureFocusMap(fs.detector, fs.emitter, fs.focuser,
+                                                     self.main_app.main_data.stage,
+                                                     positions, fmap, method=MTD_PREDICTIVE)
+        return self.ft.running_subf.result()
+
+    def _refocus(self, fs, fmap, pos):
+        """
+        Run the autofocus at the current position, and add it to the focus map
+        fs (Stream): the stream used to focus
+        fmap (FocusMap): the focus map to update
+        pos (float, float): X/Y position of the stage (m)
+        """
+        try:
+            good_focus = fs.focuser.position.value["z"]
+            self.ft.running_subf = align.AutoFocus(fs.detector, fs.emitter, fs.focuser,
+                                                   good_focus=good_focus,
+                                                   method=MTD_PREDICTIVE)
+            fp, flvl = self.ft.running_subf.result()
+        except CancelledError:
+            raise
+        except Exception:
+            logging.exception("Failed to refocus at %s, will keep the focus map", pos)
+            return
+        logging.debug("Refocused at %s: %g m", pos, fp)
+        fmap.addPoint(pos, fp)
+
+    def _move_to_tile(self, idx, orig_pos, tile_size, prev_idx, fmap=None, focuser=None):
+        """
+        Move the stage to the given tile, and if a focus map is given, adjust
+        the focus to the expected best focus at this tile.
+        fmap (None or FocusMap): the focus map
+        focuser (None or Actuator): the focuser to move, if fmap is provided
+        """
         # Go left/down, with every second line backward:
         # similar to writing/scanning convention, but move of just one unit
         # every time.
@@ -401,13 +517,22 @@ class TileAcqPlugin(Plugin):
         # |
         # --->-->-->--Z
         overlap = 1 - self.overlap.value / 100
+        pos = self._get_tile_pos(idx, orig_pos, tile_size)
         # don't move on the axis that is not supposed to have changed
         m = {}
         idx_change = numpy.subtract(idx, prev_idx)
         if idx_change[0]:
-            m["x"] = orig_pos["x"] + idx[0] * tile_size[0] * overlap
+            m["x"] = pos[0]
         if idx_change[1]:
-            m["y"] = orig_pos["y"] - idx[1] * tile_size[1] * overlap
+            m["y"] = pos[1]
+
+        if fmap is not None:
+            # Move the focus in parallel of the stage
+            z = fmap.getFocus(pos)
+            logging.debug("Moving focus to %g m for tile %s", z, idx)
+            ff = focuser.moveAbs({"z": z})
+        else:
+            ff = None
 
         logging.debug("Moving to tile %s at %s m", idx, m)
         f = self.main_app.main_data.stage.moveAbs(m)
@@ -420,6 +545,8 @@ class TileAcqPlugin(Plugin):
             logging.warning("Failed to move to tile %s", idx)
             self.ft.running_subf.cancel()
             # Continue acquiring anyway... maybe it has moved somewhere near
+        if ff is not None:
+            ff.result()
 
     def _get_fov(self, sd):
         """
@@ -511,7 +638,18 @@ class TileAcqPlugin(Plugin):
         except ValueError:  # no current streams
             movet = 0.5
 
-        return acqt * remaining + movet + stitcht
+        # Focus map measurement (if not yet done) + refocusing
+        focust = 0
+        fs = self._get_focus_stream(ss)
+        if fs is not None:
+            nfocus = 0
+            if remaining == self.nx.value * self.ny.value:
+                nfocus += len(self._get_focus_indices())
+            if self.focusPoints.value and self.refocusPeriod.value:
+                nfocus += remaining // self.refocusPeriod.value
+            focust = focusmap.estimateFocusMapTime(fs.detector, fs.emitter, nfocus)
+
+        return acqt * remaining + movet + stitcht + focust
 
     def sort_das(self, das, ss):
         """
@@ -678,15 +816,39 @@ class TileAcqPlugin(Plugin):
         ft.set_running_or_notify_cancel()  # Indicate the work is starting now
         dlg.showProgress(ft)
 
-        # For stitching only
-        da_list = []  # for each position, a list of DataArrays
+        # For stitching only: registration is done during the acquisition
+        stitcher = stitching.IncrementalStitcher() if self.stitch.value else None
+        can_stitch = False  # True if at least one stream can be stitched
         i = 0
         prev_idx = [0, 0]
+        fmap = None
+        fs = self._get_focus_stream(ss) if self.focusPoints.value else None
+        # The tiles are saved in the background, during the next acquisitions
+        eq = udataio.ExportQueue()
+        efs = []  # Futures of the exports
+        if fs is not None:
+            orig_focus = fs.focuser.position.value
+        elif self.focusPoints.value:
+            logging.warning("No stream can be focused, so the focus will not be adjusted")
         try:
+            if fs is not None:
+                fmap = self._measure_focus_map(fs, orig_pos, sfov)
+                if ft._task_state == CANCELLED:
+                    logging.debug("Acquisition cancelled")
+                    return
+                # The stage is not at the first tile anymore
+                prev_idx = [-1, -1]
+
             for ix, iy in self._generate_scanning_indices(trep):
                 logging.debug("Acquiring tile %dx%d", ix, iy)
-                self._move_to_tile((ix, iy), orig_pos, sfov, prev_idx)
+                self._move_to_tile((ix, iy), orig_pos, sfov, prev_idx,
+                                   fmap, fs and fs.focuser)
                 prev_idx = ix, iy
+                if fmap and self.refocusPeriod.value and i > 0 and i % self.refocusPeriod.value == 0:
+                    self._refocus(fs, fmap, self._get_tile_pos((ix, iy), orig_pos, sfov))
+                    if ft._task_state == CANCELLED:
+                        logging.debug("Acquisition cancelled")
+                        return
                 # Update the progress bar
                 ft.set_progress(end=self.estimate_time(nb - i) + time.time())
 
@@ -700,18 +862,25 @@ class TileAcqPlugin(Plugin):
                     logging.debug("Acquisition cancelled")
                     return
 
-                # TODO: do in a separate thread
+                # Sort tiles (largest sem on first position). It also updates
+                # the metadata, so it must be done before saving the data.
+                sdas = self.sort_das(das, ss)
+
+                # Stop early if saving failed
+                for ef in efs:
+                    if ef.done() and ef.exception():
+                        raise ef.exception()
                 fn_tile = "%s-%.5dx%.5d%s" % (fn_bs, ix, iy, fn_ext)
                 logging.debug("Will save data of tile %dx%d to %s", ix, iy, fn_tile)
-                exporter.export(fn_tile, das)
+                efs.append(eq.export(exporter, fn_tile, das))
 
                 if ft._task_state == CANCELLED:
                     logging.debug("Acquisition cancelled")
                     return
 
-                if self.stitch.value:
-                    # Sort tiles (largest sem on first position)
-                    da_list.append(self.sort_das(das, ss))
+                if stitcher and sdas:
+                    can_stitch = True
+                    stitcher.addTile(sdas)
 
                 # Check the FoV is correct using the data, and if not update
                 if i == 0:
@@ -721,30 +890,24 @@ class TileAcqPlugin(Plugin):
             # Move stage to original position
             main_data.stage.moveAbs(orig_pos)
 
+            # Wait for all the tiles to be saved
+            for ef in efs:
+                ef.result()
+
             # Stitch SEM and CL streams
             st_data = []
-            if self.stitch.value and (not da_list or not da_list[0]):
+            if stitcher and not can_stitch:
                 # if only AR or Spectrum are acquired
                 logging.warning("No stream acquired that can be used for stitching.")
-            elif self.stitch.value:
+            elif stitcher:
                 logging.info("Acquisition completed, now stitching...")
                 ft.set_progress(end=self.estimate_time(0) + time.time())
 
-                logging.info("Computing big image out of %d images", len(da_list))
-                das_registered = stitching.register(da_list)
-
-                # Weave every stream
-                if isinstance(das_registered[0], tuple):
-                    for s in range(len(das_registered[0])):
-                        streams = []
-                        for da in das_registered:
-                            streams.append(da[s])
-                        da = stitching.weave(streams)
-                        da.metadata[model.MD_DIMS] = "YX"  # TODO: do it in the weaver
-                        st_data.append(da)
-                else:
-                    da = stitching.weave(das_registered)
-                    st_data.append(da)
+                # Weave every stream (the registration is already done)
+                logging.info("Computing big image out of %d images", i)
+                st_data = stitcher.getFullImages()
+                for da in st_data:
+                    da.metadata[model.MD_DIMS] = "YX"  # TODO: do it in the weaver
 
                 # Save
                 exporter = dataio.find_fittest_converter(fn)
@@ -775,6 +938,12 @@ class TileAcqPlugin(Plugin):
             ft.running_subf.cancel()
             raise
         finally:
+            if stitcher:
+                stitcher.cancel()  # In case the acquisition was stopped early
+            # The tiles already acquired are still saved, even if cancelled
+            eq.shutdown(wait=False)
             logging.info("Tiled acquisition ended")
             main_data.stage.moveAbs(orig_pos)
+            if fs is not None:
+                fs.focuser.moveAbs(orig_focus)
 
@@ -39,10 +39,11 @@ from odemis import model, dataio, acq
 from odemis.acq import stream
 from odemis.acq.stream import MonochromatorSettingsStream, ARStream, \
     SpectrumStream, UNDEFINED_ROI, StaticStream
+from odemis.dataio import hdf5
 import odemis.gui
 from odemis.gui.conf import get_acqui_conf
 from odemis.gui.plugin import Plugin, AcquisitionDialog
-from odemis.util.dataio import splitext
+from odemis.util.dataio import splitext, ExportQueue
 import os
 import time
 import wx
@@ -50,7 +51,7 @@ import wx
 
 class TimelapsePlugin(Plugin):
     name = "Timelapse"
-    __version__ = "1.2"
+    __version__ = "1.4"
     __author__ = u"Éric Piel"
     __license__ = "Public domain"
 
@@ -72,6 +73,11 @@ class TimelapsePlugin(Plugin):
         ("filename", {
             "control_type": odemis.gui.CONTROL_SAVE_FILE,
         }),
+        ("singleFile", {
+            "label": "Single file",
+            "tooltip": "Record all the acquisitions in a single HDF5 file, "
+                       "instead of one file per acquisition",
+        }),
         ("expectedDuration", {
         }),
     ))
@@ -88,6 +94,7 @@ class TimelapsePlugin(Plugin):
         self.numberOfAcquisitions = model.IntContinuous(100, (2, 1000))
         self.semOnlyOnLast = model.BooleanVA(False)
         self.filename = model.StringVA("a.h5")
+        self.singleFile = model.BooleanVA(False)
         self.expectedDuration = model.VigilantAttribute(1, unit="s", readonly=True)
 
         self.period.subscribe(self._update_exp_dur)
@@ -278,6 +285,10 @@ class TimelapsePlugin(Plugin):
         exporter = dataio.find_fittest_converter(fn)
         bs, ext = splitext(fn)
         fn_pat = bs + "-%.5d" + ext
+        if self.singleFile.value and exporter is not hdf5:
+            logging.info("Recording in a single file needs HDF5, will save as HDF5")
+            exporter = hdf5
+            ext = exporter.EXTENSIONS[0]
 
         sacqt = acq.estimateTime(ss)
         intp = max(0, p - sacqt)
@@ -294,28 +305,67 @@ class TimelapsePlugin(Plugin):
         f.set_running_or_notify_cancel()  # Indicate the work is starting now
         dlg.showProgress(f)
 
-        for i in range(nb):
-            left = nb - i
-            dur = sacqt * left + intp * (left - 1)
-            if left == 1 and last_ss:
-                ss += last_ss
-                dur += acq.estimateTime(ss) - sacqt
-
-            startt = time.time()
-            f.set_progress(end=startt + dur)
-            das, e = acq.acquire(ss).result()
-            if f.cancelled():
-                return
-
-            exporter.export(fn_pat % (i,), das)
-
-            # Wait the period requested, excepted the last time
-            if left > 1:
-                sleept = (startt + p) - time.time()
-                if sleept > 0:
-                    time.sleep(sleept)
+        # The data is saved in the background, so that it doesn't delay the
+        # next acquisition.
+        eq = ExportQueue()
+        efs = []  # Futures of the exports
+        if self.singleFile.value:
+            # Each acquisition is appended to the same file
+            tlw = hdf5.TimelapseWriter(bs + ext)
+        else:
+            tlw = None
+        try:
+            for i in range(nb):
+                left = nb - i
+                dur = sacqt * left + intp * (left - 1)
+                if left == 1 and last_ss:
+                    dur += acq.estimateTime(ss + last_ss) - sacqt
+                    if tlw is None:
+                        ss += last_ss
+
+                startt = time.time()
+                f.set_progress(end=startt + dur)
+                das, e = acq.acquire(ss).result()
+                if f.cancelled():
+                    return
+
+                # Stop early if saving failed
+                for ef in efs:
+                    if ef.done() and ef.exception():
+                        raise ef.exception()
+                if tlw is None:
+                    efs.append(eq.export(exporter, fn_pat % (i,), das))
                 else:
-                    logging.info("Immediately starting next acquisition, %g s late", -sleept)
+                    tlw.append(das)
+                    if left == 1 and last_ss:
+                        # The streams acquired only once are saved separately,
+                        # as they don't fit in the time-lapse
+                        das, e = acq.acquire(last_ss).result()
+                        if f.cancelled():
+                            return
+                        efs.append(eq.export(exporter, bs + "-last" + ext, das))
+
+                # Wait the period requested, excepted the last time
+                if left > 1:
+                    sleept = (startt + p) - time.time()
+                    if sleept > 0:
+                        time.sleep(sleept)
+                    else:
+                        logging.info("Immediately starting next acquisition, %g s late", -sleept)
+
+            # Wait for all the data to be saved
+            for ef in efs:
+                ef.result()
+            if tlw is not None:
+                tlw.close()
+        finally:
+            # The data already acquired is still saved, even if cancelled
+            eq.shutdown(wait=False)
+            if tlw is not None:
+                try:
+                    tlw.close()
+                except IOError:
+                    pass  # Already logged by the writer
 
         f.set_result(None)  # Indicate it's over
 
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: Delmic
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+
+# This script compares the time to write a file and its size, for each
+# compression profile and each file format supporting compression.
+# By default, it uses synthetic SEM, CCD and spectrum data. It's also possible
+# to pass acquisition files, whose data is then used.
+# Example usage:
+# python export_compression.py
+# python export_compression.py --input acq1.h5 acq2.ome.tiff
+
+from __future__ import division
+
+import argparse
+import logging
+import numpy
+from odemis import dataio, model
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+
+def generate_sem(shape=(2048, 2048)):
+    """
+    Smooth structures + shot noise, typical of a SEM image
+    """
+    y, x = numpy.mgrid[0:shape[0], 0:shape[1]]
+    base = 2000 + 1000 * numpy.sin(x / 37) * numpy.cos(y / 53)
+    im = numpy.random.poisson(base).astype(numpy.uint16)
+    md = {model.MD_PIXEL_SIZE: (10e-9, 10e-9), model.MD_BPP: 12,
+          model.MD_DESCRIPTION: "Secondary electrons"}
+    return model.DataArray(im, md)
+
+
+def generate_ccd(shape=(1024, 1344)):
+    """
+    Low counts over a dark noise, typical of a (fluorescence) CCD image
+    """
+    im = numpy.random.normal(100, 5, shape)
+    im[300:500, 400:900] += numpy.random.poisson(50, (200, 500))
+    im = im.clip(0, 2 ** 16 - 1).astype(numpy.uint16)
+    md = {model.MD_PIXEL_SIZE: (1e-6, 1e-6), model.MD_BPP: 16,
+          model.MD_DESCRIPTION: "Optical"}
+    return model.DataArray(im, md)
+
+
+def generate_spectrum(shape=(1024, 1, 1, 64, 64)):
+    """
+    A spectrum cube (CTZYX) with a peak, as float
+    """
+    wl = numpy.linspace(400e-9, 800e-9, shape[0])
+    spec = 500 + 2000 * numpy.exp(-((wl - 550e-9) / 30e-9) ** 2)
+    im = numpy.random.poisson(spec[:, None, None, None, None] * numpy.ones(shape))
+    md = {model.MD_PIXEL_SIZE: (50e-9, 50e-9),
+          model.MD_WL_LIST: list(wl),
+          model.MD_DESCRIPTION: "Spectrum"}
+    return model.DataArray(im.astype(numpy.float32), md)
+
+
+def bench_export(exporter, fn, data, profile):
+    """
+    return (float, int): time to write (s), size of the file (bytes)
+    """
+    startt = time.time()
+    exporter.export(fn, data, compressed=profile)
+    dur = time.time() - startt
+    return dur, os.stat(fn).st_size
+
+
+def main(args):
+    """
+    Handles the command line arguments
+    args is the list of arguments passed
+    return (int): value to return to the OS as program exit code
+    """
+    parser = argparse.ArgumentParser(description="Benchmark of the compression profiles")
+    parser.add_argument("--input", "-i", dest="input", nargs="+",
+                        help="acquisition files to use instead of synthetic data")
+    parser.add_argument("--repeat", "-r", dest="repeat", type=int, default=3,
+                        help="number of times each export is run (the fastest is reported)")
+    options = parser.parse_args(args[1:])
+
+    if options.input:
+        datasets = []
+        for fn in options.input:
+            conv = dataio.find_fittest_converter(fn, mode=os.O_RDONLY)
+            datasets.append((os.path.basename(fn), conv.read_data(fn)))
+    else:
+        datasets = [("SEM", [generate_sem()]),
+                    ("CCD", [generate_ccd()]),
+                    ("Spectrum", [generate_spectrum()]),
+                    ]
+
+    exporters = [dataio.tiff, dataio.hdf5]
+    tmpdir = tempfile.mkdtemp()
+    try:
+        print "%-12s %-6s %-9s %10s %12s %8s" % ("data", "format", "profile",
+                                                "time (s)", "size (B)", "ratio")
+        for name, data in datasets:
+            for exporter in exporters:
+                fn = os.path.join(tmpdir, "bench" + exporter.EXTENSIONS[0])
+                raw_size = None
+                for profile in dataio.COMPRESSION_PROFILES:
+                    dur, size = min(bench_export(exporter, fn, data, profile)
+                                    for i in range(options.repeat))
+                    if raw_size is None:  # COMPRESSION_NONE is the first one
+                        raw_size = size
+                    print "%-12s %-6s %-9s %10.3f %12d %8.2f" % (
+                              name, exporter.FORMAT, profile, dur, size, raw_size / size)
+    except Exception:
+        logging.exception("Failed to run the benchmark")
+        return 128
+    finally:
+        shutil.rmtree(tmpdir)
+
+    return 0
+
+if __name__ == '__main__':
+    ret = main(sys.argv)
+    exit(ret)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: Delmic
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+
+# This script measures the overhead per pixel of the spectrum and AR mapping
+# acquisitions (SEM + CCD software synchronised), compared to the time the
+# CCD needs for each image (exposure time + readout).
+# It needs a running backend, typically a simulator, such as:
+# odemis-start install/linux/usr/share/odemis/sim/sparc2-sim.odm.yaml
+# Example usage:
+# python rep_acq_overhead.py --type spectrum --exp 0.01 --repetition 20 20
+
+from __future__ import division
+
+import argparse
+import logging
+import numpy
+from odemis import model
+from odemis.acq import stream
+import sys
+import time
+
+
+def measure_overhead(ccds, mds, exp, rep, repeat):
+    """
+    Run the acquisition and compute the overhead per pixel
+    return (float, float): acquisition duration (s), overhead per pixel (s)
+    """
+    ccd = ccds.detector
+    ccd.exposureTime.value = exp
+    ccds.repetition.value = rep
+    rep = ccds.repetition.value  # The actual one
+    npx = numpy.prod(rep)
+
+    try:
+        ro_rate = ccd.readoutRate.value
+    except AttributeError:
+        ro_rate = 100e6  # Hz
+    readout = numpy.prod(ccd.resolution.value) / ro_rate
+    min_dur = npx * (ccd.exposureTime.value + readout)
+
+    best_dur = float("inf")
+    for i in range(repeat):
+        startt = time.time()
+        f = mds.acquire()
+        f.result()
+        best_dur = min(best_dur, time.time() - startt)
+
+    return best_dur, (best_dur - min_dur) / npx
+
+
+def main(args):
+    """
+    Handles the command line arguments
+    args is the list of arguments passed
+    return (int): value to return to the OS as program exit code
+    """
+    parser = argparse.ArgumentParser(description="Measure the overhead per pixel of "
+                                     "the spectrum/AR acquisitions")
+    parser.add_argument("--type", "-t", dest="type", choices=("spectrum", "ar"),
+                        default="spectrum", help="type of acquisition")
+    parser.add_argument("--exp", "-e", dest="exp", type=float, default=0.01,
+                        help="exposure time of the CCD (s)")
+    parser.add_argument("--repetition", "-r", dest="repetition", type=int, nargs=2,
+                        default=(20, 20), help="number of pixels in X and Y")
+    parser.add_argument("--repeat", dest="repeat", type=int, default=3,
+                        help="number of times the acquisition is run (the fastest is reported)")
+    options = parser.parse_args(args[1:])
+
+    try:
+        ebeam = model.getComponent(role="e-beam")
+        sed = model.getComponent(role="se-detector")
+        if options.type == "spectrum":
+            ccd = model.getComponent(role="spectrometer")
+            ccds = stream.SpectrumSettingsStream("spec", ccd, ccd.data, ebeam)
+            mdscls = stream.SEMSpectrumMDStream
+        else:
+            ccd = model.getComponent(role="ccd")
+            ccds = stream.ARSettingsStream("ar", ccd, ccd.data, ebeam)
+            mdscls = stream.SEMARMDStream
+        sems = stream.SEMStream("sem", sed, sed.data, ebeam)
+        mds = mdscls("sem-%s" % (options.type,), [sems, ccds])
+
+        dur, overhead = measure_overhead(ccds, mds, options.exp,
+                                         tuple(options.repetition), options.repeat)
+        rep = ccds.repetition.value
+        print "%s acquisition of %dx%d pixels at %g s: %g s" % (
+                  options.type, rep[0], rep[1], options.exp, dur)
+        print "Overhead per pixel: %g ms" % (overhead * 1e3,)
+    except Exception:
+        logging.exception("Failed to measure the acquisition overhead")
+        return 128
+
+    return 0
+
+if __name__ == '__main__':
+    ret = main(sys.argv)
+    exit(ret)
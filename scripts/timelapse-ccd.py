@@ -30,6 +30,7 @@ odemis-cli --set-attr Clara binning "2, 2"
 
 from __future__ import division
 from odemis import dataio, model
+from odemis.dataio import hdf5
 import argparse
 import logging
 import odemis
@@ -46,13 +47,24 @@ def acquire_timelapse(num, filename):
         if c.role == "ccd":
             ccd = c
 
+    exporter = dataio.find_fittest_converter(filename)
+    if exporter is hdf5:
+        # Directly append each image to the file, while the next one is acquired
+        tlw = hdf5.TimelapseWriter(filename)
+        try:
+            for i in range(num):
+                logging.info("Acquiring image %d", i + 1)
+                tlw.append(ccd.data.get())
+        finally:
+            tlw.close()
+        return
+
     images = []
     for i in range(num):
         logging.info("Acquiring image %d", i + 1)
         images.append(ccd.data.get())
     
     # save the file
-    exporter = dataio.find_fittest_converter(filename)
     exporter.export(filename, images)
 
 def main(args):
@@ -13,7 +13,8 @@ run as:
 -n defines the number of images to acquire
 --period defines the time between each acquisition
 --output indicates the name of the file which will contain all the output. It 
-         should finish by .h5 (for HDF5) or .tiff (for TIFF).
+         should finish by .h5 (for HDF5) or .tiff (for TIFF). With HDF5, each
+         image is written to the file as soon as it is acquired.
 
 You first need to run the odemis backend with the SECOM config. For instance,
 start Odemis, and close the graphical interface. Alternatively you can start
@@ -33,6 +34,7 @@ from __future__ import division
 import argparse
 import logging
 from odemis import dataio, model
+from odemis.dataio import hdf5
 import odemis
 import sys
 import time
@@ -47,12 +49,22 @@ def acquire_timelapse(num, period, filename):
 #    ebeam = model.getComponent(role="ebeam")
     sed = model.getComponent(role="se-detector")
 
-    images = []
+    exporter = dataio.find_fittest_converter(filename)
+    if exporter is hdf5:
+        # Directly append each image to the file
+        tlw = hdf5.TimelapseWriter(filename)
+        images = None
+    else:
+        tlw = None
+        images = []
     try:
         for i in range(num):
             logging.info("Acquiring image %d/%d", i + 1, num)
             start = time.time()
-            images.append(sed.data.get())
+            if tlw is None:
+                images.append(sed.data.get())
+            else:
+                tlw.append(sed.data.get())
             left = period - (time.time() - start)
             if left < 0:
                 logging.warning("Acquisition took longer than the period (%g s overdue)", -left)
@@ -65,8 +77,10 @@ def acquire_timelapse(num, period, filename):
         logging.exception("Failed to acquire all the images, will try to save anyway")
     
     # save the file
-    exporter = dataio.find_fittest_converter(filename)
-    exporter.export(filename, images)
+    if tlw is None:
+        exporter.export(filename, images)
+    else:
+        tlw.close()
 
 def main(args):
     """
@@ -83,6 +83,7 @@ if sys.platform.startswith('linux'):
     scripts = ['install/linux/usr/bin/odemisd',
                'install/linux/usr/bin/odemis-cli',
                'install/linux/usr/bin/odemis-convert',
+               'install/linux/usr/bin/odemis-bench',
                'install/linux/usr/bin/odemis-gui',
                'install/linux/usr/bin/odemis-start',
                'install/linux/usr/bin/odemis-stop',
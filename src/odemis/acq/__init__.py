@@ -33,9 +33,11 @@ from concurrent.futures import CancelledError
 import logging
 import math
 from odemis import model
+import Queue
 from odemis.acq import _futures
 from odemis.acq.stream import FluoStream, SEMCCDMDStream, SEMMDStream, \
-    OverlayStream, OpticalStream, EMStream, ScannedFluoStream, ScannedFluoMDStream
+    OverlayStream, OpticalStream, EMStream, ScannedFluoStream, ScannedFluoMDStream, \
+    Stream
 from odemis.util import img, fluo, executeAsyncTask
 import sys
 import threading
@@ -51,7 +53,8 @@ from odemis.acq.stream._helper import ScannedTCSettingsStream
 # background. You are in charge of ensuring that no other acquisition is
 # going on at the same time.
 # The manager receives a list of streams to acquire, order them in the best way,
-# and then creates a separate thread to run the acquisition of each stream. It
+# and then creates a separate thread to run the acquisition of each stream. The
+# streams which use independent hardware are acquired simultaneously. It
 # returns a special "ProgressiveFuture" which is a Future object that can be
 # stopped while already running, and reports from time to time progress on its
 # execution.
@@ -92,13 +95,150 @@ def estimateTime(streams):
     streams (list of Stream): the streams to acquire
     return (0 <= float): estimated time in s.
     """
-    tot_time = 0
     # We don't use foldStreams() as it creates new streams at every call, and
-    # anyway sum of each stream should give already a good estimation.
+    # anyway each stream should give already a good estimation.
+    streams = sorted(streams, key=_weight_stream, reverse=True)
+    deps = _get_dependencies(streams)
+    ends = {}  # stream -> time since the beginning when it ends
     for s in streams:
-        tot_time += s.estimateAcquisitionTime()
+        start = max([0] + [ends[d] for d in deps[s]])
+        ends[s] = start + s.estimateAcquisitionTime()
 
-    return tot_time
+    return max([0] + ends.values())
+
+
+def _get_affects(comp):
+    """
+    comp (Component): a hardware component
+    return (set of str): the name of the components affected
+    """
+    try:
+        return set(comp.affects.value)
+    except AttributeError:
+        return set()
+
+
+def _get_opm_path(stream):
+    """
+    Find the optical path that the optical path manager would set for a stream
+    stream (Stream): the stream
+    return (None or (str, dict str -> dict)): the optical path mode and, for
+      each selector to move to reach the target detector, its name -> position.
+      None if the stream doesn't need to change the optical path.
+    raise LookupError: if the target detector cannot be found
+    """
+    opm = getattr(stream, "_opm", None)
+    if opm is None:
+        return None
+    try:
+        mode = opm.guessMode(stream)
+    except LookupError:  # The optical path is not changed for this stream
+        return None
+    target = opm.getStreamDetector(stream)
+    selectors = {}
+    for comp, mv in opm.getSelectorMoves(target.name):
+        selectors.setdefault(comp.name, {}).update(mv)
+    return mode, selectors
+
+
+def _opm_paths_conflict(path1, path2):
+    """
+    Check whether two optical paths can be used simultaneously
+    path1, path2 (None or (str, dict)): optical paths as returned by _get_opm_path()
+    return (bool): True if they need a different optical path
+    """
+    if path1 is None or path2 is None:
+        return False
+    mode1, sel1 = path1
+    mode2, sel2 = path2
+    if mode1 != mode2:
+        return True
+    # Same mode, but the target detector might need the selectors in a different position
+    for cn in set(sel1) & set(sel2):
+        for an in set(sel1[cn]) & set(sel2[cn]):
+            if sel1[cn][an] != sel2[cn][an]:
+                return True
+    return False
+
+
+def _get_stream_hardware(stream, _visited=None):
+    """
+    Find all the hardware components used by a stream (or its sub-streams)
+    stream (Stream): the stream
+    return (dict str -> Component): name -> component
+    """
+    if _visited is None:
+        _visited = set()
+    _visited.add(id(stream))
+
+    hw = {}
+    for v in vars(stream).values():
+        if not isinstance(v, (list, tuple)):
+            v = (v,)
+        for c in v:
+            if isinstance(c, model.ComponentBase):
+                hw[c.name] = c
+            elif isinstance(c, Stream) and id(c) not in _visited:
+                hw.update(_get_stream_hardware(c, _visited))
+    return hw
+
+
+def _streams_conflict(s1, s2):
+    """
+    Check whether two streams can be acquired simultaneously
+    s1, s2 (Stream): the streams
+    return (bool): True if they cannot be acquired simultaneously (or it's
+      unknown)
+    """
+    # Leeches use extra hardware (eg, the e-beam for drift correction), which
+    # is not known => just be safe.
+    if getattr(s1, "leeches", None) or getattr(s2, "leeches", None):
+        return True
+
+    hw1 = _get_stream_hardware(s1)
+    hw2 = _get_stream_hardware(s2)
+    if not hw1 or not hw2:  # Unknown hardware => cannot tell
+        return True
+
+    # Same hardware used
+    if set(hw1) & set(hw2):
+        return True
+
+    # Hardware which affects the other one (eg, the e-beam affects the CCD
+    # because of the cathodoluminescence, or a light affects a camera)
+    for hwa, hwb in ((hw1, hw2), (hw2, hw1)):
+        for c in hwa.values():
+            if _get_affects(c) & set(hwb):
+                return True
+
+    # The optical path manager might move components to set the optical path
+    # of each stream. EM streams don't depend on the optical path. If both
+    # streams need the same optical path, they can share it.
+    if not isinstance(s1, EMStream) and not isinstance(s2, EMStream):
+        try:
+            path1 = _get_opm_path(s1)
+            path2 = _get_opm_path(s2)
+        except Exception:  # Cannot tell => be safe
+            logging.debug("Failed to find the optical path of %s or %s", s1, s2, exc_info=True)
+            return True
+        if _opm_paths_conflict(path1, path2):
+            return True
+
+    return False
+
+
+def _get_dependencies(streams):
+    """
+    Compute which streams must be acquired before each stream
+    streams (list of Streams): the streams, in the order of acquisition
+    return (dict Stream -> list of Streams): for each stream, the previous
+      streams which use conflicting hardware, and so must be finished before
+      the acquisition of the stream starts.
+    """
+    deps = {}
+    for i, s in enumerate(streams):
+        deps[s] = [ps for ps in streams[:i] if _streams_conflict(ps, s)]
+    return deps
 
 
 def foldStreams(streams, reuse=None):
@@ -254,11 +394,33 @@ class AcquisitionTask(object):
         for s in streams:
             self._streamTimes[s] = s.estimateAcquisitionTime()
 
-        self._streams_left = set(self._streams) # just for progress update
-        self._current_stream = None
-        self._current_future = None
+        # Streams which use independent hardware are acquired simultaneously
+        self._deps = _get_dependencies(self._streams)
+
+        self._streams_left = set(self._streams) # not started yet
+        self._current_futures = {}  # Future -> Stream, for the running streams
+        self._current_ends = {}  # Stream -> float: expected end of the running streams
+        self._task_lock = threading.Lock()  # to update the current futures
+        self._done_futures = Queue.Queue()  # Futures of the streams which are finished
+        self._running = False
         self._cancelled = False
 
+    def _estimate_end(self):
+        """
+        Estimate when the whole task will be done
+        Must be called with _task_lock taken
+        return (float): time of the end
+        """
+        now = time.time()
+        ends = {}
+        for s in self._streams:
+            if s in self._current_ends:
+                ends[s] = max(now, self._current_ends[s])
+            elif s in self._streams_left:
+                start = max([now] + [ends[d] for d in self._deps[s] if d in ends])
+                ends[s] = start + self._streamTimes[s]
+        return max([now] + ends.values())
+
     def run(self):
         """
         Runs the acquisition
@@ -269,15 +431,15 @@ class AcquisitionTask(object):
             Exception: if it failed before any result were acquired
         """
         exp = None
-        assert(self._current_stream is None) # Task should be used only once
-        expected_time = sum(self._streamTimes.values())
+        assert(not self._running)  # Task should be used only once
+        self._running = True
         # no need to set the start time of the future: it's automatically done
         # when setting its state to running.
-        self._future.set_progress(end=time.time() + expected_time)
+        with self._task_lock:
+            end = self._estimate_end()
+        self._future.set_progress(end=end)
 
-        # Keep order so that the DataArrays are returned in the order they were
-        # acquired. Not absolutely needed, but nice for the user in some cases.
-        raw_images = OrderedDict()  # stream -> list of raw images
+        raw_images = {}  # stream -> list of raw images
         try:
             # Tell the leeches that the acquisition is starting
             for s in self._streams:
@@ -292,38 +454,44 @@ class AcquisitionTask(object):
                     # No leeches
                     pass
 
-            for s in self._streams:
-                # Get the future of the acquisition, depending on the Stream type
-                if hasattr(s, "acquire"):
-                    f = s.acquire()
-                else: # fall-back to old style stream
-                    f = _futures.wrapSimpleStreamIntoFuture(s)
-                self._current_future = f
-                self._current_stream = s
-                self._streams_left.discard(s)
-
-                # in case acquisition was cancelled, before the future was set
-                if self._cancelled:
-                    f.cancel()
-                    raise CancelledError()
-
-                # If it's a ProgressiveFuture, listen to the time update
+            # Start every stream whose conflicting streams are all finished,
+            # and wait for one of the running streams to finish, until all the
+            # streams are acquired. In case of error, the streams running are
+            # still completed, but no new stream is started.
+            error = None
+            while True:
+                if error is None:
+                    for s in self._streams:
+                        if s in self._streams_left and all(d in raw_images for d in self._deps[s]):
+                            self._start_stream(s)
+
+                with self._task_lock:
+                    if not self._current_futures:
+                        break
+
+                f = self._done_futures.get()
+                with self._task_lock:
+                    s = self._current_futures.pop(f)
+                    self._current_ends.pop(s, None)
                 try:
-                    f.add_update_callback(self._on_progress_update)
-                except AttributeError:
-                    pass # not a ProgressiveFuture, fine
-
-                # Wait for the acquisition to be finished.
-                # Will pass down exceptions, included in case it's cancelled
-                das = f.result()
+                    # Will pass down exceptions, included in case it's cancelled
+                    das = f.result()
+                except Exception as ex:
+                    if error is None or isinstance(error, CancelledError):
+                        error = ex
+                    continue
                 if not isinstance(das, collections.Iterable):
                     logging.warning("Future of %s didn't return a list of DataArrays, but %s", s, das)
                     das = []
                 raw_images[s] = das
 
                 # update the time left
-                expected_time -= self._streamTimes[s]
-                self._future.set_progress(end=time.time() + expected_time)
+                with self._task_lock:
+                    end = self._estimate_end()
+                self._future.set_progress(end=end)
+
+            if error is not None:
+                raise error
 
             # Tell the leeches it's over. Note: we don't do it in case of
             # (partial) error.
@@ -350,12 +518,19 @@ class AcquisitionTask(object):
                             exc_info=True)
             exp = ex
         finally:
+            # Keep order so that the DataArrays are returned in the order they were
+            # acquired. Not absolutely needed, but nice for the user in some cases.
+            raw_images = OrderedDict((s, raw_images[s]) for s in self._streams
+                                     if s in raw_images)
+
             # Don't hold references to the streams once it's over
-            self._streams = []
-            self._streams_left.clear()
-            self._streamTimes = {}
-            self._current_stream = None
-            self._current_future = None
+            with self._task_lock:
+                self._streams = []
+                self._streams_left.clear()
+                self._streamTimes = {}
+                self._deps = {}
+                self._current_futures = {}
+                self._current_ends = {}
 
         # Update metadata using OverlayStream (if there was one)
         self._adjust_metadata(raw_images)
@@ -400,9 +575,40 @@ class AcquisitionTask(object):
                 if model.MD_DESCRIPTION not in d.metadata:
                     d.metadata[model.MD_DESCRIPTION] = s.name.value
 
+    def _start_stream(self, s):
+        """
+        Start the acquisition of the given stream
+        s (Stream): stream to acquire
+        raise CancelledError: if the task was cancelled
+        """
+        # Get the future of the acquisition, depending on the Stream type
+        if hasattr(s, "acquire"):
+            f = s.acquire()
+        else: # fall-back to old style stream
+            f = _futures.wrapSimpleStreamIntoFuture(s)
+        logging.debug("Started acquisition of stream %s", s.name.value)
+
+        with self._task_lock:
+            self._current_futures[f] = s
+            self._current_ends[s] = time.time() + self._streamTimes[s]
+            self._streams_left.discard(s)
+            cancelled = self._cancelled
+
+        # in case acquisition was cancelled, before the future was set
+        if cancelled:
+            f.cancel()
+            raise CancelledError()
+
+        # If it's a ProgressiveFuture, listen to the time update
+        try:
+            f.add_update_callback(self._on_progress_update)
+        except AttributeError:
+            pass # not a ProgressiveFuture, fine
+        f.add_done_callback(self._done_futures.put)
+
     def _on_progress_update(self, f, start, end):
         """
-        Called when the current future has made a progress (and so it should
+        Called when a current future has made a progress (and so it should
         provide a better time estimation).
         """
         # If the acquisition is cancelled or failed, we might receive updates
@@ -410,30 +616,36 @@ class AcquisitionTask(object):
         if self._future.done():
             return
 
-        # There is a tiny chance that self._current_future is already set to
-        # None, but the future isn't officially ended yet. Also fine.
-        if self._current_future != f and self._current_future is not None:
-            logging.warning("Progress update not from the current future: %s instead of %s",
-                            f, self._current_future)
-            return
-
-        total_end = end + sum(self._streamTimes[s] for s in self._streams_left)
+        with self._task_lock:
+            # There is a tiny chance that the future is already removed, but
+            # the future isn't officially ended yet. Also fine.
+            try:
+                s = self._current_futures[f]
+            except KeyError:
+                logging.debug("Progress update not from a current future: %s", f)
+                return
+            self._current_ends[s] = end
+            total_end = self._estimate_end()
         self._future.set_progress(end=total_end)
 
     def cancel(self, future):
         """
         cancel the acquisition
         """
-        # put the cancel flag
-        self._cancelled = True
-
-        if self._current_future is not None:
-            cancelled = self._current_future.cancel()
-        else:
-            cancelled = False
+        with self._task_lock:
+            # put the cancel flag
+            self._cancelled = True
+            running = self._current_futures.keys()
+            streams_left = bool(self._streams_left)
+
+        # Cancel without holding the lock, as the acquisition threads might
+        # need it to report their progress before stopping.
+        cancelled = False
+        for f in running:
+            cancelled |= f.cancel()
 
         # Report it's too late for cancellation (and so result will come)
-        if not cancelled and not self._streams_left:
+        if not cancelled and not streams_left:
             return False
 
         return True
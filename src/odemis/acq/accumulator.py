@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+Created on 18 Oct 2026
+
+@author: Delmic
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the
+terms  of the GNU General Public License version 2 as published by the Free
+Software  Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY;  without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR  PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+"""
+
+# Accumulation of many frames of the same detector, to compute their average
+# (and variance) without keeping all the frames in memory.
+
+from __future__ import division
+
+import logging
+import math
+import numpy
+from odemis import model
+import threading
+
+
+# Minimum number of frames accumulated before the outliers are detected, as
+# the standard deviation is meaningless with fewer frames.
+OUTLIERS_MIN_COUNT = 3
+
+
+def get_best_dtype_for_acc(idtype, count=None):
+    """
+    Computes the smallest dtype that allows to accumulate all the _count_ values
+    without overflow.
+    idtype (dtype): dtype of the input (the raw data that is accumulated)
+    count (None or 0<int): number of values accumulated. If None, the biggest
+      integer type is used.
+    returns (dtype): the best fitting dtype. For floating point input, it's
+      always float64.
+    """
+    idtype = numpy.dtype(idtype)
+    if idtype.kind == "b":
+        idtype = numpy.dtype(numpy.uint8)
+    elif idtype.kind not in "iu":
+        return numpy.dtype(numpy.float64)
+
+    if idtype.kind == "u":
+        candidates = (numpy.uint16, numpy.uint32, numpy.uint64)
+    else:
+        candidates = (numpy.int16, numpy.int32, numpy.int64)
+    candidates = [numpy.dtype(c) for c in candidates if numpy.dtype(c).itemsize >= idtype.itemsize]
+    if count is None:
+        return candidates[-1]
+
+    # Python integers, to not overflow
+    iinfo = numpy.iinfo(idtype)
+    minval, maxval = int(iinfo.min) * count, int(iinfo.max) * count
+    for adtype in candidates:
+        ainfo = numpy.iinfo(adtype)
+        if ainfo.min <= minval and maxval <= ainfo.max:
+            return adtype
+
+    logging.debug("Going to use lossy intermediate type in order to support values up to %d", maxval)
+    return numpy.dtype(numpy.float64)  # might accumulate errors
+
+
+def _get_outlier_threshold(k, n):
+    """
+    Computes the threshold to detect an outlier, based on the standard deviation
+    estimated from a few values. With few values, the standard deviation is
+    often under-estimated, so the threshold has to be higher, following a
+    Student's t-distribution. It's approximated by a Cornish-Fisher expansion.
+    k (0<float): threshold if the standard deviation was exactly known
+    n (2<=int): number of values used to estimate the mean and standard deviation
+    return (float): the number of (estimated) standard deviations from the
+      (estimated) mean beyond which a new value is an outlier
+    """
+    nu = n - 1  # degrees of freedom
+    t = k + (k ** 3 + k) / (4 * nu) + (5 * k ** 5 + 16 * k ** 3 + 3 * k) / (96 * nu ** 2)
+    # The mean is only estimated too
+    return t * math.sqrt(1 + 1 / n)
+
+
+class Accumulator(object):
+    """
+    Running sum of frames (eg, the images from a DataFlow), which provides
+    their mean (and variance) at any time.
+    Each frame is added in place into the sum, which has a dtype just large
+    enough to not overflow. So the memory usage is independent of the number of
+    frames, and the frames don't need to be kept. It's thread-safe, so that it
+    can be updated directly from the DataFlow callback, as in:
+    df.subscribe(lambda df, data: acc.add(data))
+    """
+
+    def __init__(self, max_count=None, variance=False, outliers=None):
+        """
+        max_count (None or 0<int): maximum number of frames that will be
+          accumulated. It's used to pick the smallest dtype for the sum. If
+          None, 64-bit integers are used.
+        variance (bool): if True, also accumulates the squares, to compute
+          the variance.
+        outliers (None or 0<float): if not None, when a pixel of a frame differs
+          from the current mean by more than this number of standard deviations,
+          the current mean is used instead (eg, to remove cosmic rays). It's only
+          applied after OUTLIERS_MIN_COUNT frames. It requires to compute the
+          variance.
+        """
+        if max_count is not None and max_count < 1:
+            raise ValueError("max_count must be strictly positive, got %s" % (max_count,))
+        if outliers is not None:
+            if outliers <= 0:
+                raise ValueError("outliers must be strictly positive, got %s" % (outliers,))
+            variance = True
+        self._max_count = max_count
+        self._variance = variance
+        self._outliers = outliers
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Discard all the frames accumulated
+        """
+        with self._lock:
+            self._count = 0
+            self._rejected = 0
+            self._sum = None
+            self._sumsq = None
+            self._sqbuf = None  # To compute the square of each frame, without allocation
+            self._shape = None
+            self._idtype = None
+            self._md = None
+
+    @property
+    def count(self):
+        """
+        (int): number of frames accumulated
+        """
+        return self._count
+
+    @property
+    def rejected(self):
+        """
+        (int): number of pixels replaced because they were outliers
+        """
+        return self._rejected
+
+    def add(self, data):
+        """
+        Add a frame to the accumulation
+        data (DataArray): the frame. All the frames must have the same shape
+          and dtype. The metadata of the first frame is kept.
+        raise ValueError: if the frame doesn't fit the previous ones, or already
+          max_count frames have been accumulated.
+        """
+        with self._lock:
+            if self._sum is None:
+                self._allocate(data)
+            elif data.shape != self._shape or data.dtype != self._idtype:
+                raise ValueError("Frame of shape %s and type %s, while expected %s and %s" %
+                                 (data.shape, data.dtype, self._shape, self._idtype))
+            if self._max_count is not None and self._count >= self._max_count:
+                raise ValueError("Already %d frames accumulated" % (self._count,))
+
+            if self._outliers is not None and self._count >= OUTLIERS_MIN_COUNT:
+                data = self._reject_outliers(data)
+
+            numpy.add(self._sum, data, out=self._sum, casting="unsafe")
+            if self._variance:
+                # Force the computation in the (bigger) dtype of the sum of squares
+                numpy.multiply(data, data, out=self._sqbuf, dtype=self._sqbuf.dtype,
+                               casting="unsafe")
+                numpy.add(self._sumsq, self._sqbuf, out=self._sumsq)
+            self._count += 1
+
+    def _allocate(self, data):
+        """
+        Create the buffers to accumulate the frames like data
+        """
+        self._shape = data.shape
+        self._idtype = data.dtype
+        self._md = getattr(data, "metadata", {}).copy()
+        adtype = get_best_dtype_for_acc(data.dtype, self._max_count)
+        self._sum = numpy.zeros(data.shape, dtype=adtype)
+        if self._variance:
+            if adtype.kind in "iu":
+                # Exact, as long as the sum of the squares fits in 64 bits. If
+                # the number of frames is unknown, expect up to a million.
+                sqdtype = numpy.dtype(numpy.uint64 if adtype.kind == "u" else numpy.int64)
+                iinfo = numpy.iinfo(numpy.uint8 if self._idtype.kind == "b" else self._idtype)
+                maxsq = max(int(iinfo.min) ** 2, int(iinfo.max) ** 2)
+                if maxsq * (self._max_count or 2 ** 20) > numpy.iinfo(sqdtype).max:
+                    sqdtype = numpy.float64
+            else:
+                sqdtype = numpy.float64
+            self._sumsq = numpy.zeros(data.shape, dtype=sqdtype)
+            self._sqbuf = numpy.empty(data.shape, dtype=sqdtype)
+
+    def _get_mean_var(self):
+        """
+        Must be called with the lock taken, and at least one frame accumulated
+        return (ndarray of float64, None or ndarray of float64): mean and
+          variance (if it's computed)
+        """
+        n = self._count
+        mean = self._sum / n  # float64
+        if not self._variance:
+            return mean, None
+
+        # var = (Σx² - (Σx)²/n) / (n - 1)
+        var = numpy.square(self._sum, dtype=numpy.float64)
+        var /= -n
+        var += self._sumsq
+        if n > 1:
+            var /= n - 1
+        # Rounding errors can make it slightly negative
+        numpy.maximum(var, 0, out=var)
+        return mean, var
+
+    def _reject_outliers(self, data):
+        """
+        Replace the outliers in the data by the current mean
+        data (ndarray): the frame
+        return (ndarray): the same frame, or a corrected copy
+        """
+        mean, var = self._get_mean_var()
+        std = numpy.sqrt(var, out=var)
+        if self._idtype.kind in "biu":
+            # Values differing only by the quantisation are never outliers
+            numpy.maximum(std, 1, out=std)
+        std *= _get_outlier_threshold(self._outliers, self._count)
+        outliers = numpy.abs(data - mean) > std
+        nout = numpy.count_nonzero(outliers)
+        if not nout:
+            return data
+
+        logging.debug("Replacing %d outlier pixels", nout)
+        self._rejected += nout
+        if self._idtype.kind in "biu":
+            numpy.round(mean, out=mean)
+        data = data.copy()
+        data[outliers] = mean[outliers]
+        return data
+
+    def getMean(self, dtype=None):
+        """
+        Compute the mean of all the frames accumulated
+        dtype (None or dtype): the dtype of the output. If None, it's float64.
+          If it's an integer type, the values are rounded.
+        return (DataArray): the mean, with the metadata of the first frame.
+          MD_DWELL_TIME and MD_EXP_TIME are multiplied by the number of frames,
+          as it's the total time of integration.
+        raise LookupError: if no frame has been accumulated
+        """
+        with self._lock:
+            if not self._count:
+                raise LookupError("No frame accumulated")
+            mean, _ = self._get_mean_var()
+            md = self._md.copy()
+            n = self._count
+
+        if dtype is not None:
+            dtype = numpy.dtype(dtype)
+            if dtype.kind in "biu":
+                numpy.round(mean, out=mean)
+            mean = mean.astype(dtype, copy=False)
+
+        for k in (model.MD_DWELL_TIME, model.MD_EXP_TIME):
+            if k in md:
+                md[k] *= n
+        return model.DataArray(mean, md)
+
+    def getVariance(self):
+        """
+        Compute the (sample) variance of each pixel over all the frames accumulated
+        return (DataArray of float64): the variance, with the metadata of the
+          first frame
+        raise LookupError: if no frame has been accumulated
+        raise ValueError: if the variance is not computed
+        """
+        if not self._variance:
+            raise ValueError("Variance not computed, needs variance=True")
+        with self._lock:
+            if not self._count:
+                raise LookupError("No frame accumulated")
+            _, var = self._get_mean_var()
+            md = self._md.copy()
+        return model.DataArray(var, md)
@@ -27,6 +27,7 @@ from odemis.model import MD_PIXEL_SIZE
 
 from .autofocus import AutoFocus, AutoFocusSpectrometer
 from .find_overlay import FindOverlay
+from .focusmap import FocusMap, MeasureFocusMap
 from .spot import AlignSpot, FindSpot
 from odemis.util.img import Subtract
 
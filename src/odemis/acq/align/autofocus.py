@@ -25,24 +25,31 @@ from __future__ import division
 import collections
 from concurrent.futures._base import CancelledError, CANCELLED, FINISHED, \
     RUNNING
-import cv2
 import logging
 import numpy
 from odemis import model
 from odemis.model import InstantaneousFuture
-from odemis.util import executeAsyncTask
+from odemis.util import executeAsyncTask, lazy_import
 from odemis.util.img import Subtract
-from scipy import ndimage
 import threading
 import time
 
 
+cv2 = lazy_import("cv2")
+ndimage = lazy_import("scipy.ndimage")
+
 MTD_BINARY = 0
 MTD_EXHAUSTIVE = 1
+MTD_PREDICTIVE = 2
 
 MAX_STEPS_NUMBER = 100  # Max steps to perform autofocus
 MAX_BS_NUMBER = 1  # Maximum number of applying binary search with a smaller max_step
 
+# Default area used by the predictive method to measure the focus level
+PREDICTIVE_ROI = 0.5  # ratio of the field of view, in each dimension
+PREDICTIVE_BINNING = 2
+PREDICTIVE_STEPS = 10  # Typical number of steps, for the time estimation
+
 
 def _convertRBGToGrayscale(image):
     """
@@ -177,6 +184,52 @@ def _discard_data(df, data):
     pass
 
 
+def _getDepthOfField(detector, emt):
+    """
+    Find the depth of field of the imaging system
+    detector: model.DigitalCamera or model.Detector
+    emt (None or model.Emitter): In case of a SED this is the scanner used
+    return (0<float): the depth of field in m
+    """
+    avail_depths = (detector, emt)
+    if model.hasVA(emt, "dwellTime"):
+        # Hack in case of using the e-beam with a DigitalCamera detector.
+        # All the digital cameras have a depthOfField, which is updated based
+        # on the optical lens properties... but the depthOfField in this
+        # case depends on the e-beam lens.
+        # TODO: or better rely on which component the focuser affects? If it
+        # affects (also) the emitter, use this one first? (but in the
+        # current models the focusers affects nothing)
+        avail_depths = (emt, detector)
+    for c in avail_depths:
+        if model.hasVA(c, "depthOfField"):
+            dof = c.depthOfField.value
+            break
+    else:
+        logging.debug("No depth of field info found")
+        dof = 1e-6  # m, not too bad value
+    logging.debug("Depth of field is %f", dof)
+    return dof
+
+
+def _getFocusMeasure(detector):
+    """
+    Pick the function to measure the focus level for the given detector
+    detector: model.DigitalCamera or model.Detector
+    return (callable DataArray -> float): MeasureOpticalFocus or MeasureSEMFocus
+    """
+    # Pick measurement method based on the heuristics that SEM detectors
+    # are typically just a point (ie, shape == data depth).
+    # TODO: is this working as expected? Alternatively, we could check
+    # MD_DET_TYPE.
+    if len(detector.shape) > 1:
+        logging.debug("Using Optical method to estimate focus")
+        return MeasureOpticalFocus
+    else:
+        logging.debug("Using SEM method to estimate focus")
+        return MeasureSEMFocus
+
+
 def _DoBinaryFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focus):
     """
     Iteratively acquires an optical image, measures its focus level and adjusts
@@ -222,24 +275,7 @@ def _DoBinaryFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focus):
         timeout = 3 + 2 * estimateAcquisitionTime(detector, emt)
 
         # use the .depthOfField on detector or emitter as maximum stepsize
-        avail_depths = (detector, emt)
-        if model.hasVA(emt, "dwellTime"):
-            # Hack in case of using the e-beam with a DigitalCamera detector.
-            # All the digital cameras have a depthOfField, which is updated based
-            # on the optical lens properties... but the depthOfField in this
-            # case depends on the e-beam lens.
-            # TODO: or better rely on which component the focuser affects? If it
-            # affects (also) the emitter, use this one first? (but in the
-            # current models the focusers affects nothing)
-            avail_depths = (emt, detector)
-        for c in avail_depths:
-            if model.hasVA(c, "depthOfField"):
-                dof = c.depthOfField.value
-                break
-        else:
-            logging.debug("No depth of field info found")
-            dof = 1e-6  # m, not too bad value
-        logging.debug("Depth of field is %f", dof)
+        dof = _getDepthOfField(detector, emt)
         min_step = dof / 2
 
         # adjust to rng_focus if provided
@@ -261,16 +297,7 @@ def _DoBinaryFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focus):
         best_fm = 0
         last_pos = None
 
-        # Pick measurement method based on the heuristics that SEM detectors
-        # are typically just a point (ie, shape == data depth).
-        # TODO: is this working as expected? Alternatively, we could check
-        # MD_DET_TYPE.
-        if len(detector.shape) > 1:
-            logging.debug("Using Optical method to estimate focus")
-            Measure = MeasureOpticalFocus
-        else:
-            logging.debug("Using SEM method to estimate focus")
-            Measure = MeasureSEMFocus
+        Measure = _getFocusMeasure(detector)
 
         step_factor = 2 ** 7
         if good_focus is not None:
@@ -422,32 +449,9 @@ def _DoExhaustiveFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focu
         timeout = 3 + 2 * estimateAcquisitionTime(detector, emt)
 
         # use the .depthOfField on detector or emitter as maximum stepsize
-        avail_depths = (detector, emt)
-        if model.hasVA(emt, "dwellTime"):
-            # Hack in case of using the e-beam with a DigitalCamera detector.
-            # All the digital cameras have a depthOfField, which is updated based
-            # on the optical lens properties... but the depthOfField in this
-            # case depends on the e-beam lens.
-            avail_depths = (emt, detector)
-        for c in avail_depths:
-            if model.hasVA(c, "depthOfField"):
-                dof = c.depthOfField.value
-                break
-        else:
-            logging.debug("No depth of field info found")
-            dof = 1e-6  # m, not too bad value
-        logging.debug("Depth of field is %f", dof)
-
-        # Pick measurement method based on the heuristics that SEM detectors
-        # are typically just a point (ie, shape == data depth).
-        # TODO: is this working as expected? Alternatively, we could check
-        # MD_DET_TYPE.
-        if len(detector.shape) > 1:
-            logging.debug("Using Optical method to estimate focus")
-            Measure = MeasureOpticalFocus
-        else:
-            logging.debug("Using SEM method to estimate focus")
-            Measure = MeasureSEMFocus
+        dof = _getDepthOfField(detector, emt)
+
+        Measure = _getFocusMeasure(detector)
 
         # adjust to rng_focus if provided
         rng = focus.axes["z"].range
@@ -527,6 +531,271 @@ def _DoExhaustiveFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focu
             future._autofocus_state = FINISHED
 
 
+def FitFocusPeak(positions, levels):
+    """
+    Estimates the position of the best focus, by fitting a peak model on the
+    focus levels measured. The model is a Gaussian, which is fitted as a
+    parabola on the logarithm of the levels, using the points around the
+    maximum level.
+    positions (list of floats): focus positions
+    levels (list of 0<floats): focus level measured at each position
+    returns (float or None): position of the peak, or None if the points do not
+      show any peak (eg, the levels only increase in one direction)
+    """
+    if len(positions) < 3:
+        return None
+
+    order = numpy.argsort(positions)
+    pos = numpy.asarray(positions, dtype=numpy.float64)[order]
+    lvl = numpy.asarray(levels, dtype=numpy.float64)[order]
+    if (lvl <= 0).any():
+        return None
+
+    # Use the maximum, its direct neighbours, and the other points in the top
+    # half of the peak. As the measurements get closer to the peak, the fit
+    # only uses the top of the peak, where the model is the most accurate,
+    # while still using enough points to average the noise.
+    i_max = lvl.argmax()
+    if i_max == 0 or i_max == len(pos) - 1:
+        # The peak is not surrounded
+        return None
+    top = lvl >= (lvl.max() + lvl.min()) / 2
+    top[i_max - 1:i_max + 2] = True
+    pos, lvl = pos[top], lvl[top]
+
+    # Normalise the positions to have a well conditioned fit
+    center = pos[lvl.argmax()]
+    scale = pos.ptp()
+    a, b, _ = numpy.polyfit((pos - center) / scale, numpy.log(lvl), 2)
+    if a >= 0:  # Not a peak
+        return None
+
+    return center - b / (2 * a) * scale
+
+
+def _predictNextFocus(positions, levels, step, tolerance):
+    """
+    Decides the next focus position to measure, based on the focus levels
+    measured so far.
+    positions (list of floats): focus positions measured
+    levels (list of floats): focus level measured at each position
+    step (0<float): initial distance between the positions
+    tolerance (0<float): precision at which the best position should be found
+    returns (float or None): the next position to measure, or None if the best
+      position is already found.
+    """
+    spos = sorted(positions)
+    best = positions[numpy.argmax(levels)]
+    i = spos.index(best)
+    if i == 0:
+        # Best focus is further down => explore, with increasingly large steps
+        return best - max(2 * step, spos[-1] - spos[0])
+    elif i == len(spos) - 1:
+        return best + max(2 * step, spos[-1] - spos[0])
+
+    # The maximum is surrounded: the peak model should tell where the peak is
+    peak = FitFocusPeak(positions, levels)
+    if peak is not None and min(abs(peak - p) for p in positions) >= tolerance:
+        return peak
+
+    # The model doesn't predict anything new. Either it's because the
+    # peak is found, or because the points are too far apart to be
+    # precise (or the model doesn't fit, due to noise).
+    left, right = spos[i - 1], spos[i + 1]
+    if max(best - left, right - best) <= 2 * tolerance:
+        return None
+    # Narrow the largest side
+    if best - left > right - best:
+        return (best + left) / 2
+    else:
+        return (best + right) / 2
+
+
+def _reduceAcquisition(detector, emt, roi, binning):
+    """
+    Changes the settings of the detector (or scanner) to acquire faster a
+    smaller image at the center of the field of view.
+    detector: model.DigitalCamera or model.Detector
+    emt (None or model.Emitter): In case of a SED this is the scanner used
+    roi (0<float<=1): ratio of the field of view to acquire, in each dimension
+    binning (1<=int): binning (or pixel scale) to apply, in each dimension
+    return (list of (VigilantAttribute, value)): the settings changed, with
+      their original value, in the order they should be restored
+    """
+    changed = []
+    if len(detector.shape) > 2:
+        # Camera: the image is defined by the camera itself (even if there is
+        # an emitter, such as the e-beam for CL). The resolution is always centered.
+        if not model.hasVA(detector, "resolution"):
+            logging.debug("Cannot reduce the acquisition area of %s", detector.name)
+            return changed
+        comp = detector
+        binva = detector.binning if model.hasVA(detector, "binning") else None
+    elif model.hasVA(emt, "scale") and model.hasVA(emt, "resolution"):
+        # Point detector: the image is defined by the scanner. Bigger pixels,
+        # and fewer of them. Changing the scale keeps the field of view, so
+        # the resolution is set afterwards.
+        comp = emt
+        binva = emt.scale
+    else:
+        logging.debug("Cannot reduce the acquisition area of %s", detector.name)
+        return changed
+
+    try:
+        if binva is not None and binning > 1:
+            changed.append((binva, binva.value))
+            prev_b = binva.value
+            try:
+                binva.value = tuple(v * binning for v in prev_b)
+            except (ValueError, IndexError):
+                logging.debug("Failed to set binning to %d, keeping %s", binning, prev_b)
+            b = binva.value
+        else:
+            b = (1,) * len(comp.resolution.value)
+
+        if roi < 1:
+            changed.append((comp.resolution, comp.resolution.value))
+            shape = comp.shape[:len(b)]
+            rmin, rmax = comp.resolution.range
+            res = tuple(max(mn, min(int(round(s * roi / bi)), mx))
+                        for s, bi, mn, mx in zip(shape, b, rmin, rmax))
+            comp.resolution.value = res
+    except Exception:
+        _restoreAcquisition(changed)
+        raise
+
+    logging.debug("Acquiring focus images at resolution %s", comp.resolution.value)
+    return changed
+
+
+def _restoreAcquisition(changed):
+    """
+    Put back the settings changed by _reduceAcquisition()
+    changed (list of (VigilantAttribute, value))
+    """
+    for va, val in changed:
+        try:
+            va.value = val
+        except Exception:
+            logging.exception("Failed to restore setting to %s", val)
+
+
+def _DoPredictiveFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focus,
+                       roi=PREDICTIVE_ROI, binning=PREDICTIVE_BINNING, tolerance=None):
+    """
+    Measures the focus level at a few positions, fits a peak model on these
+    measurements, and moves to the predicted best position. It iterates until the
+    prediction doesn't change anymore. The focus level is measured on a
+    smaller, binned, area at the center of the field of view, to reduce the
+    acquisition time.
+    future (model.ProgressiveFuture): Progressive future provided by the wrapper
+    detector: model.DigitalCamera or model.Detector
+    emt (None or model.Emitter): In case of a SED this is the scanner used
+    focus (model.Actuator): The focus actuator (with a "z" axis)
+    dfbkg (model.DataFlow): dataflow of se- or bs- detector
+    good_focus (float): if provided, an already known good focus position to be
+      taken into consideration while autofocusing
+    rng_focus (tuple of floats): if provided, the search of the best focus position is limited
+      within this range
+    roi (0<float<=1): ratio of the field of view (in each dimension) used to
+      measure the focus level
+    binning (1<=int): binning (or pixel scale increase) used for the acquisition
+    tolerance (None or 0<float): the search stops when the predicted best position
+      is closer than this distance (in m) to a position already measured. If None,
+      half of the depth of field is used.
+    returns:
+        (float): Focus position (m)
+        (float): Focus level
+    raises:
+            CancelledError if cancelled
+            IOError if procedure failed
+    """
+    logging.debug("Starting predictive autofocus on detector %s...", detector.name)
+
+    best_pos = focus.position.value['z']
+    positions = []  # focus positions measured
+    levels = []  # focus level at each position
+    changed = []
+    try:
+        changed = _reduceAcquisition(detector, emt, roi, binning)
+
+        # Big timeout, most important being that it's shorter than eternity
+        timeout = 3 + 2 * estimateAcquisitionTime(detector, emt)
+
+        dof = _getDepthOfField(detector, emt)
+        if tolerance is None:
+            tolerance = dof / 2
+        Measure = _getFocusMeasure(detector)
+
+        # adjust to rng_focus if provided
+        rng = focus.axes["z"].range
+        if rng_focus:
+            rng = (max(rng[0], rng_focus[0]), min(rng[1], rng_focus[1]))
+        if rng[1] <= rng[0]:
+            raise ValueError("Unexpected focus range %s" % (rng,))
+
+        def measure_at(pos):
+            pos = max(rng[0], min(pos, rng[1]))
+            focus.moveAbsSync({"z": pos})
+            pos = focus.position.value["z"]
+            image = AcquireNoBackground(detector, dfbkg, timeout)
+            lvl = Measure(image)
+            logging.debug("Focus level at %f is %f", pos, lvl)
+            positions.append(pos)
+            levels.append(lvl)
+            if future._autofocus_state == CANCELLED:
+                raise CancelledError()
+
+        # Start with 3 points around the best known position. The steps are
+        # large enough to see a difference, and smaller if we already know we
+        # are close.
+        center = focus.position.value['z'] if good_focus is None else good_focus
+        step = 2 * dof if good_focus is not None else 8 * dof
+        step = min(step, (rng[1] - rng[0]) / 4)
+        for p in (center, center - step, center + step):
+            measure_at(p)
+
+        for i in range(MAX_STEPS_NUMBER):
+            next_pos = _predictNextFocus(positions, levels, step, tolerance)
+            if next_pos is None:
+                break
+            next_pos = max(rng[0], min(next_pos, rng[1]))
+            # If it's already measured (eg, at the range limit), there is
+            # nothing more to learn
+            if min(abs(next_pos - p) for p in positions) < tolerance:
+                break
+            measure_at(next_pos)
+        else:
+            logging.info("Auto focus gave up after %d steps", len(positions))
+
+        # Go to the best position: the predicted one, unless the model doesn't
+        # work, in which case the best position measured is used.
+        i_best = numpy.argmax(levels)
+        best_pos, best_fm = positions[i_best], levels[i_best]
+        peak = FitFocusPeak(positions, levels)
+        if peak is not None and rng[0] <= peak <= rng[1]:
+            i_near = numpy.argmin([abs(peak - p) for p in positions])
+            if abs(positions[i_near] - peak) < tolerance:
+                best_pos, best_fm = peak, levels[i_near]
+        focus.moveAbsSync({"z": best_pos})
+        logging.info("Auto focus found best level %g @ %g m after %d measurements",
+                     best_fm, best_pos, len(positions))
+
+        return best_pos, best_fm
+
+    except CancelledError:
+        # Go to the best position known so far
+        if levels:
+            best_pos = positions[numpy.argmax(levels)]
+        focus.moveAbsSync({"z": best_pos})
+    finally:
+        _restoreAcquisition(changed)
+        with future._autofocus_lock:
+            if future._autofocus_state == CANCELLED:
+                raise CancelledError()
+            future._autofocus_state = FINISHED
+
+
 def _CancelAutoFocus(future):
     """
     Canceller of AutoFocus task.
@@ -575,7 +844,8 @@ def estimateAutoFocusTime(detector, scanner=None, steps=MAX_STEPS_NUMBER):
     return steps * estimateAcquisitionTime(detector, scanner)
 
 
-def AutoFocus(detector, emt, focus, dfbkg=None, good_focus=None, rng_focus=None, method=MTD_BINARY):
+def AutoFocus(detector, emt, focus, dfbkg=None, good_focus=None, rng_focus=None, method=MTD_BINARY,
+              roi=PREDICTIVE_ROI, binning=PREDICTIVE_BINNING, tolerance=None):
     """
     Wrapper for DoAutoFocus. It provides the ability to check the progress of autofocus 
     procedure or even cancel it.
@@ -592,29 +862,43 @@ def AutoFocus(detector, emt, focus, dfbkg=None, good_focus=None, rng_focus=None,
     rng_focus (tuple): if provided, the search of the best focus position is limited
       within this range
     method (MTD_*): focusing method, if BINARY we follow a dichotomic method while in
-      case of EXHAUSTIVE we iterate through the whole provided range
+      case of EXHAUSTIVE we iterate through the whole provided range. PREDICTIVE
+      fits a peak model on the focus levels to directly move to the best position.
+    roi (0<float<=1): only for PREDICTIVE, ratio of the field of view (in each
+      dimension) used to measure the focus level
+    binning (1<=int): only for PREDICTIVE, binning used for the acquisition
+    tolerance (None or 0<float): only for PREDICTIVE, precision (in m) at which
+      the search stops. If None, it's based on the depth of field.
     returns (model.ProgressiveFuture):  Progress of DoAutoFocus, whose result() will return:
             Focus position (m)
             Focus level
     """
     # Create ProgressiveFuture and update its state to RUNNING
     est_start = time.time() + 0.1
-    f = model.ProgressiveFuture(start=est_start,
-                                end=est_start + estimateAutoFocusTime(detector, emt))
+    if method == MTD_PREDICTIVE:
+        dur = estimateAutoFocusTime(detector, emt, PREDICTIVE_STEPS) * roi ** 2 / binning ** 2
+    else:
+        dur = estimateAutoFocusTime(detector, emt)
+    f = model.ProgressiveFuture(start=est_start, end=est_start + dur)
     f._autofocus_state = RUNNING
     f._autofocus_lock = threading.Lock()
     f.task_canceller = _CancelAutoFocus
 
     # Run in separate thread
+    kwargs = {}
     if method == MTD_EXHAUSTIVE:
         autofocus_fn = _DoExhaustiveFocus
     elif method == MTD_BINARY:
         autofocus_fn = _DoBinaryFocus
+    elif method == MTD_PREDICTIVE:
+        autofocus_fn = _DoPredictiveFocus
+        kwargs = {"roi": roi, "binning": binning, "tolerance": tolerance}
     else:
         raise ValueError("Unknown autofocus method")
 
     executeAsyncTask(f, autofocus_fn,
-                     args=(f, detector, emt, focus, dfbkg, good_focus, rng_focus))
+                     args=(f, detector, emt, focus, dfbkg, good_focus, rng_focus),
+                     kwargs=kwargs)
     return f
 
 
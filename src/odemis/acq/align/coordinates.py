@@ -30,16 +30,16 @@ from numpy import histogram
 from numpy import unravel_index
 import numpy
 from odemis import model
+from odemis.util import lazy_import
 import operator
 
-from scipy.spatial import cKDTree
-
-import scipy.ndimage as ndimage
-import scipy.ndimage.filters as filters
-
 from ..align import transform
 
 
+spatial = lazy_import("scipy.spatial")
+ndimage = lazy_import("scipy.ndimage")
+filters = lazy_import("scipy.ndimage.filters")
+
 MAX_STEPS_NUMBER = 100  # How many steps to perform in coordinates matching
 SHIFT_THRESHOLD = 0.04  # When to still perform the shift (percentage)
 DIFF_NUMBER = 0.95  # Number of values that should be within the allowed difference
@@ -215,7 +215,7 @@ def FilterOutliers(image, subimages, subimage_coordinates, expected_spots):
     # if we have an at least 2x2 grid.
     if expected_spots >= 4 and len(clean_subimage_coordinates) > expected_spots:
         points = numpy.array(clean_subimage_coordinates)
-        tree = cKDTree(points, 5)
+        tree = spatial.cKDTree(points, 5)
         distance, index = tree.query(clean_subimage_coordinates, 5)
         list_distance = numpy.array(distance)
         avg_1 = numpy.average(list_distance[:, 1])
@@ -346,7 +346,7 @@ def _KNNsearch(x_coordinates, y_coordinates):
                                 for the corresponding element in y_coordinates
     """
     points = numpy.array(x_coordinates)
-    tree = cKDTree(points)
+    tree = spatial.cKDTree(points)
     distance, index = tree.query(y_coordinates)
     list_index = numpy.array(index).tolist()
 
@@ -521,7 +521,7 @@ def _FindOuterOutliers(x_coordinates):
     """
     # For each point, search for the 2 closest neighbors
     points = numpy.array(x_coordinates)
-    tree = cKDTree(points, 2)
+    tree = spatial.cKDTree(points, 2)
     distance, index = tree.query(x_coordinates, 2)
     list_distance = numpy.array(distance)
 
@@ -541,7 +541,7 @@ def _FindInnerOutliers(x_coordinates):
     returns (List of tuples): Coordinates without inner outliers
     """
     points = numpy.array(x_coordinates)
-    tree = cKDTree(points, 2)
+    tree = spatial.cKDTree(points, 2)
     distance, index = tree.query(x_coordinates, 2)
     list_index = numpy.array(index)
 
@@ -24,7 +24,6 @@ from __future__ import division
 
 from concurrent.futures._base import CancelledError, CANCELLED, FINISHED, \
     RUNNING
-import cv2
 import logging
 import math
 from numpy import array, linalg
@@ -34,13 +33,15 @@ from odemis.acq.align import transform, spot, autofocus, FindOverlay
 from odemis.acq.align.autofocus import AcquireNoBackground, MTD_EXHAUSTIVE
 from odemis.acq.drift import MeasureShift
 from odemis.dataio import tiff
-from odemis.util import img, executeAsyncTask
+from odemis.util import img, executeAsyncTask, lazy_import
 import os
-from scipy.ndimage import zoom
 import threading
 import time
 
 
+cv2 = lazy_import("cv2")
+ndimage = lazy_import("scipy.ndimage")
+
 logger = logging.getLogger(__name__)
 CALIB_DIRECTORY = u"delphi-calibration-report"  # delphi calibration report directory
 CALIB_LOG = u"calibration.log"
@@ -1462,7 +1463,7 @@ def _DoHFWShiftFactor(future, detector, escan, logpath=None):
                 # smaller image FoV, and resample it to have them the same size
                 cropped_image = larger_image[crop_res[1] // 2: 3 * crop_res[1] // 2,
                                              crop_res[0] // 2: 3 * crop_res[0] // 2]
-                resampled_image = zoom(cropped_image, zoom=zoom_f)
+                resampled_image = ndimage.zoom(cropped_image, zoom=zoom_f)
                 # Apply phase correlation
                 shift_px = MeasureShift(smaller_image, resampled_image, 10)
                 if logpath:
@@ -1608,7 +1609,7 @@ def _DoResolutionShiftFactor(future, detector, escan, logpath):
                 continue
 
             # Resample the smaller image to fit the resolution of the larger image
-            resampled_image = zoom(smaller_image, max_resolution / smaller_image.shape[0])
+            resampled_image = ndimage.zoom(smaller_image, max_resolution / smaller_image.shape[0])
             # Apply phase correlation
             shift_px = MeasureShift(largest_image, resampled_image, 10)
             logger.debug("Computed resolution shift of %s px @ res=%d", shift_px, cur_resolution)
@@ -1776,7 +1777,7 @@ def _DoScaleShiftFactor(future, detector, escan, logpath=None):
                 # smaller image FoV, and resample it to have them the same size
                 cropped_image = larger_image[crop_res[1] // 2: 3 * crop_res[1] // 2,
                                              crop_res[0] // 2: 3 * crop_res[0] // 2]
-                resampled_image = zoom(cropped_image, zoom=zoom_f)
+                resampled_image = ndimage.zoom(cropped_image, zoom=zoom_f)
                 # Apply phase correlation
                 shift_px = MeasureShift(smaller_image, resampled_image, 10)
                 if logpath:
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+Created on 18 Oct 2026
+
+@author: Delmic
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the
+terms  of the GNU General Public License version 2 as published by the Free
+Software  Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY;  without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR  PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+"""
+
+# Estimation of the best focus position over the whole sample, from the focus
+# measured at a few positions. This allows to acquire many positions (eg, the
+# tiles of a large area) without running the autofocus at each of them.
+
+from __future__ import division
+
+from concurrent.futures._base import CancelledError, CANCELLED, FINISHED, \
+    RUNNING
+import logging
+import math
+import numpy
+from odemis import model
+from odemis.model import InstantaneousFuture
+from odemis.util import executeAsyncTask
+import threading
+import time
+
+from .autofocus import AutoFocus, MTD_PREDICTIVE, estimateAutoFocusTime, \
+    PREDICTIVE_STEPS
+
+
+FIT_PLANE = 0  # Tilted plane, robust and sufficient for flat samples
+FIT_SPLINE = 1  # Thin-plate spline, which can follow curved samples
+
+MOVE_TIME = 1  # s, rough estimation of a stage move, for the time estimation
+
+
+def _tps_kernel(r):
+    """
+    Radial basis function of the thin-plate spline: r² log(r)
+    r (numpy.array of 0<=float): distances
+    return (numpy.array of float): same shape as r
+    """
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        k = r ** 2 * numpy.log(r)
+    k[r == 0] = 0
+    return k
+
+
+class FocusMap(object):
+    """
+    Surface of best focus position, as a function of the X/Y position of the
+    stage. It's estimated from the focus measured at a few positions, and
+    interpolated (or extrapolated) everywhere else.
+    """
+
+    def __init__(self, method=FIT_PLANE, smoothing=0):
+        """
+        method (FIT_*): how the surface is fitted on the points. FIT_PLANE
+          uses a least-square plane. FIT_SPLINE uses a thin-plate spline, which
+          passes through all the points (unless smoothing > 0). Whatever the
+          method, with less than 3 points, the surface is a plane with the
+          smallest slope fitting the points.
+        smoothing (0<=float): only for FIT_SPLINE, regularisation of the spline.
+          0 passes exactly through the points, the bigger the closer to a plane.
+        """
+        if method not in (FIT_PLANE, FIT_SPLINE):
+            raise ValueError("Unknown fitting method %s" % (method,))
+        if smoothing < 0:
+            raise ValueError("Smoothing must be positive, got %s" % (smoothing,))
+        self.method = method
+        self.smoothing = smoothing
+        self._points = []  # list of (x, y, z)
+        self._lock = threading.Lock()
+        self._fit = None  # cached model, reset each time a point is added
+
+    @property
+    def points(self):
+        """
+        (list of (float, float, float)): the X, Y positions and the focus
+          position at each of them
+        """
+        return list(self._points)
+
+    def addPoint(self, pos, z):
+        """
+        Add a focus measurement. If a point was already present at the same
+        position, it's replaced (eg, the focus was measured again).
+        pos (float, float): X/Y position of the stage (m)
+        z (float): best focus position at this position (m)
+        """
+        with self._lock:
+            x, y = pos
+            for i, (px, py, pz) in enumerate(self._points):
+                if math.hypot(px - x, py - y) < 1e-9:
+                    self._points[i] = (x, y, z)
+                    break
+            else:
+                self._points.append((x, y, z))
+            self._fit = None
+
+    def _normalise(self, xy):
+        """
+        Convert positions in the space used for the fit, centred on the points,
+        and of unit scale, to keep the fit well conditioned.
+        xy (numpy.array of shape Nx2): positions
+        return (numpy.array of shape Nx2)
+        """
+        return (xy - self._fit["center"]) / self._fit["scale"]
+
+    def _computeFit(self):
+        """
+        Fit the surface on the current points
+        """
+        pts = numpy.array(self._points, dtype=numpy.float64)
+        xy, z = pts[:, :2], pts[:, 2]
+        center = xy.mean(axis=0)
+        scale = numpy.ptp(xy, axis=0).max()
+        if scale == 0:
+            scale = 1
+        self._fit = {"center": center, "scale": scale}
+        nxy = self._normalise(xy)
+        n = len(pts)
+
+        # Affine part: z = a0 + a1 * x + a2 * y
+        # With less than 3 points, lstsq returns the minimum norm solution,
+        # which corresponds to the plane with the smallest slope.
+        p = numpy.column_stack((numpy.ones(n), nxy))
+        if self.method == FIT_SPLINE and n >= 3:
+            # Thin-plate spline: solve
+            # | K + λI  P | |w|   |z|
+            # | Pᵀ      0 | |a| = |0|
+            d = numpy.hypot(nxy[:, None, 0] - nxy[None, :, 0],
+                            nxy[:, None, 1] - nxy[None, :, 1])
+            k = _tps_kernel(d) + self.smoothing * numpy.identity(n)
+            a = numpy.zeros((n + 3, n + 3))
+            a[:n, :n] = k
+            a[:n, n:] = p
+            a[n:, :n] = p.T
+            b = numpy.zeros(n + 3)
+            b[:n] = z
+            try:
+                sol = numpy.linalg.solve(a, b)
+                self._fit["weights"] = sol[:n]
+                self._fit["affine"] = sol[n:]
+                self._fit["nodes"] = nxy
+                return
+            except numpy.linalg.LinAlgError:
+                # Typically, all the points are aligned
+                logging.debug("Failed to fit a spline on the focus points, will use a plane")
+
+        self._fit["affine"] = numpy.linalg.lstsq(p, z, rcond=-1)[0]
+
+    def getFocus(self, pos):
+        """
+        Estimate the best focus position at a given position
+        pos (float, float): X/Y position of the stage (m)
+        return (float): focus position (m)
+        raise LookupError: if no point has been added yet
+        """
+        with self._lock:
+            if not self._points:
+                raise LookupError("No focus point in the map")
+            if self._fit is None:
+                self._computeFit()
+
+            nxy = self._normalise(numpy.array(pos, dtype=numpy.float64))
+            a = self._fit["affine"]
+            z = a[0] + a[1] * nxy[0] + a[2] * nxy[1]
+            if "weights" in self._fit:
+                nodes = self._fit["nodes"]
+                d = numpy.hypot(nodes[:, 0] - nxy[0], nodes[:, 1] - nxy[1])
+                z += numpy.dot(self._fit["weights"], _tps_kernel(d))
+            return float(z)
+
+
+def estimateFocusMapTime(detector, emt, npoints):
+    """
+    Estimate how long measuring a focus map will take
+    detector (model.DigitalCamera or model.Detector): Detector used to focus
+    emt (None or model.Emitter): In case of a SED this is the scanner used
+    npoints (0<=int): number of positions where the focus is measured
+    return (0<=float): time in s
+    """
+    aft = estimateAutoFocusTime(detector, emt, PREDICTIVE_STEPS)
+    return npoints * (aft + MOVE_TIME)
+
+
+def MeasureFocusMap(detector, emt, focus, stage, positions, focus_map=None,
+                    method=MTD_PREDICTIVE, rng_focus=None):
+    """
+    Run the autofocus at each of the given positions, to estimate the focus
+    over the area. The stage is left at the last position.
+    detector (model.DigitalCamera or model.Detector): Detector on which to
+      measure the focus quality
+    emt (None or model.Emitter): In case of a SED this is the scanner used
+    focus (model.Actuator): The focus actuator (with a "z" axis)
+    stage (model.Actuator): The stage (with "x" and "y" axes)
+    positions (list of (float, float)): the X/Y stage positions (m). They are
+      measured in the given order, so it's best to pass them in an order which
+      minimises the moves.
+    focus_map (None or FocusMap): the map to which the points are added. If
+      None, a new FocusMap (fitting a plane) is created.
+    method (MTD_*): autofocus method
+    rng_focus (None or tuple of 2 floats): range in which the focus is searched
+    return (model.ProgressiveFuture -> FocusMap): the focus map, with one
+      point added for each position
+    """
+    if focus_map is None:
+        focus_map = FocusMap()
+
+    est_start = time.time() + 0.1
+    dur = estimateFocusMapTime(detector, emt, len(positions))
+    f = model.ProgressiveFuture(start=est_start, end=est_start + dur)
+    f.task_canceller = _CancelFocusMap
+    f._autofocus_state = RUNNING
+    f._autofocus_lock = threading.Lock()
+    f._subfuture = InstantaneousFuture()
+
+    executeAsyncTask(f, _DoMeasureFocusMap,
+                     args=(f, detector, emt, focus, stage, positions, focus_map,
+                           method, rng_focus))
+    return f
+
+
+def _DoMeasureFocusMap(future, detector, emt, focus, stage, positions, focus_map,
+                       method, rng_focus):
+    """
+    cf MeasureFocusMap
+    return (FocusMap)
+    """
+    try:
+        for i, pos in enumerate(positions):
+            tstart = time.time()
+            logging.debug("Measuring focus at position %s", pos)
+            stage.moveAbsSync({"x": pos[0], "y": pos[1]})
+
+            # Starting from the focus expected at this position speeds up the
+            # search (and reduces the risk to lock on another peak).
+            try:
+                good_focus = focus_map.getFocus(pos)
+                focus.moveAbsSync({"z": good_focus})
+            except LookupError:
+                good_focus = None
+
+            with future._autofocus_lock:
+                if future._autofocus_state == CANCELLED:
+                    raise CancelledError()
+                future._subfuture = AutoFocus(detector, emt, focus,
+                                              good_focus=good_focus,
+                                              rng_focus=rng_focus, method=method)
+            fp, flvl = future._subfuture.result()
+            logging.debug("Found focus %g m (level = %g) at position %s", fp, flvl, pos)
+            focus_map.addPoint(pos, fp)
+
+            # Estimate the rest will take the same time as this point
+            left = len(positions) - i - 1
+            future.set_progress(end=time.time() + left * (time.time() - tstart))
+
+        return focus_map
+    except CancelledError:
+        logging.debug("Focus map measurement cancelled")
+    finally:
+        with future._autofocus_lock:
+            if future._autofocus_state == CANCELLED:
+                raise CancelledError()
+            future._autofocus_state = FINISHED
+
+
+def _CancelFocusMap(future):
+    """
+    Canceller of MeasureFocusMap task.
+    """
+    logging.debug("Cancelling focus map measurement...")
+
+    with future._autofocus_lock:
+        if future._autofocus_state == FINISHED:
+            return False
+        future._autofocus_state = CANCELLED
+        future._subfuture.cancel()
+        logging.debug("Focus map cancellation requested.")
+
+    return True
@@ -25,12 +25,13 @@ from __future__ import division
 
 import logging
 import numpy
-import cv2
-from scipy import ndimage
 from odemis import model
-from odemis.util import img
+from odemis.util import img, lazy_import
 
 
+cv2 = lazy_import("cv2")
+ndimage = lazy_import("scipy.ndimage")
+
 # The brute-force matcher works in theory a bit better than the Flann-based one,
 # but slower. In practice, it doesn't seem to show better results, and if they
 # are many keypoints (eg, 2000) the slow-down can be a couple of seconds.
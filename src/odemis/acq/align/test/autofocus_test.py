@@ -22,6 +22,7 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 from concurrent.futures._base import CancelledError
 import logging
 from odemis import model
+import numpy
 import odemis
 from odemis.acq import align
 from odemis.acq.align import autofocus
@@ -102,6 +103,36 @@ class TestAutofocus(unittest.TestCase):
             self.assertGreater(prev_res, res)
             prev_res = res
 
+    def test_fit_focus_peak(self):
+        """
+        Test FitFocusPeak and the choice of the next position to measure
+        """
+        def curve(z):
+            return 10 + 100 * numpy.exp(-(z - 13e-6) ** 2 / (2 * (20e-6) ** 2))
+
+        pos = [-40e-6, 0, 40e-6]
+        peak = autofocus.FitFocusPeak(pos, [curve(p) for p in pos])
+        self.assertAlmostEqual(peak, 13e-6, delta=5e-6)
+
+        # No peak visible
+        pos = [0, 10e-6, 20e-6]
+        self.assertIsNone(autofocus.FitFocusPeak(pos, [1, 2, 3]))
+        self.assertGreater(autofocus._predictNextFocus(pos, [1, 2, 3], 10e-6, 1e-6), 20e-6)
+
+        # Iterate until the best position is found
+        pos = [-100e-6, -140e-6, -60e-6]
+        lvls = [curve(p) for p in pos]
+        for i in range(20):
+            p = autofocus._predictNextFocus(pos, lvls, 40e-6, 1e-6)
+            if p is None:
+                break
+            pos.append(p)
+            lvls.append(curve(p))
+        else:
+            self.fail("Failed to find the peak after %d measurements" % (len(pos),))
+        self.assertLess(len(pos), 15)
+        self.assertAlmostEqual(autofocus.FitFocusPeak(pos, lvls), 13e-6, delta=1e-6)
+
     @timeout(1000)
     def test_autofocus_opt(self):
         """
@@ -145,6 +176,77 @@ class TestAutofocus(unittest.TestCase):
         self.assertGreater(foc_lev, 0)
 
 
+    @timeout(1000)
+    def test_autofocus_sem_predictive(self):
+        """
+        Test AutoFocus on e-beam with the predictive method
+        """
+        self.efocus.moveAbs({"z": self._sem_good_focus - 100e-06}).result()
+        self.ebeam.dwellTime.value = self.ebeam.dwellTime.range[0]
+        res = self.ebeam.resolution.value
+        scale = self.ebeam.scale.value
+        future_focus = align.AutoFocus(self.sed, self.ebeam, self.efocus,
+                                       method=autofocus.MTD_PREDICTIVE)
+        foc_pos, foc_lev = future_focus.result(timeout=900)
+        self.assertAlmostEqual(foc_pos, self._sem_good_focus, 3)
+        self.assertGreater(foc_lev, 0)
+
+        # The settings should be back to the original ones
+        self.assertEqual(self.ebeam.resolution.value, res)
+        self.assertEqual(self.ebeam.scale.value, scale)
+
+    @timeout(1000)
+    def test_autofocus_opt_predictive(self):
+        """
+        Test AutoFocus on CCD with the predictive method, on a small ROI
+        """
+        self.focus.moveAbs({"z": self._opt_good_focus - 100e-6}).result()
+        self.ccd.exposureTime.value = self.ccd.exposureTime.range[0]
+        res = self.ccd.resolution.value
+        binning = self.ccd.binning.value
+        ebeam_res = self.ebeam.resolution.value
+        ebeam_scale = self.ebeam.scale.value
+
+        # Record the settings used during the autofocus
+        res_used = []
+        binning_used = []
+        ebeam_res_used = []
+
+        def on_res(v):
+            res_used.append(v)
+
+        def on_binning(v):
+            binning_used.append(v)
+
+        def on_ebeam_res(v):
+            ebeam_res_used.append(v)
+
+        self.ccd.resolution.subscribe(on_res)
+        self.ccd.binning.subscribe(on_binning)
+        self.ebeam.resolution.subscribe(on_ebeam_res)
+        try:
+            future_focus = align.AutoFocus(self.ccd, self.ebeam, self.focus,
+                                           method=autofocus.MTD_PREDICTIVE, roi=0.3, binning=2)
+            foc_pos, foc_lev = future_focus.result(timeout=900)
+        finally:
+            self.ccd.resolution.unsubscribe(on_res)
+            self.ccd.binning.unsubscribe(on_binning)
+            self.ebeam.resolution.unsubscribe(on_ebeam_res)
+        self.assertAlmostEqual(foc_pos, self._opt_good_focus, 3)
+        self.assertGreater(foc_lev, 0)
+
+        # The CCD was used with a smaller area and a bigger binning...
+        self.assertIn(tuple(b * 2 for b in binning), binning_used)
+        self.assertTrue(any(r[0] < res[0] and r[1] < res[1] for r in res_used))
+        # ... and the e-beam was not touched
+        self.assertEqual(ebeam_res_used, [])
+        self.assertEqual(self.ebeam.resolution.value, ebeam_res)
+        self.assertEqual(self.ebeam.scale.value, ebeam_scale)
+
+        # The settings should be back to the original ones
+        self.assertEqual(self.ccd.resolution.value, res)
+        self.assertEqual(self.ccd.binning.value, binning)
+
 class TestAutofocusSpectrometer(unittest.TestCase):
     """
     Test autofocus spectrometer function
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: Delmic
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+from __future__ import division
+
+import logging
+import math
+from odemis.acq.align import focusmap
+import unittest
+
+
+logging.getLogger().setLevel(logging.DEBUG)
+
+
+class TestFocusMap(unittest.TestCase):
+    """
+    Test the interpolation of the FocusMap
+    """
+
+    def test_empty(self):
+        fm = focusmap.FocusMap()
+        with self.assertRaises(LookupError):
+            fm.getFocus((0, 0))
+
+    def test_few_points(self):
+        fm = focusmap.FocusMap(focusmap.FIT_SPLINE)
+        fm.addPoint((1e-3, 2e-3), 10e-6)
+        self.assertAlmostEqual(fm.getFocus((5e-3, -3e-3)), 10e-6)
+
+        # Two points => slope only along the line
+        fm.addPoint((3e-3, 2e-3), 20e-6)
+        self.assertAlmostEqual(fm.getFocus((2e-3, 2e-3)), 15e-6)
+        self.assertAlmostEqual(fm.getFocus((2e-3, 5e-3)), 15e-6)
+
+        # Same position => replaced
+        fm.addPoint((3e-3, 2e-3), 30e-6)
+        self.assertEqual(len(fm.points), 2)
+        self.assertAlmostEqual(fm.getFocus((3e-3, 2e-3)), 30e-6)
+
+    def test_plane(self):
+        """
+        A tilted sample is exactly fitted, and extrapolated
+        """
+        def z(x, y):
+            return 50e-6 + 0.01 * x - 0.02 * y
+
+        fm = focusmap.FocusMap(focusmap.FIT_PLANE)
+        for x, y in ((0, 0), (1e-3, 0), (0, 1e-3), (1e-3, 1e-3)):
+            fm.addPoint((x, y), z(x, y))
+
+        for x, y in ((0.5e-3, 0.5e-3), (0.2e-3, 0.9e-3), (-1e-3, 2e-3)):
+            self.assertAlmostEqual(fm.getFocus((x, y)), z(x, y), delta=1e-9)
+
+    def test_spline(self):
+        """
+        A curved sample is followed by the spline, but not by the plane
+        """
+        def z(x, y):
+            return 50e-6 + 20e-6 * math.sin(x / 1e-3) * math.cos(y / 1e-3)
+
+        fmp = focusmap.FocusMap(focusmap.FIT_PLANE)
+        fms = focusmap.FocusMap(focusmap.FIT_SPLINE)
+        for i in range(5):
+            for j in range(5):
+                x, y = i * 0.5e-3, j * 0.5e-3
+                fmp.addPoint((x, y), z(x, y))
+                fms.addPoint((x, y), z(x, y))
+
+        # Passes through the points
+        self.assertAlmostEqual(fms.getFocus((1e-3, 0.5e-3)), z(1e-3, 0.5e-3), delta=1e-9)
+
+        errp, errs = 0, 0
+        for x, y in ((0.25e-3, 0.25e-3), (1.25e-3, 0.75e-3), (1.75e-3, 1.25e-3)):
+            errp = max(errp, abs(fmp.getFocus((x, y)) - z(x, y)))
+            errs = max(errs, abs(fms.getFocus((x, y)) - z(x, y)))
+        logging.debug("Max error with plane = %g, spline = %g", errp, errs)
+        self.assertLess(errs, 1e-6)
+        self.assertLess(errs, errp / 4)
+
+        # Smoothing keeps the surface close to the points
+        fmss = focusmap.FocusMap(focusmap.FIT_SPLINE, smoothing=0.1)
+        for x, y, zp in fms.points:
+            fmss.addPoint((x, y), zp)
+        self.assertAlmostEqual(fmss.getFocus((1e-3, 1e-3)), z(1e-3, 1e-3), delta=5e-6)
+
+    def test_aligned_spline(self):
+        """
+        Aligned points cannot be fitted by a spline, but still work
+        """
+        fm = focusmap.FocusMap(focusmap.FIT_SPLINE)
+        for i in range(4):
+            fm.addPoint((i * 1e-3, 0), i * 1e-6)
+        self.assertAlmostEqual(fm.getFocus((1.5e-3, 0)), 1.5e-6, delta=1e-9)
+
+
+if __name__ == "__main__":
+    unittest.main()
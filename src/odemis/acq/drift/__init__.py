@@ -26,11 +26,14 @@ import itertools
 import logging
 import math
 import numpy
-from scipy import misc
 import threading
-import cv2
 
 from odemis.acq.align.shift import MeasureShift
+from odemis.util import lazy_import
+
+
+misc = lazy_import("scipy.misc")
+cv2 = lazy_import("cv2")
 
 MIN_RESOLUTION = (20, 20) # seems 10x10 sometimes work, but let's not tent it
 MAX_PIXELS = 128 ** 2  # px
@@ -646,6 +646,21 @@ class OpticalPathManager(object):
         return (list of futures)
         """
         fmoves = []
+        for comp, mv in self.getSelectorMoves(target):
+            logging.debug("Move %s added so %s targets to %s", mv, comp.name, target)
+            fmoves.append(comp.moveAbs(mv))
+
+        return fmoves
+
+    def getSelectorMoves(self, target):
+        """
+        Computes the moves of the selectors needed so that the optical path
+        leads to the target component (usually a detector). Nothing is moved.
+        target (str): component name
+        return (list of (Actuator, dict str -> value)): each selector to move,
+          with the position of its axes, in the order they should be moved.
+        """
+        moves = []
         for comp in self._actuators:
             # TODO: pre-cache this as comp/target -> axis/pos
             # TODO: don't do moves already done
@@ -668,12 +683,11 @@ class OpticalPathManager(object):
                 mv.update(comp_md[model.MD_FAV_POS_DEACTIVE])
 
             if mv:
-                logging.debug("Move %s added so %s targets to %s", mv, comp.name, target)
-                fmoves.append(comp.moveAbs(mv))
+                moves.append((comp, mv))
                 # make sure this component is also on the optical path
-                fmoves.extend(self.selectorsToPath(comp.name))
+                moves.extend(self.getSelectorMoves(comp.name))
 
-        return fmoves
+        return moves
 
     def guessMode(self, guess_stream):
         """
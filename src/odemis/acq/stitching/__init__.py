@@ -20,6 +20,8 @@ from odemis.acq.stitching._registrar import *
 from odemis.acq.stitching._weaver import *
 
 import copy
+import logging
+from odemis import model
 import random
 
 REGISTER_IDENTITY = 0
@@ -28,6 +30,67 @@ WEAVER_MEAN = 0
 WEAVER_COLLAGE = 1
 
 
+def _create_registrar(method):
+    if method == REGISTER_SHIFT:
+        return ShiftRegistrar()
+    elif method == REGISTER_IDENTITY:
+        return IdentityRegistrar()
+    else:
+        raise ValueError("Invalid registrar %s" % (method,))
+
+
+def _create_weaver(method):
+    if method == WEAVER_MEAN:
+        return MeanWeaver()
+    elif method == WEAVER_COLLAGE:
+        return CollageWeaver()
+    else:
+        raise ValueError("Invalid weaver %s" % (method,))
+
+
+def _addTileToRegistrar(registrar, ts):
+    """
+    ts (DataArray of shape YX or tuple of DataArrays): see register()
+    """
+    # Separate tile and dependent_tiles
+    if isinstance(ts, tuple):
+        registrar.addTile(ts[0], ts[1:])
+    else:
+        registrar.addTile(ts)
+
+
+def _updateTilePosition(registrar, ts, i):
+    """
+    Create a new tile (or tuple of tiles) with the position computed by the registrar
+    registrar (Registrar): registrar which has (at least) i+1 tiles
+    ts (DataArray of shape YX or tuple of DataArrays): the ith tile
+    i (int): index of the tile
+    return (DataArray of shape YX or tuple of DataArrays): ts with updated MD_POS
+    """
+    tile_pos, dep_tile_pos = registrar.getPositions()
+    # Return tuple of positions if dependent tiles are present
+    if isinstance(ts, tuple):
+        tile = ts[0]
+        dep_tiles = ts[1:]
+
+        # Update main tile
+        md = copy.deepcopy(tile.metadata)
+        md[model.MD_POS] = tile_pos[i]
+        tileUpd = model.DataArray(tile, md)
+
+        # Update dependent tiles
+        tilesNew = [tileUpd]
+        for j, dt in enumerate(dep_tiles):
+            md = copy.deepcopy(dt.metadata)
+            md[model.MD_POS] = dep_tile_pos[i][j]
+            tilesNew.append(model.DataArray(dt, md))
+        return tuple(tilesNew)
+    else:
+        md = copy.deepcopy(ts.metadata)
+        md[model.MD_POS] = tile_pos[i]
+        return model.DataArray(ts, md)
+
+
 def register(tiles, method=REGISTER_SHIFT):
     """
     tiles (list of DataArray of shape YX or tuples of DataArrays): The tiles to compute the registration. 
@@ -38,56 +101,14 @@ def register(tiles, method=REGISTER_SHIFT):
         tiles (list of DataArray of shape YX or tuples of DataArrays): The tiles as passed, but with updated 
         MD_POS metadata
     """
-
-    if method == REGISTER_SHIFT:
-        registrar = ShiftRegistrar()
-    elif method == REGISTER_IDENTITY:
-        registrar = IdentityRegistrar()
-    else:
-        raise ValueError("Invalid registrar %s" % (method,))
+    registrar = _create_registrar(method)
 
     # Register tiles
-    updatedTiles = []
     for ts in tiles:
-        # Separate tile and dependent_tiles
-        if isinstance(ts, tuple):
-            tile = ts[0]
-            dep_tiles = ts[1:]
-        else:
-            tile = ts
-            dep_tiles = None
-        registrar.addTile(tile, dep_tiles)
+        _addTileToRegistrar(registrar, ts)
 
     # Update positions
-    for i, ts in enumerate(tiles):
-        # Return tuple of positions if dependent tiles are present
-        if isinstance(ts, tuple):
-            tile = ts[0]
-            dep_tiles = ts[1:]
-
-            # Update main tile
-            md = copy.deepcopy(tile.metadata)
-            md[model.MD_POS] = registrar.getPositions()[0][i]
-            tileUpd = model.DataArray(tile, md)
-
-            # Update dependent tiles
-            tilesNew = [tileUpd]
-            for j, dt in enumerate(dep_tiles):
-                md = copy.deepcopy(dt.metadata)
-                md[model.MD_POS] = registrar.getPositions()[1][i][j]
-                tilesNew.append(model.DataArray(dt, md))
-            tileUpd = tuple(tilesNew)
-
-        else:
-            dep_tiles = None
-
-            md = copy.deepcopy(ts.metadata)
-            md[model.MD_POS] = registrar.getPositions()[0][i]
-            tileUpd = model.DataArray(ts, md)
-
-        updatedTiles.append(tileUpd)
-
-    return updatedTiles
+    return [_updateTilePosition(registrar, ts, i) for i, ts in enumerate(tiles)]
 
 
 def weave(tiles, method=WEAVER_MEAN):
@@ -98,13 +119,7 @@ def weave(tiles, method=WEAVER_MEAN):
     return:
         tiles (list of DataArray of shape YX or tuples of DataArrays): The tiles as passed, but with updated MD_POS metadata
     """
-
-    if method == WEAVER_MEAN:
-        weaver = MeanWeaver()
-    elif method == WEAVER_COLLAGE:
-        weaver = CollageWeaver()
-    else:
-        raise ValueError("Invalid weaver %s" % (method,))
+    weaver = _create_weaver(method)
 
     for t in tiles:
         weaver.addTile(t)
@@ -113,3 +128,86 @@ def weave(tiles, method=WEAVER_MEAN):
     return stitched_image
 
 
+class IncrementalStitcher(object):
+    """
+    Registers the tiles as soon as they are added: the shifts between
+    neighbour tiles are measured in separate threads, while the next tiles are
+    acquired. Once all the tiles are added, the positions are computed and the
+    tiles are passed to the weavers (one per stream). So the final images are
+    available shortly after the last tile is acquired.
+    As the positions are computed using all the tiles, it gives the same
+    result as register() + weave().
+    """
+
+    def __init__(self, register_method=REGISTER_SHIFT, weaver_method=WEAVER_MEAN):
+        """
+        register_method (REGISTER_*): registration method
+        weaver_method (WEAVER_*): weaving method
+        """
+        self._registrar = _create_registrar(register_method)
+        _create_weaver(weaver_method)  # Check the method is correct
+        self._weaver_method = weaver_method
+        self._tiles = []  # All the tiles added (DataArray or tuple of DataArrays)
+        self._nstreams = None  # Number of streams (per tile)
+        # Only one thread, so that the tiles are processed in order
+        self._executor = model.CancellableThreadPoolExecutor(max_workers=1)
+        self._futures = []
+
+    def addTile(self, tiles):
+        """
+        Schedule the registration of a new tile. Returns immediately.
+        The tiles must be added in the order they are acquired (see ShiftRegistrar.addTile()).
+        tiles (DataArray of shape YX or tuple of DataArrays): the tile, and
+          possibly its dependent tiles (see register()). If tuples are passed,
+          they must always have the same length.
+        return (Future): the future of the addition of the tile to the registrar.
+        """
+        f = self._executor.submit(self._registerTile, tiles, len(self._futures))
+        self._futures.append(f)
+        return f
+
+    def _registerTile(self, ts, i):
+        nstreams = len(ts) if isinstance(ts, tuple) else 1
+        if self._nstreams is None:
+            self._nstreams = nstreams
+        elif self._nstreams != nstreams:
+            raise ValueError("Tile %d has %d streams, while previous ones had %d" %
+                             (i, nstreams, self._nstreams))
+
+        # The shifts with the neighbours are measured in the background. The
+        # positions are only computed at the end, so that they are final when
+        # the tiles are woven.
+        _addTileToRegistrar(self._registrar, ts)
+        self._tiles.append(ts)
+        logging.debug("Added tile %d to registrar", i)
+
+    def getFullImages(self):
+        """
+        Wait for all the tiles to be registered, and weave them. No tile can be
+        added afterwards.
+        return (list of DataArray of shape YX): the stitched image of each stream,
+          in the same order as the tiles in the tuples passed.
+        raise: any error which happened during the registration
+        """
+        try:
+            for f in self._futures:
+                f.result()
+        finally:
+            self._executor.shutdown(wait=False)
+        self._futures = []
+
+        weavers = [_create_weaver(self._weaver_method) for _ in range(self._nstreams or 0)]
+        for i, ts in enumerate(self._tiles):
+            ts_reg = _updateTilePosition(self._registrar, ts, i)
+            if not isinstance(ts_reg, tuple):
+                ts_reg = (ts_reg,)
+            for w, t in zip(weavers, ts_reg):
+                w.addTile(t)
+        return [w.getFullImage() for w in weavers]
+
+    def cancel(self):
+        """
+        Cancel the registration of all the tiles not yet registered
+        """
+        self._executor.cancel()
+        self._executor.shutdown(wait=False)
@@ -21,20 +21,21 @@ You should have received a copy of the GNU General Public License along with Ode
 
 
 from __future__ import division
-from odemis.acq.drift import MeasureShift
-import numpy
+
+from concurrent.futures.thread import ThreadPoolExecutor
+import logging
 import math
+import multiprocessing
+import numpy
 from odemis import model
-import logging
+from odemis.acq.drift import MeasureShift
 
-BEST_MATCH = 0.9  # minimum match value indicating optimal shift value
-GOOD_MATCH = 0.2  # minimum match value indicating shift value can be used in the average position calculation
+GOOD_MATCH = 0.2  # minimum match value indicating shift value can be used in the position calculation
 # maximum percentage of overlap size indicating an extreme shift value that
 # should be aborted
 EXTREME_SHIFT = 0.6
-
-LEFT = 1  # direction in pos_to_left_right function
-RIGHT = -1
+# weight of the shift used when the shift measured is not a good match
+FALLBACK_WEIGHT = 0.01
 
 
 class IdentityRegistrar(object):
@@ -70,25 +71,22 @@ class IdentityRegistrar(object):
 
 class ShiftRegistrar(object):
     """
-    Locates the position of the image relative to the previous top tiles (horizontally and vertically) 
-    by using cross-correlation. The cross-correlation is done using just the part of the images which are 
-    supposed to be overlapping. In case the cross-correlation doesn't work (based on a couple of simple tests), 
-    fallback to the average shift on the same axis.
+    Locates the position of the image relative to its neighbour tiles (horizontally and vertically)
+    by using cross-correlation. The cross-correlation is done using just the part of the images which are
+    supposed to be overlapping. The shift of each pair of neighbours is measured in a separate thread,
+    as soon as both tiles are available. The positions of all the tiles are then computed at once, by
+    a weighted least-squares fit on all the shifts measured, so that an error on one pair doesn't
+    propagate to the rest of the row or column. In case the cross-correlation doesn't work (based on a
+    couple of simple tests), fallback to the shift expected from the metadata, with a low weight.
     """
 
     def __init__(self):
-        # arrays to store the vertical/horizontal shift values measured for
-        # each tile
         # initialize grid to 1x1. The size will increase as new tiles are
         # added.
         self.nx = 1
         self.ny = 1
-        self.coords_ver = [[None]]
-        self.coords_hor = [[None]]
-        self.shifts = [[None]]
+        self.shifts = [[None]]  # position of each tile (X, Y) in px, relative to the first tile
         self.tiles = [[None]]
-        self.last_ver = (0, 0)  # last vertical shift measured
-        self.last_hor = (0, 0)  # last horizontal shift measured
 
         # Initialize overlap. This will be modified after the second tile has been added.
         # A value is needed to avoid errors when calculating the position for
@@ -106,11 +104,15 @@ class ShiftRegistrar(object):
         self.posX = None  # int. Position of the current tile in the grid. (0,0) is the top left, posX
         # increases when moving to the right
         self.posY = None  # int. Y position, increases when moving down.
-        self.pos_prev_x = None  # int. X coordinate of previous tile. Used to determine whether
-        # the current tile should be compared to the right or to the left tile.
         self.osize = None  # int. Overlap size in pixels
         self.tsize = None  # int. Expected shift in pixels, distance between the centers of two tiles
 
+        # (row, col) of the left/top tile, (row, col) of the right/bottom tile -> Future
+        # returning the measured shift between the two tiles (see _measure_pair())
+        self._pairs = {}
+        self._solved = True  # True if the shifts are up-to-date with all the pairs
+        self._executor = None  # Created on the first measurement
+
     def addTile(self, tile, dependent_tiles=None):
         """
         Extends grid by one tile.
@@ -138,8 +140,6 @@ class ShiftRegistrar(object):
             self.px_size = tile.metadata[model.MD_PIXEL_SIZE]
             self.posX = 0
             self.posY = 0
-
-            self.pos_prev_x = 0  # used to determine if tile should be compared to right or left tile
         else:
             if tile.shape != self.tiles[0][0].shape:
                 raise ValueError("Tile shape differs from previous tile shapes %s != %s" %
@@ -173,25 +173,11 @@ class ShiftRegistrar(object):
                     self.posY = pos_prev[0]
                     self.posX = pos_prev[1] - 1
 
-            self.pos_prev_x = pos_prev[1]
             # Calculate overlap
             if abs(ver_diff) > abs(hor_diff):
-                size_meter = self.size[0] * self.px_size[1]
-                diff = abs(tile.metadata[model.MD_POS][1] - md_pos_prev[1])
-                self.ovrlp = abs(size_meter - diff) / size_meter
-                # self.size is given as YX, MD_POS as XY
-                self.osize = self.size[0] * \
-                    self.ovrlp  # overlap size in pixels
-                self.tsize = int(self.size[0] - self.osize)  # expected shift, distance between
-                # the centers of two tiles
+                self.ovrlp, self.osize, self.tsize = self._get_overlap(ver_diff, self.size[0], self.px_size[1])
             else:
-                size_meter = self.size[1] * self.px_size[0]
-                diff = abs(tile.metadata[model.MD_POS][0] - md_pos_prev[0])
-                self.ovrlp = abs(size_meter - diff) / size_meter
-
-                self.osize = self.size[1] * \
-                    self.ovrlp  # overlap size in pixels
-                self.tsize = int(self.size[1] - self.osize)
+                self.ovrlp, self.osize, self.tsize = self._get_overlap(hor_diff, self.size[1], self.px_size[0])
 
         for dt in dependent_tiles:
             sdt = numpy.subtract(dt.metadata[model.MD_POS], tile.metadata[model.MD_POS])
@@ -201,11 +187,14 @@ class ShiftRegistrar(object):
 
     def getPositions(self):
         """
+        Blocks until the shift of all the tiles added has been measured.
         returns:
         tile_positions (list of N tuples): the adjusted position in X/Y for each tile, in the order they were added
         dep_tile_positions (list of N tuples of K tuples of 2 floats): for each tile, it returns 
         the adjusted position of each dependent tile (in the order they were passed)
         """
+        self._solve_positions()
+
         firstPosition = numpy.divide(
             self.tiles[0][0].metadata[model.MD_POS], self.px_size)
         tile_positions = []
@@ -225,6 +214,24 @@ class ShiftRegistrar(object):
 
         return tile_positions, dep_tile_positions
 
+    def _get_overlap(self, diff, size, px_size):
+        """
+        Computes the overlap between two tiles
+        diff (float): distance between the centers of the tiles, in m
+        size (int): size of the tiles along the axis, in px
+        px_size (float): pixel size along the axis, in m
+        return:
+          ovrlp (0<=float): overlap ratio
+          osize (float): overlap size in pixels
+          tsize (int): expected shift, distance between the centers of two tiles
+        """
+        size_meter = size * px_size
+        ovrlp = abs(size_meter - abs(diff)) / size_meter
+        osize = size * ovrlp
+        # round, to not be off by one pixel due to floating point errors
+        tsize = int(round(size - osize))
+        return ovrlp, osize, tsize
+
     def _find_closest_tile(self, pos):
         """ finds the tile in the grid that is closest to pos.
         returns: 
@@ -248,13 +255,10 @@ class ShiftRegistrar(object):
             self.nx += 1
             for i in range(len(self.tiles)):
                 self.tiles[i].append(None)
-                self.coords_ver[i].append(None)
-                self.coords_hor[i].append(None)
                 self.shifts[i].append(None)
         else:
+            self.ny += 1
             self.tiles.append([None] * self.nx)
-            self.coords_ver.append([None] * self.nx)
-            self.coords_hor.append([None] * self.nx)
             self.shifts.append([None] * self.nx)
 
     def _estimateROI(self, shift):
@@ -283,17 +287,26 @@ class ShiftRegistrar(object):
 
         return (l1, t1, r1, b1), (l2, t2, r2, b2)
 
-    def _estimateMatch(self, imageA, imageB, shift=(0, 0)):
+    def _estimateMatch(self, imageA, imageB, shift=(0, 0), tsize=None, osize=None):
         """
         Returns an estimation of the similarity between the given images
         when the second is shifted by the shift value. It is used to assess 
         the quality of a shift measurement by giving the shifted image.
+        tsize (None or int): expected distance between the two tiles, in px.
+          If None, the one of the latest tile added is used.
+        osize (None or float): expected overlap size, in px. If None, the one
+          of the latest tile added is used.
         return (0 <= float<=1): the bigger, the more similar are the images
         """
+        if tsize is None:
+            tsize = self.tsize
+        if osize is None:
+            osize = self.osize
+
         # If case the shift is extreme, force the match to 0, to indicate
         # something is wrong
-        min_shift = math.sqrt(2) * (self.tsize - self.osize) - self.osize * EXTREME_SHIFT
-        max_shift = math.sqrt(2) * (self.tsize - self.osize) + self.osize * EXTREME_SHIFT
+        min_shift = math.sqrt(2) * (tsize - osize) - osize * EXTREME_SHIFT
+        max_shift = math.sqrt(2) * (tsize - osize) + osize * EXTREME_SHIFT
         if not min_shift <= math.hypot(*shift) <= max_shift:
             return 0
 
@@ -337,169 +350,49 @@ class ShiftRegistrar(object):
         [x, y] = MeasureShift(b, a)
         return x, y
 
-    def _mean_shift(self, row, col, coords_array):
+    def _measure_pair(self, tile1, tile2, exp_pos, horizontal):
         """
-        Returns the mean shift computed along the given row and column
+        Measures the shift between two neighbour tiles. Runs in a separate thread.
+        tile1 (DataArray of shape YX): the left or top tile
+        tile2 (DataArray of shape YX): the right or bottom tile
+        exp_pos (2 floats): position of tile2 relative to tile1, in px (X, Y),
+          according to the metadata
+        horizontal (bool): True if tile2 is on the right of tile1, False if it's
+          below tile1
+        return:
+          pos (2 floats): position of tile2 relative to tile1, in px (X, Y)
+          weight (0<float<=1): confidence in the position
         """
-        val = [coords_array[row][i] for i in range(1, col) if coords_array[row][i] is not None] + \
-              [coords_array[i][col]
-                  for i in range(1, row) if coords_array[i][col] is not None]
-        if not val:
-            raise ValueError("Not enough data to compute mean horizontal shift")
-        mean_x = int(sum(v[0] for v in val) / len(val))
-        mean_y = int(sum(v[1] for v in val) / len(val))
-        return mean_x, mean_y
-
-    def _pos_to_left_right(self, row, col, xdir):
-        """
-        Returns the position of the new tile after calculating the shift with the
-        neighbor on the left or right
-        xdir: LEFT, RIGHT
-        """
-        # shift compared to left
-        x, y = 0, 0
-
-        # calculate the shift compared to the neighbor on the left if possible
-        pos = None
-        match = 0
-
-        tile = self.tiles[row][col]
-        # the expected shift vector between the two tiles if the scanning would
-        # be ideal
-        exp_shift = (self.tsize, 0)
-
-        if (xdir == LEFT and col > 0) or (xdir == RIGHT and col < self.nx):
-            if xdir == LEFT:
-                prev_pos = self.shifts[row][col - 1]
-                prev_tile = self.tiles[row][col - 1]
-                x, y = self._get_shift(prev_tile, tile, exp_shift)
-            elif xdir == RIGHT:
-                prev_pos = self.shifts[row][col + 1]
-                prev_tile = self.tiles[row][col + 1]
-                x, y = self._get_shift(tile, prev_tile, exp_shift)
-                y = -y
-                x = -x
-            match = self._estimateMatch(
-                prev_tile, tile, (exp_shift[0] - x, exp_shift[1] - y))
-
-            if match < BEST_MATCH and (row > 1 or col > 1):
-                # if the shift calculated does not give a sufficient match,
-                # try the horizontal mean shift along this row and column if
-                # possible
-                try:
-                    mean_x, mean_y = self._mean_shift(row, col, self.coords_hor)
-                except ValueError:
-                    # if a mean value is not available try the last horizontal
-                    # shift measured
-                    mean_x, mean_y = self.last_hor
-                match_c = self._estimateMatch(prev_tile, tile,
-                                              (exp_shift[0] - mean_x, exp_shift[1] - mean_y))
-                if match_c > match:
-                    x, y = mean_x, mean_y
-                    match = match_c
-
-                if (mean_x, mean_y) != (0, 0):
-                    # try to calculate shift from here, maybe it works better
-                    # now
-                    drift = self._get_shift(
-                        prev_tile, tile, (exp_shift[0] - mean_x, exp_shift[1] - mean_y))
-                    mean_x += drift[0]
-                    mean_y += drift[1]
-                    match_c = self._estimateMatch(
-                        prev_tile, tile, (exp_shift[0] - mean_x, exp_shift[1] - mean_y))
-                    if match_c > match:
-                        x, y = mean_x, mean_y
-                        match = match_c
-
-            # store the new horizontal shift computed
-            self.last_hor = x, y
-            if match >= BEST_MATCH:
-                self.coords_hor[row][col] = x, y
-
-            # calculate the new position based on the shift with respect to the
-            # neighbour position (prev_pos)
-            if xdir == LEFT:
-                pos = (int(prev_pos[0] + (self.size[1] * (1 - self.ovrlp)) - x),
-                       int(prev_pos[1] - y))
-                if pos[0] < prev_pos[0]:
-                    logging.warning("Inserted tile to the wrong side (left instead of right)")
-            else:
-                pos = (int(prev_pos[0] - (self.size[1] * (1 - self.ovrlp)) - x),
-                       int(prev_pos[1] - y))
-                if pos[0] > prev_pos[0]:
-                    logging.warning("Inserted tile to the wrong side (right instead of left)")
-
-        return pos, match
-
-    def _pos_to_top(self, row, col):
-        """
-        Returns the position of the new tile after calculating the shift with the
-        neighbor on the top
-        """
-        # shift compared to top
-        x, y = 0, 0
-
-        # calculate the shift compared to the neighbor on the top if possible
-        pos = None
-        match = 0
-
-        tile = self.tiles[row][col]
-        # the expected shift vector between the two tiles if the scanning would
-        # be ideal
-        exp_shift = (0, self.tsize)
-        if row > 0:
-            prev_pos = self.shifts[row - 1][col]
-            prev_tile = self.tiles[row - 1][col]
-            x, y = self._get_shift(prev_tile, tile, exp_shift)
-            match = self._estimateMatch(
-                prev_tile, tile, (exp_shift[0] - x, exp_shift[1] - y))
-
-            if match < BEST_MATCH and (row > 1 or col > 1):
-                # if the shift calculated does not give a sufficient match,
-                # try the vertical mean shift along this row and column if
-                # possible
-                try:
-                    mean_x, mean_y = self._mean_shift(
-                        row, col, self.coords_ver)
-                except ValueError:
-                    # if a mean value is not available try the last vertical
-                    # shift measured
-                    mean_x, mean_y = self.last_ver
-                match_c = self._estimateMatch(
-                    prev_tile, tile, (exp_shift[0] - mean_x, exp_shift[1] - mean_y))
-                if match_c > match:
-                    x, y = mean_x, mean_y
-                    match = match_c
-
-                if (mean_x, mean_y) != (0, 0):
-                    # try to calculate shift from here, maybe it works better
-                    # now
-                    drift = self._get_shift(
-                        prev_tile, tile, (exp_shift[0] - mean_x, exp_shift[1] - mean_y))
-                    mean_x += drift[0]
-                    mean_y += drift[1]
-                    match_c = self._estimateMatch(
-                        prev_tile, tile, (exp_shift[0] - mean_x, exp_shift[1] - mean_y))
-                    if match_c > match:
-                        x, y = mean_x, mean_y
-                        match = match_c
-
-            # store the new vertical shift computed
-            self.last_ver = x, y
-            if match >= BEST_MATCH:
-                self.coords_ver[row][col] = x, y
-
-            # calculate the new position based on the shift with respect to the
-            # top neighbor position (prev_pos)
-            pos = (int(prev_pos[0] - x),
-                   int(prev_pos[1] + (self.size[0] * (1 - self.ovrlp)) - y))
-
-        return pos, match
+        if horizontal:
+            _, osize, tsize = self._get_overlap(exp_pos[0], self.size[1], 1)
+            # the expected shift vector between the two tiles if the scanning would
+            # be ideal
+            exp_shift = (tsize, 0)
+        else:
+            _, osize, tsize = self._get_overlap(exp_pos[1], self.size[0], 1)
+            exp_shift = (0, tsize)
+
+        x, y = self._get_shift(tile1, tile2, exp_shift)
+        pos = (exp_shift[0] - x, exp_shift[1] - y)
+        match = self._estimateMatch(tile1, tile2, pos, tsize, osize)
+        if match >= GOOD_MATCH:
+            return pos, match
+
+        # The cross-correlation might not have worked (eg, featureless tiles).
+        # If the shift is still plausible, keep it but with a low weight, so that
+        # any good measurement of the neighbours has precedence. Otherwise, rely
+        # on the metadata.
+        if math.hypot(pos[0] - exp_pos[0], pos[1] - exp_pos[1]) <= osize * EXTREME_SHIFT:
+            return pos, FALLBACK_WEIGHT
+        logging.debug("Shift measured %s with match %g, falling back to %s",
+                      pos, match, exp_pos)
+        return exp_pos, FALLBACK_WEIGHT
 
     def _compute_registration(self, tile, row, col):
         """
         Stitches one tile to the overall image. Tiles should be inserted in an
         order such that the previous top or previous left tiles have already been inserted.
+        The shift with each neighbour already present is measured asynchronously.
         tile (DataArray of shape YX): Tile to be stitched
         row (0<=int): Row of the tile position
         col (0<=int): Column of the tile position
@@ -507,54 +400,109 @@ class ShiftRegistrar(object):
         """
         if (row >= 1 and self.tiles[row - 1][col] is None) and (col >= 1 and self.tiles[row][col - 1] is None):
             raise ValueError(
-                "Trying to stitch image at %d,%d, while its previous image hasn't been stitched yet")
+                "Trying to stitch image at %d,%d, while its previous image hasn't been stitched yet" % (row, col))
         # store the tile
         self.tiles[row][col] = tile
+        self.acqOrder.append([row, col])
+        self._solved = False
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=multiprocessing.cpu_count())
+
+        md_pos = tile.metadata[model.MD_POS]
+        for nrow, ncol in ((row, col - 1), (row - 1, col), (row, col + 1), (row + 1, col)):
+            if not (0 <= nrow < len(self.tiles) and 0 <= ncol < self.nx):
+                continue
+            ntile = self.tiles[nrow][ncol]
+            if ntile is None:
+                continue
+
+            # Always measure from the left/top tile to the right/bottom one
+            n_md_pos = ntile.metadata[model.MD_POS]
+            exp_pos = ((md_pos[0] - n_md_pos[0]) / self.px_size[0],
+                       (n_md_pos[1] - md_pos[1]) / self.px_size[1])
+            if (nrow, ncol) < (row, col):
+                pair = ((nrow, ncol), (row, col))
+                args = ntile, tile, exp_pos
+            else:
+                pair = ((row, col), (nrow, ncol))
+                args = tile, ntile, (-exp_pos[0], -exp_pos[1])
+            self._pairs[pair] = self._executor.submit(self._measure_pair, *args,
+                                                      horizontal=(nrow == row))
 
-        # expected tile position, if there would be no shift
-        # we avoid using tsize to not loose precision due to rounding
-        ox = int(col * (self.size[1] * (1 - self.ovrlp)))
-        oy = int(row * (self.size[0] * (1 - self.ovrlp)))
-
-        pos = None
-        pos2 = None
-        match = 0
-        match2 = 0
-
-        if self.pos_prev_x < col:
-            if col != 0 and self.tiles[row][col - 1] is not None:
-                # calculate the shift compared to the neighbor on the left if
-                # possible
-                pos, match = self._pos_to_left_right(row, col, LEFT)
-        elif self.pos_prev_x > col:
-            if col != self.nx and self.tiles[row][col + 1] is not None:
-                # calculate the shift compared to the neighbor on the right if
-                # possible
-                pos, match = self._pos_to_left_right(row, col, RIGHT)
-
-        if row != 0 and self.tiles[row - 1][col] is not None:
-            # calculate the shift compared to the neighbor on the top if
-            # possible
-            pos2, match2 = self._pos_to_top(row, col)
-
-        # get rid of extreme values
-        if (pos is None) and (pos2 is None):
-            pos = (ox, oy)
-        elif (pos is None):
-            pos = pos2
-        elif (pos2 is None):
-            pass
-        elif match > GOOD_MATCH and match2 > GOOD_MATCH:
-            # if the match is not really bad, then take the average position
-            pos = (int((pos[0] + pos2[0]) / 2), int((pos[1] + pos2[1]) / 2))
-        elif match2 > match:
-            # otherwise just keep the best one
-            pos = pos2
-        elif match2 == 0 and match == 0:
-            # no good value, fall back to given position
-            pos = (ox, oy)
-
-        # store the position of the tile
-        self.shifts[row][col] = pos
+    def _get_md_shift(self, tile):
+        """
+        tile (DataArray): a tile
+        return (2 floats): the position of the tile relative to the first tile,
+          according to the metadata, in px (X, Y)
+        """
+        md_pos = tile.metadata[model.MD_POS]
+        md_pos0 = self.tiles[0][0].metadata[model.MD_POS]
+        return ((md_pos[0] - md_pos0[0]) / self.px_size[0],
+                (md_pos0[1] - md_pos[1]) / self.px_size[1])
 
-        self.acqOrder.append([row, col])
+    def _solve_positions(self):
+        """
+        Computes the position of every tile, based on the shifts between pairs
+        of tiles, and store them in .shifts. The position of the first tile is
+        fixed, and the other positions are the ones minimizing the weighted
+        squared difference with all the shifts measured (on each axis
+        independently). A tile without any measured neighbour (or a group of
+        tiles only connected to each other) keeps its position from the metadata.
+        """
+        if self._solved:
+            return
+
+        order = [tuple(ti) for ti in self.acqOrder]
+        idx = dict((ti, i) for i, ti in enumerate(order))
+        n = len(order)
+
+        # Normal equations of the weighted least-squares: L.P = B, where L is
+        # the (weighted) Laplacian of the graph of tile pairs.
+        lap = numpy.zeros((n, n))
+        rhs = numpy.zeros((n, 2))
+        neighbours = [[] for i in range(n)]
+        for (ti1, ti2), f in self._pairs.items():
+            pos, weight = f.result()
+            i1, i2 = idx[ti1], idx[ti2]
+            lap[i1, i1] += weight
+            lap[i2, i2] += weight
+            lap[i1, i2] -= weight
+            lap[i2, i1] -= weight
+            rhs[i2] += numpy.multiply(pos, weight)
+            rhs[i1] -= numpy.multiply(pos, weight)
+            neighbours[i1].append(i2)
+            neighbours[i2].append(i1)
+
+        # All the shifts are known, so the threads are not needed anymore
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+        # Each group of connected tiles is solved separately (otherwise L is
+        # singular). Within a group, the first tile acquired is the reference:
+        # it's fixed at its position according to the metadata (so the very first
+        # tile is at 0,0), and its row and column are dropped from the system.
+        positions = numpy.zeros((n, 2))
+        grouped = set()
+        for ref in range(n):
+            if ref in grouped:
+                continue
+            group = [ref]
+            grouped.add(ref)
+            for i in group:  # group grows while it's being iterated
+                for ni in neighbours[i]:
+                    if ni not in grouped:
+                        grouped.add(ni)
+                        group.append(ni)
+
+            positions[ref] = self._get_md_shift(self.tiles[order[ref][0]][order[ref][1]])
+            others = sorted(group[1:])
+            if others:
+                sublap = lap[numpy.ix_(others, others)]
+                subrhs = rhs[others] - numpy.outer(lap[others, ref], positions[ref])
+                positions[others] = numpy.linalg.solve(sublap, subrhs)
+
+        for (row, col), p in zip(order, positions):
+            self.shifts[row][col] = tuple(p)
+        self._solved = True
@@ -18,7 +18,7 @@ from __future__ import division
 
 import logging
 import numpy
-from odemis import model, util
+from odemis import model
 from odemis.util import img
 
 
@@ -30,21 +30,20 @@ from odemis.util import img
 # directly copy the image already transformed.
 # TODO: handle higher dimensions by just copying them as-is
 
-class CollageWeaver(object):
+class Weaver(object):
     """
-    Very straight-forward version, which just paste the images where their center
-    position is. It expects that the pixel size for all the images are identical.
-    It doesn't take into account the rotation and skew metadata.
-    tiles (iterable of 2D DataArray): each image must have at least MD_POS and
-      MD_PIXEL_SIZE metadata. They should all have the same dtype.
-    border (None or value): if there is a value, it's used around each image, to
-     highlight the position
-    return (2D DataArray): same dtype as the tiles, with shape corresponding to
-      the bounding box.
+    Base class for the weavers. It takes care of storing the tiles, of
+    computing their position in the global image and of allocating it.
+    Subclasses only have to implement _pasteTiles().
+    The memory used, on top of the tiles themselves, is the global image and a
+    few temporary arrays of the size of a tile. The global image can also be
+    stored in a memory-mapped file, in which case it can be bigger than the
+    memory available.
     """
 
     def __init__(self):
         self.tiles = []
+        self._bg = None  # minimum value of all the tiles, used as background
 
     def addTile(self, tile):
         """
@@ -57,66 +56,102 @@ class CollageWeaver(object):
         img.mergeMetadata(tile.metadata)
         self.tiles.append(tile)
 
-    def getFullImage(self):
+        # Keep track of the background value, to not have to go through all
+        # the tiles again at the end
+        tmin = tile.min()
+        if self._bg is None or tmin < self._bg:
+            self._bg = tmin
+
+    def _getBoundingBoxes(self):
         """
-        return (2D DataArray): same dtype as the tiles, with shape corresponding to the bounding box. 
+        Compute the bounding box of each tile and the global bounding box
+        return:
+          tbbx_px (numpy.array of shape Nx4 of int): ltrb of each tile, in
+            pixels, from the top-left of the global image.
+          gbbx_phy (4 floats): ltrb of the global image, in physical coordinates
         """
-
         tiles = self.tiles
 
-        # Compute the bounding box of each tile and the global bounding box
-
         # Get a fixed pixel size by using the first one
         # TODO: use the mean, in case they are all slightly different due to
         # correction?
         pxs = tiles[0].metadata[model.MD_PIXEL_SIZE]
 
-        tbbx_phy = []  # tuples of ltrb in physical coordinates
-        for t in tiles:
-            c = t.metadata[model.MD_POS]
-            w = t.shape[-1], t.shape[-2]
-            if not util.almost_equal(pxs[0], t.metadata[model.MD_PIXEL_SIZE][0], rtol=0.01):
-                logging.warning("Tile @ %s has a unexpected pixel size (%g vs %g)",
-                                c, t.metadata[model.MD_PIXEL_SIZE][0], pxs[0])
-            bbx = (c[0] - (w[0] * pxs[0] / 2), c[1] - (w[1] * pxs[1] / 2),
-                   c[0] + (w[0] * pxs[0] / 2), c[1] + (w[1] * pxs[1] / 2))
-
-            tbbx_phy.append(bbx)
+        pos = numpy.array([t.metadata[model.MD_POS] for t in tiles], dtype=numpy.float64)
+        # width, height of each tile
+        shapes = numpy.array([(t.shape[-1], t.shape[-2]) for t in tiles], dtype=numpy.int64)
+
+        # Same as util.almost_equal(), with rtol=0.01
+        tpxs = numpy.array([t.metadata[model.MD_PIXEL_SIZE][0] for t in tiles])
+        tol = numpy.maximum(1e-18, numpy.maximum(abs(tpxs), abs(pxs[0])) * 0.01)
+        for i in numpy.nonzero(abs(tpxs - pxs[0]) > tol)[0]:
+            logging.warning("Tile @ %s has a unexpected pixel size (%g vs %g)",
+                            tuple(pos[i]), tpxs[i], pxs[0])
+
+        # ltrb in physical coordinates (with "top" the max Y)
+        hsize_phy = shapes * pxs / 2
+        tbbx_phy = numpy.hstack((pos - hsize_phy, pos + hsize_phy))
+        gbbx_phy = (tbbx_phy[:, 0].min(), tbbx_phy[:, 1].min(),
+                    tbbx_phy[:, 2].max(), tbbx_phy[:, 3].max())
+
+        # Compute the bounding-boxes in pixel coordinates.
+        # The origin is the top-left (Y is max as Y is inverted). As all the
+        # values are positive, floor(x + 0.5) is the same as round(x).
+        glt = gbbx_phy[0], gbbx_phy[3]
+        lt = numpy.empty((len(tiles), 2), dtype=numpy.int64)
+        lt[:, 0] = numpy.floor((tbbx_phy[:, 0] - glt[0]) / pxs[0] + 0.5)
+        lt[:, 1] = numpy.floor(-(tbbx_phy[:, 3] - glt[1]) / pxs[1] + 0.5)
+        tbbx_px = numpy.hstack((lt, lt + shapes))
 
-        gbbx_phy = (min(b[0] for b in tbbx_phy), min(b[1] for b in tbbx_phy),
-                    max(b[2] for b in tbbx_phy), max(b[3] for b in tbbx_phy))
+        assert tbbx_px[:, 0].min() == tbbx_px[:, 1].min() == 0
 
-        # Compute the bounding-boxes in pixel coordinates
-        tbbx_px = []
+        return tbbx_px, gbbx_phy
 
-        # that's the origin (Y is max as Y is inverted)
-        glt = gbbx_phy[0], gbbx_phy[3]
-        for bp, t in zip(tbbx_phy, tiles):
-            lt = (int(round((bp[0] - glt[0]) / pxs[0])),
-                  int(round(-(bp[3] - glt[1]) / pxs[1])))
-            w = t.shape[-1], t.shape[-2]
-            bbx = (lt[0], lt[1],
-                   lt[0] + w[0], lt[1] + w[1])
-            tbbx_px.append(bbx)
+    def _createImage(self, shape, dtype, filename=None):
+        """
+        Allocate the global image, filled with the background value
+        shape (int, int): shape of the image
+        dtype (numpy.dtype)
+        filename (None or str): if not None, the image is stored in a
+          memory-mapped file at this path
+        return (numpy.ndarray or numpy.memmap)
+        """
+        logging.debug("Generating global image of size %dx%d px", shape[1], shape[0])
+        if filename is None:
+            im = numpy.empty(shape, dtype=dtype)
+        else:
+            im = numpy.memmap(filename, dtype=dtype, mode="w+", shape=shape)
+        # Use minimum of the values in the tiles for background
+        im[...] = self._bg
+        return im
 
-        gbbx_px = (min(b[0] for b in tbbx_px), min(b[1] for b in tbbx_px),
-                   max(b[2] for b in tbbx_px), max(b[3] for b in tbbx_px))
+    def _pasteTiles(self, im, tbbx_px):
+        """
+        Copy all the tiles into the global image
+        im (numpy.ndarray): the global image, filled with the background
+        tbbx_px (numpy.array of shape Nx4 of int): ltrb of each tile
+        """
+        raise NotImplementedError()
 
-        assert gbbx_px[0] == gbbx_px[1] == 0
+    def getFullImage(self, filename=None):
+        """
+        filename (None or str): if not None, the image is stored in a
+          memory-mapped file at this path, instead of in memory. This allows
+          to generate images bigger than the memory. The file contains just
+          the raw data, and can be deleted once the image is not used anymore.
+        return (2D DataArray): same dtype as the tiles, with shape corresponding to the bounding box.
+        """
+        tiles = self.tiles
+        tbbx_px, gbbx_phy = self._getBoundingBoxes()
+        gshape = int(tbbx_px[:, 3].max()), int(tbbx_px[:, 2].max())
 
-        if numpy.greater(gbbx_px[-2:], 4 * numpy.sum(tbbx_px[-2:])).any():
+        tarea = numpy.prod(tbbx_px[:, 2:] - tbbx_px[:, :2], axis=1, dtype=numpy.float64)
+        if gshape[0] * gshape[1] > 4 * tarea.sum():
             # Overlap > 50% or missing tiles
             logging.warning("Global area much bigger than sum of tile areas")
 
-        # Paste each tile
-        logging.debug("Generating global image of size %dx%d px",
-                      gbbx_px[-2], gbbx_px[-1])
-        im = numpy.empty((gbbx_px[-1], gbbx_px[-2]), dtype=tiles[0].dtype)
-        # Use minimum of the values in the tiles for background
-        im[:] = numpy.amin(tiles)
-        for b, t in zip(tbbx_px, tiles):
-            im[b[1]:b[1] + t.shape[0], b[0]:b[0] + t.shape[1]] = t
-            # TODO: border
+        im = self._createImage(gshape, tiles[0].dtype, filename)
+        self._pasteTiles(im, tbbx_px)
 
         # Update metadata
         # TODO: check this is also correct based on lt + half shape * pxs
@@ -128,76 +163,76 @@ class CollageWeaver(object):
         return model.DataArray(im, md)
 
 
-class MeanWeaver(object):
+class CollageWeaver(Weaver):
+    """
+    Very straight-forward version, which just paste the images where their center
+    position is. It expects that the pixel size for all the images are identical.
+    It doesn't take into account the rotation and skew metadata.
+    """
+
+    def _pasteTiles(self, im, tbbx_px):
+        for b, t in zip(tbbx_px, self.tiles):
+            im[b[1]:b[3], b[0]:b[2]] = t
+            # TODO: border
+
+
+class MeanWeaver(Weaver):
     """
     Pixels of the final image which are corresponding to several tiles are computed as an 
     average of the pixel of each tile.
     """
 
     def __init__(self):
-        self.tiles = []
-
-    def addTile(self, tile):
-        # Merge the correction metadata inside each image (to keep the rest of the
-        # code simple)
-        tile = model.DataArray(tile, tile.metadata.copy())
-        img.mergeMetadata(tile.metadata)
-        self.tiles.append(tile)
+        super(MeanWeaver, self).__init__()
+        self._weights = {}  # shape -> 2D array of float: cache of the weights
 
-    def getFullImage(self):
+    def _getWeights(self, shape):
         """
-        return (2D DataArray): same dtype as the tiles, with shape corresponding to the bounding box. 
+        Create weight matrix with decreasing values from its center that
+        has the same size as the tile.
+        shape (int, int): shape of the tile
+        return (2D array of float): weight of the image already present, between 0 and 1
         """
-        tiles = self.tiles
-
-        # Compute the bounding box of each tile and the global bounding box
-
-        # Get a fixed pixel size by using the first one
-        # TODO: use the mean, in case they are all slightly different due to
-        # correction?
-        pxs = tiles[0].metadata[model.MD_PIXEL_SIZE]
-
-        tbbx_phy = []  # tuples of ltrb in physical coordinates
-        for t in tiles:
-            c = t.metadata[model.MD_POS]
-            w = t.shape[-1], t.shape[-2]
-            if not util.almost_equal(pxs[0], t.metadata[model.MD_PIXEL_SIZE][0], rtol=0.01):
-                logging.warning("Tile @ %s has a unexpected pixel size (%g vs %g)",
-                                c, t.metadata[model.MD_PIXEL_SIZE][0], pxs[0])
-            bbx = (c[0] - (w[0] * pxs[0] / 2), c[1] - (w[1] * pxs[1] / 2),
-                   c[0] + (w[0] * pxs[0] / 2), c[1] + (w[1] * pxs[1] / 2))
-
-            tbbx_phy.append(bbx)
-
-        gbbx_phy = (min(b[0] for b in tbbx_phy), min(b[1] for b in tbbx_phy),
-                    max(b[2] for b in tbbx_phy), max(b[3] for b in tbbx_phy))
-
-        # Compute the bounding-boxes in pixel coordinates
-        tbbx_px = []
-
-        # that's the origin (Y is max as Y is inverted)
-        glt = gbbx_phy[0], gbbx_phy[3]
-        for bp, t in zip(tbbx_phy, tiles):
-            lt = (int(round((bp[0] - glt[0]) / pxs[0])),
-                  int(round(-(bp[3] - glt[1]) / pxs[1])))
-            w = t.shape[-1], t.shape[-2]
-            bbx = (lt[0], lt[1],
-                   lt[0] + w[0], lt[1] + w[1])
-            tbbx_px.append(bbx)
-
-        gbbx_px = (min(b[0] for b in tbbx_px), min(b[1] for b in tbbx_px),
-                   max(b[2] for b in tbbx_px), max(b[3] for b in tbbx_px))
-
-        assert gbbx_px[0] == gbbx_px[1] == 0
-        if numpy.greater(gbbx_px[-2:], 4 * numpy.sum(tbbx_px[-2:])).any():
-            # Overlap > 50% or missing tiles
-            logging.warning("Global area much bigger than sum of tile areas")
-
+        try:
+            return self._weights[shape]
+        except KeyError:
+            pass
+
+        hh, hw = numpy.divide(shape, 2)  # half-height, half-width
+        # Deal with even/odd tile sizes
+        if shape[1] % 2 == 0:
+            x = numpy.arange(-hw, hw, 1)
+        else:
+            x = numpy.arange(-hw, hw + 1, 1)
+
+        if shape[0] % 2 == 0:
+            y = numpy.arange(-hh, hh, 1)
+        else:
+            y = numpy.arange(-hh, hh + 1, 1)
+
+        xx, yy = numpy.meshgrid((x / hw) ** 6, (y / hh) ** 6)
+        w = numpy.maximum(xx, yy)
+        # Hardcoding a weight function is quite arbitrary and might result in
+        # suboptimal solutions in some cases.
+        # Alternatively, different weights might be used. One option would be to select
+        # a fixed region on the sides of the image, e.g. 20% (expected overlap), and
+        # only apply a (linear) gradient to these parts, while keeping the new tile for the
+        # rest of the region. However, this approach does not solve the hardcoding problem
+        # since the overlap region is still arbitrary. Future solutions might adaptively
+        # select the this region.
+
+        # Typically, all the tiles have the same shape, so it's computed only once
+        self._weights[shape] = w
+        return w
+
+    def _pasteTiles(self, im, tbbx_px):
         # Weave tiles by using a smooth gradient. The part of the tile that does not overlap
         # with any previous tiles is inserted into the part of the
         # ovv image that is still empty. This part is determined by a mask, which indicates
-        # the parts of the image that already contain image data (True) and the ones that are still
-        # empty (False). For the overlapping parts, the tile is multiplied with weights corresponding
+        # the parts of the tile window that already contain image data (True) and the ones
+        # that are still empty (False). It is computed from the bounding boxes of the
+        # previous tiles, so that no mask of the size of the global image is needed.
+        # For the overlapping parts, the tile is multiplied with weights corresponding
         # to a gradient that has its maximum at the center of the tile and
         # smoothly decreases toward the edges. The function for creating the weights is
         # a distance measure resembling the maximum-norm, i.e. equidistant points lie
@@ -209,65 +244,29 @@ class MeanWeaver(object):
         # complementary weights (1 -  weights) and the weighted overlapping parts of the new tile and
         # the ovv image are added, so the resulting image contains a gradient in the overlapping regions
         # between all the tiles that have been inserted before and the newly inserted tile.
-
-        # Paste each tile
-        logging.debug("Generating global image of size %dx%d px",
-                      gbbx_px[-2], gbbx_px[-1])
-        im = numpy.empty((gbbx_px[-1], gbbx_px[-2]), dtype=tiles[0].dtype)
-        # Use minimum of the values in the tiles for background
-        im[:] = numpy.amin(tiles)
-
-        # The mask is multiplied with the tile, thereby creating a tile with a gradient
-        mask = numpy.zeros((gbbx_px[-1], gbbx_px[-2]), dtype=numpy.bool)
-
-        for b, t in zip(tbbx_px, tiles):
+        for i, (b, t) in enumerate(zip(tbbx_px, self.tiles)):
             # Part of image overlapping with tile
-            roi = im[b[1]:b[1] + t.shape[0], b[0]:b[0] + t.shape[1]]
-            moi = mask[b[1]:b[1] + t.shape[0], b[0]:b[0] + t.shape[1]]
+            roi = im[b[1]:b[3], b[0]:b[2]]
+
+            # Find the previous tiles which overlap with this one
+            prev = tbbx_px[:i]
+            ilt = numpy.maximum(prev[:, :2], b[:2]) - b[:2]
+            irb = numpy.minimum(prev[:, 2:], b[2:]) - b[:2]
+            overlapping = numpy.all(irb > ilt, axis=1)
+            if not overlapping.any():
+                # Insert the whole image, as it's still empty
+                roi[...] = t
+                continue
+
+            # Mask of the pixels already containing data
+            moi = numpy.zeros(t.shape, dtype=numpy.bool)
+            for l, t_, r, b_ in numpy.hstack((ilt, irb))[overlapping]:
+                moi[t_:b_, l:r] = True
 
             # Insert image at positions that are still empty
             roi[~moi] = t[~moi]
 
             # Create gradient in overlapping region. Ratio between old image and new tile values determined by
             # distance to the center of the tile
-
-            # Create weight matrix with decreasing values from its center that
-            # has the same size as the tile.
-            hh, hw = numpy.divide(roi.shape, 2)  # half-height, half-width
-            # Deal with even/odd tile sizes
-            sz = roi.shape
-            if sz[1] % 2 == 0:
-                x = numpy.arange(-hw, hw, 1)
-            else:
-                x = numpy.arange(-hw, hw + 1, 1)
-
-            if sz[0] % 2 == 0:
-                y = numpy.arange(-hh, hh, 1)
-            else:
-                y = numpy.arange(-hh, hh + 1, 1)
-
-            xx, yy = numpy.meshgrid((x / hw) ** 6, (y / hh) ** 6)
-            w = numpy.maximum(xx, yy)
-            # Hardcoding a weight function is quite arbitrary and might result in
-            # suboptimal solutions in some cases.
-            # Alternatively, different weights might be used. One option would be to select
-            # a fixed region on the sides of the image, e.g. 20% (expected overlap), and
-            # only apply a (linear) gradient to these parts, while keeping the new tile for the
-            # rest of the region. However, this approach does not solve the hardcoding problem
-            # since the overlap region is still arbitrary. Future solutions might adaptively
-            # select the this region.
-
-            # Use weights to create gradient in overlapping region
-            roi[moi] = (t * (1 - w))[moi] + (roi * w)[moi]
-
-            # Update mask
-            mask[b[1]:b[1] + t.shape[0], b[0]:b[0] + t.shape[1]] = True
-
-        # Update metadata
-        # TODO: check this is also correct based on lt + half shape * pxs
-        c_phy = ((gbbx_phy[0] + gbbx_phy[2]) / 2,
-                 (gbbx_phy[1] + gbbx_phy[3]) / 2)
-        md = tiles[0].metadata.copy()
-        md[model.MD_POS] = c_phy
-
-        return model.DataArray(im, md)
+            w = self._getWeights(t.shape)[moi]
+            roi[moi] = t[moi] * (1 - w) + roi[moi] * w
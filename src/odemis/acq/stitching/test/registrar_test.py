@@ -554,6 +554,50 @@ class TestShiftRegistrar(unittest.TestCase):
                     self.assertAlmostEqual(dep_tile[0], p[0] + r1 * px_size[0])
                     self.assertAlmostEqual(dep_tile[1], p[1] + r2 * px_size[1])
 
+    def test_grid_no_drift(self):
+        """
+        Test on a large grid of tiles with random shifts: the error shouldn't
+        accumulate along the rows and columns.
+        """
+        rng = numpy.random.RandomState(1)
+        num = 8
+        tsize = 200
+        step = int(tsize * 0.8)  # 20% overlap
+        jitter = 6  # px
+        px_size = 1e-6
+
+        # Random structures of a few pixels large
+        shape = (step * (num - 1) + tsize + 4 * jitter,) * 2
+        kx = numpy.fft.fftfreq(shape[1])[numpy.newaxis, :]
+        ky = numpy.fft.fftfreq(shape[0])[:, numpy.newaxis]
+        img = numpy.fft.ifft2(numpy.fft.fft2(rng.rand(*shape)) * numpy.exp(-(kx ** 2 + ky ** 2) * 200)).real
+        img = ((img - img.min()) * (4000 / img.ptp())).astype(numpy.uint16)
+
+        tiles = []
+        pos = []
+        for r in range(num):
+            # zigzag
+            cols = range(num) if r % 2 == 0 else range(num - 1, -1, -1)
+            for c in cols:
+                x, y = rng.randint(-jitter, jitter + 1, 2) + 2 * jitter + (c * step, r * step)
+                md = {
+                    model.MD_PIXEL_SIZE: (px_size, px_size),
+                    model.MD_POS: ((c * step + tsize / 2) * px_size, -(r * step + tsize / 2) * px_size),
+                }
+                tiles.append(model.DataArray(img[y:y + tsize, x:x + tsize], md))
+                pos.append(((x + tsize / 2) * px_size, -(y + tsize / 2) * px_size))
+
+        registrar = ShiftRegistrar()
+        for t in tiles:
+            registrar.addTile(t)
+        tile_pos = registrar.getPositions()[0]
+
+        # Compare relative to the first tile, as it's the reference
+        for tp, p in zip(tile_pos, pos):
+            diff = numpy.subtract(numpy.subtract(tp, tile_pos[0]), numpy.subtract(p, pos[0]))
+            self.assertLessEqual(abs(diff[0]), 2 * px_size, "%s != %s" % (tp, p))
+            self.assertLessEqual(abs(diff[1]), 2 * px_size, "%s != %s" % (tp, p))
+
 
 if __name__ == '__main__':
     unittest.main()
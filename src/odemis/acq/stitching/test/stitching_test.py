@@ -26,7 +26,8 @@ import copy
 import numpy
 from odemis import model
 import odemis
-from odemis.acq.stitching import register, weave, REGISTER_IDENTITY, REGISTER_SHIFT, WEAVER_COLLAGE, WEAVER_MEAN
+from odemis.acq.stitching import register, weave, REGISTER_IDENTITY, REGISTER_SHIFT, WEAVER_COLLAGE, WEAVER_MEAN, \
+    IncrementalStitcher
 from odemis.dataio import find_fittest_converter
 from odemis.util.img import ensure2DImage
 import os
@@ -233,6 +234,49 @@ class TestWeave(unittest.TestCase):
                     numpy.testing.assert_allclose(w, img[:sz, :sz], rtol=1)
 
 
+class TestIncrementalStitcher(unittest.TestCase):
+
+    def test_same_as_register_weave(self):
+        """
+        Check the incremental stitching gives the same result as register + weave
+        """
+        for img in IMGS:
+            conv = find_fittest_converter(img)
+            data = conv.read_data(img)[0]
+            img = ensure2DImage(data)
+            [tiles, _] = decompose_image(img, 0.2, 3, "horizontalZigzag")
+
+            all_tiles = [(t, t) for t in tiles]
+            exp_tiles = register(all_tiles)
+            exp_ims = [weave([ts[s] for ts in exp_tiles], WEAVER_MEAN) for s in range(2)]
+
+            stitcher = IncrementalStitcher(REGISTER_SHIFT, WEAVER_MEAN)
+            for ts in all_tiles:
+                stitcher.addTile(ts)
+            ims = stitcher.getFullImages()
+
+            self.assertEqual(len(ims), 2)
+            for im, exp_im in zip(ims, exp_ims):
+                numpy.testing.assert_array_equal(im, exp_im)
+                self.assertEqual(im.metadata[model.MD_POS], exp_im.metadata[model.MD_POS])
+
+    def test_wrong_streams(self):
+        """
+        Tiles with a different number of streams are refused
+        """
+        img = numpy.zeros((256, 256), dtype=numpy.uint16)
+        md = {model.MD_PIXEL_SIZE: (1e-6, 1e-6), model.MD_POS: (0, 0)}
+        tile = model.DataArray(img, md)
+
+        stitcher = IncrementalStitcher(REGISTER_IDENTITY, WEAVER_COLLAGE)
+        stitcher.addTile((tile, tile))
+        f = stitcher.addTile((tile,))
+        with self.assertRaises(ValueError):
+            f.result()
+        with self.assertRaises(ValueError):
+            stitcher.getFullImages()
+
+
 def decompose_image(img, overlap=0.1, numTiles=5, method="horizontalLines", shift=True):
     """
     Decomposes image into tiles for testing. The tiles overlap and their center positions are subject to random noise.
@@ -31,6 +31,7 @@ from odemis.dataio import find_fittest_converter
 from odemis.util.img import ensure2DImage
 import os
 import random
+import tempfile
 import time
 import unittest
 
@@ -299,6 +300,40 @@ class TestMeanWeaver(unittest.TestCase):
             # value than the value of the right pixel
             self.assertLess(row[-1], row[0])
 
+    def test_memmap(self):
+        """
+        Test the global image can be stored in a memory-mapped file, with
+        exactly the same result as in memory
+        """
+        img = numpy.arange(300 * 400, dtype=numpy.uint16).reshape(300, 400)
+        md = {
+            model.MD_PIXEL_SIZE: (1e-6, 1e-6),  # m/px
+        }
+        tiles = []
+        for x, y in ((0, 0), (150, 0), (0, 100), (150, 100)):
+            tmd = md.copy()
+            tmd[model.MD_POS] = ((x + 125) * 1e-6, -(y + 100) * 1e-6)
+            tiles.append(model.DataArray(img[y:y + 200, x:x + 250], tmd))
+
+        weaver = MeanWeaver()
+        for t in tiles:
+            weaver.addTile(t)
+
+        exp_out = weaver.getFullImage()
+        fd, fn = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            outd = weaver.getFullImage(filename=fn)
+            self.assertEqual(outd.shape, (300, 400))
+            numpy.testing.assert_array_equal(outd, exp_out)
+            # Each pixel is present in every tile with the same value (but the
+            # blending may round it down)
+            numpy.testing.assert_allclose(outd, img, atol=1)
+            self.assertEqual(outd.metadata[model.MD_POS], exp_out.metadata[model.MD_POS])
+            del outd
+        finally:
+            os.remove(fn)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -32,12 +32,14 @@ import numpy
 from odemis import model
 from odemis.acq import calibration
 from odemis.model import MD_POS, MD_PIXEL_SIZE, VigilantAttribute
-from odemis.util import img, conversion, polar, spectrum
-from scipy import ndimage
+from odemis.util import img, conversion, polar, spectrum, lazy_import
 
 from ._base import Stream
 
 
+ndimage = lazy_import("scipy.ndimage")
+
+
 class StaticStream(Stream):
     """
     Stream containing one static image.
@@ -70,6 +70,11 @@ from ._base import Stream, POL_6POS, POL_POSITIONS
 EBEAM_DETECTORS = ("se-detector", "bs-detector", "cl-detector", "monochromator",
                    "ebic-detector")
 
+# Maximum number of CCD images waiting to be preprocessed. When the
+# preprocessing is slower than the acquisition, the acquisition is slowed down
+# to not use too much memory.
+PREPROCESS_QUEUE_SIZE = 4
+
 
 class MultipleDetectorStream(Stream):
     """
@@ -783,6 +788,7 @@ class SEMCCDMDStream(MultipleDetectorStream):
         self._ccd_df = s1._dataflow
         self._trigger = self._ccd.softwareTrigger
         self._ccd_idx = len(self._streams) - 1  # optical detector is always last in streams
+        self._prep_thread = None  # Thread preprocessing the CCD data during acquisition
 
     def _estimateRawAcquisitionTime(self):
         """
@@ -885,6 +891,107 @@ class SEMCCDMDStream(MultipleDetectorStream):
 
         self._raw.append(da)
 
+    def _startPreprocessing(self):
+        """
+        Start the thread which preprocesses the CCD data, in parallel of the
+        acquisition.
+        """
+        self._prep_queue = Queue.Queue(maxsize=PREPROCESS_QUEUE_SIZE)
+        self._prep_error = None
+        self._prep_thread = threading.Thread(target=self._preprocessingLoop,
+                                             name="Preprocessing of %s" % (self.name.value,))
+        self._prep_thread.daemon = True
+        self._prep_thread.start()
+
+    def _preprocessingLoop(self):
+        """
+        Preprocess the CCD data queued, and replace the raw data with the
+        result, until None is received.
+        """
+        q = self._prep_queue
+        while True:
+            item = q.get()
+            try:
+                if item is None:
+                    return
+                if self._prep_error is not None:
+                    continue  # Just empty the queue
+                das, i, data, px_idx = item
+                try:
+                    pdata = self._preprocessData(self._ccd_idx, data, px_idx)
+                    # Only store it if it's still the same data (ie, the list
+                    # hasn't been reset)
+                    if i < len(das) and das[i] is data:
+                        das[i] = pdata
+                    logging.debug("Processed CCD data %d = %s", i, px_idx)
+                except Exception as ex:
+                    logging.exception("Failed to preprocess data of pixel %s", px_idx)
+                    self._prep_error = ex
+            finally:
+                q.task_done()
+
+    def _queuePreprocessing(self, px_idx):
+        """
+        Queue the latest CCD data for preprocessing. It is replaced by the
+        preprocessed data in ._acq_data, asynchronously.
+        px_idx (int, int): current scanning position of the ebeam
+        raise Exception: if a previous preprocessing failed
+        """
+        if self._prep_error is not None:
+            raise self._prep_error
+        das = self._acq_data[self._ccd_idx]
+        # Blocks if the queue is full
+        self._prep_queue.put((das, len(das) - 1, das[-1], px_idx))
+
+    def _waitPreprocessing(self):
+        """
+        Wait for all the queued data to be preprocessed, so that ._acq_data
+        only contains preprocessed data.
+        raise Exception: if a preprocessing failed
+        """
+        self._prep_queue.join()
+        if self._prep_error is not None:
+            raise self._prep_error
+
+    def _stopPreprocessing(self):
+        """
+        Wait for all the queued data to be preprocessed, and stop the thread.
+        raise Exception: if a preprocessing failed
+        """
+        if self._prep_thread is None:
+            return
+        self._prep_queue.put(None)
+        self._prep_thread.join()
+        self._prep_thread = None
+        if self._prep_error is not None:
+            raise self._prep_error
+
+    def _getSpotTranslation(self, spot_pos, px_idx, trans_rng):
+        """
+        Compute the e-beam translation of a given pixel, with the drift correction
+        spot_pos (numpy.array): position of each pixel, as returned by
+          _getSpotPositions()
+        px_idx (int, int): Y/X index of the pixel
+        trans_rng (tuple of 2 tuples of floats): min/max translation
+        return (float, float): the translation (clipped to the range)
+        """
+        trans = tuple(spot_pos[px_idx])  # spot position
+
+        # take care of drift
+        if self._dc_estimator:
+            trans = (trans[0] - self._dc_estimator.tot_drift[0],
+                     trans[1] - self._dc_estimator.tot_drift[1])
+        # Clip locally, instead of calling the (remote) VA at every pixel
+        cptrans = tuple(min(max(l, t), h) for t, l, h in zip(trans, trans_rng[0], trans_rng[1]))
+        if cptrans != trans:
+            if self._dc_estimator:
+                logging.error("Drift of %s px caused acquisition region out "
+                              "of bounds: needed to scan spot at %s.",
+                              self._dc_estimator.tot_drift, trans)
+            else:
+                logging.error("Unexpected clipping in the scan spot position %s", trans)
+        return cptrans
+
     def _runAcquisition(self, future):
         """
         Acquires images from the multiple detectors via software synchronisation.
@@ -919,6 +1026,11 @@ class SEMCCDMDStream(MultipleDetectorStream):
             tot_num = numpy.prod(rep)  # total number of pixels
             sub_pxs = self._emitter.pixelSize.value  # sub-pixel size
 
+            trans_rng = self._emitter.translation.range
+            logging.debug("Scanning resolution is %s and scale %s",
+                          self._emitter.resolution.value,
+                          self._emitter.scale.value)
+
             self._acq_data = [[] for _ in self._streams]  # just to be sure it's really empty
             self._raw = []
             self._anchor_raw = []
@@ -956,10 +1068,19 @@ class SEMCCDMDStream(MultipleDetectorStream):
             # retrigger, or unsynchronise/resynchronise just before the end of
             # last scan).
 
+            # To reduce the overhead per pixel, the acquisition is pipelined:
+            # * The CCD data is preprocessed (and its raw data dropped) by a
+            #   separate thread, via a bounded queue.
+            # * As soon as the SEM data is received, the e-beam is moved to the
+            #   next spot, while the CCD data is being handled.
+            # * The spot positions are computed locally (without accessing the
+            #   remote VAs).
+
             # prepare detector
             self._ccd_df.synchronizedOn(self._trigger)
             # subscribe to last entry in _subscribers (optical detector)
             self._ccd_df.subscribe(self._subscribers[self._ccd_idx])
+            self._startPreprocessing()
 
             # Instead of subscribing/unsubscribing to the SEM for each pixel,
             # we've tried to keep subscribed, but request to be unsynchronised/
@@ -989,37 +1110,31 @@ class SEMCCDMDStream(MultipleDetectorStream):
                 n = 0  # number of points (ebeam positions) acquired so far
 
                 # iterate over pixel positions for scanning
-                for px_idx in numpy.ndindex(*rep[::-1]):  # last dim (X) iterates first
-                    trans = tuple(spot_pos[px_idx])  # spot position
-
-                    # take care of drift
-                    if self._dc_estimator:
-                        trans = (trans[0] - self._dc_estimator.tot_drift[0],
-                                 trans[1] - self._dc_estimator.tot_drift[1])
-                    cptrans = self._emitter.translation.clip(trans)
-                    if cptrans != trans:
-                        if self._dc_estimator:
-                            logging.error("Drift of %s px caused acquisition region out "
-                                          "of bounds: needed to scan spot at %s.",
-                                          self._dc_estimator.tot_drift, trans)
-                        else:
-                            logging.error("Unexpected clipping in the scan spot position %s", trans)
-                    self._emitter.translation.value = cptrans
-                    logging.debug("E-beam spot after drift correction: %s",
-                                  self._emitter.translation.value)
-                    logging.debug("Scanning resolution is %s and scale %s",
-                                  self._emitter.resolution.value,
-                                  self._emitter.scale.value)
+                px_idxs = list(numpy.ndindex(*rep[::-1]))  # last dim (X) iterates first
+                spot_ready = False  # True if the e-beam is already at the spot
+                for i, px_idx in enumerate(px_idxs):
+                    if not spot_ready:
+                        cptrans = self._getSpotTranslation(spot_pos, px_idx, trans_rng)
+                        self._emitter.translation.value = cptrans
+                    logging.debug("E-beam spot after drift correction: %s", cptrans)
+
+                    # The next spot (without drift change)
+                    if i + 1 < len(px_idxs):
+                        cptrans = self._getSpotTranslation(spot_pos, px_idxs[i + 1], trans_rng)
+                    else:
+                        cptrans = None
 
                     # acquire
-                    self._acquireImage(n, pol_pos, px_idx, px_time, sem_time, sub_pxs,
-                                       tot_num, leech_time_ppx, leech_np, future)
+                    spot_ready = self._acquireImage(n, pol_pos, px_idx, px_time, sem_time, sub_pxs,
+                                                    tot_num, leech_time_ppx, leech_np, future,
+                                                    next_trans=cptrans)
                     n += 1
 
             # acquisition done!
             for s, sub in zip(self._streams, self._subscribers):
                 s._dataflow.unsubscribe(sub)
             self._ccd_df.synchronizedOn(None)
+            self._stopPreprocessing()
 
             with self._acq_lock:
                 if self._acq_state == CANCELLED:
@@ -1042,6 +1157,10 @@ class SEMCCDMDStream(MultipleDetectorStream):
             for s, sub in zip(self._streams, self._subscribers):
                 s._dataflow.unsubscribe(sub)
             self._ccd_df.synchronizedOn(None)
+            try:
+                self._stopPreprocessing()
+            except Exception:
+                pass  # Already reported by the preprocessing thread
 
             self._raw = []
             self._anchor_raw = []
@@ -1084,7 +1203,7 @@ class SEMCCDMDStream(MultipleDetectorStream):
         return timedout
 
     def _acquireImage(self, n, pol_pos, px_idx, px_time, sem_time, sub_pxs,
-                      tot_num, leech_time_ppx, leech_np, future):
+                      tot_num, leech_time_ppx, leech_np, future, next_trans=None):
         """
         acquires image from detector
         :param n (int): number of points (pixel positions) acquired so far
@@ -1099,6 +1218,11 @@ class SEMCCDMDStream(MultipleDetectorStream):
         :param leech_np (list of 0<int or None): for each leech, number of pixels before the leech should be
            executed again. It's automatically updated inside the list. (np = next pixels)
         :param future: current future running for the whole acquisition
+        :param next_trans (None or (float, float)): e-beam translation of the
+          next pixel. If provided, the e-beam is moved there as soon as the
+          current pixel is acquired, unless a leech has to run first (as it
+          might change the drift).
+        :return (bool): True if the e-beam was moved to next_trans
         """
 
         failures = 0  # keeps track of acquisition failures
@@ -1171,6 +1295,13 @@ class SEMCCDMDStream(MultipleDetectorStream):
             if self._acq_state == CANCELLED:
                 raise CancelledError()
 
+            # The e-beam is not needed anymore for this pixel => already go
+            # to the next spot, while handling the data.
+            spot_ready = False
+            if next_trans is not None and 1 not in leech_np:
+                self._emitter.translation.value = next_trans
+                spot_ready = True
+
             # MD_POS default to the center of the stage, but it needs to be
             # the position of the e-beam (without the shift for drift correction)
             raw_pos = self._acq_data[0][-1].metadata[MD_POS]
@@ -1183,8 +1314,7 @@ class SEMCCDMDStream(MultipleDetectorStream):
             if self._analyzer:
                 ccd_data.metadata[MD_POL_MODE] = pol_pos
 
-            self._acq_data[-1][-1] = self._preprocessData(len(self._streams) - 1, ccd_data, px_idx)
-            logging.debug("Processed CCD data %d = %s", n, px_idx)
+            self._queuePreprocessing(px_idx)
 
             leech_time_left = (tot_num - n + 1) * leech_time_ppx
             self._updateProgress(future, time.time() - start, n + 1, tot_num, leech_time_left)
@@ -1195,6 +1325,8 @@ class SEMCCDMDStream(MultipleDetectorStream):
                     continue
                 leech_np[li] -= 1
                 if leech_np[li] == 0:
+                    # The leech expects the CCD data to be already preprocessed
+                    self._waitPreprocessing()
                     try:
                         np = l.next([d[-1] for d in self._acq_data])
                     except Exception:
@@ -1206,7 +1338,7 @@ class SEMCCDMDStream(MultipleDetectorStream):
 
             # Since we reached this point means everything went fine, so
             # no need to retry
-            break
+            return spot_ready
 
     def _adjustHardwareSettingsScanStage(self):
         """
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: Delmic
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+from __future__ import division
+
+import logging
+import numpy
+from odemis import model
+from odemis.acq.accumulator import Accumulator, get_best_dtype_for_acc
+import unittest
+
+
+logging.getLogger().setLevel(logging.DEBUG)
+
+
+class TestAccumulator(unittest.TestCase):
+
+    def test_best_dtype(self):
+        self.assertEqual(get_best_dtype_for_acc(numpy.uint8, 100), numpy.uint16)
+        self.assertEqual(get_best_dtype_for_acc(numpy.uint16, 100), numpy.uint32)
+        self.assertEqual(get_best_dtype_for_acc(numpy.uint16, 2 ** 20), numpy.uint64)
+        self.assertEqual(get_best_dtype_for_acc(numpy.int16, 100), numpy.int32)
+        self.assertEqual(get_best_dtype_for_acc(numpy.uint16, None), numpy.uint64)
+        self.assertEqual(get_best_dtype_for_acc(numpy.float32, 100), numpy.float64)
+
+    def test_mean_var(self):
+        """
+        The mean and variance are the same as computed on all the frames
+        """
+        frames = [numpy.random.randint(0, 2 ** 16, (32, 64)).astype(numpy.uint16)
+                  for i in range(20)]
+        md = {model.MD_DWELL_TIME: 1e-6, model.MD_PIXEL_SIZE: (1e-9, 1e-9)}
+        acc = Accumulator(max_count=len(frames), variance=True)
+        for f in frames:
+            acc.add(model.DataArray(f, md))
+        self.assertEqual(acc.count, len(frames))
+
+        mean = acc.getMean()
+        numpy.testing.assert_almost_equal(mean, numpy.mean(frames, axis=0))
+        self.assertEqual(mean.metadata[model.MD_DWELL_TIME], 1e-6 * len(frames))
+        self.assertEqual(mean.metadata[model.MD_PIXEL_SIZE], (1e-9, 1e-9))
+        imean = acc.getMean(numpy.uint16)
+        self.assertEqual(imean.dtype, numpy.uint16)
+        numpy.testing.assert_array_equal(imean, numpy.round(numpy.mean(frames, axis=0)))
+
+        var = acc.getVariance()
+        numpy.testing.assert_allclose(var, numpy.var(frames, axis=0, ddof=1), rtol=1e-9)
+
+        # Too many frames
+        with self.assertRaises(ValueError):
+            acc.add(model.DataArray(frames[0], md))
+
+        acc.reset()
+        with self.assertRaises(LookupError):
+            acc.getMean()
+
+    def test_outliers(self):
+        """
+        A very high pixel in one frame is ignored
+        """
+        acc = Accumulator(outliers=5)
+        numpy.random.seed(0)
+        for i in range(10):
+            f = numpy.random.normal(1000, 10, (16, 16)).astype(numpy.int16)
+            if i == 6:
+                f[3, 4] = 30000  # "cosmic ray"
+            acc.add(model.DataArray(f))
+
+        mean = acc.getMean()
+        self.assertLess(abs(mean[3, 4] - 1000), 30)
+        self.assertGreaterEqual(acc.rejected, 1)
+        self.assertLess(acc.rejected, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -24,7 +24,7 @@ import logging
 import numpy
 from odemis import model, acq
 import odemis
-from odemis.util import test
+from odemis.util import test, executeAsyncTask
 import os
 import time
 import unittest
@@ -62,11 +62,121 @@ class Fake0DDataFlow(model.DataFlow):
         return da
 
 
+class FakeStream(object):
+    """
+    Imitates a stream which acquires during the given time, with a given detector
+    """
+    def __init__(self, name, detector, dur):
+        self.name = model.StringVA(name)
+        self._detector = detector
+        self._dur = dur
+
+    def estimateAcquisitionTime(self):
+        return self._dur
+
+    def acquire(self):
+        f = model.ProgressiveFuture()
+        executeAsyncTask(f, self._run)
+        return f
+
+    def _run(self):
+        time.sleep(self._dur)
+        return [model.DataArray(numpy.zeros((2, 2)))]
+
+
+class FakeSelector(object):
+    """
+    Imitates a selector component
+    """
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeOPM(object):
+    """
+    Imitates an optical path manager, with one mode per detector
+    """
+    def __init__(self, modes, selectors):
+        """
+        modes (dict str -> str): detector name -> mode
+        selectors (dict str -> list of (FakeSelector, dict)): detector name -> moves
+        """
+        self._modes = modes
+        self._selectors = selectors
+
+    def guessMode(self, stream):
+        try:
+            return self._modes[stream._detector.name]
+        except KeyError:
+            raise LookupError("No mode for %s" % (stream._detector.name,))
+
+    def getStreamDetector(self, stream):
+        return stream._detector
+
+    def getSelectorMoves(self, target):
+        return self._selectors.get(target, [])
+
+
 class TestNoBackend(unittest.TestCase):
     # No backend, and only fake streams that don't generate anything
 
-    # TODO
-    pass
+    def test_concurrent(self):
+        """
+        Streams with independent hardware are acquired simultaneously
+        """
+        det1 = Fake0DDetector("det1")
+        det2 = Fake0DDetector("det2")
+        s1 = FakeStream("s1", det1, 1)
+        s2 = FakeStream("s2", det2, 1)
+        s3 = FakeStream("s3", det1, 0.5)
+        ss = [s1, s2, s3]
+
+        # s3 uses the same detector as s1 => after s1, in parallel to s2
+        self.assertAlmostEqual(acq.estimateTime(ss), 1.5)
+
+        startt = time.time()
+        f = acq.acquire(ss)
+        data, e = f.result()
+        dur = time.time() - startt
+        self.assertIsNone(e)
+        self.assertEqual(len(data), 3)
+        # Returned in the same order as the streams
+        self.assertEqual([d.metadata[model.MD_DESCRIPTION] for d in data],
+                         ["s1", "s2", "s3"])
+        self.assertLess(dur, 2.4)  # Sequentially would be 2.5s
+        self.assertGreaterEqual(dur, 1.5)
+
+    def test_opm_conflict(self):
+        """
+        Streams only conflict via the optical path manager if they need a
+        different optical path
+        """
+        det1 = Fake0DDetector("det1")
+        det2 = Fake0DDetector("det2")
+        det3 = Fake0DDetector("det3")
+        det4 = Fake0DDetector("det4")
+        det5 = Fake0DDetector("det5")
+        selector = FakeSelector("selector")
+        opm = FakeOPM({"det1": "mode1", "det2": "mode1", "det3": "mode1", "det4": "mode2"},
+                      {"det3": [(selector, {"rx": 0})], "det4": [(selector, {"rx": 1})]})
+        ss = [FakeStream("s%d" % i, d, 1) for i, d in enumerate((det1, det2, det3, det4, det5), 1)]
+        for s in ss:
+            s._opm = opm
+        s1, s2, s3, s4, s5 = ss
+
+        # Same optical path
+        self.assertFalse(acq._streams_conflict(s1, s2))
+        self.assertFalse(acq._streams_conflict(s1, s3))
+        # Different mode
+        self.assertTrue(acq._streams_conflict(s1, s4))
+        # No optical path needed
+        self.assertFalse(acq._streams_conflict(s1, s5))
+        self.assertFalse(acq._streams_conflict(s4, s5))
+
+        # Same mode, but a different selector position
+        opm._modes["det4"] = "mode1"
+        self.assertTrue(acq._streams_conflict(s3, s4))
+        self.assertFalse(acq._streams_conflict(s1, s4))
 
 # @skip("simple")
 class SECOMTestCase(unittest.TestCase):
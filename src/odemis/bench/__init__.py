@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: Delmic
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+
+# Benchmarks of the parts of Odemis on which the performance matters (ie, the
+# "hot paths"). They are split in two suites: the "micro" benchmarks measure
+# a single function or mechanism, while the "macro" benchmarks measure a whole
+# acquisition on the simulators. They only need a CPU, and no network access.
+#
+# Each benchmark is a function, registered with the @benchmark decorator, which
+# takes the number of repetitions as argument, and returns a list of Metrics.
+
+from __future__ import division
+
+import collections
+import logging
+import timeit
+
+
+SUITE_MICRO = "micro"
+SUITE_MACRO = "macro"
+SUITES = (SUITE_MICRO, SUITE_MACRO)
+
+# name -> (suite, callable)
+_benchmarks = collections.OrderedDict()
+
+
+class Metric(object):
+    """
+    One value measured by a benchmark
+    """
+
+    def __init__(self, name, value, unit, higher_better=False, samples=None,
+                 budget=None, details=None):
+        """
+        name (str): unique name of the metric, with the words separated by "."
+          (eg, "img.histogram.uint16")
+        value (float): the measured value
+        unit (str): unit of the value (eg, "s", "fps", "MB/s")
+        higher_better (bool): True if a higher value is better (eg, a speed),
+          False if a lower value is better (eg, a duration).
+        samples (None or list of floats): all the values measured, from which
+          value is computed
+        budget (None or float): worse value acceptable (ie, maximum, or minimum
+          if higher_better). None if there is no such limit.
+        details (None or dict str -> value): extra information about the
+          measurement, which is saved but not compared.
+        """
+        self.name = name
+        self.value = value
+        self.unit = unit
+        self.higher_better = higher_better
+        self.samples = samples or []
+        self.budget = budget
+        self.details = details or {}
+
+    def __repr__(self):
+        return "Metric(%r, %g, %r)" % (self.name, self.value, self.unit)
+
+    def to_dict(self):
+        """
+        return (dict str -> value): representation of the metric for JSON
+        """
+        return {"value": self.value,
+                "unit": self.unit,
+                "higher_better": self.higher_better,
+                "samples": self.samples,
+                "budget": self.budget,
+                "details": self.details,
+               }
+
+
+def benchmark(suite, name=None):
+    """
+    Decorator to register a benchmark function
+    suite (SUITE_*): the suite in which the benchmark is
+    name (None or str): name of the benchmark. If None, the name of the
+      module and of the function is used.
+    """
+    if suite not in SUITES:
+        raise ValueError("Unknown suite %s" % (suite,))
+
+    def register(f):
+        bname = name
+        if bname is None:
+            bname = "%s.%s" % (f.__module__.split(".")[-1], f.__name__)
+        if bname in _benchmarks:
+            raise ValueError("Benchmark %s already registered" % (bname,))
+        _benchmarks[bname] = (suite, f)
+        return f
+
+    return register
+
+
+def getBenchmarks(suites=SUITES):
+    """
+    List all the known benchmarks
+    suites (iterable of SUITE_*): the suites to list
+    return (OrderedDict str -> callable): name -> benchmark function
+    """
+    # Import the modules to register all the benchmarks
+    from odemis.bench import micro, macro, startup
+
+    return collections.OrderedDict((n, f) for n, (s, f) in _benchmarks.items()
+                                   if s in suites)
+
+
+def median(values):
+    """
+    values (list of numbers): must not be empty
+    return (float): the median of the values
+    """
+    s = sorted(values)
+    n = len(s)
+    if n % 2:
+        return float(s[n // 2])
+    else:
+        return (s[n // 2 - 1] + s[n // 2]) / 2
+
+
+def measureDuration(f, repeat, number=1):
+    """
+    Time the execution of a function
+    f (callable): function to call, with no argument
+    repeat (1<=int): number of measurements
+    number (1<=int): number of calls per measurement
+    return (list of float): duration (in s) of one call, for each measurement
+    """
+    timer = timeit.Timer(f)
+    return [t / number for t in timer.repeat(repeat, number)]
+
+
+def durationMetric(name, f, repeat, number=1):
+    """
+    Time the execution of a function, and report the median duration
+    name (str): name of the metric
+    f, repeat, number: see measureDuration()
+    return (Metric): the median duration of a call (in s)
+    """
+    durations = measureDuration(f, repeat, number)
+    logging.debug("%s took %g s (min %g s)", name, median(durations), min(durations))
+    return Metric(name, median(durations), "s", samples=durations)
+
+
+def speedMetric(name, f, size, repeat, number=1):
+    """
+    Time the execution of a function, and report the median speed
+    name (str): name of the metric
+    f, repeat, number: see measureDuration()
+    size (0<float): size of the data processed by f (in MB)
+    return (Metric): the median speed of a call (in MB/s)
+    """
+    durations = measureDuration(f, repeat, number)
+    speeds = [size / max(d, 1e-9) for d in durations]
+    logging.debug("%s at %g MB/s", name, median(speeds))
+    return Metric(name, median(speeds), "MB/s", higher_better=True, samples=speeds)
+
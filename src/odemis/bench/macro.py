@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: Delmic
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+
+# Macro benchmarks: each of them measures a whole acquisition, as done by the
+# GUI, on the simulated hardware. The simulators are run directly in this
+# process, so that no back-end is needed.
+
+from __future__ import division
+
+import logging
+import numpy
+from odemis.acq import stream
+from odemis.bench import benchmark, SUITE_MACRO, Metric, median
+from odemis.driver import simsem, andorcam2
+import time
+
+
+CONFIG_SED = {"name": "sed", "role": "se-detector"}
+CONFIG_SCANNER = {"name": "scanner", "role": "e-beam"}
+CONFIG_SEM = {"name": "sem", "role": "sem",
+              "children": {"detector0": CONFIG_SED, "scanner": CONFIG_SCANNER}
+             }
+CONFIG_CCD = {"name": "ccd", "role": "ccd", "device": "fake",
+              "image": "andorcam2-fake-clara.tiff"}
+
+SEMCCD_REPETITION = (10, 8)  # Number of e-beam spots (X, Y)
+SEMCCD_EXP_TIME = 0.01  # s, short, to mostly measure the overhead
+
+
+def _getChild(comp, role):
+    for c in comp.children.value:
+        if c.role == role:
+            return c
+    raise LookupError("No child %s in %s" % (role, comp.name))
+
+
+@benchmark(SUITE_MACRO, "acq.SEMCCDMDStream")
+def semccd_acquisition(repeat):
+    """
+    Acquisition of a SEM/CCD multiple detector stream, on the simulators.
+    Measures the total duration, and the overhead for each e-beam spot, compared
+    to just the exposure time of the CCD.
+    """
+    sem = simsem.SimSEM(**CONFIG_SEM)
+    ccd = andorcam2.AndorCam2(**CONFIG_CCD)
+    try:
+        ebeam = _getChild(sem, CONFIG_SCANNER["role"])
+        sed = _getChild(sem, CONFIG_SED["role"])
+
+        sems = stream.SEMStream("bench sem", sed, sed.data, ebeam)
+        ars = stream.ARSettingsStream("bench ar", ccd, ccd.data, ebeam)
+        sas = stream.SEMARMDStream("bench sem-ar", [sems, ars])
+
+        # Small images, as on a typical AR acquisition
+        ccd.binning.value = tuple(min(4, mx) for mx in ccd.binning.range[1])
+        ccd.exposureTime.value = SEMCCD_EXP_TIME
+        exp = ccd.exposureTime.value
+        ars.roi.value = (0.1, 0.1, 0.9, 0.9)
+        ars.repetition.value = SEMCCD_REPETITION
+        npx = numpy.prod(ars.repetition.value)
+
+        durs = []
+        for i in range(repeat):
+            timeout = 10 + 3 * sas.estimateAcquisitionTime()
+            start = time.time()
+            f = sas.acquire()
+            data = f.result(timeout)
+            durs.append(time.time() - start)
+            if len(data) != npx + 1:
+                logging.warning("Acquisition returned %d images, while expected %d",
+                                len(data), npx + 1)
+    finally:
+        ccd.terminate()
+        sem.terminate()
+
+    overheads = [d / npx - exp for d in durs]
+    return [Metric("acq.SEMCCDMDStream.duration", median(durs), "s", samples=durs),
+            Metric("acq.SEMCCDMDStream.overhead", median(overheads), "s",
+                   samples=overheads),
+           ]
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: Delmic
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+
+# Command line tool to run the benchmarks, and compare the results with a
+# previous run.
+# Example usage:
+# odemis-bench --output new.json --baseline ref.json --threshold 0.2
+# odemis-bench --filter startup.imports --budget "startup.import.odemis.model=0.3"
+
+from __future__ import division, print_function
+
+import argparse
+import fnmatch
+import logging
+import odemis
+from odemis import bench
+from odemis.bench import report
+import sys
+
+
+def run(names, repeat):
+    """
+    Run the given benchmarks
+    names (list of str): names of the benchmarks
+    repeat (1<=int): number of measurements of each metric
+    return (list of Metric, dict str -> str): the metrics measured, and the
+      error message of each benchmark which failed
+    """
+    benchmarks = bench.getBenchmarks()
+    metrics = []
+    errors = {}
+    for n in names:
+        logging.info("Running benchmark %s", n)
+        try:
+            ms = benchmarks[n](repeat)
+        except Exception as ex:
+            logging.exception("Benchmark %s failed", n)
+            errors[n] = "%s: %s" % (ex.__class__.__name__, ex)
+            continue
+        for m in ms:
+            logging.info("%s: %g %s", m.name, m.value, m.unit)
+        metrics.extend(ms)
+    return metrics, errors
+
+
+def parse_threshold(s):
+    """
+    Parse the argument of a metric specific threshold
+    s (str): of the form "pattern=threshold"
+    return (str, float): the pattern and the threshold
+    """
+    try:
+        pattern, t = s.rsplit("=", 1)
+        t = float(t)
+        if t < 0:
+            raise ValueError("Negative threshold")
+    except ValueError:
+        raise argparse.ArgumentTypeError("Threshold '%s' should be like 'pattern=0.2'" % (s,))
+    return pattern, t
+
+
+def parse_budget(s):
+    """
+    Parse the argument of a metric budget
+    s (str): of the form "pattern=budget"
+    return (str, float): the pattern and the budget
+    """
+    try:
+        pattern, b = s.rsplit("=", 1)
+        b = float(b)
+    except ValueError:
+        raise argparse.ArgumentTypeError("Budget '%s' should be like 'pattern=0.5'" % (s,))
+    return pattern, b
+
+
+def main(args):
+    """
+    Handles the command line arguments
+    args is the list of arguments passed
+    return (int): value to return to the OS as program exit code
+    """
+
+    # arguments handling
+    parser = argparse.ArgumentParser(prog="odemis-bench",
+                                     description="Benchmarks of " + odemis.__fullname__)
+
+    parser.add_argument('--version', dest="version", action='store_true',
+                        help="show program's version number and exit")
+    parser.add_argument("--log-level", dest="loglev", metavar="<level>", type=int,
+                        default=1, help="set verbosity level (0-2, default = 1)")
+    parser.add_argument("--list", "-l", dest="list", action="store_true", default=False,
+                        help="list the benchmarks available")
+    parser.add_argument("--suite", dest="suite", choices=bench.SUITES + ("all",),
+                        default="all", help="only run the benchmarks of the given suite")
+    parser.add_argument("--filter", "-f", dest="filters", action="append", metavar="<pattern>",
+                        help="only run the benchmarks matching the pattern "
+                        "(eg, 'img.*'). Can be given multiple times.")
+    parser.add_argument("--repeat", "-r", dest="repeat", type=int, default=5,
+                        help="number of measurements of each metric (default = 5)")
+    parser.add_argument("--output", "-o", dest="output", metavar="<file>",
+                        help="name of the JSON file where the results are saved")
+    parser.add_argument("--baseline", "-b", dest="baseline", metavar="<file>",
+                        help="name of a JSON file with previous results to compare with. "
+                        "If a metric regressed, the exit code is 1 (2 if a "
+                        "benchmark failed).")
+    parser.add_argument("--threshold", "-t", dest="threshold", type=float,
+                        default=report.DEFAULT_THRESHOLD,
+                        help="ratio by which a metric can be worse than the baseline "
+                        "before being a regression (default = %s)" % (report.DEFAULT_THRESHOLD,))
+    parser.add_argument("--metric-threshold", dest="thresholds", action="append",
+                        type=parse_threshold, metavar="<pattern>=<ratio>",
+                        help="threshold for the metrics matching the pattern "
+                        "(eg, 'dataflow.*=0.3'). Can be given multiple times.")
+    parser.add_argument("--budget", dest="budgets", action="append",
+                        type=parse_budget, metavar="<pattern>=<value>",
+                        help="worse acceptable value for the metrics matching the "
+                        "pattern (eg, 'startup.import.*=0.8'), overriding the default "
+                        "budget. If a metric exceeds its budget, the exit code is 1. "
+                        "Can be given multiple times.")
+    parser.add_argument("--compare", dest="compare", metavar="<file>",
+                        help="don't run the benchmarks, but compare the results of "
+                        "the given file to the baseline")
+
+    options = parser.parse_args(args[1:])
+
+    # Cannot use the internal feature, because it doesn't support multiline
+    if options.version:
+        print(odemis.__fullname__ + " " + odemis.__version__ + "\n" +
+              odemis.__copyright__ + "\n" +
+              "Licensed under the " + odemis.__license__)
+        return 0
+
+    # Set up logging before everything else
+    if options.loglev < 0:
+        logging.error("Log-level must be positive.")
+        return 127
+    loglev_names = (logging.WARNING, logging.INFO, logging.DEBUG)
+    loglev = loglev_names[min(len(loglev_names) - 1, options.loglev)]
+    logging.getLogger().setLevel(loglev)
+
+    if options.repeat < 1:
+        logging.error("Repeat must be at least 1, got %d.", options.repeat)
+        return 127
+
+    try:
+        if options.list:
+            for n, f in bench.getBenchmarks().items():
+                print("%s: %s" % (n, (f.__doc__ or "").strip().split("\n")[0]))
+            return 0
+
+        baseline = None
+        if options.baseline:
+            baseline = report.loadReport(options.baseline)
+
+        if options.compare:
+            current = report.loadReport(options.compare)
+        else:
+            suites = bench.SUITES if options.suite == "all" else (options.suite,)
+            names = list(bench.getBenchmarks(suites).keys())
+            if options.filters:
+                names = [n for n in names
+                         if any(fnmatch.fnmatchcase(n, p) for p in options.filters)]
+            if not names:
+                logging.error("No benchmark to run")
+                return 127
+
+            metrics, errors = run(names, options.repeat)
+            current = report.createReport(metrics, errors)
+            if options.output:
+                report.saveReport(options.output, current)
+                logging.info("Results saved to %s", options.output)
+
+        ret = 0
+        if current["errors"]:
+            logging.error("%d benchmarks failed: %s", len(current["errors"]),
+                          ", ".join(sorted(current["errors"].keys())))
+            ret = 2
+
+        exceeded = report.checkBudgets(current, options.budgets)
+        for n, v, b in exceeded:
+            logging.warning("Metric %s exceeded its budget: %g (budget = %g %s)", n, v, b,
+                            current["metrics"][n]["unit"])
+        if exceeded:
+            ret = max(ret, 1)
+
+        if baseline is not None:
+            results = report.compareReports(baseline, current, options.threshold,
+                                            options.thresholds)
+            units = dict((n, m["unit"]) for n, m in current["metrics"].items())
+            print(report.formatComparison(results, units))
+            regressed = [r[0] for r in results if r[4] == report.ST_REGRESSED]
+            if regressed:
+                logging.warning("%d metrics regressed: %s", len(regressed), ", ".join(regressed))
+                ret = max(ret, 1)
+        elif options.compare:
+            logging.error("Comparison requested, but no baseline given")
+            return 127
+        else:
+            for n in sorted(current["metrics"]):
+                m = current["metrics"][n]
+                print("%s\t%g\t%s" % (n, m["value"], m["unit"]))
+    except KeyboardInterrupt:
+        logging.info("Interrupted before the end of the execution")
+        return 1
+    except ValueError as exp:
+        logging.error("%s", exp)
+        return 127
+    except IOError as exp:
+        logging.error("%s", exp)
+        return 129
+    except Exception:
+        logging.exception("Unexpected error while performing action.")
+        return 130
+
+    return ret
+
+if __name__ == '__main__':
+    ret = main(sys.argv)
+    exit(ret)
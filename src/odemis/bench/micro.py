@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: Delmic
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+
+# Micro benchmarks: each of them measures the speed of one mechanism or
+# function, independently of the rest.
+
+from __future__ import division
+
+import logging
+import numpy
+from odemis import model
+from odemis.acq.align.shift import MeasureShift
+from odemis.bench import benchmark, SUITE_MICRO, Metric, median, durationMetric, \
+    speedMetric
+from odemis.dataio import tiff, hdf5
+from odemis.util import img
+import os
+from scipy import ndimage
+import shutil
+import tempfile
+import threading
+import time
+
+
+# Shapes of the frames sent via the DataFlow: a small one, to measure the
+# overhead per frame, and a big one, to measure the bandwidth.
+DATAFLOW_SHAPES = ((256, 256), (2048, 2048))
+DATAFLOW_LATENCY_PERIOD = 0.05  # s, between frames, so that they don't queue up
+
+# dtype -> maximum value of the data, for the image conversions
+IMG_DTYPES = ((numpy.uint8, 255),
+              (numpy.uint16, 4095),  # Typical 12-bit camera
+              (numpy.uint32, 2 ** 20 - 1),  # Typical counting detector
+              (numpy.float32, 1),
+              (numpy.float64, 1),
+             )
+IMG_SHAPE = (2048, 2048)
+SHIFT_SHAPE = (1024, 1024)
+
+
+def _createImage(shape, dtype, maxv, seed=0):
+    """
+    Generate an image looking a little bit like a real one: smooth features,
+    with some noise. The same arguments always generate the same image.
+    shape (int, int): shape of the image
+    dtype (numpy.dtype): type of the data
+    maxv (number): maximum value of the data
+    return (ndarray): the image
+    """
+    rng = numpy.random.RandomState(seed)
+    im = ndimage.gaussian_filter(rng.random_sample(shape), 8)
+    im -= im.min()
+    im *= 0.9 / im.max()
+    im += rng.random_sample(shape) * 0.1  # noise
+    im *= maxv
+    return im.astype(dtype)
+
+
+class GeneratorDataFlow(model.DataFlow):
+    """
+    DataFlow which sends the same frame continuously, as fast as it can
+    (or with a given period). The acquisition date of each frame is the time it
+    is sent, to measure the latency.
+    """
+
+    def __init__(self):
+        model.DataFlow.__init__(self)
+        self.period = 0  # s
+        self._frame = numpy.zeros((1, 1), dtype=numpy.uint16)
+        self._stop = threading.Event()
+
+    def setFrame(self, shape, dtype):
+        self._frame = _createImage(shape, dtype, numpy.iinfo(dtype).max)
+
+    def start_generate(self):
+        # A new event for each thread, as the previous thread might still be
+        # running (stop_generate() doesn't wait for it).
+        self._stop = threading.Event()
+        t = threading.Thread(target=self._generate, args=(self._stop,),
+                             name="Benchmark data generator")
+        t.daemon = True
+        t.start()
+
+    def stop_generate(self):
+        self._stop.set()
+
+    def _generate(self, stop):
+        try:
+            while not stop.is_set():
+                md = {model.MD_ACQ_DATE: time.time()}
+                self.notify(model.DataArray(self._frame, md))
+                if self.period:
+                    stop.wait(self.period)
+        except Exception:
+            logging.exception("Failure in the data generator")
+
+
+class BenchComponent(model.Component):
+    """
+    Component to measure the overhead of the remote access to the VAs and
+    DataFlows.
+    """
+
+    def __init__(self, name, daemon=None):
+        model.Component.__init__(self, name=name, daemon=daemon)
+        self.value = model.FloatVA(0)
+        self.data = GeneratorDataFlow()
+
+    def setFrame(self, shape, dtype, period):
+        """
+        Change the frames generated by .data
+        shape (int, int): shape of the frames
+        dtype (str): name of the data type of the frames
+        period (0<=float): time (in s) between the end of sending a frame and
+          the next frame. If 0, the frames are sent as fast as possible.
+        """
+        self.data.setFrame(tuple(shape), numpy.dtype(dtype))
+        self.data.period = period
+
+    def terminate(self):
+        self.data.stop_generate()
+        model.Component.terminate(self)
+
+
+class _Receiver(object):
+    """
+    Collects the reception time and latency of the frames of a DataFlow
+    """
+
+    def __init__(self, n):
+        """
+        n (int): number of frames to receive, before .done is set
+        """
+        self.n = n
+        self.times = []
+        self.latencies = []
+        self.done = threading.Event()
+
+    def on_data(self, df, data):
+        now = time.time()
+        if len(self.times) >= self.n:
+            return
+        self.times.append(now)
+        self.latencies.append(now - data.metadata[model.MD_ACQ_DATE])
+        if len(self.times) >= self.n:
+            self.done.set()
+
+
+def _receiveFrames(df, n):
+    """
+    Subscribe to a DataFlow until a given number of frames is received
+    df (DataFlow): the DataFlow to subscribe to
+    n (int): number of frames
+    return (_Receiver): the receiver, with the information of each frame
+    raise IOError: if the frames are not received within 60 s
+    """
+    recv = _Receiver(n)
+    df.subscribe(recv.on_data)
+    try:
+        if not recv.done.wait(60):
+            raise IOError("Only received %d frames out of %d" % (len(recv.times), n))
+    finally:
+        df.unsubscribe(recv.on_data)
+    return recv
+
+
+class _BenchContainer(object):
+    """
+    Runs a BenchComponent in a separate container (ie, process), for as long
+    as it's used as a context manager.
+    """
+
+    def __enter__(self):
+        cname = "odemis-bench-%d" % (os.getpid(),)
+        self.container, self.comp = model.createInNewContainer(cname, BenchComponent,
+                                                               {"name": "bench"})
+        return self.comp
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.comp.terminate()
+        finally:
+            self.container.terminate()
+
+
+@benchmark(SUITE_MICRO, "dataflow")
+def dataflow(repeat):
+    """
+    Throughput and latency of a DataFlow received from another container
+    """
+    metrics = []
+    with _BenchContainer() as comp:
+        for shape in DATAFLOW_SHAPES:
+            sname = "x".join("%d" % s for s in shape)
+            size = numpy.prod(shape) * 2 / 1e6  # MB, as uint16
+
+            # As fast as possible
+            comp.setFrame(shape, "uint16", 0)
+            fps = []
+            for i in range(repeat):
+                n = 2 + max(10, int(100 / size))  # Not too long with big frames
+                recv = _receiveFrames(comp.data, n)
+                # Skip the first frame, which depends on the subscription time
+                fps.append((n - 2) / (recv.times[-1] - recv.times[1]))
+            metrics.append(Metric("dataflow.throughput.%s" % (sname,), median(fps),
+                                  "fps", higher_better=True, samples=fps))
+            bws = [f * size for f in fps]
+            metrics.append(Metric("dataflow.bandwidth.%s" % (sname,), median(bws),
+                                  "MB/s", higher_better=True, samples=bws))
+
+            # Slowly enough so that the frames don't wait to be sent
+            comp.setFrame(shape, "uint16", DATAFLOW_LATENCY_PERIOD)
+            recv = _receiveFrames(comp.data, 2 + 10 * repeat)
+            lats = recv.latencies[2:]
+            metrics.append(Metric("dataflow.latency.%s" % (sname,), median(lats),
+                                  "s", samples=lats))
+
+    return metrics
+
+
+@benchmark(SUITE_MICRO, "va")
+def va(repeat):
+    """
+    Latency of reading and writing a VA of another container
+    """
+    with _BenchContainer() as comp:
+        rva = comp.value
+
+        def set_value():
+            rva.value = 1.5
+
+        return [durationMetric("va.get", lambda: rva.value, repeat, number=100),
+                durationMetric("va.set", set_value, repeat, number=100)]
+
+
+@benchmark(SUITE_MICRO, "img.DataArray2RGB")
+def dataArray2RGB(repeat):
+    """
+    Conversion of greyscale images to RGB, as for displaying them
+    """
+    metrics = []
+    for dtype, maxv in IMG_DTYPES:
+        data = _createImage(IMG_SHAPE, dtype, maxv)
+        irange = (data.dtype.type(0), data.dtype.type(maxv))
+        name = "img.DataArray2RGB.%s" % (numpy.dtype(dtype).name,)
+        metrics.append(durationMetric(name, lambda: img.DataArray2RGB(data, irange),
+                                      repeat))
+    return metrics
+
+
+@benchmark(SUITE_MICRO, "img.histogram")
+def histogram(repeat):
+    """
+    Computation of the histogram of images, with the range of the data
+    """
+    metrics = []
+    for dtype, maxv in IMG_DTYPES:
+        data = _createImage(IMG_SHAPE, dtype, maxv)
+        if data.dtype.kind in "biu":
+            irange = (0, maxv)
+        else:
+            irange = None  # As for the floats, the range is typically unknown
+        name = "img.histogram.%s" % (numpy.dtype(dtype).name,)
+        metrics.append(durationMetric(name, lambda: img.histogram(data, irange),
+                                      repeat))
+    return metrics
+
+
+def _exportSpeed(name, exporter, ext, repeat):
+    """
+    Measure the speed of writing an image
+    name (str): name of the metric
+    exporter (callable): function with (filename, DataArray) as arguments
+    ext (str): extension of the file
+    repeat (int): number of measurements
+    return (Metric): the speed (in MB/s)
+    """
+    md = {model.MD_PIXEL_SIZE: (1e-7, 1e-7),
+          model.MD_POS: (1e-3, -2e-3),
+          model.MD_ACQ_DATE: time.time(),
+          model.MD_EXP_TIME: 0.1,
+          model.MD_DESCRIPTION: "benchmark",
+         }
+    data = model.DataArray(_createImage(IMG_SHAPE, numpy.uint16, 4095), md)
+    tmpdir = tempfile.mkdtemp(prefix="odemis-bench")
+    try:
+        fn = os.path.join(tmpdir, "bench" + ext)
+        return speedMetric(name, lambda: exporter(fn, data), data.nbytes / 1e6, repeat)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+@benchmark(SUITE_MICRO, "dataio.tiff")
+def tiff_export(repeat):
+    """
+    Writing speed of an image in the TIFF format
+    """
+    return [_exportSpeed("dataio.tiff.export", tiff.export, tiff.EXTENSIONS[0], repeat)]
+
+
+@benchmark(SUITE_MICRO, "dataio.hdf5")
+def hdf5_export(repeat):
+    """
+    Writing speed of an image in the HDF5 format
+    """
+    return [_exportSpeed("dataio.hdf5.export", hdf5.export, hdf5.EXTENSIONS[0], repeat)]
+
+
+@benchmark(SUITE_MICRO, "align.MeasureShift")
+def measureShift(repeat):
+    """
+    Measurement of the shift between two images, as used for drift correction
+    """
+    im1 = _createImage(SHIFT_SHAPE, numpy.uint16, 4095)
+    im2 = numpy.roll(numpy.roll(im1, 5, axis=0), -3, axis=1)
+    sname = "x".join("%d" % s for s in SHIFT_SHAPE)
+    metrics = []
+    for prec in (1, 10):
+        name = "align.MeasureShift.%s.p%d" % (sname, prec)
+        metrics.append(durationMetric(name, lambda: MeasureShift(im1, im2, prec),
+                                      repeat))
+    return metrics
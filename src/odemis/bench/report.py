@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: Delmic
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+
+# Storage of the results of the benchmarks as JSON, and comparison with the
+# results of a previous run (the "baseline").
+
+from __future__ import division
+
+import fnmatch
+import json
+import odemis
+import platform
+import time
+
+
+FORMAT_VERSION = 1
+
+# Status of a metric, compared to the baseline
+ST_OK = "ok"
+ST_IMPROVED = "improved"
+ST_REGRESSED = "regressed"
+ST_NEW = "new"  # not in the baseline
+ST_MISSING = "missing"  # only in the baseline
+
+DEFAULT_THRESHOLD = 0.1  # ratio of change accepted without being a regression
+
+
+def createReport(metrics, errors=None):
+    """
+    Create the representation of the results of a run
+    metrics (list of Metric): all the metrics measured
+    errors (None or dict str -> str): name of the benchmark -> error message,
+      for the benchmarks which failed.
+    return (dict): the report, ready to be saved as JSON
+    """
+    return {"format": FORMAT_VERSION,
+            "odemis": odemis.__version__,
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "host": platform.node(),
+            "machine": platform.machine(),
+            "python": platform.python_version(),
+            "metrics": dict((m.name, m.to_dict()) for m in metrics),
+            "errors": errors or {},
+           }
+
+
+def saveReport(filename, report):
+    """
+    filename (str): path of the JSON file to write
+    report (dict): as returned by createReport()
+    """
+    with open(filename, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def loadReport(filename):
+    """
+    filename (str): path of the JSON file to read
+    return (dict): the report, as created by createReport()
+    raise IOError: if the file cannot be read
+    raise ValueError: if the file is not a report
+    """
+    with open(filename) as f:
+        report = json.load(f)
+    if not isinstance(report, dict) or "metrics" not in report:
+        raise ValueError("File %s doesn't contain benchmark results" % (filename,))
+    if report.get("format", 0) > FORMAT_VERSION:
+        raise ValueError("File %s has results in an unsupported format %s" %
+                         (filename, report.get("format")))
+    return report
+
+
+def getThreshold(name, threshold, thresholds=None):
+    """
+    Find the threshold which applies to a given metric
+    name (str): name of the metric
+    threshold (None or 0<=float): default threshold
+    thresholds (None or list of (str, float)): pattern (as for fnmatch) ->
+      threshold. The last matching pattern is used.
+    return (None or 0<=float): the threshold
+    """
+    for pattern, t in (thresholds or []):
+        if fnmatch.fnmatchcase(name, pattern):
+            threshold = t
+    return threshold
+
+
+def checkBudgets(current, budgets=None):
+    """
+    Check the metrics are within their budget
+    current (dict): report of the run to check
+    budgets (None or list of (str, float)): budgets for some metrics, as
+      pattern -> budget (see getThreshold()). They override the budget of the
+      metrics.
+    return (list of (str, float, float)): for each metric not within its
+      budget: name, value, budget
+    """
+    exceeded = []
+    for name, m in sorted(current["metrics"].items()):
+        budget = getThreshold(name, m.get("budget"), budgets)
+        if budget is None:
+            continue
+        if m.get("higher_better", False):
+            over = m["value"] < budget
+        else:
+            over = m["value"] > budget
+        if over:
+            exceeded.append((name, m["value"], budget))
+    return exceeded
+
+
+def compareReports(baseline, current, threshold=DEFAULT_THRESHOLD, thresholds=None):
+    """
+    Compare the metrics of a run with the metrics of a baseline run
+    baseline (dict): report of the reference run
+    current (dict): report of the run to check
+    threshold (0<=float): ratio of the baseline value by which a metric can be
+      worse before being considered a regression (eg, 0.1 for 10%).
+    thresholds (None or list of (str, float)): specific thresholds for some
+      metrics, as pattern -> threshold (see getThreshold()).
+    return (list of (str, float or None, float or None, float or None, ST_*)):
+      for each metric: name, baseline value, current value, relative change,
+      status. The change is positive when the metric improved.
+    """
+    bmetrics = baseline["metrics"]
+    cmetrics = current["metrics"]
+
+    results = []
+    for name in sorted(set(bmetrics) | set(cmetrics)):
+        if name not in cmetrics:
+            results.append((name, bmetrics[name]["value"], None, None, ST_MISSING))
+            continue
+        elif name not in bmetrics:
+            results.append((name, None, cmetrics[name]["value"], None, ST_NEW))
+            continue
+
+        bval = bmetrics[name]["value"]
+        cval = cmetrics[name]["value"]
+        if bval == 0:
+            change = 0 if cval == 0 else float("inf")
+            if cval < 0:
+                change = -change
+        else:
+            change = (cval - bval) / abs(bval)
+        if not cmetrics[name].get("higher_better", False):
+            change = -change
+
+        t = getThreshold(name, threshold, thresholds)
+        if change < -t:
+            status = ST_REGRESSED
+        elif change > t:
+            status = ST_IMPROVED
+        else:
+            status = ST_OK
+        results.append((name, bval, cval, change, status))
+
+    return results
+
+
+def formatComparison(results, units=None):
+    """
+    Convert the comparison to a human readable text
+    results (list of tuples): as returned by compareReports()
+    units (None or dict str -> str): unit of each metric
+    return (str): a table with one line per metric
+    """
+    units = units or {}
+    lines = []
+    width = max([len(r[0]) for r in results] + [6])
+    lines.append("%-*s %12s %12s %-5s %8s  %s" %
+                 (width, "metric", "baseline", "current", "unit", "change", "status"))
+    for name, bval, cval, change, status in results:
+        bstr = "-" if bval is None else "%.4g" % (bval,)
+        cstr = "-" if cval is None else "%.4g" % (cval,)
+        chstr = "-" if change is None else "%+.1f%%" % (change * 100,)
+        lines.append("%-*s %12s %12s %-5s %8s  %s" %
+                     (width, name, bstr, cstr, units.get(name, ""), chstr, status))
+    return "\n".join(lines)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: Delmic
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+
+# Start-up time benchmark: measures how long it takes to import the main
+# modules of Odemis, in a new Python interpreter each time (as the modules are
+# only imported once per process).
+# Python 2 doesn't have "-X importtime", so the import time of each module is
+# traced by wrapping the __import__() builtin function, which provides the same
+# information: the time spent in each module itself, and including the modules
+# it imports. The modules are identified by comparing sys.modules before and
+# after each import, and the time spent in the tracing itself is discounted.
+
+from __future__ import division
+
+import json
+import logging
+from odemis.bench import benchmark, SUITE_MICRO, Metric, median
+import os
+import subprocess
+import sys
+
+
+# Module to import -> maximum import time (in s)
+IMPORT_BUDGETS = {
+    "odemis.model": 0.5,
+    "odemis.dataio": 1.0,
+    "odemis.util.img": 0.5,
+    "odemis.acq.stream": 2.0,
+    "odemis.cli.main": 1.0,
+    "odemis.odemisd.main": 1.5,
+}
+
+# Number of modules reported in the details, sorted by import time
+NUM_DETAILED_MODULES = 10
+
+# Code run in the new interpreter. It imports the module passed as argument,
+# and writes on the last line of the output the import times as JSON.
+_TRACER_CODE = """
+import __builtin__, json, sys, time
+_orig_import = __builtin__.__import__
+# For each level of the stack: time spent in the imports which loaded modules,
+# time spent in tracing, set of the modules loaded
+_stack = [[0, 0, set()]]
+_times = {}  # module name(s) -> (self time, cumulative time)
+def _traced_import(name, *args, **kwargs):
+    tracet = time.time()
+    before = set(sys.modules)
+    _stack.append([0, 0, set()])
+    start = time.time()
+    try:
+        return _orig_import(name, *args, **kwargs)
+    finally:
+        end = time.time()
+        sub, subtrace, submods = _stack.pop()
+        # The modules actually loaded (name can be relative, or refer to the
+        # package of the modules loaded via the fromlist). None entries are
+        # just placeholders of failed implicit relative imports.
+        new = set(n for n in sys.modules if n not in before and sys.modules[n] is not None)
+        dur = end - start - subtrace
+        parent = _stack[-1]
+        parent[2] |= new
+        if new:
+            parent[0] += dur
+        own = new - submods  # The ones loaded by the nested imports are counted there
+        if own:
+            key = "+".join(sorted(own))
+            st, ct = _times.get(key, (0, 0))
+            _times[key] = (st + dur - sub, ct + dur)
+        parent[1] += subtrace + (start - tracet) + (time.time() - end)
+__builtin__.__import__ = _traced_import
+start = time.time()
+__import__(sys.argv[1])
+total = time.time() - start - _stack[0][1]
+__builtin__.__import__ = _orig_import
+sys.stdout.write("\\n" + json.dumps({"total": total, "modules": _times}) + "\\n")
+"""
+
+
+def measureImport(module):
+    """
+    Import a module in a new Python interpreter
+    module (str): name of the module to import
+    return (float, dict str -> (float, float)): total import time (in s), and
+      for each module imported: self time and cumulative time (in s). If a
+      single import statement loaded several modules (eg, a package and its
+      sub-module), their names are joined with "+".
+    raise IOError: if the import failed
+    """
+    env = os.environ.copy()
+    # Make sure the same version of Odemis is imported
+    srcdir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env["PYTHONPATH"] = os.pathsep.join([srcdir] + [p for p in [env.get("PYTHONPATH")] if p])
+
+    p = subprocess.Popen([sys.executable, "-c", _TRACER_CODE, module], env=env,
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = p.communicate()
+    if p.returncode != 0:
+        raise IOError("Failed to import %s: %s" % (module, err.strip().split("\n")[-1]))
+
+    res = json.loads(out.strip().split("\n")[-1])
+    modules = dict((n, tuple(t)) for n, t in res["modules"].items())
+    return res["total"], modules
+
+
+@benchmark(SUITE_MICRO, "startup.imports")
+def startup_imports(repeat):
+    """
+    Import time of the main modules, in a new interpreter, compared to a budget
+    """
+    metrics = []
+    for module, budget in sorted(IMPORT_BUDGETS.items()):
+        totals = []
+        selftimes = {}  # module name -> list of self times
+        for i in range(repeat):
+            total, modules = measureImport(module)
+            totals.append(total)
+            for n, (st, ct) in modules.items():
+                selftimes.setdefault(n, []).append(st)
+
+        # Report the slowest modules, to find quickly the culprit
+        slowest = sorted(((median(ts), n) for n, ts in selftimes.items()), reverse=True)
+        details = dict((n, t) for t, n in slowest[:NUM_DETAILED_MODULES])
+        logging.debug("Slowest modules imported by %s: %s", module,
+                      ", ".join("%s (%g s)" % (n, t) for t, n in slowest[:NUM_DETAILED_MODULES]))
+        metrics.append(Metric("startup.import.%s" % (module,), median(totals), "s",
+                              samples=totals, budget=budget, details=details))
+    return metrics
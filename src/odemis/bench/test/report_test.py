@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: Delmic
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+from __future__ import division
+
+import logging
+from odemis import bench
+from odemis.bench import Metric, report
+import os
+import tempfile
+import unittest
+
+
+logging.getLogger().setLevel(logging.DEBUG)
+
+
+class TestReport(unittest.TestCase):
+
+    def setUp(self):
+        self.baseline = report.createReport([
+            Metric("img.histogram.uint16", 0.1, "s"),
+            Metric("dataflow.bandwidth.2048x2048", 500, "MB/s", higher_better=True),
+            Metric("va.get", 0.001, "s"),
+            Metric("old.metric", 1, "s"),
+        ])
+
+    def test_save_load(self):
+        fd, fn = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        try:
+            report.saveReport(fn, self.baseline)
+            rep = report.loadReport(fn)
+        finally:
+            os.remove(fn)
+        self.assertEqual(rep["metrics"], self.baseline["metrics"])
+        self.assertEqual(rep["metrics"]["va.get"]["value"], 0.001)
+
+    def test_compare(self):
+        current = report.createReport([
+            Metric("img.histogram.uint16", 0.2, "s"),  # twice slower
+            Metric("dataflow.bandwidth.2048x2048", 1000, "MB/s", higher_better=True),
+            Metric("va.get", 0.00105, "s"),  # +5%
+            Metric("new.metric", 1, "s"),
+        ])
+        results = report.compareReports(self.baseline, current, threshold=0.1)
+        status = dict((r[0], r[4]) for r in results)
+        self.assertEqual(status, {"img.histogram.uint16": report.ST_REGRESSED,
+                                  "dataflow.bandwidth.2048x2048": report.ST_IMPROVED,
+                                  "va.get": report.ST_OK,
+                                  "old.metric": report.ST_MISSING,
+                                  "new.metric": report.ST_NEW,
+                                 })
+        change = dict((r[0], r[3]) for r in results)
+        self.assertAlmostEqual(change["img.histogram.uint16"], -1)
+        self.assertAlmostEqual(change["dataflow.bandwidth.2048x2048"], 1)
+
+        # Specific thresholds, the last matching pattern is used
+        results = report.compareReports(self.baseline, current, threshold=0.01,
+                                        thresholds=[("img.*", 0.5), ("img.histogram.*", 2)])
+        status = dict((r[0], r[4]) for r in results)
+        self.assertEqual(status["img.histogram.uint16"], report.ST_OK)
+        self.assertEqual(status["va.get"], report.ST_REGRESSED)
+
+        txt = report.formatComparison(results)
+        self.assertEqual(len(txt.split("\n")), len(results) + 1)
+
+    def test_budgets(self):
+        current = report.createReport([
+            Metric("startup.import.odemis.model", 0.6, "s", budget=0.5),
+            Metric("startup.import.odemis.dataio", 0.4, "s", budget=1),
+            Metric("dataflow.bandwidth.2048x2048", 500, "MB/s", higher_better=True,
+                   budget=1000),
+            Metric("va.get", 0.001, "s"),
+        ])
+        exceeded = report.checkBudgets(current)
+        self.assertEqual([e[0] for e in exceeded],
+                         ["dataflow.bandwidth.2048x2048", "startup.import.odemis.model"])
+
+        # Budgets passed explicitly override the default ones
+        exceeded = report.checkBudgets(current, [("startup.import.*", 0.3),
+                                                 ("dataflow.*", 100)])
+        self.assertEqual(exceeded, [("startup.import.odemis.dataio", 0.4, 0.3),
+                                    ("startup.import.odemis.model", 0.6, 0.3)])
+
+    def test_median(self):
+        self.assertEqual(bench.median([3, 1, 2]), 2)
+        self.assertEqual(bench.median([4, 1, 2, 3]), 2.5)
+        durs = bench.measureDuration(lambda: None, 3, 10)
+        self.assertEqual(len(durs), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -26,8 +26,10 @@ from __future__ import division
 import argparse
 from gettext import ngettext
 import logging
+import multiprocessing
 import numpy
 from odemis import dataio, model
+from odemis.dataio import tiff
 from odemis.acq.stream import StaticSEMStream, StaticCLStream, StaticSpectrumStream, \
                               StaticARStream, StaticFluoStream
 import odemis
@@ -36,6 +38,7 @@ from odemis.util import spectrum
 from odemis.util import dataio as io
 import os
 import sys
+import time
 
 from odemis.acq.stitching import WEAVER_MEAN, WEAVER_COLLAGE
 
@@ -102,9 +105,11 @@ def open_ec(fn):
     return [da]
 
 
-def save_acq(fn, data, thumbs, pyramid=False):
+def save_acq(fn, data, thumbs, pyramid=False, compression=None):
     """
     Saves to a file the data and thumbnail
+    compression (None or str): compression profile (dataio.COMPRESSION_*).
+      If None, the default of the format is used.
     """
     exporter = dataio.find_fittest_converter(fn)
 
@@ -123,6 +128,12 @@ def save_acq(fn, data, thumbs, pyramid=False):
         else:
             raise ValueError("Format %s doesn't support pyramidal export" %
                              (exporter.FORMAT,))
+    if compression is not None:
+        if exporter.CAN_COMPRESS:
+            kwargs["compressed"] = compression
+        else:
+            raise ValueError("Format %s doesn't support compression" %
+                             (exporter.FORMAT,))
 
     exporter.export(fn, data, thumb, **kwargs)
 
@@ -265,6 +276,192 @@ def stitch(infns, method):
     return st_data
 
 
+def index_dir(dirname):
+    """
+    Update the index of the acquisition files of a directory, and list them
+    """
+    if not os.path.isdir(dirname):
+        raise ValueError("%s is not a directory" % (dirname,))
+
+    index = io.index_directory(dirname)
+    for bn, info in sorted(index.items()):
+        streams = info["streams"]
+        desc = ", ".join("%s %s" % (s["metadata"].get(model.MD_DESCRIPTION, "?"),
+                                    "x".join(str(d) for d in s["shape"]))
+                         for s in streams)
+        print "%s (%s): %d %s: %s" % (bn, info["format"], len(streams),
+                                      ngettext("stream", "streams", len(streams)), desc)
+
+    logging.info("Indexed %d files in %s", len(index), dirname)
+
+
+def _get_available_memory():
+    """
+    return (int or None): memory available (in bytes), or None if unknown
+    """
+    try:
+        with open("/proc/meminfo") as f:
+            for l in f:
+                if l.startswith("MemAvailable:"):
+                    return int(l.split()[1]) * 1024
+    except (IOError, ValueError):
+        pass
+    return None
+
+
+def _get_file_size(fn):
+    """
+    return (int): size of the file in bytes, or 0 if it cannot be accessed
+    """
+    try:
+        return os.stat(fn).st_size
+    except OSError:
+        return 0
+
+
+def _is_up_to_date(outfn, infns):
+    """
+    return (bool): True if the output file exists and is newer than all the
+      input files
+    raise OSError: if an input file cannot be accessed (eg, it doesn't exist)
+    """
+    try:
+        outmt = os.stat(outfn).st_mtime
+    except OSError:
+        return False
+    return all(os.stat(fn).st_mtime <= outmt for fn in infns)
+
+
+def convert_job(job):
+    """
+    Run one conversion, to be called from a worker process
+    job (tuple): infns (list of str), outfn (str), stitch (None or weaving
+      method), pyramid (bool), compression (None or str), minusfns (list of str)
+    return (str, float, None or str): output filename, duration (s), error message
+      (or None if successful)
+    """
+    infns, outfn, weaver, pyramid, compression, minusfns = job
+    startt = time.time()
+    try:
+        if weaver is not None:
+            data = stitch(infns, weaver)
+            thumbs = []
+        else:
+            data, thumbs = open_acq(infns[0])
+
+        if minusfns:
+            thumbs = []
+            for fn in minusfns:
+                sdata, _ = open_acq(fn)
+                data = minus(data, sdata)
+
+        save_acq(outfn, data, thumbs, pyramid, compression)
+    except Exception as ex:
+        logging.debug("Conversion to %s failed", outfn, exc_info=True)
+        return outfn, time.time() - startt, "%s: %s" % (ex.__class__.__name__, ex)
+
+    return outfn, time.time() - startt, None
+
+
+def _list_acq_files(dirname):
+    """
+    return (list of str): the paths of the acquisition files in a directory
+    """
+    fmts = dataio.get_available_formats(os.O_RDONLY)
+    exts = tuple(e.lower() for es in fmts.values() for e in es)
+    return [os.path.join(dirname, bn) for bn in sorted(os.listdir(dirname))
+            if not bn.startswith(".") and bn.lower().endswith(exts)]
+
+
+def batch_convert(inputs, outdir, ext, weaver=None, pyramid=False,
+                  compression=None, minusfns=None, force=False, njobs=None):
+    """
+    Convert many files, in parallel (with one process per file).
+    inputs (list of str): files or directories. If weaver is None, each file
+      (including each file in the directories) is converted into one file.
+      Otherwise, each directory is a set of tiles to stitch into one file.
+    outdir (str): directory where the output files are written
+    ext (str): extension of the output files, which defines the format
+    weaver (None or WEAVER_*): if not None, stitch the tiles with this method
+    pyramid (bool): see save_acq()
+    compression (None or str): see save_acq()
+    minusfns (None or list of str): files to subtract to each input
+    force (bool): if False, outputs newer than their input are not converted again
+    njobs (None or 0<int): maximum number of conversions simultaneously. If
+      None, it's limited by the number of CPUs and by the available memory.
+    return (int): number of conversions which failed
+    """
+    minusfns = minusfns or []
+
+    # Each job is a list of input files -> one output file
+    jobs = []
+    for inp in inputs:
+        if weaver is not None:
+            if not os.path.isdir(inp):
+                raise ValueError("%s is not a directory of tiles" % (inp,))
+            infns = _list_acq_files(inp)
+            name = os.path.basename(os.path.normpath(inp))
+            jobs.append((infns, os.path.join(outdir, name + ext)))
+        elif os.path.isdir(inp):
+            for fn in _list_acq_files(inp):
+                name, _ = io.splitext(os.path.basename(fn))
+                jobs.append(([fn], os.path.join(outdir, name + ext)))
+        else:
+            name, _ = io.splitext(os.path.basename(inp))
+            jobs.append(([inp], os.path.join(outdir, name + ext)))
+
+    outfns = [o for i, o in jobs]
+    if len(set(outfns)) != len(outfns):
+        raise ValueError("Multiple inputs would be converted to the same output file")
+
+    todo = []
+    for infns, outfn in jobs:
+        try:
+            if not force and _is_up_to_date(outfn, infns + minusfns):
+                logging.info("Skipping %s which is already up to date", outfn)
+                continue
+        except OSError as ex:
+            # Typically, the file was deleted since the directory was listed
+            logging.warning("Skipping %s as an input file cannot be read: %s", outfn, ex)
+            continue
+        todo.append((infns, outfn, weaver, pyramid, compression, minusfns))
+
+    if not todo:
+        logging.info("Nothing to convert")
+        return 0
+
+    if njobs is None:
+        njobs = multiprocessing.cpu_count()
+        # The data is fully loaded in memory (and typically a couple of copies
+        # are needed) => don't run more simultaneous jobs than memory allows
+        mem = _get_available_memory()
+        if mem is not None:
+            maxsize = max(sum(_get_file_size(fn) for fn in j[0]) for j in todo)
+            # Files are compressed, so take a (rather large) margin
+            njobs = max(1, min(njobs, int(mem // (maxsize * 8 + 1))))
+    njobs = min(njobs, len(todo))
+    logging.info("Converting %d files, with %d simultaneous jobs", len(todo), njobs)
+
+    startt = time.time()
+    nfailed = 0
+    # One task per child, to be sure that the memory is freed after each conversion
+    pool = multiprocessing.Pool(njobs, maxtasksperchild=1)
+    try:
+        for outfn, dur, err in pool.imap_unordered(convert_job, todo):
+            if err:
+                nfailed += 1
+                logging.error("Failed to generate %s (after %g s): %s", outfn, dur, err)
+            else:
+                logging.info("Generated %s in %g s", outfn, dur)
+    finally:
+        pool.close()
+        pool.join()
+
+    logging.info("Converted %d files in %g s (%d failed)",
+                 len(todo) - nfailed, time.time() - startt, nfailed)
+    return nfailed
+
+
 def main(args):
     """
     Handles the command line arguments
@@ -280,6 +477,13 @@ def main(args):
                         help="name of the input file")
     parser.add_argument("--tiles", "-t", dest="tiles", nargs="+",
                         help="list of files acquired in tiles to re-assemble")
+    parser.add_argument("--batch", "-b", dest="batch", nargs="+",
+                        help="list of files or directories to convert in batch. "
+                        "--output must then be a directory. With --stitch, each "
+                        "directory is a set of tiles to re-assemble.")
+    parser.add_argument("--index", dest="index", metavar="DIRECTORY",
+                        help="update the metadata and thumbnail index of all the "
+                        "acquisition files in the directory, and list them")
     parser.add_argument("--effcomp", dest="effcomp",
                         help="name of a spectrum efficiency compensation table (in CSV format)")
     fmts = dataio.get_available_formats(os.O_WRONLY)
@@ -292,6 +496,11 @@ def main(args):
                         help="Export the data in pyramidal format. "
                         "It takes about 2x more space, but allows to visualise large images. "
                         "Currently, only the TIFF format supports this option.")
+    parser.add_argument("--compression", "-c", dest="compression",
+                        choices=dataio.COMPRESSION_PROFILES,
+                        help="Compression profile. 'fast' takes little CPU time, "
+                        "'max' creates the smallest files. Default is 'balanced' "
+                        "(for the formats supporting compression).")
     parser.add_argument("--minus", "-m", dest="minus", action='append',
             help="name of an acquisition file whose data is subtracted from the input file.")
     parser.add_argument("--weaver", "-w", dest="weaver",
@@ -300,6 +509,18 @@ def main(args):
             "(paste tiles as-is at calculated position)", choices=("mean", "collage"),
             default='mean')
 
+    parser.add_argument("--stitch", "-s", dest="stitch", action='store_true',
+                        help="in batch mode, stitch the tiles of each directory")
+    parser.add_argument("--ext", "-e", dest="ext", default=tiff.EXTENSIONS[0],
+                        help="in batch mode, extension of the output files, which "
+                        "defines their format (default is %(default)s)")
+    parser.add_argument("--jobs", "-j", dest="jobs", type=int,
+                        help="in batch mode, maximum number of files converted "
+                        "simultaneously (default depends on the CPUs and memory available)")
+    parser.add_argument("--force", "-f", dest="force", action='store_true',
+                        help="in batch mode, also convert the files whose output "
+                        "is already up to date")
+
     # TODO: --export (spatial) image that defaults to a HFW corresponding to the
     # smallest image, and can be overridden by --hfw xxx (in µm).
     # TODO: --range parameter to select which image to select from the input
@@ -314,6 +535,26 @@ def main(args):
                "Licensed under the " + odemis.__license__)
         return 0
 
+    if options.index:
+        index_dir(options.index)
+        return 0
+
+    method = {"collage": WEAVER_COLLAGE, "mean": WEAVER_MEAN}[options.weaver]
+    if options.batch:
+        if not options.output or not os.path.isdir(options.output):
+            raise ValueError("--output must be an existing directory in batch mode.")
+        if options.input or options.tiles or options.effcomp:
+            raise ValueError("--batch cannot be used with --input, --tiles, --effcomp.")
+        if options.jobs is not None and options.jobs < 1:
+            raise ValueError("--jobs must be at least 1.")
+        weaver = method if options.stitch else None
+        nfailed = batch_convert(options.batch, options.output, options.ext,
+                                weaver, options.pyramid, options.compression,
+                                options.minus, options.force, options.jobs)
+        if nfailed:
+            raise IOError("%d conversions failed" % (nfailed,))
+        return 0
+
     infn = options.input
     tifns = options.tiles
     ecfn = options.effcomp
@@ -331,7 +572,6 @@ def main(args):
                      len(data), ngettext("image", "images", len(data)),
                      len(thumbs), ngettext("thumbnail", "thumbnails", len(thumbs)))
     elif tifns:
-        method = {"collage": WEAVER_COLLAGE, "mean": WEAVER_MEAN}[options.weaver]
         data = stitch(tifns, method)
         thumbs = []
         logging.info("File contains %d %s",
@@ -349,7 +589,7 @@ def main(args):
             sdata, _ = open_acq(fn)
             data = minus(data, sdata)
 
-    save_acq(outfn, data, thumbs, options.pyramid)
+    save_acq(outfn, data, thumbs, options.pyramid, options.compression)
 
     logging.info("Successfully generated file %s", outfn)
 
@@ -38,8 +38,10 @@ from odemis.util import units
 from odemis.util.conversion import convert_to_object
 from odemis.util.driver import BACKEND_RUNNING, \
     BACKEND_DEAD, BACKEND_STOPPED, get_backend_status, BACKEND_STARTING
+import pstats
 import sys
 import threading
+import time
 
 
 status_to_xtcode = {BACKEND_RUNNING: 0,
@@ -757,6 +759,56 @@ def live_display(comp_name, df_name):
     finally:
         df.unsubscribe(new_image_wrapper)
 
+def profile(comp_name, duration, filename=None):
+    """
+    Profile the code running in the container of a component, and save the
+    statistics in a pstats file
+    comp_name (string): name of the component
+    duration (0<float): duration of the profiling (in s)
+    filename (None or unicode): name of the pstats file. If None, it's named
+      after the component and the current time.
+    """
+    component = get_component(comp_name)
+    container = model.getContainerOf(component)
+
+    logging.info("Profiling the container of %s for %g s...", component.name, duration)
+    # The timeout ensures it stops, even if this process dies
+    container.startProfiling(timeout=duration + 10)
+    try:
+        time.sleep(duration)
+    except KeyboardInterrupt:
+        logging.info("Stopping the profiling early")
+    finally:
+        stats, timings = container.stopProfiling()
+
+    if filename is None:
+        filename = u"%s-%s.pstats" % (component.name, time.strftime("%Y%m%d-%H%M%S"))
+    try:
+        with open(filename, "wb") as f:
+            f.write(stats)
+    except IOError as exc:
+        raise IOError(u"Failed to save to '%s': %s" % (filename, exc))
+    logging.info(u"Profiling statistics saved to %s", filename)
+
+    # Summary of the functions taking the most time
+    ps = pstats.Stats(filename, stream=sys.stdout)
+    ps.sort_stats("time").print_stats(20)
+
+    print("DataFlow listener\tcalls\ttotal (s)\tmax (s)")
+    for dfname, lname, n, tot, mx in timings:
+        print("%s -> %s\t%d\t%g\t%g" % (dfname, lname, n, tot, mx))
+
+def print_thread_stacks(comp_name):
+    """
+    Display the current stack of every thread of the container of a component
+    comp_name (string): name of the component
+    """
+    component = get_component(comp_name)
+    container = model.getContainerOf(component)
+    stacks = container.getThreadStacks()
+    for name in sorted(stacks.keys()):
+        print("Thread %s:\n%s" % (name, stacks[name]))
+
 def ensure_output_encoding():
     """
     Make sure the output encoding supports unicode
@@ -835,10 +887,19 @@ def main(args):
     dm_grp.add_argument("--output", "-o", dest="output",
                         help="name of the file where the image should be saved "
                         "after acquisition. The file format is derived from the extension "
-                        "(TIFF and HDF5 are supported).")
+                        "(TIFF and HDF5 are supported). For profiling, name of the "
+                        "pstats file.")
     dm_grpe.add_argument("--live", dest="live", nargs="+",
                          metavar=("<component>", "data-flow"),
                          help="display and update an image on the screen (default data-flow is \"data\")")
+    dm_grpe.add_argument("--profile", dest="profile", metavar="<component>",
+                         help="profile the code running with the component (in the same "
+                         "container), and save the statistics as a pstats file.")
+    dm_grp.add_argument("--duration", dest="duration", type=float, default=10,
+                        help="duration (in s) of the profiling (default = 10 s).")
+    dm_grpe.add_argument("--threads", dest="threads", metavar="<component>",
+                         help="display the current stack of all the threads running with "
+                         "the component (in the same container).")
 
     options = parser.parse_args(args[1:])
 
@@ -877,12 +938,15 @@ def main(args):
         options.list, options.stop, options.move,
         options.position, options.reference,
         options.listprop, options.setattr, options.upmd,
-        options.acquire, options.live)):
+        options.acquire, options.live, options.profile, options.threads)):
         logging.error("No action specified.")
         return 127
     if options.acquire is not None and options.output is None:
         logging.error("Name of the output file must be specified.")
         return 127
+    if options.duration <= 0:
+        logging.error("Duration must be positive.")
+        return 127
     if options.setattr:
         for l in options.setattr:
             if len(l) < 3 or (len(l) - 1) % 2 == 1:
@@ -965,6 +1029,13 @@ def main(args):
             else:
                 raise ValueError("Live command accepts only one data-flow")
             live_display(component, dataflow)
+        elif options.profile is not None:
+            filename = None
+            if options.output is not None:
+                filename = options.output.decode(sys.getfilesystemencoding())
+            profile(options.profile, options.duration, filename)
+        elif options.threads is not None:
+            print_thread_stacks(options.threads)
     except KeyboardInterrupt:
         logging.info("Interrupted before the end of the execution")
         return 1
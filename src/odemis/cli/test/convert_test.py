@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: Delmic
+Testing class for convert.py of cli.
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+from __future__ import division
+
+import logging
+import numpy
+from odemis import model
+from odemis.cli import convert
+from odemis.dataio import tiff, hdf5
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+
+logging.getLogger().setLevel(logging.DEBUG)
+
+
+class TestBatchConvert(unittest.TestCase):
+
+    def setUp(self):
+        self.indir = tempfile.mkdtemp()
+        self.outdir = tempfile.mkdtemp()
+        md = {model.MD_DESCRIPTION: "sem",
+              model.MD_PIXEL_SIZE: (1e-7, 1e-7),
+              model.MD_POS: (1e-3, -30e-3),
+              }
+        for i in range(3):
+            data = model.DataArray(numpy.zeros((64, 128), numpy.uint16) + i, md)
+            tiff.export(os.path.join(self.indir, u"acq%d.ome.tiff" % i), data)
+
+    def tearDown(self):
+        shutil.rmtree(self.indir)
+        shutil.rmtree(self.outdir)
+
+    def test_batch_dir(self):
+        """
+        Convert a whole directory, and check that converting again is skipped
+        """
+        ret = convert.main(["convert", "--batch", self.indir, "--output", self.outdir,
+                            "--ext", ".h5", "-j", "2"])
+        self.assertEqual(ret, 0)
+        outfns = sorted(os.listdir(self.outdir))
+        self.assertEqual(outfns, ["acq0.h5", "acq1.h5", "acq2.h5"])
+        for i, fn in enumerate(outfns):
+            data = hdf5.read_data(os.path.join(self.outdir, fn))
+            self.assertEqual(len(data), 1)
+            self.assertEqual(data[0].shape[-2:], (64, 128))
+            self.assertEqual(data[0][..., 0, 0], i)
+
+        # Up to date => nothing converted
+        mtimes = [os.stat(os.path.join(self.outdir, fn)).st_mtime for fn in outfns]
+        time.sleep(0.1)
+        nfailed = convert.batch_convert([self.indir], self.outdir, ".h5")
+        self.assertEqual(nfailed, 0)
+        mtimes2 = [os.stat(os.path.join(self.outdir, fn)).st_mtime for fn in outfns]
+        self.assertEqual(mtimes, mtimes2)
+
+        # Input updated => only that one converted
+        time.sleep(0.1)
+        data = model.DataArray(numpy.zeros((32, 32), numpy.uint16))
+        tiff.export(os.path.join(self.indir, u"acq1.ome.tiff"), data)
+        nfailed = convert.batch_convert([self.indir], self.outdir, ".h5")
+        self.assertEqual(nfailed, 0)
+        mtimes3 = [os.stat(os.path.join(self.outdir, fn)).st_mtime for fn in outfns]
+        self.assertEqual(mtimes3[0], mtimes[0])
+        self.assertGreater(mtimes3[1], mtimes[1])
+        self.assertEqual(mtimes3[2], mtimes[2])
+
+    def test_batch_failure(self):
+        """
+        A file which cannot be read doesn't prevent the others to be converted
+        """
+        badfn = os.path.join(self.indir, u"bad.h5")
+        with open(badfn, "w") as f:
+            f.write("not an HDF5 file")
+
+        nfailed = convert.batch_convert([badfn, os.path.join(self.indir, u"acq0.ome.tiff")],
+                                        self.outdir, ".h5", compression="fast")
+        self.assertEqual(nfailed, 1)
+        self.assertEqual(os.listdir(self.outdir), ["acq0.h5"])
+
+    def test_batch_missing(self):
+        """
+        An input file which disappeared is skipped, without stopping the batch
+        """
+        nfailed = convert.batch_convert([self.indir], self.outdir, ".h5")
+        self.assertEqual(nfailed, 0)
+
+        # acq1 deleted (eg, after listing the directory)
+        time.sleep(0.1)
+        os.remove(os.path.join(self.indir, u"acq1.ome.tiff"))
+        data = model.DataArray(numpy.zeros((32, 32), numpy.uint16))
+        tiff.export(os.path.join(self.indir, u"acq2.ome.tiff"), data)
+        infns = [os.path.join(self.indir, u"acq%d.ome.tiff" % i) for i in range(3)]
+        nfailed = convert.batch_convert(infns, self.outdir, ".h5")
+        self.assertEqual(nfailed, 0)
+        data = hdf5.read_data(os.path.join(self.outdir, u"acq2.h5"))
+        self.assertEqual(data[0].shape[-2:], (32, 32))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -26,6 +26,8 @@ from __future__ import division
 import importlib
 import logging
 from odemis.dataio import tiff
+from odemis.dataio._compress import COMPRESSION_NONE, COMPRESSION_FAST, \
+    COMPRESSION_BALANCED, COMPRESSION_MAX, COMPRESSION_PROFILES
 import os
 
 
@@ -34,6 +36,8 @@ import os
 #  * FORMAT (string): user friendly name of the format
 #  * EXTENSIONS (list of strings): possible file-name extensions
 #  * export (callable): write model.DataArray into a file
+#  * CAN_COMPRESS (bool): if True, export() accepts a "compressed" argument,
+#    which is either a boolean or one of the COMPRESSION_* profiles.
 #  * read_data (callable): read a file into model.DataArray
 #  * read_thumbnail (callable): read the thumbnail(s) of a file
 #  if it doesn't support writing, then is has no .export(), and if it doesn't
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: Delmic
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+# Helpers shared by the exporters to select a compression and to compress
+# (independent) blocks of data in parallel.
+
+from __future__ import division
+
+from concurrent.futures.thread import ThreadPoolExecutor
+import collections
+import multiprocessing
+import numpy
+import zlib
+
+
+# Compression profiles, which each exporter maps to the most fitting codec
+# it supports.
+COMPRESSION_NONE = "none"
+COMPRESSION_FAST = "fast"  # Low CPU usage, still reduces the size a lot
+COMPRESSION_BALANCED = "balanced"  # Default
+COMPRESSION_MAX = "max"  # Smallest file, but slow
+COMPRESSION_PROFILES = (COMPRESSION_NONE, COMPRESSION_FAST, COMPRESSION_BALANCED,
+                        COMPRESSION_MAX)
+
+
+def get_compression_profile(compressed):
+    """
+    Convert the "compressed" argument of the exporters to a profile name
+    compressed (bool or str): False for no compression, True for the default
+      compression, or one of the COMPRESSION_* profile names.
+    return (str): one of the COMPRESSION_* values
+    raise ValueError: if the profile is unknown
+    """
+    if compressed is True:
+        return COMPRESSION_BALANCED
+    elif not compressed:
+        return COMPRESSION_NONE
+    elif compressed in COMPRESSION_PROFILES:
+        return compressed
+    else:
+        raise ValueError("Unknown compression profile '%s', should be one of %s" %
+                         (compressed, ", ".join(COMPRESSION_PROFILES)))
+
+
+def _get_num_workers():
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def shuffle_bytes(a):
+    """
+    Reorder the bytes of an array so that the n-th byte of every element are
+    grouped together (the same as the HDF5 "shuffle" filter does).
+    a (numpy.ndarray): the data
+    return (str): the shuffled bytes
+    """
+    a = numpy.ascontiguousarray(a)
+    if a.itemsize == 1:
+        return a.tostring()
+    return a.view(numpy.uint8).reshape(-1, a.itemsize).T.tostring()
+
+
+def deflate_blocks(blocks, level, max_workers=None):
+    """
+    Compress a sequence of data blocks with zlib (aka "deflate"), using
+    multiple threads. zlib releases the GIL while compressing, so this scales
+    with the number of CPUs.
+    The blocks are read lazily, and at most a few blocks per worker are kept
+    in memory at the same time, so that it's fine to pass a generator over
+    large data.
+    blocks (iterable of str or numpy.ndarray): the data to compress
+    level (0<=int<=9): zlib compression level
+    max_workers (None or int>0): number of threads. If None, one per CPU.
+    yield (str): the compressed blocks, in the same order as the input
+    """
+    if max_workers is None:
+        max_workers = _get_num_workers()
+
+    if max_workers <= 1:
+        for b in blocks:
+            yield zlib.compress(b, level)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        queue = collections.deque()
+        for b in blocks:
+            queue.append(executor.submit(zlib.compress, b, level))
+            # Limit the memory usage by not submitting too far in advance
+            if len(queue) >= 2 * max_workers:
+                yield queue.popleft().result()
+        while queue:
+            yield queue.popleft().result()
+    finally:
+        executor.shutdown(wait=True)
@@ -30,6 +30,7 @@ EXTENSIONS = [u".csv"]
 
 LOSSY = True  # because it only supports AR in phi/theta and spectrum in wavelength/intensity format export
 CAN_SAVE_PYRAMID = False
+CAN_COMPRESS = False
 
 
 def export(filename, data):
@@ -23,11 +23,17 @@ from __future__ import division
 
 import collections
 import h5py
+import itertools
 import logging
 import numpy
 from odemis import model
+from odemis.dataio._compress import get_compression_profile, deflate_blocks, \
+    shuffle_bytes, COMPRESSION_NONE, COMPRESSION_FAST, COMPRESSION_BALANCED, \
+    COMPRESSION_MAX
 from odemis.util import spectrum, img, fluo
 import os
+import Queue
+import threading
 import time
 
 
@@ -37,6 +43,18 @@ FORMAT = "HDF5"
 EXTENSIONS = [u".h5", u".hdf5"]
 LOSSY = False
 CAN_SAVE_PYRAMID = False
+CAN_COMPRESS = True
+
+# Compression profile -> (gzip level, shuffle)
+# Only gzip is used, as szip is not free for commercial usage and lzf is not
+# supported by most of the other HDF5 readers. The chunks are compressed in
+# parallel, so even the "max" profile is not too slow on multi-core computers.
+_COMPRESSIONS = {
+    COMPRESSION_NONE: (None, False),
+    COMPRESSION_FAST: (1, False),
+    COMPRESSION_BALANCED: (4, False),  # Same as the h5py default
+    COMPRESSION_MAX: (9, True),
+}
 
 # We are trying to follow the same format as SVI, as defined here:
 # http://www.svi.nl/HDF5
@@ -55,6 +73,14 @@ CAN_SAVE_PYRAMID = False
 #     + SVIData (Not necessary for us)
 
 
+# Time-lapses recorded with TimelapseWriter follow the same structure, with
+# one acquisition per series of frames. The T dimension grows as frames are
+# appended, and ImageData/DimensionScaleT contains the time of each frame, in s
+# relative to TOffset (the acquisition date of the first frame).
+
+# Maximum number of frames waiting to be written by a TimelapseWriter
+TIMELAPSE_QUEUE_SIZE = 16
+
 # Image is an official extension to HDF5:
 # http://www.hdfgroup.org/HDF5/doc/ADGuide/ImageSpec.html
 
@@ -81,7 +107,45 @@ CAN_SAVE_PYRAMID = False
 # http://code.google.com/p/h5py/issues/detail?id=157
 
 
-def _create_image_dataset(group, dataset_name, image, **kwargs):
+def _create_deflated_dataset(group, dataset_name, data, level, shuffle=False):
+    """
+    Create a gzip compressed dataset, with the compression of each chunk done
+    in parallel (instead of the single-threaded HDF5 filter pipeline).
+    group (HDF group): the group that will contain the dataset
+    dataset_name (string): name of the dataset
+    data (numpy.ndarray): the data to store
+    level (0<=int<=9): gzip compression level
+    shuffle (bool): whether the shuffle filter is applied before compression
+    returns the new dataset
+    """
+    dataset = group.create_dataset(dataset_name, shape=data.shape, dtype=data.dtype,
+                                   chunks=True, compression="gzip",
+                                   compression_opts=level, shuffle=shuffle)
+    chunks = dataset.chunks
+    offsets = list(itertools.product(*[range(0, s, c) for s, c in zip(data.shape, chunks)]))
+
+    def read_chunks():
+        for o in offsets:
+            block = data[tuple(slice(i, i + c) for i, c in zip(o, chunks))]
+            if block.shape != chunks:
+                # Chunks on the border are always stored full size
+                fblock = numpy.zeros(chunks, dtype=data.dtype)
+                fblock[tuple(slice(0, s) for s in block.shape)] = block
+                block = fblock
+            if shuffle:
+                yield shuffle_bytes(block)
+            else:
+                yield numpy.ascontiguousarray(block).tostring()
+
+    # The chunk data is passed directly to the file: it must match exactly
+    # the encoding of the filter pipeline (shuffle, then deflate).
+    for o, cdata in itertools.izip(offsets, deflate_blocks(read_chunks(), level)):
+        dataset.id.write_direct_chunk(o, cdata)
+
+    return dataset
+
+
+def _create_image_dataset(group, dataset_name, image, compression=COMPRESSION_NONE):
     """
     Create a dataset respecting the HDF5 image specification
     http://www.hdfgroup.org/HDF5/doc/ADGuide/ImageSpec.html
@@ -89,11 +153,29 @@ def _create_image_dataset(group, dataset_name, image, **kwargs):
     group (HDF group): the group that will contain the dataset
     dataset_name (string): name of the dataset
     image (numpy.ndimage): the image to create. It should have at least 2 dimensions
+    compression (str): compression profile (COMPRESSION_*)
     returns the new dataset
     """
     assert(len(image.shape) >= 2)
-    image_dataset = group.create_dataset(dataset_name, data=image, **kwargs)
+    level, shuffle = _COMPRESSIONS[compression]
+    if level is None:
+        image_dataset = group.create_dataset(dataset_name, data=image)
+    else:
+        image_dataset = _create_deflated_dataset(group, dataset_name, image, level, shuffle)
+
+    _add_image_class(image_dataset, image)
+    if image_dataset.attrs["IMAGE_SUBCLASS"] == "IMAGE_GRAYSCALE":
+        image_dataset.attrs["IMAGE_MINMAXRANGE"] = [image.min(), image.max()]
+
+    return image_dataset
+
 
+def _add_image_class(image_dataset, image):
+    """
+    Adds the attributes of the HDF5 image specification to a dataset
+    image_dataset (HDF Dataset): the image dataset
+    image (numpy.ndimage): an image with the same shape (and type) as the dataset
+    """
     # numpy.string_ is to force fixed-length string (necessary for compatibility)
     # FIXME: needs to be NULLTERM, not NULLPAD... but h5py doesn't allow to distinguish
     image_dataset.attrs["CLASS"] = numpy.string_("IMAGE")
@@ -111,17 +193,30 @@ def _create_image_dataset(group, dataset_name, image, **kwargs):
     else:
         image_dataset.attrs["IMAGE_SUBCLASS"] = numpy.string_("IMAGE_GRAYSCALE")
         image_dataset.attrs["IMAGE_WHITE_IS_ZERO"] = numpy.array(0, dtype="uint8")
-        image_dataset.attrs["IMAGE_MINMAXRANGE"] = [image.min(), image.max()]
 
     image_dataset.attrs["DISPLAY_ORIGIN"] = numpy.string_("UL") # not rotated
     image_dataset.attrs["IMAGE_VERSION"] = numpy.string_("1.2")
 
-    return image_dataset
+
+def _placeholder_array(dataset):
+    """
+    Create an array with the same shape and dtype as a dataset, without
+    reading the data nor allocating the memory for it.
+    dataset (HDF Dataset): the dataset
+    return (numpy.ndarray): read-only array, filled with zeros
+    """
+    a = numpy.lib.stride_tricks.as_strided(numpy.zeros(1, dtype=dataset.dtype),
+                                           shape=dataset.shape,
+                                           strides=(0,) * len(dataset.shape))
+    a.flags.writeable = False
+    return a
 
 
-def _read_image_dataset(dataset):
+def _read_image_dataset(dataset, placeholder=False):
     """
     Get a numpy array from a dataset respecting the HDF5 image specification.
+    placeholder (bool): if True, the data is not read, and an array of the
+     same shape, filled with zeros, is returned (see _placeholder_array())
     returns (numpy.ndimage): it has at least 2 dimensions and if RGB, it has
      a 3 dimensions and the metadata MD_DIMS indicates the order.
     raises
@@ -138,7 +233,10 @@ def _read_image_dataset(dataset):
     # conversion is almost entirely different depending on subclass
     subclass = dataset.attrs.get("IMAGE_SUBCLASS", "IMAGE_GRAYSCALE")
 
-    image = model.DataArray(dataset[...])
+    if placeholder:
+        image = model.DataArray(_placeholder_array(dataset))
+    else:
+        image = model.DataArray(dataset[...])
     if subclass == "IMAGE_GRAYSCALE":
         pass
     elif subclass == "IMAGE_TRUECOLOR":
@@ -242,7 +340,8 @@ def _add_image_info(group, dataset, image):
     #   the time dimension compared to the acquisition event (eg, energy
     #   release on the sample). It's stored in the TOffsetRelative in s.
     # Finally, there is MD_PIXEL_DUR which is the duration between each
-    # element on the time dimension scale.
+    # element on the time dimension scale, or MD_TIME_LIST which is the time
+    # of each element (eg, for a time-lapse, with irregular frame times).
     # TODO: in retrospective, it would have been more logical to store the
     # relative time in TOffset, and the acquisition date (which is not essential
     # to the data) in PhysicalData/AcquisitionDate.
@@ -306,14 +405,21 @@ def _add_image_info(group, dataset, image):
 
         if "T" in dims:
             tpos = dims.index("T")
-            try:
-                v = image.metadata[model.MD_PIXEL_DUR]
+            if model.MD_TIME_LIST in image.metadata:
+                # Store explicitly the time of each frame (like for wavelengths).
+                # It's resizable, to allow appending frames.
+                v = numpy.array(image.metadata[model.MD_TIME_LIST], dtype=numpy.float64)
                 s = ST_REPORTED
-            except KeyError:
-                # Just to put something
-                v = 1.0  # s
-                s = ST_DEFAULT
-            group["DimensionScaleT"] = v  # s
+                group.create_dataset("DimensionScaleT", data=v, maxshape=(None,))
+            else:
+                try:
+                    v = image.metadata[model.MD_PIXEL_DUR]
+                    s = ST_REPORTED
+                except KeyError:
+                    # Just to put something
+                    v = 1.0  # s
+                    s = ST_DEFAULT
+                group["DimensionScaleT"] = v  # s
             group["DimensionScaleT"].attrs["UNIT"] = "s"
             dataset.dims.create_scale(group["DimensionScaleT"], "T")
             _h5svi_set_state(group["DimensionScaleT"], s)
@@ -420,14 +526,23 @@ def _read_image_info(group):
 
     # Time scale
     try:
-        for dim in dataset.dims:
+        for i, dim in enumerate(dataset.dims):
             if dim.label == "T" and dim:
                 state = _h5svi_get_state(dim[0])
+                if isinstance(state, list):  # One per frame, all the same
+                    state = state[0] if state else None
                 if state != ST_REPORTED:
                     # Only set as real metadata if it was actual information
                     break
-                pxd = float(dim[0][()])
-                md[model.MD_PIXEL_DUR] = pxd
+                if dim[0].shape == ():
+                    pxd = float(dim[0][()])
+                    md[model.MD_PIXEL_DUR] = pxd
+                else:
+                    # Explicit time of each frame. If the file is being written,
+                    # the list can be (temporarily) shorter than the data, in
+                    # which case only the frames with a time are complete.
+                    tl = dim[0][:dataset.shape[i]]
+                    md[model.MD_TIME_LIST] = tl.tolist()
     except Exception:
         logging.warning("Failed to parse T scale", exc_info=True)
 
@@ -1149,13 +1264,14 @@ def _add_svi_info(group):
     gi["URL"] = "www.delmic.com"
 
 
-def _add_acquistion_svi(group, data, mds, **kwargs):
+def _add_acquistion_svi(group, data, mds, compression=COMPRESSION_NONE):
     """
     Adds the acquisition data according to the sub-format by SVI
     group (HDF Group): the group that will contain the metadata (named "PhysicalData")
     data (DataArray): image with (global) metadata, all the images must
       have the same shape.
     mds (None or list of dict): metadata for each C of the image (if different) 
+    compression (str): compression profile (COMPRESSION_*)
     """
     gi = group.create_group("ImageData")
 
@@ -1164,7 +1280,7 @@ def _add_acquistion_svi(group, data, mds, **kwargs):
     _h5py_enum_commit(group, "StateEnumeration", _dtstate)
 
     # TODO: use scaleoffset to store the number of bits used (MD_BPP)
-    ids = _create_image_dataset(gi, "Image", data, **kwargs)
+    ids = _create_image_dataset(gi, "Image", data, compression=compression)
     _add_image_info(gi, ids, data)
     _add_image_metadata(group, data, mds)
     _add_svi_info(group)
@@ -1372,11 +1488,12 @@ def _thumbFromHDF5(filename):
     return thumbs
 
 
-def _dataFromSVIHDF5(f):
+def _dataFromSVIHDF5(f, placeholder=False):
     """
     Read microscopy data from an HDF5 file using the SVI convention.
     Expects to find them as IMAGE in XXX/ImageData/Image + XXX/PhysicalData.
     f (h5py.File): the root of the file
+    placeholder (bool): if True, only the metadata is read (see _read_image_dataset())
     return (list of model.DataArray)
     """
     data = []
@@ -1393,7 +1510,7 @@ def _dataFromSVIHDF5(f):
 
         # Read the raw data
         try:
-            da = _read_image_dataset(image)
+            da = _read_image_dataset(image, placeholder)
         except Exception:
             logging.exception("Failed to read data of acquisition '%s'", obj.name)
 
@@ -1408,10 +1525,11 @@ def _dataFromSVIHDF5(f):
     return data
 
 
-def _dataFromHDF5(filename):
+def _dataFromHDF5(filename, placeholder=False):
     """
     Read microscopy data from an HDF5 file.
     filename (string): path of the file to read
+    placeholder (bool): if True, only the metadata is read (see _read_image_dataset())
     return (list of model.DataArray)
     """
     f = h5py.File(filename, "r")
@@ -1421,7 +1539,7 @@ def _dataFromHDF5(filename):
     for obj in f.values():
         if (isinstance(obj, h5py.Group) and
             isinstance(obj.get("SVIData"), h5py.Group)):
-            return _dataFromSVIHDF5(f)
+            return _dataFromSVIHDF5(f, placeholder)
 
     data = []
     # go rough: return any dataset with numbers (and more than one element)
@@ -1436,7 +1554,10 @@ def _dataFromHDF5(filename):
                 return
             # TODO: if it's an image, open it as an image
             # TODO: try to get some metadata?
-            da = model.DataArray(obj[...])
+            if placeholder:
+                da = model.DataArray(_placeholder_array(obj))
+            else:
+                da = model.DataArray(obj[...])
         except Exception:
             logging.info("Skipping '%s' as it doesn't seem a correct data", name)
         data.append(da)
@@ -1464,8 +1585,10 @@ def _saveAsHDF5(filename, ldata, thumbnail, compressed=True):
     ldata (list of DataArray): list of 2D (up to 5D) data of int or float. 
      Should have at least one array.
     thumbnail (None or DataArray): see export
-    compressed (boolean): whether the file is compressed or not.
+    compressed (boolean or str): see export
     """
+    compression = get_compression_profile(compressed)
+
     # h5py will extend the current file by default, so we want to make sure
     # there is no file at all.
     try:
@@ -1473,12 +1596,6 @@ def _saveAsHDF5(filename, ldata, thumbnail, compressed=True):
     except OSError:
         pass
     f = h5py.File(filename, "w") # w will fail if file exists
-    if compressed:
-        # szip is not free for commercial usage and lzf doesn't seem to be
-        # well supported yet
-        compression = "gzip"
-    else:
-        compression = None
 
     if thumbnail is not None:
         thumbnail = _mergeCorrectionMetadata(thumbnail)
@@ -1502,7 +1619,7 @@ def _saveAsHDF5(filename, ldata, thumbnail, compressed=True):
 
 # TODO: allow to append data to a file, or any other way to allow saving large
 # data without having everything in memory simultaneously.
-def export(filename, data, thumbnail=None):
+def export(filename, data, thumbnail=None, compressed=True):
     '''
     Write an HDF5 file with the given image and metadata
     filename (unicode): filename of the file to create (including path)
@@ -1516,13 +1633,16 @@ def export(filename, data, thumbnail=None):
       (reasonable) size. Must be either 2D array (greyscale) or 3D with last 
       dimension of length 3 (RGB). If the exporter doesn't support it, it will
       be dropped silently.
+    compressed (boolean or str): whether the file is compressed or not. It can
+      also be the name of a compression profile ("none", "fast", "balanced",
+      or "max"). True is the same as "balanced".
     '''
     # TODO: add an argument to not do any clever data aggregation?
     if not isinstance(data, (list, tuple)):
         # TODO should probably not enforce it: respect duck typing
         assert(isinstance(data, model.DataArray))
         data = [data]
-    _saveAsHDF5(filename, data, thumbnail)
+    _saveAsHDF5(filename, data, thumbnail, compressed)
 
 
 def read_data(filename):
@@ -1545,6 +1665,19 @@ def read_data(filename):
     return _dataFromHDF5(filename)
 
 
+def read_metadata(filename):
+    """
+    Read the shape, dtype and metadata of the data of an HDF5 file, without
+    reading the data itself. It's much faster than read_data() on large files.
+    filename (unicode): filename of the file to read
+    return (list of model.DataArray): same as read_data(), but the DataArrays
+      are read-only and only contain zeros (they don't use any memory).
+    raises:
+        IOError in case the file format is not as expected.
+    """
+    return _dataFromHDF5(filename, placeholder=True)
+
+
 def read_thumbnail(filename):
     """
     Read the thumbnail data of a given HDF5 file.
@@ -1559,3 +1692,326 @@ def read_thumbnail(filename):
 
     return _thumbFromHDF5(filename)
 
+
+
+def _frame_to_ctzyx(da):
+    """
+    Convert a frame to the 5 dimensions used to store a time-lapse
+    da (DataArray): frame of 2 to 4 dimensions, ordered as a subset of CZYX.
+      A T dimension of length 1 is accepted too.
+    return (DataArray): view of the frame of shape C1ZYX, with the metadata
+      MD_DIMS and MD_ACQ_DATE set.
+    raise ValueError: if the frame has a time dimension or unsupported dimensions
+    """
+    dims = da.metadata.get(model.MD_DIMS, "CTZYX"[-da.ndim:])
+    if len(dims) != da.ndim or not 2 <= da.ndim <= 5:
+        raise ValueError("Frame of shape %s and dimensions %s not supported" %
+                         (da.shape, dims))
+    if "T" in dims and da.shape[dims.index("T")] != 1:
+        raise ValueError("Frame of shape %s already has a time dimension" % (da.shape,))
+    if "".join(d for d in "CTZYX" if d in dims) != dims or dims[-2:] != "YX":
+        raise ValueError("Frame dimensions %s cannot be stored as CTZYX" % (dims,))
+
+    shape = tuple(da.shape[dims.index(d)] if d in dims else 1 for d in "CTZYX")
+    md = da.metadata.copy()
+    md[model.MD_DIMS] = "CTZYX"
+    if model.MD_ACQ_DATE not in md:
+        md[model.MD_ACQ_DATE] = time.time()
+    return model.DataArray(da.reshape(shape), md)
+
+
+class TimelapseWriter(object):
+    """
+    Records a series of frames (eg, a time-lapse) into a single HDF5 file, by
+    appending each frame along the T dimension. The frames are written by a
+    separate thread, so that appending a frame doesn't delay the acquisition.
+    The file is written in "Single Writer Multiple Reader" mode, so that it can
+    be read with open_timelapse() while the recording is still going on. Note
+    that such file can only be read with HDF5 v1.10 or later.
+    """
+
+    def __init__(self, filename, compressed=True):
+        """
+        filename (unicode): filename of the file to create (including path)
+        compressed (boolean or str): whether the file is compressed or not. It
+          can also be the name of a compression profile (see export()).
+        """
+        self.filename = filename
+        self._compression = get_compression_profile(compressed)
+        self._formats = None  # (shape, dtype) of each frame, from the first frame
+        self._series = []  # (image dataset, time dataset, date of first frame)
+        self._error = None
+        self._closed = False
+        self._queue = Queue.Queue(maxsize=TIMELAPSE_QUEUE_SIZE)
+        self.frames = 0  # Number of frames written
+
+        # h5py will extend the current file by default, so we want to make sure
+        # there is no file at all.
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+        # SWMR needs the latest version of the file format
+        self._file = h5py.File(filename, "w", libver="latest")
+
+        self._thread = threading.Thread(target=self._run,
+                                        name="HDF5 timelapse writer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def append(self, data):
+        """
+        Add a frame at the end of the recording. It only blocks if too many
+        frames are already waiting to be written.
+        data (model.DataArray or list of model.DataArray): the frame, or one
+          frame per series (eg, one per stream). It must contain the same number
+          of DataArrays, with the same shape and dtype at every call. The frames
+          have up to 4 dimensions: C, Z, Y, X. MD_ACQ_DATE is recorded for each
+          frame (and if missing, the current time is used).
+        raise ValueError: if the data doesn't correspond to the previous frames,
+          or if the recording is closed.
+        raise IOError: if writing a previous frame failed
+        """
+        if self._closed:
+            raise ValueError("Recording of %s is already closed" % (self.filename,))
+        if self._error is not None:
+            raise IOError("Failed to write frame %d: %s" % (self.frames, self._error))
+
+        if not isinstance(data, (list, tuple)):
+            data = [data]
+        frames = [_frame_to_ctzyx(da) for da in data]
+        formats = [(f.shape, f.dtype) for f in frames]
+        if self._formats is None:
+            self._formats = formats
+        elif formats != self._formats:
+            raise ValueError("Frame of format %s different from the first frame %s" %
+                             (formats, self._formats))
+
+        self._queue.put(frames)
+
+    def close(self):
+        """
+        Write all the frames waiting, and close the file. It's fine to call it
+        multiple times.
+        raise IOError: if writing a frame failed
+        """
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise IOError("Failed to write frame %d: %s" % (self.frames, self._error))
+
+    def _run(self):
+        """
+        Main loop of the writer thread
+        """
+        try:
+            while True:
+                frames = self._queue.get()
+                if frames is None:
+                    return
+                if self._error is not None:
+                    continue  # Just empty the queue, to not block append()
+
+                try:
+                    if not self._series:
+                        self._create_series(frames)
+                    self._write_frames(frames)
+                except Exception as ex:
+                    logging.exception("Failed to write frame %d to %s",
+                                      self.frames, self.filename)
+                    self._error = ex
+        finally:
+            self._file.close()
+
+    def _create_series(self, frames):
+        """
+        Create the structure of the file, one acquisition group per series
+        frames (list of DataArrays): the first frame of each series
+        """
+        level, shuffle = _COMPRESSIONS[self._compression]
+        if level is None:
+            comp_args = {}
+        else:
+            comp_args = {"compression": "gzip", "compression_opts": level,
+                         "shuffle": shuffle}
+
+        for i, f in enumerate(frames):
+            f = _mergeCorrectionMetadata(f)
+            ga = self._file.create_group("Acquisition%d" % i)
+            gi = ga.create_group("ImageData")
+            _h5py_enum_commit(ga, "StateEnumeration", _dtstate)
+
+            # One chunk per frame, so that each frame is written independently
+            shape = f.shape[:1] + (0,) + f.shape[2:]
+            maxshape = f.shape[:1] + (None,) + f.shape[2:]
+            ids = gi.create_dataset("Image", shape=shape, dtype=f.dtype,
+                                    maxshape=maxshape, chunks=f.shape, **comp_args)
+            # IMAGE_MINMAXRANGE is not set, as it would change at every frame
+            _add_image_class(ids, f)
+
+            md = f.metadata.copy()
+            md.pop(model.MD_PIXEL_DUR, None)
+            md[model.MD_TIME_LIST] = []
+            _add_image_info(gi, ids, model.DataArray(f, md))
+            # The time scale grows, so just one state, valid for all the frames
+            _h5svi_set_state(gi["DimensionScaleT"], [ST_REPORTED])
+            _add_image_metadata(ga, f, None)
+            _add_svi_info(ga)
+            self._series.append((ids, gi["DimensionScaleT"], md[model.MD_ACQ_DATE]))
+
+        # From now on, no new object or attribute can be created
+        self._file.swmr_mode = True
+
+    def _write_frames(self, frames):
+        """
+        Append a frame to each series
+        frames (list of DataArrays): one frame per series
+        """
+        t = self.frames
+        # The image first, and only then its time: the readers only consider
+        # the frames which have a time, so they never see a frame not yet written.
+        self._write_images(frames, t)
+        self._write_times(frames, t)
+        self.frames += 1
+
+    def _write_images(self, frames, t):
+        """
+        Write the data of a frame in each series
+        frames (list of DataArrays): one frame per series
+        t (int): index of the frame
+        """
+        for (ids, tds, date0), f in zip(self._series, frames):
+            ids.resize(t + 1, axis=1)
+            ids[:, t:t + 1] = f
+            ids.flush()
+
+    def _write_times(self, frames, t):
+        """
+        Write the time of a frame in each series, which makes the frame visible
+        to the readers
+        frames (list of DataArrays): one frame per series
+        t (int): index of the frame
+        """
+        for (ids, tds, date0), f in zip(self._series, frames):
+            tds.resize((t + 1,))
+            tds[t] = f.metadata[model.MD_ACQ_DATE] - date0
+            tds.flush()
+
+
+class DataArrayShadowHDF5(model.DataArrayShadow):
+    """
+    Gives access to an image of an HDF5 file, without reading the data until
+    it's requested. If the file is still being recorded by a TimelapseWriter,
+    the new frames can be accessed after calling refresh().
+    """
+
+    def __init__(self, group, pdgroup, swmr=False):
+        """
+        group (HDF Group): the group "ImageData" that contains the image
+        pdgroup (HDF Group): the group "PhysicalData" associated to the image
+        swmr (bool): whether the file is opened in SWMR mode (and so can
+          be updated by refresh())
+        """
+        self._group = group
+        self._swmr = swmr
+        self._pdgroup = pdgroup
+        self._dataset = group["Image"]
+        self._lock = threading.Lock()
+        shape, md = self._read_info()
+        model.DataArrayShadow.__init__(self, shape, self._dataset.dtype, md)
+
+    def _read_info(self):
+        """
+        return:
+          shape (tuple of int): the shape of the data (available)
+          md (dict): the metadata
+        """
+        md = _read_image_info(self._group)
+        # Only the metadata is needed, so pass an empty placeholder as data
+        md = _parse_physical_data(self._pdgroup, model.DataArray(numpy.empty(0), md))[0].metadata
+        shape = self._dataset.shape
+        if model.MD_TIME_LIST in md:
+            # Only the frames with a time are complete
+            shape = shape[:1] + (len(md[model.MD_TIME_LIST]),) + shape[2:]
+        return shape, md
+
+    def refresh(self):
+        """
+        Update the shape and the metadata, to include the frames written since
+        the file was opened.
+        """
+        with self._lock:
+            if self._swmr:
+                self._dataset.refresh()
+                if "DimensionScaleT" in self._group:
+                    self._group["DimensionScaleT"].refresh()
+            self.shape, self.metadata = self._read_info()
+
+    def getData(self):
+        """
+        Fetches the whole data available
+        return DataArray: the data, with its metadata
+        """
+        with self._lock:
+            if len(self.shape) == 5:
+                data = self._dataset[:, :self.shape[1]]
+            else:
+                data = self._dataset[...]
+            md = self.metadata.copy()
+        return model.DataArray(data, md)
+
+    def getFrame(self, t):
+        """
+        Fetches one frame of a time-lapse
+        t (0<=int): index of the frame on the T dimension
+        return DataArray: the frame, with only the dimensions of length > 1
+          (among C, Z) and Y, X. Its MD_ACQ_DATE is the time of the frame.
+        raise IndexError: if the frame is not (yet) available
+        """
+        with self._lock:
+            if len(self.shape) != 5 or not 0 <= t < self.shape[1]:
+                raise IndexError("No frame %d in data of shape %s" % (t, self.shape))
+            frame = self._dataset[:, t]
+            md = self.metadata.copy()
+
+        tl = md.pop(model.MD_TIME_LIST, None)
+        if tl is not None and model.MD_ACQ_DATE in md:
+            md[model.MD_ACQ_DATE] += tl[t]
+        while frame.ndim > 2 and frame.shape[0] == 1:
+            frame = frame[0]
+        return model.DataArray(frame, md)
+
+
+def open_timelapse(filename):
+    """
+    Opens an HDF5 file, typically recorded with TimelapseWriter, without
+    reading the data. It's possible to open it while it's still being recorded.
+    filename (unicode): filename of the file to read
+    return (list of DataArrayShadowHDF5): one per acquisition (ie, series of
+      frames) in the file
+    raises:
+        IOError in case the file format is not as expected.
+    """
+    try:
+        f = h5py.File(filename, "r", libver="latest", swmr=True)
+        swmr = True
+    except IOError:
+        # Not written in SWMR mode (eg, with export()) => read normally
+        f = h5py.File(filename, "r")
+        swmr = False
+
+    shadows = []
+    for obj in f.values():
+        if not isinstance(obj, h5py.Group):
+            continue
+        try:
+            imagedata = obj["ImageData"]
+            physicaldata = obj["PhysicalData"]
+            imagedata["Image"]
+        except KeyError:
+            continue  # not conforming => try next object
+        shadows.append(DataArrayShadowHDF5(imagedata, physicaldata, swmr))
+
+    return shadows
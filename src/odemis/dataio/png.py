@@ -19,9 +19,11 @@ from __future__ import division
 
 import logging
 from odemis import model
-from odemis.util import img
+from odemis.util import img, lazy_import
 import os
-import scipy
+
+
+misc = lazy_import("scipy.misc")
 
 
 FORMAT = "PNG"
@@ -31,6 +33,7 @@ EXTENSIONS = [u".png"]
 # TODO: support 16-bits? But then it looses the point to have a "simple" format?
 LOSSY = True # because it doesn't support 16 bits
 CAN_SAVE_PYRAMID = False
+CAN_COMPRESS = False
 
 
 def _saveAsPNG(filename, data):
@@ -59,7 +62,7 @@ def _saveAsPNG(filename, data):
         rgb8 = img.DataArray2RGB(data, irange)
 
     # save to file
-    scipy.misc.imsave(filename, rgb8)
+    misc.imsave(filename, rgb8)
 
 def export(filename, data, thumbnail=None):
     '''
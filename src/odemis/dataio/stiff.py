@@ -28,6 +28,7 @@ FORMAT = "Serialized TIFF"
 # list of file-name extensions possible, the first one is the default when saving a file
 EXTENSIONS = [u".0.ome.tiff"]
 CAN_SAVE_PYRAMID = True
+CAN_COMPRESS = True
 LOSSY = False
 
 # An almost identical OME-XML metadata block is inserted into the first IFD of
@@ -49,6 +50,7 @@ def export(filename, data, thumbnail=None, compressed=True, pyramid=False):
       Can be of any (reasonable) size. Must be either 2D array (greyscale) or 3D
       with last dimension of length 3 (RGB). If the exporter doesn't support it,
       it will be dropped silently.
-    compressed (boolean): whether the file is compressed or not.
+    compressed (boolean or str): whether the file is compressed or not, or
+      the compression profile (cf tiff.export()).
     '''
     tiff.export(filename, data, thumbnail, compressed, multiple_files=True, pyramid=pyramid)
@@ -30,6 +30,7 @@ from odemis import model
 from odemis.dataio import hdf5
 from odemis.util import img
 import os
+import threading
 import time
 import unittest
 from unittest.case import skip
@@ -73,6 +74,35 @@ class TestHDF5IO(unittest.TestCase):
         self.assertEqual(im.shape, data.shape)
         self.assertEqual(im[white[-1:-3:-1]], data[white[-1:-3:-1]])
 
+    def testExportCompression(self):
+        """
+        Check all the compression profiles give back the same data
+        """
+        size = (1000, 600)  # bigger than a chunk
+        sizes = {}
+        for dtype in (numpy.uint16, numpy.int8, numpy.float32):
+            data = model.DataArray(numpy.zeros(size[::-1], dtype))
+            data[10:20, 40:80] = 12
+            data[500:, 500:] = numpy.random.randint(0, 100, (size[1] - 500, size[0] - 500))
+            for profile in ("none", "fast", "balanced", "max", True, False):
+                hdf5.export(FILENAME, data, compressed=profile)
+                sizes[profile] = os.stat(FILENAME).st_size
+
+                rdata = hdf5.read_data(FILENAME)
+                self.assertEqual(len(rdata), 1)
+                im = rdata[0]
+                im.shape = im.shape[3:5]
+                self.assertEqual(im.dtype, data.dtype)
+                numpy.testing.assert_array_equal(im, data)
+
+            self.assertEqual(sizes[True], sizes["balanced"])
+            self.assertEqual(sizes[False], sizes["none"])
+            self.assertLess(sizes["fast"], sizes["none"])
+            self.assertLessEqual(sizes["max"], sizes["fast"])
+
+        with self.assertRaises(ValueError):
+            hdf5.export(FILENAME, data, compressed="foo")
+
     def testUnicodeName(self):
         """Try filename not fitting in ascii"""
         # create a simple greyscale image
@@ -408,6 +438,29 @@ class TestHDF5IO(unittest.TestCase):
         self.assertEqual(im[blue[::-1]].tolist(), [0, 0, 255])
         self.assertAlmostEqual(im.metadata[model.MD_POS], thumbnail.metadata[model.MD_POS])
 
+    def testReadMetadata(self):
+        """
+        Checks that the metadata can be read without the data
+        """
+        md = {model.MD_DESCRIPTION: u"sem",
+              model.MD_PIXEL_SIZE: (1e-7, 1e-7),
+              model.MD_POS: (1e-3, -30e-3),
+              }
+        ldata = [model.DataArray(numpy.ones((512, 256), numpy.uint16), md),
+                 model.DataArray(numpy.ones((50, 40), numpy.float32), md)]
+        hdf5.export(FILENAME, ldata)
+
+        rdata = hdf5.read_data(FILENAME)
+        rmds = hdf5.read_metadata(FILENAME)
+        self.assertEqual(len(rmds), len(rdata))
+        for im, imd in zip(rdata, rmds):
+            self.assertEqual(imd.shape, im.shape)
+            self.assertEqual(imd.dtype, im.dtype)
+            self.assertEqual(imd.metadata, im.metadata)
+            # The data is not read
+            self.assertEqual(imd.max(), 0)
+            self.assertFalse(imd.flags.writeable)
+
     def testReadMDSpec(self):
         """
         Checks that we can read back the metadata of an image
@@ -1066,6 +1119,119 @@ class TestHDF5IO(unittest.TestCase):
         self.assertEqual(im[0, 0].tolist(), [0, 255, 0])
 
 
+class TestTimelapseWriter(unittest.TestCase):
+
+    def tearDown(self):
+        try:
+            os.remove(FILENAME)
+        except Exception:
+            pass
+
+    def _create_frame(self, i, acq_date):
+        md = {model.MD_DESCRIPTION: u"test",
+              model.MD_PIXEL_SIZE: (1e-6, 1e-6),
+              model.MD_ACQ_DATE: acq_date}
+        return model.DataArray(numpy.zeros((64, 32), numpy.uint16) + i, md)
+
+    def test_append(self):
+        """
+        Record frames, and read them back while recording and afterwards
+        """
+        t0 = time.time()
+        writer = hdf5.TimelapseWriter(FILENAME, compressed="fast")
+        for i in range(3):
+            writer.append(self._create_frame(i, t0 + i * 0.5))
+        time.sleep(0.5)  # Give time to write the frames
+
+        # Read while the recording is still going on
+        rdata = hdf5.open_timelapse(FILENAME)
+        self.assertEqual(len(rdata), 1)
+        self.assertEqual(rdata[0].shape, (1, 3, 1, 64, 32))
+        for i in range(3, 5):
+            writer.append(self._create_frame(i, t0 + i * 0.5))
+        time.sleep(0.5)
+        rdata[0].refresh()
+        self.assertEqual(rdata[0].shape, (1, 5, 1, 64, 32))
+        frame = rdata[0].getFrame(4)
+        self.assertEqual(frame.shape, (64, 32))
+        self.assertEqual(frame[0, 0], 4)
+        self.assertAlmostEqual(frame.metadata[model.MD_ACQ_DATE], t0 + 2)
+        self.assertEqual(frame.metadata[model.MD_DESCRIPTION], u"test")
+
+        # A frame of a different shape is refused
+        with self.assertRaises(ValueError):
+            writer.append(model.DataArray(numpy.zeros((16, 16), numpy.uint16)))
+        writer.close()
+
+        rdata = hdf5.read_data(FILENAME)
+        self.assertEqual(len(rdata), 1)
+        im = rdata[0]
+        self.assertEqual(im.shape, (1, 5, 1, 64, 32))
+        self.assertEqual(im[0, :, 0, 0, 0].tolist(), range(5))
+        self.assertAlmostEqual(im.metadata[model.MD_ACQ_DATE], t0)
+        numpy.testing.assert_almost_equal(im.metadata[model.MD_TIME_LIST],
+                                          [i * 0.5 for i in range(5)])
+        self.assertEqual(im.metadata[model.MD_PIXEL_SIZE], (1e-6, 1e-6))
+
+    def test_partial_frame(self):
+        """
+        A frame being written is not visible until it's complete
+        """
+        t0 = time.time()
+        writer = hdf5.TimelapseWriter(FILENAME)
+        writer.append(self._create_frame(1, t0))
+        for i in range(50):  # Wait for the first frame to be written
+            if writer.frames == 1:
+                break
+            time.sleep(0.1)
+
+        # Pause the writer between the data and the time of the next frame
+        orig_write_times = writer._write_times
+        images_written = threading.Event()
+        resume = threading.Event()
+
+        def paused_write_times(frames, t):
+            images_written.set()
+            resume.wait(10)
+            orig_write_times(frames, t)
+
+        writer._write_times = paused_write_times
+        writer.append(self._create_frame(2, t0 + 1))
+        self.assertTrue(images_written.wait(10))
+
+        rdata = hdf5.open_timelapse(FILENAME)
+        self.assertEqual(rdata[0].shape, (1, 1, 1, 64, 32))
+        self.assertEqual(rdata[0].getFrame(0)[0, 0], 1)
+        with self.assertRaises(IndexError):
+            rdata[0].getFrame(1)
+
+        resume.set()
+        writer.close()
+        rdata[0].refresh()
+        self.assertEqual(rdata[0].shape, (1, 2, 1, 64, 32))
+        frame = rdata[0].getFrame(1)
+        self.assertEqual(frame[0, 0], 2)
+        self.assertAlmostEqual(frame.metadata[model.MD_ACQ_DATE], t0 + 1)
+
+    def test_multiple_series(self):
+        """
+        Record frames of two streams simultaneously
+        """
+        writer = hdf5.TimelapseWriter(FILENAME)
+        for i in range(4):
+            ccd = self._create_frame(i, time.time())
+            spec = model.DataArray(numpy.ones((20, 8, 8), numpy.float32) * i,
+                                   {model.MD_DIMS: "CYX"})
+            writer.append([ccd, spec])
+        writer.close()
+
+        rdata = hdf5.read_data(FILENAME)
+        self.assertEqual(sorted(d.shape for d in rdata),
+                         [(1, 4, 1, 64, 32), (20, 4, 1, 8, 8)])
+        for d in rdata:
+            self.assertEqual(len(d.metadata[model.MD_TIME_LIST]), 4)
+
+
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
@@ -75,6 +75,33 @@ class TestTiffIO(unittest.TestCase):
         self.assertEqual(im.size, size)
         self.assertEqual(im.getpixel(white), 124)
 
+    def testExportCompression(self):
+        """
+        Check all the compression profiles give back the same data
+        """
+        size = (1000, 600)  # more than one strip
+        sizes = {}
+        for dtype in (numpy.uint16, numpy.int8, numpy.float32):
+            data = model.DataArray(numpy.zeros(size[::-1], dtype))
+            data[10:20, 40:80] = 12
+            data[500:, 500:] = numpy.random.randint(0, 100, (size[1] - 500, size[0] - 500))
+            for profile in ("none", "fast", "balanced", "max", True, False):
+                tiff.export(FILENAME, data, compressed=profile)
+                sizes[profile] = os.stat(FILENAME).st_size
+
+                rdata = tiff.read_data(FILENAME)
+                self.assertEqual(len(rdata), 1)
+                self.assertEqual(rdata[0].dtype, data.dtype)
+                numpy.testing.assert_array_equal(rdata[0], data)
+
+            self.assertEqual(sizes[True], sizes["balanced"])
+            self.assertEqual(sizes[False], sizes["none"])
+            self.assertLess(sizes["fast"], sizes["none"])
+            self.assertLessEqual(sizes["max"], sizes["fast"])
+
+        with self.assertRaises(ValueError):
+            tiff.export(FILENAME, data, compressed="foo")
+
     def testUnicodeName(self):
         """Try filename not fitting in ascii"""
         # create a simple greyscale image
@@ -28,6 +28,8 @@ import math
 import numpy
 from odemis import model, util
 import odemis
+from odemis.dataio._compress import get_compression_profile, deflate_blocks, \
+    COMPRESSION_NONE, COMPRESSION_FAST, COMPRESSION_BALANCED, COMPRESSION_MAX
 from odemis.util import spectrum, img, fluo
 import operator
 import os
@@ -65,9 +67,24 @@ EXTENSIONS = [u".ome.tiff", u".ome.tif", u".tiff", u".tif"]
 STIFF_SPLIT = ".0."  # pattern to replace with the "stiff" multiple file
 
 CAN_SAVE_PYRAMID = True # indicates the support for pyramidal export
+CAN_COMPRESS = True # indicates the support for compression profiles
 TILE_SIZE = 256 # Tile size of pyramidal images
 LOSSY = False
 
+# Compression profile -> (libtiff compression, deflate level)
+# According to this page: http://www.openmicroscopy.org/site/support/file-formats/ome-tiff/ome-tiff-data
+# LZW is a good trade-off between compatibility and small size (reduces file
+# size by about 2). => that's why we use it by default.
+# With deflate, the (greyscale) strips are compressed in parallel, at the given
+# level. When not possible (eg, tiles), libtiff compresses at its default level.
+_COMPRESSIONS = {
+    COMPRESSION_NONE: (None, None),
+    COMPRESSION_FAST: ("adobe_deflate", 1),
+    COMPRESSION_BALANCED: ("lzw", None),
+    COMPRESSION_MAX: ("adobe_deflate", 9),
+}
+STRIP_SIZE = 256 * 1024  # bytes, approximate uncompressed size of a strip
+
 # We try to make it as much as possible looking like a normal (multi-page) TIFF,
 # with as much metadata as possible saved in the known TIFF tags. In addition,
 # we ensure it's compatible with OME-TIFF, which support much more metadata, and
@@ -1531,7 +1548,7 @@ def _saveAsMultiTiffLT(filename, ldata, thumbnail, compressed=True, multiple_fil
     filename (string): name of the file to save
     ldata (list of DataArray): list of 2D data of int or float. Should have at least one array
     thumbnail (None or DataArray): see export
-    compressed (boolean): whether the file is LZW compressed or not.
+    compressed (boolean or str): see export
     multiple_files (boolean): whether the data is distributed across multiple
       files or not.
     file_index (int): index of this particular file.
@@ -1549,13 +1566,7 @@ def _saveAsMultiTiffLT(filename, ldata, thumbnail, compressed=True, multiple_fil
     else:
         f = TIFF.open(filename, mode='w')
 
-    # According to this page: http://www.openmicroscopy.org/site/support/file-formats/ome-tiff/ome-tiff-data
-    # LZW is a good trade-off between compatibility and small size (reduces file
-    # size by about 2). => that's why we use it by default
-    if compressed:
-        compression = "lzw"
-    else:
-        compression = None
+    compression, level = _COMPRESSIONS[get_compression_profile(compressed)]
 
     # merge correction metadata (as we cannot save them separatly in OME-TIFF)
     ldata = [_mergeCorrectionMetadata(da) for da in ldata]
@@ -1684,7 +1695,8 @@ def _saveAsMultiTiffLT(filename, ldata, thumbnail, compressed=True, multiple_fil
                 c = None # libtiff doesn't support compression on these types
             else:
                 c = compression
-            write_image(f, data[i], write_rgb=write_rgb, compression=c, pyramid=pyramid)
+            write_image(f, data[i], write_rgb=write_rgb, compression=c, pyramid=pyramid,
+                        level=level)
 
 
 def _genResizedShapes(data):
@@ -1718,18 +1730,78 @@ def _ensure_fs_encoding(filename):
         return filename.encode(sys.getfilesystemencoding())
 
 
-def write_image(f, arr, compression=None, write_rgb=False, pyramid=False):
+def _write_image_deflated(f, arr, level):
+    """
+    Write a greyscale image as deflate compressed strips, with the strips
+    compressed in parallel.
+    f (libtiff file handle): Handle of a TIFF file
+    arr (numpy.ndarray of 2 dims): the image to write
+    level (0<=int<=9): deflate compression level
+    """
+    arr = numpy.ascontiguousarray(arr)
+    if arr.dtype == numpy.bool:
+        arr = arr.view(numpy.uint8)
+
+    if arr.dtype.kind == "f":
+        sample_format = T.SAMPLEFORMAT_IEEEFP
+    elif arr.dtype.kind == "u":
+        sample_format = T.SAMPLEFORMAT_UINT
+    elif arr.dtype.kind == "i":
+        sample_format = T.SAMPLEFORMAT_INT
+    else:
+        raise NotImplementedError("Cannot write data of type %s" % (arr.dtype,))
+
+    height, width = arr.shape
+    rows = max(1, STRIP_SIZE // (width * arr.itemsize))
+
+    f.SetField(T.TIFFTAG_COMPRESSION, T.COMPRESSION_ADOBE_DEFLATE)
+    predict = arr.dtype.kind in "iu"
+    if predict:
+        # Horizontal predictor, as libtiff does for LZW. As the strips are
+        # passed "raw", the difference has to be computed by us. It relies on
+        # the integer overflow to wrap-around, as the reader does.
+        f.SetField(T.TIFFTAG_PREDICTOR, T.PREDICTOR_HORIZONTAL)
+    f.SetField(T.TIFFTAG_BITSPERSAMPLE, arr.itemsize * 8)
+    f.SetField(T.TIFFTAG_SAMPLEFORMAT, sample_format)
+    f.SetField(T.TIFFTAG_ORIENTATION, T.ORIENTATION_TOPLEFT)
+    f.SetField(T.TIFFTAG_IMAGEWIDTH, width)
+    f.SetField(T.TIFFTAG_IMAGELENGTH, height)
+    f.SetField(T.TIFFTAG_PHOTOMETRIC, T.PHOTOMETRIC_MINISBLACK)
+    f.SetField(T.TIFFTAG_PLANARCONFIG, T.PLANARCONFIG_CONTIG)
+    f.SetField(T.TIFFTAG_ROWSPERSTRIP, rows)
+
+    def read_strips():
+        for y in range(0, height, rows):
+            strip = arr[y:y + rows]
+            if predict:
+                diff = strip.copy()
+                diff[:, 1:] -= strip[:, :-1]
+                strip = diff
+            yield strip.tostring()
+
+    for i, cdata in enumerate(deflate_blocks(read_strips(), level)):
+        f.WriteRawStrip(i, cdata, len(cdata))
+    f.WriteDirectory()
+
+
+def write_image(f, arr, compression=None, write_rgb=False, pyramid=False, level=None):
     """
     f (libtiff file handle): Handle of a TIFF file
     arr (DataArray): DataArray to be written to the file
-    compression (boolean): Compression type to be used on the TIFF file
+    compression (None or str): Compression type to be used on the TIFF file
     write_rgb (boolean): True if the image is RGB, False if the image is grayscale
     pyramid (boolean): whether the file should be saved in the pyramid format or not.
       In this format, each image is saved along with different zoom levels
+    level (None or 0<=int<=9): compression level, only used for deflate. If None,
+      the libtiff default is used.
     """
     # if not pyramid, just save the image in the TIFF file, and return
     if not pyramid:
-        f.write_image(arr, compression=compression, write_rgb=write_rgb)
+        if (compression == "adobe_deflate" and level is not None and
+            arr.ndim == 2 and not write_rgb):
+            _write_image_deflated(f, arr, level)
+        else:
+            f.write_image(arr, compression=compression, write_rgb=write_rgb)
         return
 
     # generate the sizes of the zoom levels to be generated and saved
@@ -1768,9 +1840,12 @@ def export(filename, data, thumbnail=None, compressed=True, multiple_files=False
       for the file. Can be of any (reasonable) size. Must be either 2D array
       (greyscale) or 3D with last dimension of length 3 (RGB). If the exporter
       doesn't support it, it will be dropped silently.
-    compressed (boolean): whether the file is compressed or not.
+    compressed (boolean or str): whether the file is compressed or not. It can
+      also be the name of a compression profile ("none", "fast", "balanced",
+      or "max"). True is the same as "balanced".
     multiple_files (boolean): whether the data is distributed across multiple
       files or not.
+    pyramid (boolean): whether the file should be saved in the pyramid format or not.
     '''
     filename = _ensure_fs_encoding(filename)
     if isinstance(data, list):
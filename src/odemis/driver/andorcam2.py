@@ -275,6 +275,10 @@ class AndorV2DLL(CDLL):
     AM_FASTKINETICS = 4
     AM_VIDEO = 5  # aka "run til abort"
 
+    # For SetTriggerMode()
+    TM_INTERNAL = 0
+    TM_SOFTWARE = 10
+
     @staticmethod
     def at_errcheck(result, func, args):
         """
@@ -745,6 +749,9 @@ class AndorCam2(model.DigitalCamera):
         self._late_events = collections.deque() # events which haven't been handled yet
         self._ready_for_acq_start = False
         self._acq_sync_lock = threading.Lock()
+        # True while the synchronized acquisition is running in software
+        # trigger mode (instead of starting a new acquisition for each image)
+        self._sw_triggered = False
 
         self.data = AndorCam2DataFlow(self)
         # Convenience event for the user to connect and fire
@@ -815,7 +822,15 @@ class AndorCam2(model.DigitalCamera):
             self.atcore.SetFrameTransferMode(1)
             logging.debug("Frame transfer mode selected")
 
-        self.atcore.SetTriggerMode(0) # 0 = internal
+        # With software trigger, the acquisition is started only once, and then
+        # each image is acquired on request. This avoids to set-up a new
+        # acquisition for every image, in synchronized mode.
+        self._can_sw_trigger = self._isTriggerModeAvailable(AndorV2DLL.AM_VIDEO,
+                                                            AndorV2DLL.TM_SOFTWARE)
+        logging.debug("Software trigger is %savailable",
+                      "" if self._can_sw_trigger else "not ")
+
+        self.atcore.SetTriggerMode(AndorV2DLL.TM_INTERNAL)
 
         # For "Run Til Abort".
         # We used to do it after changing the settings, but on the iDus, it
@@ -1135,6 +1150,50 @@ class AndorCam2(model.DigitalCamera):
             timeout_ms = c_uint(int(round(timeout * 1e3))) # ms
             self.atcore.WaitForAcquisitionTimeOut(timeout_ms)
 
+    def GetNumberNewImages(self):
+        """
+        return (int, int): index of the first and last images available in the
+          circular buffer and not yet read
+        raise AndorV2Error: with errno 20024 (DRV_NO_NEW_DATA) if no new image
+        """
+        first, last = c_int32(), c_int32()
+        self.atcore.GetNumberNewImages(byref(first), byref(last))
+        return first.value, last.value
+
+    def GetImages16(self, first, last, cbuffer, size):
+        """
+        Copy images from the circular buffer
+        first (int): index of the first image to copy
+        last (int): index of the last image to copy
+        cbuffer (ctypes array of uint16): buffer to store all the images
+        size (int): number of pixels of one image
+        return (int, int): index of the first and last valid images copied
+        """
+        validfirst, validlast = c_int32(), c_int32()
+        self.atcore.GetImages16(c_int32(first), c_int32(last), cbuffer,
+                                c_uint32(size * (last - first + 1)),
+                                byref(validfirst), byref(validlast))
+        return validfirst.value, validlast.value
+
+    def _isTriggerModeAvailable(self, acqmode, trigmode):
+        """
+        Check whether a trigger mode can be used with a given acquisition mode
+        acqmode (int): acquisition mode, as in AndorV2DLL.AM_*
+        trigmode (int): trigger mode, as in AndorV2DLL.TM_*
+        return (bool): True if the trigger mode is available
+        """
+        try:
+            self.atcore.SetAcquisitionMode(acqmode)
+            self.atcore.IsTriggerModeAvailable(trigmode)
+        except AttributeError:  # Old SDK
+            return False
+        except AndorV2Error as exp:
+            # 20095 = DRV_INVALID_TRIGGER_MODE
+            if exp.errno not in (20095, 20991, 20992):
+                logging.warning("Failed to check trigger mode %d: %s", trigmode, exp)
+            return False
+        return True
+
     def _getReadoutRates(self):
         """
         returns (set of float): all available readout rates, in Hz
@@ -1905,7 +1964,10 @@ class AndorCam2(model.DigitalCamera):
         if self.data._sync_event:
             # need synchronized acquisition
             self._late_events.clear()
-            target = self._acquire_thread_synchronized
+            if self._can_sw_trigger:
+                target = self._acquire_thread_triggered
+            else:
+                target = self._acquire_thread_synchronized
         else:
             # no event (now, and hopefully not during the acquisition)
             target = self._acquire_thread_continuous
@@ -2078,7 +2140,8 @@ class AndorCam2(model.DigitalCamera):
                             self.acquisition_lock.release()
                             self.acquire_must_stop.clear()
                             raise
-                    # TODO: instead use software trigger (ie, SetTriggerMode(10) + SendSoftwareTrigger())
+                    # Only used if the software trigger is not available (cf
+                    # _acquire_thread_triggered()).
                     # We don't use the kinetic mode as it might go faster than we can
                     # process them.
                     self.atcore.SetAcquisitionMode(AndorV2DLL.AM_SINGLE)
@@ -2187,6 +2250,171 @@ class AndorCam2(model.DigitalCamera):
             logging.debug("Acquisition thread closed")
             self.acquire_must_stop.clear()
 
+    def _acquire_thread_triggered(self, callback):
+        """
+        The core of the acquisition thread. Runs until acquire_must_stop is set.
+        Version which wait for a synchronized event, and uses the software
+        trigger. The acquisition is only set-up once (in "run till abort" mode),
+        and then each synchronization event triggers the acquisition of one
+        image, which is read from the circular buffer of the camera.
+        As the next image is only triggered after the previous one has been
+        received, if the events come faster than the camera can acquire, they
+        are queued (instead of being dropped).
+        """
+        self._ready_for_acq_start = False
+        need_reinit = True
+        failures = 0
+        last_img = 0  # index of the last image read from the circular buffer
+        try:
+            while not self.acquire_must_stop.is_set():
+                # need to stop acquisition to update settings
+                if need_reinit or self._need_update_settings():
+                    try:
+                        if self.GetStatus() == AndorV2DLL.DRV_ACQUIRING:
+                            self._sw_triggered = False
+                            self.atcore.AbortAcquisition()
+                            time.sleep(0.1)
+                    except AndorV2Error as (errno, strerr):
+                        # it was already aborted
+                        if errno != 20073: # DRV_IDLE
+                            self.acquisition_lock.release()
+                            self.acquire_must_stop.clear()
+                            raise
+                    self.atcore.SetAcquisitionMode(AndorV2DLL.AM_VIDEO)
+                    self.atcore.SetTriggerMode(AndorV2DLL.TM_SOFTWARE)
+                    # Seems exposure needs to be re-set after setting acquisition mode
+                    self._prev_settings[1] = None # 1 => exposure time
+                    size = self._update_settings()
+                    npixels = size[0] * size[1]
+
+                    exposure, accumulate, kinetic = self.GetAcquisitionTimings()
+                    logging.debug("Accumulate time = %f, kinetic = %f", accumulate, kinetic)
+                    readout = npixels * self._metadata[model.MD_READOUT_TIME] # s
+                    duration = max(accumulate, exposure + readout)
+                    logging.debug("Will get image every %g s (expected %g s)", accumulate, exposure + readout)
+
+                    # Arm the acquisition: the images will be acquired on trigger
+                    self.atcore.StartAcquisition()
+                    self._sw_triggered = True
+                    last_img = 0  # The circular buffer is reset at start
+                    need_reinit = False
+
+                # Wait for the event, and trigger the image
+                self._start_acquisition()
+                tstart = time.time()
+                tend = tstart + duration
+                metadata = dict(self._metadata) # duplicate
+                metadata[model.MD_ACQ_DATE] = tstart
+                cbuffer = self._allocate_buffer(size)
+
+                # first we wait ourselves the typical time (which might be very long)
+                # while detecting requests for stop
+                if self.acquire_must_stop.wait(max(0, duration - 0.1)):
+                    raise CancelledError()
+
+                # then wait a bounded time to ensure the image is acquired
+                try:
+                    while True:
+                        if self.acquire_must_stop.is_set():
+                            raise CancelledError()
+
+                        try:
+                            first, last = self.GetNumberNewImages()
+                        except AndorV2Error as (errno, strerr):
+                            if errno != 20024: # DRV_NO_NEW_DATA
+                                raise
+                            if time.time() > tend + 1:
+                                logging.warning("Timeout after %g s", time.time() - tstart)
+                                raise # seems actually serious
+                            try:
+                                self.WaitForAcquisition(0.1)
+                            except AndorV2Error as (errno, strerr):
+                                if errno != 20024: # DRV_NO_NEW_DATA
+                                    raise
+                        else:
+                            break # new image!
+
+                    if first > last_img + 1:
+                        logging.warning("Lost %d images in the circular buffer",
+                                        first - last_img - 1)
+                    if last > first:
+                        # Should never happen as one image is triggered at a time
+                        logging.warning("Received %d images, while expected only one",
+                                        last - first + 1)
+                        cbuffer = (c_uint16 * (npixels * (last - first + 1)))()
+                    self.GetImages16(first, last, cbuffer, npixels)
+                    last_img = last
+                except AndorV2Error as (errno, strerr):
+                    # try again up to 5 times
+                    failures += 1
+                    if failures >= 5:
+                        raise
+                    try:
+                        self._sw_triggered = False
+                        self.atcore.CancelWait()
+                        if self.GetStatus() == AndorV2DLL.DRV_ACQUIRING:
+                            self.atcore.AbortAcquisition()  # Need to stop acquisition to read temperature
+                        temp = self.GetTemperature()
+                    except AndorV2Error:
+                        temp = None
+                    # -999°C means the camera is gone
+                    if temp == -999:
+                        logging.error("Camera seems to have disappeared, will try to reinitialise it")
+                        self.Reinitialize()
+                    else:
+                        time.sleep(0.1)
+                        logging.warning("trying again to acquire image after error %s", strerr)
+                    need_reinit = True
+                    continue
+                else:
+                    failures = 0
+
+                logging.debug("image acquired successfully after %g s", time.time() - tstart)
+                p = cast(cbuffer, POINTER(c_uint16))
+                images = numpy.ctypeslib.as_array(p, (last - first + 1, size[1], size[0]))
+                for im in images:
+                    array = model.DataArray(im, metadata)
+                    callback(self._transposeDAToUser(array))
+                del cbuffer, images, array
+
+                # force the GC to non-used buffers, for some reason, without this
+                # the GC runs only after we've managed to fill up the memory
+                gc.collect()
+        except CancelledError:
+            # received a must-stop event
+            pass
+        except Exception:
+            logging.exception("Failure during acquisition")
+        finally:
+            # ending cleanly
+            self._sw_triggered = False
+            try:
+                if self.GetStatus() == AndorV2DLL.DRV_ACQUIRING:
+                    self.atcore.AbortAcquisition()
+                # The other acquisition modes expect the internal trigger
+                self.atcore.SetTriggerMode(AndorV2DLL.TM_INTERNAL)
+            except AndorV2Error as (errno, strerr):
+                # it was already aborted
+                if errno != 20073: # DRV_IDLE
+                    self.acquisition_lock.release()
+                    logging.debug("Acquisition thread closed after giving up")
+                    self.acquire_must_stop.clear()
+                    raise
+            self.atcore.FreeInternalMemory() # TODO not sure it's needed
+            self.acquisition_lock.release()
+            gc.collect()
+            logging.debug("Acquisition thread closed")
+            self.acquire_must_stop.clear()
+
+    def _trigger_acquisition(self):
+        """
+        Start the acquisition of an image (in synchronized mode)
+        """
+        if self._sw_triggered:
+            self.atcore.SendSoftwareTrigger()
+        else:
+            self.atcore.StartAcquisition()
+
     def _start_acquisition(self):
         """
         Triggers the start of the acquisition on the camera. If the DataFlow
@@ -2198,7 +2426,7 @@ class AndorCam2(model.DigitalCamera):
             if self._late_events:
                 event_time = self._late_events.popleft()
                 logging.warning("starting acquisition late by %g s", time.time() - event_time)
-                self.atcore.StartAcquisition()
+                self._trigger_acquisition()
                 return
             else:
                 self._ready_for_acq_start = True
@@ -2209,7 +2437,7 @@ class AndorCam2(model.DigitalCamera):
             while not self.acquire_must_stop.is_set():
                 if not self.data._sync_event: # not synchronized (anymore)?
                     logging.debug("starting acquisition")
-                    self.atcore.StartAcquisition()
+                    self._trigger_acquisition()
                     return
                 # doesn't need to be very frequent, just not too long to delay
                 # cancelling the acquisition, and to check for the event frequently
@@ -2236,7 +2464,7 @@ class AndorCam2(model.DigitalCamera):
                 return
 
         logging.debug("starting sync acquisition")
-        self.atcore.StartAcquisition()
+        self._trigger_acquisition()
         self._ready_for_acq_start = False
         self._got_event.set() # let the acquisition thread know it's starting
 
@@ -2582,6 +2810,13 @@ class FakeAndorV2DLL(object):
         self.acq_end = None
         self.acq_aborted = threading.Event()
 
+        # Circular buffer (for software trigger)
+        self.ringSize = 16  # number of images it can hold
+        self._triggered_ends = collections.deque()  # end time of the triggered images not yet acquired
+        self._nacquired = 0  # total number of images acquired (= index of the last one)
+        self._nread = 0  # index of the last image read
+        self._nwaited = 0  # index of the last image reported by WaitForAcquisition()
+
     def Initialize(self, path):
         if not os.path.isdir(path):
             logging.warning("Trying to inialise simulator with an incorrect path: %s",
@@ -2848,12 +3083,20 @@ class FakeAndorV2DLL(object):
         # mode 0 = auto
         pass # whatever
 
+    def IsTriggerModeAvailable(self, mode):
+        # Only internal and software trigger are simulated, and software trigger
+        # only in run till abort
+        if _val(mode) == 0 or (_val(mode) == 10 and self.acqmode == 5):
+            return
+        raise AndorV2Error(20095, "DRV_INVALID_TRIGGER_MODE")
+
     def SetTriggerMode(self, mode):
-        # 0 = internal
+        # 0 = internal, 10 = software
         if _val(mode) > 12:
             raise AndorV2Error(20066, "Argument out of bounds")
-        if _val(mode) != 0:
+        if _val(mode) not in (0, 10):
             raise NotImplementedError()
+        self.triggermode = _val(mode)
 
     def SetAcquisitionMode(self, mode):
         """
@@ -2889,12 +3132,63 @@ class FakeAndorV2DLL(object):
 
     def StartAcquisition(self):
         self.status = AndorV2DLL.DRV_ACQUIRING
+        # The circular buffer is reset at each start
+        self._triggered_ends.clear()
+        self._nacquired = self._nread = self._nwaited = 0
+        if self.triggermode == 10:
+            self.acq_end = None  # Waiting for the software trigger
+            return
         duration = self.exposure + self._getReadout()
         self.acq_end = time.time() + duration
 #         if random.randint(0, 10) == 0:  # DEBUG
 #             self.acq_end += 15
 
+    def SendSoftwareTrigger(self):
+        if self.status != AndorV2DLL.DRV_ACQUIRING or self.triggermode != 10:
+            raise AndorV2Error(20992, "DRV_NOT_AVAILABLE")
+        # If the previous image is not finished, this one starts just after
+        duration = self.exposure + self._getReadout()
+        start = time.time()
+        if self._triggered_ends:
+            start = max(start, self._triggered_ends[-1])
+        self._triggered_ends.append(start + duration)
+
+    def _updateCircularBuffer(self):
+        """
+        Move the triggered images which are finished to the circular buffer
+        """
+        now = time.time()
+        while self._triggered_ends and self._triggered_ends[0] <= now:
+            self._triggered_ends.popleft()
+            self._nacquired += 1
+
+    def _WaitForTrigAcquisition(self, timeout):
+        """
+        WaitForAcquisition() when in software trigger mode: returns as soon as
+        a new image is in the circular buffer
+        """
+        end = time.time() + timeout
+        try:
+            while True:
+                self._updateCircularBuffer()
+                if self._nacquired > self._nwaited:
+                    self._nwaited = self._nacquired
+                    return
+
+                left = end - time.time()
+                if left <= 0:
+                    raise AndorV2Error(20024, "No new data, simulated acquisition waiting for trigger")
+                if self._triggered_ends:
+                    left = min(left, self._triggered_ends[0] - time.time())
+                if self.acq_aborted.wait(max(0.001, left)):
+                    raise AndorV2Error(20024, "No new data, simulated acquisition aborted")
+        finally:
+            self.acq_aborted.clear()
+
     def _WaitForAcquisition(self, timeout=None):
+        if self.triggermode == 10 and self.status == AndorV2DLL.DRV_ACQUIRING:
+            return self._WaitForTrigAcquisition(1e6 if timeout is None else timeout)
+
         left = self.acq_end - time.time()
         if timeout is None:
             timeout = left
@@ -2937,8 +3231,40 @@ class FakeAndorV2DLL(object):
             raise ValueError("res %s != size %d" % (res, size.value))
         # TODO: simulate binning by summing data and clipping
         ndbuffer = numpy.ctypeslib.as_array(p, (res[1], res[0]))
-        ndbuffer[...] = self._data[self.roi[2] - 1:self.roi[3]:self.binning[1],
-                                   self.roi[0] - 1:self.roi[1]:self.binning[0]]
+        ndbuffer[...] = self._getImage()
+
+    def _getImage(self):
+        """
+        return (numpy.ndarray): the image, as currently configured
+        """
+        return self._data[self.roi[2] - 1:self.roi[3]:self.binning[1],
+                          self.roi[0] - 1:self.roi[1]:self.binning[0]]
+
+    def GetNumberNewImages(self, p_first, p_last):
+        self._updateCircularBuffer()
+        if self._nacquired <= self._nread:
+            raise AndorV2Error(20024, "DRV_NO_NEW_DATA")
+        first = _deref(p_first, c_int32)
+        last = _deref(p_last, c_int32)
+        # The oldest images are overwritten when the buffer is full
+        first.value = max(self._nread + 1, self._nacquired - self.ringSize + 1)
+        last.value = self._nacquired
+
+    def GetImages16(self, first, last, cbuffer, size, p_validfirst, p_validlast):
+        first, last = _val(first), _val(last)
+        self._updateCircularBuffer()
+        if not (max(1, self._nacquired - self.ringSize + 1) <= first <= last <= self._nacquired):
+            raise AndorV2Error(20067, "DRV_P2INVALID")
+        im = self._getImage()
+        n = last - first + 1
+        if n * im.size != _val(size):
+            raise AndorV2Error(20119, "DRV_ERROR_BUFFSIZE")
+        p = cast(cbuffer, POINTER(c_uint16))
+        ndbuffer = numpy.ctypeslib.as_array(p, (n,) + im.shape)
+        ndbuffer[...] = im
+        self._nread = max(self._nread, last)
+        _deref(p_validfirst, c_int32).value = first
+        _deref(p_validlast, c_int32).value = last
 
     def FreeInternalMemory(self):
         pass
@@ -739,6 +739,14 @@ class Controller(object):
         except IndexError:
             raise ValueError("Failed to parse answer from %s %d: '%s'" %
                              (com, axis, resp))
+        return self._parseValue(value_str)
+
+    @staticmethod
+    def _parseValue(value_str):
+        """
+        value_str (str): the value as returned by the controller
+        returns (int or float or str): value converted depending on the type detected
+        """
         try:
             value = int(value_str)
         except ValueError:
@@ -749,6 +757,70 @@ class Controller(object):
 
         return value
 
+    @staticmethod
+    def _parseAxesValues(com, resp, axes):
+        """
+        Decode the answer of a command with multiple axes.
+        Ex: POS? 1 2 -> 1=25.3 \n2=12.1
+        com (str): the command sent (only used for error messages)
+        resp (str or list of str): the answer (one line per axis)
+        axes (set of int): the axes expected in the answer
+        returns (dict int -> int or float or str): axis -> value
+        raise ValueError: if the answer cannot be parsed
+        """
+        if isinstance(resp, basestring):
+            resp = [resp]
+        values = {}
+        for l in resp:
+            try:
+                axis_str, value_str = l.split("=")
+                # Multi-line answers may start with \x00
+                values[int(axis_str.lstrip("\x00"))] = Controller._parseValue(value_str)
+            except ValueError:
+                raise ValueError("Failed to parse answer from %s: '%s'" % (com, resp))
+
+        if set(values.keys()) != set(axes):
+            raise ValueError("Answer from %s has axes %s, while expected %s" %
+                             (com, values.keys(), list(axes)))
+        return values
+
+    def _queryMoveState(self, axes, pos_axes, check=False):
+        """
+        Read the on target state of some axes, and the position of some axes,
+          in a single query
+        axes (set of int): axes for which to read the on target state
+        pos_axes (set of int): axes for which to read the position
+        check (bool): if True, also checks the error status
+        returns (set of int, dict int -> float): axes not on target,
+          and position of each pos_axes (in "user" units)
+        raise PIGCSError if check is True and an error on a controller happened
+        """
+        assert axes.issubset(self._channels) and pos_axes.issubset(self._channels)
+        coms = []
+        if check:
+            coms.append("ERR?\n")
+        if axes:
+            coms.append("ONT? %s\n" % (" ".join("%d" % a for a in sorted(axes)),))
+        if pos_axes:
+            coms.append("POS? %s\n" % (" ".join("%d" % a for a in sorted(pos_axes)),))
+        if not coms:
+            return set(), {}
+
+        lresp = self._sendQueryCommand(coms)
+        if check:
+            err = int(lresp.pop(0))
+            if err:
+                raise PIGCSError(err)
+        moving = set()
+        if axes:
+            ont = self._parseAxesValues("ONT?", lresp.pop(0), axes)
+            moving = set(a for a, v in ont.items() if v != 1)
+        pos = {}
+        if pos_axes:
+            pos = self._parseAxesValues("POS?", lresp.pop(0), pos_axes)
+
+        return moving, pos
+
     def HasLimitSwitches(self, axis):
         """
         Report whether the given axis has limit switches (is able to detect
@@ -1540,6 +1612,22 @@ class Controller(object):
         # takes more characters and for CL, we need a more clever code anyway
         return not axes.isdisjoint(self.GetMotionStatus())
 
+    def getMoveState(self, axes, pos_axes):
+        """
+        Indicate which motors are moving, and their position, with as few
+          queries as possible.
+        axes (set of int): axes to check whether they move
+        pos_axes (set of int): axes for which to read the position
+        return (set of int, dict int -> float): the axes moving (subset of axes),
+          and the current position of each of the pos_axes
+        raise PIGCSError if an error on a controller happened
+        """
+        # Default implementation, one axis at a time. Closed-loop controllers
+        # override it to read everything in one query.
+        moving = set(a for a in axes if self.isMoving({a}))
+        pos = dict((a, self.getPosition(a)) for a in pos_axes)
+        return moving, pos
+
     def stopMotion(self):
         """
         Stop the motion on all axes immediately
@@ -1790,6 +1878,16 @@ class CLAbsController(Controller):
 
         return False
 
+    def getMoveState(self, axes, pos_axes):
+        # Same as isMoving() and getPosition(), but in one query
+        moving, upos = self._queryMoveState(axes, pos_axes, check=bool(axes))
+        now = time.time()
+        pos = {}
+        for a, p in upos.items():
+            pos[a] = p * self._upm[a]
+            self._lastpos[a] = (pos[a], now)
+        return moving, pos
+
     # TODO allow to reference, but need to get multiple axes, and to check the
     # status, isMoving() cannot be used, but just GetMotionStatus()
     # def startReferencing(self, axis):
@@ -2310,6 +2408,28 @@ class CLRelController(Controller):
 
         return False
 
+    def getMoveState(self, axes, pos_axes):
+        # Same as isMoving() and getPosition(), but in one query.
+        # Hold the position locks in order, so that it cannot deadlock
+        locks = [self._pos_lock[a] for a in sorted(pos_axes)]
+        for l in locks:
+            l.acquire()
+        try:
+            # A merge of the query with error check causes a long delay (~40 ms)
+            # in the answer
+            moving, upos = self._queryMoveState(axes, pos_axes, check=False)
+        finally:
+            for l in reversed(locks):
+                l.release()
+
+        # Stopped axes => turn off encoder (in a few seconds)
+        if self._auto_suspend:
+            for a in axes - moving:
+                self._releaseAxis(a, self._auto_suspend)
+
+        pos = dict((a, p * self._upm[a]) for a, p in upos.items())
+        return moving, pos
+
 
         # TODO: handle the fact that if the stage reaches the physical limit without knowing,
         # the move will fail with:
@@ -2899,22 +3019,68 @@ class Bus(model.Actuator):
         """
         if axes is None:
             pos = {}
+            axes = set(self._axis_to_cc.keys())
         else:
             pos = self.position._value.copy()
 
         npos = {}
-        for a, (controller, channel) in self._axis_to_cc.items():
-            if axes is None or a in axes:
-                try:
-                    npos[a] = controller.getPosition(channel)
-                except PIGCSError:
-                    logging.warning("Failed to update position of axis %s", a, exc_info=True)
+        for controller, chans in self._groupByController(axes).items():
+            try:
+                _, cpos = controller.getMoveState(set(), set(chans.keys()))
+            except PIGCSError:
+                logging.warning("Failed to update position of axes %s",
+                                chans.values(), exc_info=True)
+                continue
+            npos.update((chans[c], p) for c, p in cpos.items())
 
         pos.update(self._applyInversion(npos))
         logging.debug("Reporting new position at %s", pos)
 
         self.position._set_value(pos, force_write=True)
 
+    def _groupByController(self, axes):
+        """
+        axes (set of str): axes names
+        return (dict Controller -> (dict int -> str)): for each controller, the
+          channel -> axis name of the given axes
+        """
+        ctrl_chans = {}
+        for an in axes:
+            controller, channel = self._axis_to_cc[an]
+            ctrl_chans.setdefault(controller, {})[channel] = an
+        return ctrl_chans
+
+    def _readMoveState(self, axes, pos_axes):
+        """
+        Read which axes are moving, and the position of some axes, with one
+          query per controller.
+        axes (set of str): the axes names to check whether they are moving
+        pos_axes (set of str): the axes names for which to read the position
+        return (set of str, dict str -> float): the axes still moving, and the
+          position of the pos_axes (without inversion)
+        raise PIGCSError: if a controller reported an error
+        """
+        moving = set()
+        npos = {}
+        for controller, chans in self._groupByController(axes | pos_axes).items():
+            m_chans = set(c for c, an in chans.items() if an in axes)
+            p_chans = set(c for c, an in chans.items() if an in pos_axes)
+            cmoving, cpos = controller.getMoveState(m_chans, p_chans)
+            moving.update(chans[c] for c in cmoving)
+            npos.update((chans[c], p) for c, p in cpos.items())
+
+        return moving, npos
+
+    def _reportPosition(self, npos):
+        """
+        Update the position VA with some new positions
+        npos (dict str -> float): axis name -> position (without inversion)
+        """
+        pos = self.position._value.copy()
+        pos.update(self._applyInversion(npos))
+        logging.debug("Reporting new position at %s", pos)
+        self.position._set_value(pos, force_write=True)
+
     def _refreshPosition(self):
         """
         Called regularly to update the position of the closed-loop axes
@@ -3151,11 +3317,25 @@ class Bus(model.Actuator):
                     logging.debug("Ending move control early as next move is an update containing %s", moving_axes)
                     return
 
-                for an in moving_axes.copy():  # need copy to remove during iteration
-                    controller, channel = self._axis_to_cc[an]
-                    # TODO: change isMoving to report separate info on multiple channels
-                    if not controller.isMoving({channel}):
-                        moving_axes.discard(an)
+                # The position is read together with the move state, from time
+                # to time (10 Hz), and at every check once the move should be
+                # over, so that the final position is already known when the
+                # end of the move is detected.
+                now = time.time()
+                if now - last_upd > 0.1 or now >= end:
+                    pos_axes = last_axes
+                else:
+                    pos_axes = set()
+                moving_axes, npos = self._readMoveState(moving_axes, pos_axes)
+                if npos:
+                    self._reportPosition(npos)
+                    last_upd = now
+                    last_axes = moving_axes.copy()
+                elif last_axes != moving_axes and moving_axes:
+                    # Some axes just stopped => report their final position
+                    self._updatePosition(last_axes)
+                    last_upd = now
+                    last_axes = moving_axes.copy()
                 if not moving_axes:
                     # no more axes to wait for
                     break
@@ -3170,12 +3350,6 @@ class Bus(model.Actuator):
                                        "expected it takes only %g s" %
                                        (max_dur, dur))
 
-                # Update the position from time to time (10 Hz)
-                if now - last_upd > 0.1 or last_axes != moving_axes:
-                    self._updatePosition(last_axes)
-                    last_upd = now
-                    last_axes = moving_axes.copy()
-
                 # Wait half of the time left (maximum 0.1 s)
                 left = end - time.time()
                 sleept = max(0.001, min(left / 2, 0.1))
@@ -3191,11 +3365,11 @@ class Bus(model.Actuator):
         except Exception:
             raise
         finally:
-            if need_pos_update:
+            if need_pos_update and last_axes:
                 # Position update takes quite some time, which increases latency for
                 # the caller to know the move is done => only update the last axes
-                # moving (and don't notify the VA) and update the rest of axes in a
-                # separate thread
+                # moving whose position is not yet known (and don't notify the VA)
+                # and update the rest of axes in a separate thread
                 self._updatePosition(last_axes)
             self._pos_needs_update.set()
 
@@ -3438,6 +3612,106 @@ class Bus(model.Actuator):
         return sock
 
 
+class AnswerParser(object):
+    """
+    Decodes the answers of a controller to one or several query commands.
+    The data can be passed as soon as it is received, in chunks of any size.
+    Only the new complete lines are processed, so the decoding time is linear
+    with the length of the answer.
+    The basic is simple. An answer starts with a prefix, and finishes
+    with \n. If it actually finishes with " \n", then it's just a new
+    line and not the end of the answer.
+    However, it gets muddy sometimes with empty answers. For instance,
+    it can answer "0 1 \n", which is an empty answer. But some
+    controllers answer "1 HLP\n" with "0 1 \nBla bla \nBla\n"
+    """
+    def __init__(self, prefix, ncom, full_com):
+        """
+        prefix (str): the prefix of each answer (eg, "0 1 ")
+        ncom (1<=int): number of commands sent, and so of answers expected
+        full_com (str): the commands sent, only used for error messages
+        """
+        self._prefix = prefix
+        self._ncom = ncom
+        self._full_com = full_com
+        self._partial = []  # data received after the last \n
+        self._lines = []  # one string per line of the current answer
+        self._continuing = False  # True if the current answer has more lines
+        self._answers = []  # one answer per command
+
+    def feed(self, data):
+        """
+        Process the data received
+        data (str): the next data received (not empty)
+        return (bool): True if it looks like the answers to all the commands
+          have been received.
+        raise IOError: if the answer doesn't respect the protocol
+        """
+        self._partial.append(data)
+        if "\n" not in data:
+            return False
+
+        lines = "".join(self._partial).split("\n")
+        # if the answer finishes with \n, last split is empty
+        lines, last = lines[:-1], lines[-1]
+        self._partial = [last] if last else []
+        logging.debug("Received: '%s'", "\n".join(lines).encode('string_escape'))
+
+        for l in lines:
+            self._processLine(l)
+
+        # does it look like we received the end of an answer?
+        return (not self._continuing and not self._partial and
+                len(self._answers) >= self._ncom)
+
+    def _processLine(self, l):
+        """
+        l (str): a complete line (without the \n)
+        """
+        if not self._continuing:
+            self._lines = []
+            # remove the prefix
+            if l.startswith(self._prefix):
+                l = l[len(self._prefix):]
+            else:
+                # Maybe the previous line was actually continuing (but the hardware is strange)?
+                if self._answers and self._answers[-1] == "":
+                    logging.debug("Reconcidering previous line as beginning of multi-line")
+                    self._answers = self._answers[:-1]
+                else:
+                    # TODO: maybe we got some garbage data from before,
+                    # check if there is already data available that fits the
+                    # prefix. (=> keep reading but with a short timeout)
+                    logging.debug("Failed to decode answer '%s'", l.encode('string_escape'))
+                    raise IOError("Report prefix unexpected after '%s': '%s'." % (self._full_com, l))
+
+        if l[-1:] == " ":  # multi-line
+            self._continuing = True
+            self._lines.append(l[:-1])  # remove the space indicating multi-line
+        else:
+            # End of the answer for that command
+            self._continuing = False
+            self._lines.append(l)
+            if len(self._lines) == 1:
+                self._answers.append(self._lines[0])
+            else:
+                self._answers.append(self._lines)
+
+    def getAnswers(self):
+        """
+        return (list of (str or list of str)): the answer to each command
+          (a list of lines if it is multi-line).
+        """
+        ret = self._answers
+        if len(ret) > self._ncom:
+            logging.warning("Skipping previous answers from hardware %r",
+                            ret[:-self._ncom])
+            ret = ret[-self._ncom:]
+        elif len(ret) < self._ncom:
+            logging.error("Expected %d answers but only got %d", self._ncom, len(ret))
+        return ret
+
+
 class SerialBusAccesser(object):
     """
     Manages connections to the low-level bus
@@ -3510,60 +3784,17 @@ class SerialBusAccesser(object):
             # ensure everything is received, before expecting an answer
             self.serial.flush()
 
-            ans = ""  # received data not yet processed
-            ret = []  # one answer per command
-            continuing = False
+            parser = AnswerParser(prefix, len(com), full_com)
             while True:
-                char = self.serial.read()  # empty if timeout
-                if not char:
+                # Read everything already received, or wait for at least one byte
+                data = self.serial.read(max(1, self.serial.inWaiting()))  # empty if timeout
+                if not data:
                     raise model.HwError("Controller %s timed out, check the device is "
                                         "plugged in and turned on." % addr)
-                ans += char
-
-                anssplited = ans.split("\n")
-                # if the answer finishes with \n, last split is empty
-                anssplited, ans = anssplited[:-1], anssplited[-1]
-                if anssplited:
-                    logging.debug("Received: '%s'", "\n".join(anssplited).encode('string_escape'))
-
-                for l in anssplited:
-                    if not continuing:
-                        lines = []  # one string per answer line
-                        # remove the prefix
-                        if l.startswith(prefix):
-                            l = l[len(prefix):]
-                        else:
-                            # Maybe the previous line was actually continuing (but the hardware is strange)?
-                            if ret and ret[-1] == "":
-                                logging.debug("Reconcidering previous line as beginning of multi-line")
-                                ret = ret[:-1]
-                            else:
-                                logging.debug("Failed to decode answer '%s'", l.encode('string_escape'))
-                                raise IOError("Report prefix unexpected after '%s': '%s'." % (full_com, l))
-
-                    if l[-1:] == " ":  # multi-line
-                        continuing = True
-                        lines.append(l[:-1])  # remove the space indicating multi-line
-                    else:
-                        # End of the answer for that command
-                        continuing = False
-                        lines.append(l)
-                        if len(lines) == 1:
-                            ret.append(lines[0])
-                        else:
-                            ret.append(lines)
-
-                # does it look like we received the end of an answer?
-                if not continuing and not ans and len(ret) >= len(com):
+                if parser.feed(data):
                     break
 
-        if len(ret) > len(com):
-            logging.warning("Skipping previous answers from hardware %r",
-                            ret[:-len(com)])
-            ret = ret[-len(com):]
-        elif len(ret) < len(com):
-            logging.error("Expected %d answers but only got %d", len(com), len(ret))
-
+        ret = parser.getAnswers()
         if not multicom:
             return ret[0]
         else:
@@ -3665,16 +3896,8 @@ class IPBusAccesser(object):
             self.socket.sendall(full_com)
 
             # Read the answer
-            # The basic is simple. An answer starts with a prefix, and finishes
-            # with \n. If it actually finishes with " \n", then it's just a new
-            # line and not the end of the answer.
-            # However, it gets muddy sometimes with empty answers. For instance,
-            # it can answer "0 1 \n", which is an empty answer. But some
-            # controllers answer "1 HLP\n" with "0 1 \nBla bla \nBla\n"
             end_time = time.time() + 0.5
-            ans = ""  # received data not yet processed
-            ret = []  # one answer per command
-            continuing = False
+            parser = AnswerParser(prefix, len(com), full_com)
             while True:
                 try:
                     data = self.socket.recv(4096)
@@ -3692,55 +3915,10 @@ class IPBusAccesser(object):
                     time.sleep(0.01)
                     continue
 
-                logging.debug("Received: '%s'", data.encode('string_escape'))
-                ans += data
-
-                anssplited = ans.split("\n")
-                # if the answer finishes with \n, last split is empty
-                anssplited, ans = anssplited[:-1], anssplited[-1]
-
-                for l in anssplited:
-                    # logging.debug("Processing %s", l)
-                    if not continuing:
-                        lines = []  # one string per answer line
-                        # remove the prefix
-                        if l.startswith(prefix):
-                            l = l[len(prefix):]
-                        else:
-                            # Maybe the previous line was actually continuing (but the hardware is strange)?
-                            if ret and ret[-1] == "":
-                                logging.debug("Reconcidering previous line as beginning of multi-line")
-                                ret = ret[:-1]
-                            else:
-                                # TODO: maybe we got some garbage data from before,
-                                # check if there is already data available that fits the
-                                # prefix. (=> keep reading but with a short timeout)
-                                logging.debug("Failed to decode answer '%s'", l.encode('string_escape'))
-                                raise IOError("Report prefix unexpected after '%s': '%s'." % (full_com, l))
-
-                    if l[-1:] == " ":  # multi-line
-                        continuing = True
-                        lines.append(l[:-1])  # remove the space indicating multi-line
-                    else:
-                        # End of the answer for that command
-                        continuing = False
-                        lines.append(l)
-                        if len(lines) == 1:
-                            ret.append(lines[0])
-                        else:
-                            ret.append(lines)
-
-                # does it look like we received the end of an answer?
-                if not continuing and not ans and len(ret) >= len(com):
+                if parser.feed(data):
                     break
 
-        if len(ret) > len(com):
-            logging.warning("Skipping previous answers from hardware %r",
-                            ret[:-len(com)])
-            ret = ret[-len(com):]
-        elif len(ret) < len(com):
-            logging.error("Expected %d answers but only got %d", len(com), len(ret))
-
+        ret = parser.getAnswers()
         if not multicom:
             return ret[0]
         else:
@@ -3879,13 +4057,17 @@ class E861Simulator(object):
         while len(ret) < size:
             time.sleep(0.01)
             left = size - len(ret)
-            ret += self._output_buf[:left]
-            self._output_buf = self._output_buf[len(ret):]
+            d = self._output_buf[:left]
+            ret += d
+            self._output_buf = self._output_buf[len(d):]
             if self.timeout and time.time() > end_time:
                 break
 
         return ret
 
+    def inWaiting(self):
+        return len(self._output_buf)
+
     def close(self):
         # using read or write will fail after that
         del self._output_buf
@@ -4263,13 +4445,18 @@ class DaisyChainSimulator(object):
             time.sleep(0.01)
             left = size - len(ret)
             with self._obuf_lock:
-                ret += self._output_buf[:left]
-                self._output_buf = self._output_buf[len(ret):]
+                d = self._output_buf[:left]
+                ret += d
+                self._output_buf = self._output_buf[len(d):]
             if self.timeout and time.time() > end_time:
                 break
 
         return ret
 
+    def inWaiting(self):
+        with self._obuf_lock:
+            return len(self._output_buf)
+
     def _thread_read_serial(self, ser):
         """
         Push the output of the given serial port into our output
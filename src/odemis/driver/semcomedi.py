@@ -43,6 +43,12 @@ import weakref
 
 import odemis.driver.comedi_simple as comedi
 
+# See if the optimised (cython-based) functions are available
+try:
+    from odemis.util import oversample_fast
+except ImportError:
+    logging.warn("Failed to load optimised oversampling functions, slow version will be used.")
+    oversample_fast = None
 
 #pylint: disable=E1101
 # This is a module to drive a FEI Scanning electron microscope via the so-called
@@ -110,6 +116,21 @@ NI_AO_TRIG_AI_START1 = 19  # Trigger number for AI Start1 (= beginning of a comm
 ACQ_CMD_UPD = 1
 ACQ_CMD_TERM = 2
 
+# The scan arrays of the last settings used are kept, so that alternating
+# between settings (eg, moving the beam spot by spot via the translation) doesn't
+# require to compute them again.
+SCAN_CACHE_MAX_ENTRIES = 64
+SCAN_CACHE_MAX_BYTES = 64 * 2 ** 20  # B
+
+# When the same area is scanned repeatedly (eg, live view), several frames are
+# scanned in a single command, so that there is no dead time between frames.
+# The command is stopped early if the settings change.
+CONTINUOUS_MAX_DURATION = 5  # s, maximum duration of one command
+CONTINUOUS_MAX_FRAMES = 256  # maximum number of frames in one command
+
+# When the raw data is reduced while being read, number of values read at once
+READ_BLOCK_SIZE = 2 ** 16
+
 # helper functions
 def get_best_dtype_for_acc(idtype, count):
     """
@@ -273,6 +294,7 @@ class SEMComedi(model.HwComponent):
         # probably not useful anymore => just check if _acquisitions is empty?
         self._acquisition_must_stop = threading.Event()
         self._acquisitions = set()  # detectors currently active
+        self._prev_acq_settings = None  # detectors and scan settings of the last acquisition
 
         # create the detector children "detectorN" and "counterN"
         self._detectors = {}  # str (name) -> component
@@ -1025,13 +1047,14 @@ class SEMComedi(model.HwComponent):
                       period * 1e6)
         rshape = (data.shape[0], data.shape[1] - margin)
 
-        # allocate one full buffer per channel
-        buf = []
-        for c in rchannels:
-            buf.append(numpy.empty(rshape, dtype=self._reader.dtype))
+        # allocate one full buffer per channel (all in one array, so that the
+        # raw data of all the channels can be reduced at once)
+        bufs = numpy.empty((len(rchannels),) + rshape, dtype=self._reader.dtype)
+        buf = list(bufs)
         # TODO: this is pessimistic if max_data of device < dtype.max, so
         # better use the max_data of the device directly.
         adtype = get_best_dtype_for_acc(self._reader.dtype, osr)
+        use_fast = oversample_fast is not None
 
         # read "maxlines" lines at a time
         x = 0
@@ -1041,14 +1064,28 @@ class SEMComedi(model.HwComponent):
             wdata = data[x:x + lines, :, :] # just a couple of lines
             wdata = wdata.reshape(-1, wdata.shape[2]) # flatten X/Y
             islast = (x + lines >= data.shape[0])
+
+            # If possible, decimate the data while it's read, directly into
+            # each buffer, instead of holding all the raw data in memory.
+            reducer = None
+            if use_fast:
+                try:
+                    reducer = oversample_fast.OversampleReducer(bufs[:, x:x + lines],
+                                                                margin, osr)
+                except ValueError as exp:
+                    logging.info("Fast decimation cannot run: %s", exp)
+                    use_fast = False
+
             rbuf = self._write_read_raw_one_cmd(wchannels, wranges, rchannels,
                                     rranges, period, osr, wdata, margin,
-                                    rest=(islast and self._scanner.fast_park))
+                                    rest=(islast and self._scanner.fast_park),
+                                    reducer=reducer)
 
-            # decimate into each buffer
-            for i, b in enumerate(buf):
-                self._scan_raw_to_lines(rshape, margin, osr, x,
-                                        rbuf[..., i], b[x:x + lines, ...], adtype)
+            if reducer is None:
+                # decimate into each buffer
+                for i, b in enumerate(buf):
+                    self._scan_raw_to_lines(rshape, margin, osr, x,
+                                            rbuf[..., i], b[x:x + lines, ...], adtype)
 
             x += lines
 
@@ -1177,7 +1214,8 @@ class SEMComedi(model.HwComponent):
         oarray[x, y - margin] = numpy.sum(data, dtype=adtype) / (osr * dpr)
 
     def _fake_write_read_raw_one_cmd(self, wchannels, wranges, rchannels, rranges,
-                                     period, osr, data, settling_samples, rest=False):
+                                     period, osr, data, settling_samples, rest=False,
+                                     reducer=None):
         """
         Imitates _write_read_raw_one_cmd() but works with the comedi_test driver,
           just read data.
@@ -1215,7 +1253,7 @@ class SEMComedi(model.HwComponent):
             self._writer.prepare(wbuf, expected_time)
 
             # prepare read buffer info
-            self._reader.prepare(nrscans * nrchans, expected_time)
+            self._reader.prepare(nrscans * nrchans, expected_time, reducer=reducer)
 
         # FIXME: some times, after many fine acquisitions, this command fails
         # with "ComediError: returned -1 -> (16) Device or resource busy"
@@ -1243,15 +1281,18 @@ class SEMComedi(model.HwComponent):
         logging.debug("Waiting %g s for the acquisition to finish", timeout)
         rbuf = self._reader.wait(timeout)
         self._writer.wait(0.1)
+        logging.debug("acquisition took %g s, init=%g s", time.time() - begin, start - begin)
+        if reducer is not None:
+            return None  # The data is already in the reducer
         # reshape to 2D
         rbuf.shape = (nrscans, nrchans)
         if rest:
             rbuf = rbuf[:-osr, :] # remove data read during rest positioning
-        logging.debug("acquisition took %g s, init=%g s", time.time() - begin, start - begin)
         return rbuf
 
     def _write_read_raw_one_cmd(self, wchannels, wranges, rchannels, rranges,
-                                period, osr, data, settling_samples, rest=False):
+                                period, osr, data, settling_samples, rest=False,
+                                reducer=None):
         """
         write data on the given analog output channels and read synchronously
           on the given analog input channels in one command
@@ -1268,9 +1309,11 @@ class SEMComedi(model.HwComponent):
         settling_samples (int): number of first write samples used for the
           settling of the beam, and so don't need to trigger newPosition
         rest (boolean): if True, will add one more write to set to rest position
-        return (2D numpy.array with dtype=device type)
+        reducer (None or OversampleReducer): if provided, the raw data is passed
+          to it progressively, while it's read, instead of being returned.
+        return (None or 2D numpy.array with dtype=device type)
             the raw data read (first dimension is data.shape[0] * osr) for each
-            channel (as second dimension).
+            channel (as second dimension). None if a reducer is provided.
         raises:
             IOError: in case of timeout or cancellation
         """
@@ -1303,7 +1346,7 @@ class SEMComedi(model.HwComponent):
             self.setup_timed_command(self._ai_subdevice, rchannels, rranges,
                                      rperiod_ns, stop_arg=nrscans, aref=comedi.AREF_DIFF)
             # prepare to read
-            self._reader.prepare(nrscans * nrchans, expected_time)
+            self._reader.prepare(nrscans * nrchans, expected_time, reducer=reducer)
 
             # create a command for writing
             # HACK WARNING:
@@ -1360,6 +1403,8 @@ class SEMComedi(model.HwComponent):
         rbuf = self._reader.wait(timeout)
         if nwscans != 1:
             self._writer.wait() # writer is faster, so there should be no wait
+        if reducer is not None:
+            return None  # The data is already in the reducer
         # reshape to 2D
         rbuf.shape = (nrscans, nrchans)
         if rest:
@@ -1676,9 +1721,19 @@ class SEMComedi(model.HwComponent):
                 if detectors:
                     self._scanner.indicate_scan_state(True)
                     # write and read the raw data
+                    # Continuous scanning is only worthy if the same scan is
+                    # repeated (eg, live view). It's not used for the first
+                    # frame, as it might be a single frame acquisition.
+                    acq_settings = (detectors, self._get_scan_settings())
+                    prev_acq_settings, self._prev_acq_settings = self._prev_acq_settings, acq_settings
                     try:
                         if any(isinstance(d, CountingDetector) for d in detectors):
                             rdas = self._acquire_counting_detector(detectors)
+                        elif (acq_settings == prev_acq_settings and
+                              self._can_scan_continuously(detectors)):
+                            # The data is sent as soon as each frame is received
+                            self._acquire_analog_detectors_continuous(detectors)
+                            rdas = ()
                         else:
                             rdas = self._acquire_analog_detectors(detectors)
                     except CancelledError:
@@ -1700,11 +1755,7 @@ class SEMComedi(model.HwComponent):
                             continue
 
                     nfailures = 0
-
-                    for d, da in zip(detectors, rdas):
-                        if d.inverted:
-                            da = (d.shape[0] - 1) - da
-                        d.data.notify(da)
+                    self._notify_data(detectors, rdas)
 
                     # force the GC to non-used buffers, for some reason, without this
                     # the GC runs only after we've managed to fill up the memory
@@ -1734,6 +1785,18 @@ class SEMComedi(model.HwComponent):
             logging.info("Acquisition thread closed")
             self._acquisition_thread = None
 
+    @staticmethod
+    def _notify_data(detectors, rdas):
+        """
+        Send the data acquired to the DataFlow of each detector
+        detectors (list of Detectors)
+        rdas (list of DataArrays): the raw data of each detector, in the same order
+        """
+        for d, da in zip(detectors, rdas):
+            if d.inverted:
+                da = (d.shape[0] - 1) - da
+            d.data.notify(da)
+
     def _req_stop_acquisition(self):
         """
         Request the acquisition to stop
@@ -1796,7 +1859,7 @@ class SEMComedi(model.HwComponent):
 
         # add scanner translation to the center
         center = self._metadata.get(model.MD_POS, (0, 0))
-        trans = self._scanner.pixelToPhy(self._scanner.translation.value)
+        trans = self._scanner.pixelToPhy(self._scanner.get_scan_translation())
         metadata[model.MD_POS] = (center[0] + trans[0],
                                   center[1] + trans[1])
 
@@ -1829,6 +1892,172 @@ class SEMComedi(model.HwComponent):
 
         return rdas
 
+    def _get_scan_settings(self):
+        """
+        returns (tuple): all the settings which affect the scan
+        """
+        s = self._scanner
+        return (s.resolution.value, s.scale.value, s.translation.value,
+                s.dwellTime.value, id(s.scanPath.value))
+
+    def _can_scan_continuously(self, detectors):
+        """
+        Check whether the acquisition can be done with several frames per
+          command. That's only possible if the frames are not synchronised,
+          there is no need to report each new position, and a whole frame can
+          be read in one command.
+        detectors (AnalogDetectors)
+        returns (bool)
+        """
+        if any(d.data._sync_event for d in detectors):
+            return False
+        if self._scanner.newPosition.hasListeners() or self._scanner.fast_park:
+            return False
+        return self._get_continuous_frames(len(detectors)) >= 2
+
+    def _get_continuous_frames(self, nrchans):
+        """
+        Compute how many frames can be scanned in one command, with the current
+          settings.
+        nrchans (1<=int): number of read channels
+        returns (0<=int): number of frames, 0 if not even one frame fits
+        """
+        s = self._scanner
+        res = s.resolution.value if s.scanPath.value is None else (len(s.scanPath.value), 1)
+        dt = s.dwellTime.value
+        if nrchans != s._nrchans:
+            # The oversampling rate might change, so consider only the frames
+            # that would fit with osr=1
+            osr, dpr = 1, 1
+        else:
+            osr, dpr = s._osr, s._dpr
+        if dpr > 1:
+            return 0
+        # Approximate, as it doesn't take into account the settling margin
+        frame_sz = res[0] * res[1] * nrchans * osr * self._reader.dtype.itemsize
+        frame_dur = res[0] * res[1] * dt
+        return int(min(CONTINUOUS_MAX_FRAMES,
+                       self._max_bufsz // frame_sz,
+                       CONTINUOUS_MAX_DURATION // frame_dur))
+
+    def _acquire_analog_detectors_continuous(self, detectors):
+        """
+        Run the acquisition of several frames in a row, for multiple analog
+          detectors (and no counters). The same scan is written multiple times
+          in a single command, and each frame is sent as soon as it's read, so
+          there is no dead time between frames. It stops early if the settings
+          change, or detectors are added or removed.
+        detectors (AnalogDetectors)
+        returns nothing, the data is sent directly to the detectors' DataFlows
+        """
+        rchannels = tuple(d.channel for d in detectors)
+        rranges = tuple(d._range for d in detectors)
+        nrchans = len(rchannels)
+
+        # get the scan values (automatically updated to the latest needs)
+        settings = self._get_scan_settings()
+        (scan, period, shape, margin,
+         wchannels, wranges, osr, dpr) = self._scanner.get_scan_data(nrchans)
+        frame_sz = scan.shape[0] * scan.shape[1] * nrchans * osr * self._reader.dtype.itemsize
+        nframes = int(min(CONTINUOUS_MAX_FRAMES, self._max_bufsz // frame_sz,
+                          CONTINUOUS_MAX_DURATION // (scan.shape[0] * scan.shape[1] * period)))
+        if nframes < 1 or dpr > 1:
+            # Could happen if osr increased => just do one frame the normal way
+            rdas = self._acquire_analog_detectors(detectors)
+            self._notify_data(detectors, rdas)
+            return
+
+        wdata = scan.reshape(-1, scan.shape[2])  # flatten X/Y
+        nwscans = wdata.shape[0]  # per frame
+        nrscans = nwscans * osr  # per frame
+        period_ns = int(round(period * 1e9))  # in nanoseconds
+        rperiod_ns = int(round(period * 1e9) / osr)  # in nanoseconds
+        frame_time = nwscans * period  # s
+        expected_time = nframes * frame_time  # s
+        rshape = (scan.shape[0], scan.shape[1] - margin)
+        adtype = get_best_dtype_for_acc(self._reader.dtype, osr)
+
+        # Scanner metadata (note: MD_POS is expected to be on the base/e-beam metadata)
+        center = self._metadata.get(model.MD_POS, (0, 0))
+        trans = self._scanner.pixelToPhy(self._scanner.get_scan_translation())
+        metadata = {
+            model.MD_DWELL_TIME: period,
+            model.MD_SAMPLES_PER_PIXEL: osr * dpr,
+            model.MD_POS: (center[0] + trans[0], center[1] + trans[1]),
+        }
+        md = []
+        for det in detectors:
+            mdi = self._metadata.copy()
+            mdi.update(det.getMetadata())
+            mdi.update(metadata)
+            md.append(mdi)
+
+        with self._acquisition_init_lock:
+            if self._acquisition_must_stop.is_set():
+                raise CancelledError("Acquisition cancelled during preparation")
+
+            logging.debug("Generating continuous write and read commands for %d "
+                          "frames of %d scans", nframes, nwscans)
+            if self._test:
+                # comedi_test: the write is only simulated (cf _fake_write_read_raw_one_cmd())
+                self._writer.prepare(wdata.ravel(), expected_time, repeat=nframes)
+                self._reader.prepare(nframes * nrscans * nrchans, expected_time, chunks=nframes)
+            else:
+                self.setup_timed_command(self._ai_subdevice, rchannels, rranges,
+                                         rperiod_ns, stop_arg=nframes * nrscans,
+                                         aref=comedi.AREF_DIFF)
+                self._reader.prepare(nframes * nrscans * nrchans, expected_time, chunks=nframes)
+
+                self.setup_timed_command(self._ao_subdevice, wchannels, wranges, period_ns,
+                                         start_src=comedi.TRIG_EXT,
+                                         start_arg=NI_TRIG_AI_START1,
+                                         stop_arg=nframes * nwscans)
+                self._writer.prepare(wdata.ravel(), expected_time, repeat=nframes)
+
+        # run the commands (cf _write_read_raw_one_cmd())
+        if self._test:
+            self.setup_timed_command(self._ai_subdevice, rchannels, rranges, rperiod_ns,
+                                     start_src=comedi.TRIG_NOW,
+                                     stop_arg=nframes * nrscans)
+        else:
+            comedi.internal_trigger(self._device, self._ao_subdevice, self._ao_trig)
+            comedi.internal_trigger(self._device, self._ai_subdevice, 0)
+        start = time.time()
+        self._reader.run()
+        self._writer.run()
+
+        for f in range(nframes):
+            timeout = frame_time * 1.10 + 0.1 + max(0, start + f * frame_time - time.time())
+            rbuf = self._reader.wait_chunk(timeout)
+            rbuf.shape = (nrscans, nrchans)
+
+            rdas = []
+            for i, mdi in enumerate(md):
+                b = numpy.empty(rshape, dtype=self._reader.dtype)
+                self._scan_raw_to_lines(rshape, margin, osr, 0, rbuf[..., i], b, adtype)
+                mdi = mdi.copy()
+                mdi[model.MD_ACQ_DATE] = start + f * frame_time
+                rdas.append(model.DataArray(b, mdi))
+            self._notify_data(detectors, rdas)
+
+            # Anything changed? => stop the command (and start a new one)
+            if (f < nframes - 1 and
+                (not self._acq_cmd_q.empty() or
+                 self._get_scan_settings() != settings or
+                 any(d.data._sync_event for d in detectors) or
+                 self._scanner.newPosition.hasListeners())):
+                logging.debug("Stopping continuous scan after %d frames", f + 1)
+                self._req_stop_acquisition()
+                try:
+                    self._writer.wait(0.1)
+                except (CancelledError, IOError):
+                    pass
+                return
+
+        self._writer.wait()  # writer is faster, so there should be no wait
+        logging.debug("Continuous scan of %d frames took %g s, while expected %g s",
+                      nframes, time.time() - start, expected_time)
+
     def _acquire_counting_detector(self, detectors):
         """
         Run the acquisition for one counting detector (and the other detectors
@@ -1875,7 +2104,7 @@ class SEMComedi(model.HwComponent):
 
         # add scanner translation to the center
         center = self._metadata.get(model.MD_POS, (0, 0))
-        trans = self._scanner.pixelToPhy(self._scanner.translation.value)
+        trans = self._scanner.pixelToPhy(self._scanner.get_scan_translation())
         metadata[model.MD_POS] = (center[0] + trans[0],
                                   center[1] + trans[1])
 
@@ -2076,15 +2305,25 @@ class Reader(Accesser):
         self.count = None
         self._lock = threading.Lock()
 
-    def prepare(self, count, duration):
+    def prepare(self, count, duration, chunks=1, reducer=None):
         """
         count: number of values to read
         duration: expected total duration it will take (in s)
+        chunks (1<=int): number of parts in which the values are read. If more
+          than 1, each part is available via wait_chunk() as soon as it is read
+          (instead of all the data via wait()).
+        reducer (None or OversampleReducer): if provided, the values are passed
+          to it by blocks, as soon as they are read, and they are not kept
+          (wait() returns None).
         """
         with self._lock:
             self.count = count
             self.duration = duration
             self.cancelled = False
+            self.chunks = chunks
+            self._chunk_q = Queue.Queue()
+            self.reducer = reducer
+            self._nread = 0
             # TODO: don't create a new thread for every read => just create at
             # init, and use Queue/Event to synchronise
             if self.thread and self.thread.isAlive():
@@ -2102,7 +2341,24 @@ class Reader(Accesser):
     def _thread(self):
         """To be called in a separate thread"""
         try:
-            self.buf = numpy.fromfile(self.file, dtype=self.dtype, count=self.count)
+            if self.reducer is not None:
+                # The data is reduced while the rest is being acquired
+                while self._nread < self.count:
+                    bcount = min(READ_BLOCK_SIZE, self.count - self._nread)
+                    b = numpy.fromfile(self.file, dtype=self.dtype, count=bcount)
+                    self.reducer.add(b)
+                    self._nread += b.size
+                    if b.size != bcount:
+                        break  # Probably cancelled
+            elif self.chunks == 1:
+                self.buf = numpy.fromfile(self.file, dtype=self.dtype, count=self.count)
+            else:
+                chunksz = self.count // self.chunks
+                for i in range(self.chunks):
+                    b = numpy.fromfile(self.file, dtype=self.dtype, count=chunksz)
+                    self._chunk_q.put(b)
+                    if b.size != chunksz:
+                        break  # Probably cancelled
             logging.debug("read took %g s", time.time() - self._begin)
             # Kernel 4.4+ requires to cancel reading (it's also possible to try
             # to read further and get a EOF, but if the device has extra data,
@@ -2113,6 +2369,32 @@ class Reader(Accesser):
             logging.debug("Read ended before the end")
         except:
             logging.exception("Unhandled error in reading thread")
+        finally:
+            self._chunk_q.put(None)  # In case wait_chunk() waits for more
+
+    def wait_chunk(self, timeout):
+        """
+        Wait for the next part of the data to be read, when reading in multiple
+          chunks.
+        timeout (float): maximum number of seconds to wait for the chunk
+        returns (numpy.array): the count/chunks values read
+        raises:
+            CancelledError: if the read was cancelled
+            IOError: if the data could not be read in time
+        """
+        try:
+            b = self._chunk_q.get(timeout=timeout)
+        except Queue.Empty:
+            logging.warning("Reading thread didn't provide data after %g s", timeout)
+            self.cancel()
+            raise IOError("Timeout while reading the data")
+
+        if self.cancelled:
+            raise CancelledError("Reading thread was cancelled")
+        elif b is None or b.size != self.count // self.chunks:
+            raise IOError("Failed to read all the %d expected values" %
+                          (self.count // self.chunks,))
+        return b
 
     def wait(self, timeout=None):
         """
@@ -2139,6 +2421,11 @@ class Reader(Accesser):
             logging.warning("Reading thread is still running after %g s", timeout)
             self.cancel()
 
+        if self.reducer is not None:
+            if self._nread != self.count:
+                raise IOError("Read only %d values from the %d expected" % (self._nread, self.count))
+            return None
+
         # the result should be in self.buf
         if self.buf is None:
             raise IOError("Failed to read all the %d expected values" % self.count)
@@ -2393,12 +2680,15 @@ class Writer(Accesser):
         self._preload_size = None
         self._lock = threading.Lock()
 
-    def prepare(self, buf, duration):
+    def prepare(self, buf, duration, repeat=1):
         """
         buf (numpy.ndarray): 1 dimension array to write
         duration: expected total duration it will take (in s)
+        repeat (1<=int): number of times the whole buffer is written. The
+          device buffer is filled with the successive copies, as a ring, without
+          duplicating the data in memory.
         """
-        if buf.size <= 2:
+        if buf.size * repeat <= 2:
             # Bug reported 20140206: There seems to be is a bug in the NI comedi
             # driver that cause writes of only one scan to never finish.
             logging.warning("Buffer has length=%d, probably going to fail",
@@ -2407,20 +2697,22 @@ class Writer(Accesser):
         with self._lock:
             self.duration = duration
             self.buf = buf
+            self.repeat = repeat
             self.cancelled = False
             self.file.seek(0)
 
             # preload the buffer with enough data first
+            total = len(buf) * repeat
             dev_buf_size = comedi.get_buffer_size(self._device, self._subdevice)
-            self._preload_size = dev_buf_size // buf.itemsize
-            logging.debug("Going to preload %d bytes", buf[:self._preload_size].nbytes)
+            self._preload_size = min(dev_buf_size // buf.itemsize, total)
+            logging.debug("Going to preload %d bytes", self._preload_size * buf.itemsize)
             # It can block if we preload too much
             # TODO: write in non-blocking mode, and raise an error if not everything
             # was written (because it's a sign there were some other data still
             # in the buffer)
-            buf[:self._preload_size].tofile(self.file)
+            self._write_repeated(0, self._preload_size)
 
-            if len(buf) <= self._preload_size:
+            if total <= self._preload_size:
                 # If all the buffer fit within _preload_size, don't start
                 # thread, on small buffers it avoids a lot of overhead.
                 self.thread = None
@@ -2428,6 +2720,19 @@ class Writer(Accesser):
             else:
                 self.thread = threading.Thread(name="SEMComedi writer", target=self._thread)
 
+    def _write_repeated(self, start, end):
+        """
+        Write a part of the buffer repeated .repeat times
+        start (0<=int): index of the first value to write (in the repeated buffer)
+        end (0<=int): index of the value after the last value to write
+        """
+        n = len(self.buf)
+        while start < end and not self.cancelled:
+            i = start % n
+            l = min(n - i, end - start)
+            self.buf[i:i + l].tofile(self.file)
+            start += l
+
     def run(self):
         self._begin = time.time()
         self._expected_end = time.time() + self.duration
@@ -2443,7 +2748,7 @@ class Writer(Accesser):
         try:
             # Note: self.file.write(self.buf...) seems to do the job as well
             logging.debug("Writing rest of data")
-            self.buf[self._preload_size:].tofile(self.file)
+            self._write_repeated(self._preload_size, len(self.buf) * self.repeat)
             if self.cancelled:
                 return
             self.file.flush()
@@ -2556,7 +2861,7 @@ class FakeWriter(Accesser):
     def close(self):
         pass
 
-    def prepare(self, buf, duration):
+    def prepare(self, buf, duration, repeat=1):
         self.duration = duration
         self._must_stop.clear()
 
@@ -2793,8 +3098,18 @@ class Scanner(model.Emitter):
         # the beam settling time or when put to rest.
         self.newPosition = model.Event()
 
-        self._prev_settings = [None, None, None, None] # resolution, scale, translation, margin
-        self._scan_array = None # last scan array computed
+        # (None or numpy.array of shape Nx2 of floats): if not None, instead of
+        # scanning the area defined by resolution, scale and translation, the
+        # beam goes successively to each of these positions, all written to the
+        # DAQ board at once. The positions are X/Y in px, relative to the center
+        # of the scan area (like .translation). The data acquired then has a
+        # shape of 1xN.
+        self.scanPath = model.VigilantAttribute(None, unit="px", setter=self._setScanPath)
+
+        # settings -> (raw scan array, ranges, scan path), last used at the end
+        self._scan_cache = collections.OrderedDict()
+        self._scan_cache_hits = 0
+        self._scan_cache_misses = 0
 
     def terminate(self):
         if self._scanning_mng:
@@ -2919,6 +3234,36 @@ class Scanner(model.Emitter):
                 max(min(value[1], max_tran[1]), -max_tran[1]))
         return tran
 
+    def _setScanPath(self, value):
+        """
+        value (None or array of shape Nx2): positions of the beam (X/Y in px)
+        returns (None or read-only numpy.array of shape Nx2 of float64)
+        """
+        if value is None:
+            return None
+
+        path = numpy.array(value, dtype=numpy.float64)
+        if path.ndim != 2 or path.shape[1] != 2 or path.shape[0] < 1:
+            raise ValueError("Scan path should be of shape Nx2, but got %s" % (path.shape,))
+        hsize = (self._shape[0] / 2, self._shape[1] / 2)
+        if (numpy.abs(path) > hsize).any():
+            raise ValueError("Scan path has positions beyond the scan area of %s px" %
+                             (self._shape,))
+        # The cache of the scan arrays relies on it to never change
+        path.flags.writeable = False
+        return path
+
+    def get_scan_translation(self):
+        """
+        returns (float, float): the shift from the center (in px) of the center
+          of the scan area
+        """
+        if self.scanPath.value is None:
+            return self.translation.value
+        else:
+            # Each position is already absolute
+            return (0, 0)
+
     # we share metadata with our parent
     def getMetadata(self):
         return self.parent.getMetadata()
@@ -3103,7 +3448,9 @@ class Scanner(model.Emitter):
           osr: over-sampling rate, how many input samples should be acquired by pixel
           dpr: duplication rate, how many times each pixel should be re-acquired
         Note: it can update the dwell time, if nrchans changed since previous time
-        Note: it only recomputes the scanning array if the settings have changed
+        Note: it only recomputes the scanning array if the settings have not
+          been used recently
+        Note: if .scanPath is set, the scanning area is 1 x the number of positions
         Note: it's not thread-safe, you must ensure no simultaneous calls.
         """
         if nrchans != self._nrchans:
@@ -3111,40 +3458,119 @@ class Scanner(model.Emitter):
             self.dwellTime.value = self.dwellTime.value
             assert nrchans == self._nrchans
         dwell_time, osr, dpr = self.dwellTime.value, self._osr, self._dpr
-        resolution = self.resolution.value
-        scale = self.scale.value
-        translation = self.translation.value
+        path = self.scanPath.value
+        if path is None:
+            resolution = self.resolution.value
+            scale = self.scale.value
+            translation = self.translation.value
+
+            # settle_time is proportional to the size of the ROI (and =0 if only 1 px)
+            st = self._settle_time * scale[0] * (resolution[0] - 1) / (self._shape[0] - 1)
+        else:
+            resolution = (len(path), 1)
+            # The beam may have to move up to the whole span of the positions
+            st = self._settle_time * numpy.ptp(path[:, 0]) / (self._shape[0] - 1)
 
-        # settle_time is proportional to the size of the ROI (and =0 if only 1 px)
-        st = self._settle_time * scale[0] * (resolution[0] - 1) / (self._shape[0] - 1)
         # Round-up if settle time represents more than 1% of the dwell time.
         # Below 1% the improvment would be marginal, and that allows to have
         # tiny areas (eg, 4x4) scanned without the first pixel of each line
         # being exposed twice more than the others.
         margin = int(math.ceil(st / dwell_time - 0.01))
 
-        new_settings = [resolution, scale, translation, margin]
-        if self._prev_settings != new_settings:
-            # TODO: if only margin changes, just duplicate the margin columns
-            # need to recompute the scanning array
-            self._update_raw_scan_array(resolution[::-1], scale[::-1],
-                                        translation[::-1], margin)
+        if path is None:
+            settings = (tuple(resolution), tuple(scale), tuple(translation), margin)
+        else:
+            # The path is read-only, and kept in the cache, so its id is unique
+            settings = (id(path), margin)
+
+        try:
+            scan, ranges, _ = self._scan_cache.pop(settings)
+            self._scan_cache_hits += 1
+        except KeyError:
+            # need to compute the scanning array
+            self._scan_cache_misses += 1
+            if path is None:
+                # TODO: if only margin changes, just duplicate the margin columns
+                scan, ranges = self._compute_raw_scan_array(resolution[::-1], scale[::-1],
+                                                            translation[::-1], margin)
+            else:
+                scan, ranges = self._compute_raw_scan_path(path, margin)
+            # The same array will be passed to the next acquisitions
+            scan.flags.writeable = False
+
+        # (Re)insert as the most recently used
+        self._scan_cache[settings] = (scan, ranges, path)
+        self._prune_scan_cache()
+
+        return (scan, dwell_time, resolution[::-1],
+                margin, self._channels, ranges, osr, dpr)
+
+    def _prune_scan_cache(self):
+        """
+        Remove the least recently used scan arrays, so that the cache stays
+          within SCAN_CACHE_MAX_ENTRIES and SCAN_CACHE_MAX_BYTES. The most
+          recently used array is always kept.
+        """
+        nbytes = sum(s.nbytes for s, _, _ in self._scan_cache.values())
+        while (len(self._scan_cache) > 1 and
+               (len(self._scan_cache) > SCAN_CACHE_MAX_ENTRIES or
+                nbytes > SCAN_CACHE_MAX_BYTES)):
+            _, (s, _, _) = self._scan_cache.popitem(last=False)
+            nbytes -= s.nbytes
+
+    def get_scan_cache_hit_rate(self):
+        """
+        returns (0<=float<=1): ratio of calls to get_scan_data() which didn't need
+          to compute the scan array, since the beginning (or 0 if never called).
+        """
+        total = self._scan_cache_hits + self._scan_cache_misses
+        if not total:
+            return 0
+        return self._scan_cache_hits / total
 
-            self._prev_settings = new_settings
+    def _compute_raw_scan_path(self, path, margin):
+        """
+        Compute the raw array of values to send to move the beam to a list of
+          positions.
+        path (numpy.array of shape Nx2): X/Y positions in px, relative to the
+          center of the scan area
+        margin (0<=int): number of additional times the first position is
+          written, to let the beam settle
+        returns (3D ndarray of shape 1 x (N + margin) x 2, list of int): the raw
+          Y/X values, and the range index of each output channel
+        """
+        area_shape = self._shape[::-1]
+        scan_phys = numpy.empty((1, len(path) + margin, 2), dtype=numpy.double)
+        for i, lim in enumerate(self._limits):  # Y/X
+            center = (lim[0] + lim[1]) / 2
+            pxv = (lim[1] - lim[0]) / area_shape[i]  # V/px
+            scan_phys[0, margin:, i] = center + path[:, 1 - i] * pxv
+            scan_phys[0, :margin, i] = scan_phys[0, margin, i]
 
-        return (self._scan_array, dwell_time, resolution[::-1],
-                margin, self._channels, self._ranges, osr, dpr)
+        # Compute the best ranges for each channel
+        ranges = []
+        for i, channel in enumerate(self._channels):
+            data_lim = (scan_phys[..., i].min(), scan_phys[..., i].max())
+            best_range = comedi.find_range(self.parent._device,
+                                           self.parent._ao_subdevice,
+                              channel, comedi.UNIT_volt, data_lim[0], data_lim[1])
+            ranges.append(best_range)
 
-    def _update_raw_scan_array(self, shape, scale, translation, margin):
+        scan = self.parent._array_from_phys(self.parent._ao_subdevice,
+                                            self._channels, ranges, scan_phys)
+        return scan, ranges
+
+    def _compute_raw_scan_array(self, shape, scale, translation, margin):
         """
-        Update the raw array of values to send to scan the 2D area.
+        Compute the raw array of values to send to scan the 2D area.
         shape (list of 2 int): H/W=Y/X of the scanning area (slow, fast axis)
         scale (tuple of 2 float): scaling of the pixels
         translation (tuple of 2 float): shift from the center
         margin (0<=int): number of additional pixels to add at the beginning of
             each scanned line
         Warning: the dimensions follow the numpy convention, so opposite of user API
-        returns nothing, but update ._scan_array and ._ranges.
+        returns (3D ndarray of shape[0] x (shape[1] + margin) x 2, list of int):
+          the raw Y/X values, and the range index of each output channel
         """
         area_shape = self._shape[::-1]
         # adapt limits according to the scale and translation so that if scale
@@ -3185,7 +3611,6 @@ class Scanner(model.Emitter):
                                                self.parent._ao_subdevice,
                                   channel, comedi.UNIT_volt, data_lim[0], data_lim[1])
                 ranges.append(best_range)
-            self._ranges = ranges
 
             # computes the limits in raw values
             # Note: _array_from_phys expects the channel as last dim
@@ -3194,7 +3619,6 @@ class Scanner(model.Emitter):
                                                   self._channels, ranges,
                                                   rlimits)
             scan_raw = self._generate_scan_array(shape, limits.T, margin)
-            self._scan_array = scan_raw
         else:
             limits = numpy.array(roi_limits, dtype=numpy.double)
             scan_phys = self._generate_scan_array(shape, limits, margin)
@@ -3207,10 +3631,11 @@ class Scanner(model.Emitter):
                                                self.parent._ao_subdevice,
                                   channel, comedi.UNIT_volt, data_lim[0], data_lim[1])
                 ranges.append(best_range)
-            self._ranges = ranges
 
-            self._scan_array = self.parent._array_from_phys(self.parent._ao_subdevice,
-                                            self._channels, ranges, scan_phys)
+            scan_raw = self.parent._array_from_phys(self.parent._ao_subdevice,
+                                                    self._channels, ranges, scan_phys)
+
+        return scan_raw, ranges
 
     @staticmethod
     def _generate_scan_array(shape, limits, margin):
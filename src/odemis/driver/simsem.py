@@ -23,6 +23,7 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 from __future__ import division
 
 import Queue
+import collections
 import logging
 import math
 import numpy
@@ -37,6 +38,18 @@ import time
 import weakref
 
 
+# Smallest size (in px) of the coarsest version of the fake image
+PYRAMID_MIN_SIZE = 64
+# Number of blurred versions of the fake image kept in memory
+BLUR_CACHE_SIZE = 4
+# Precision of the blur (in px of the image which is blurred). The blur is
+# rounded to this value, so that the blurred images can be reused.
+BLUR_PRECISION = 0.1
+# Minimum blur (in px) when using a coarser version of the fake image. Images
+# with a larger blur are blurred and sampled from a coarser version.
+BLUR_MIN_SIGMA = 8
+
+
 class SimSEM(model.HwComponent):
     '''
     This is an extension of the model.HwComponent class. It first reads and
@@ -65,6 +78,12 @@ class SimSEM(model.HwComponent):
             image = os.path.join(os.path.dirname(__file__), image)
         converter = dataio.find_fittest_converter(image, mode=os.O_RDONLY)
         self.fake_img = img.ensure2DImage(converter.read_data(image)[0])
+        # Pre-render coarser versions of the image, used for the scans with
+        # large pixels (or very blurred)
+        self._img_pyramid = self._createPyramid(self.fake_img)
+        # (int, float, float) -> ndarray: level, sigma Y/X -> blurred image
+        self._blur_cache = collections.OrderedDict()
+        self._blur_cache_lock = threading.Lock()
 
         self._drift_period = drift_period
 
@@ -108,6 +127,72 @@ class SimSEM(model.HwComponent):
         for d in self._detectors:
             d.terminate()
 
+    @staticmethod
+    def _createPyramid(im):
+        """
+        Computes the versions of an image at coarser resolutions
+        im (2D ndarray): the image
+        return (list of 2D ndarrays): for each level, the image with half of the
+          size of the previous level (each pixel being the mean of 2x2 pixels).
+          The first level is the original image.
+        """
+        pyramid = [im]
+        while min(pyramid[-1].shape) >= 2 * PYRAMID_MIN_SIZE:
+            prev = pyramid[-1]
+            h, w = prev.shape[0] // 2, prev.shape[1] // 2
+            binned = prev[:h * 2, :w * 2].reshape(h, 2, w, 2).mean(axis=(1, 3))
+            pyramid.append(numpy.round(binned).astype(im.dtype))
+        return pyramid
+
+    def _getBlurredImage(self, level, sigma, box):
+        """
+        Returns a region of a version of the fake image blurred. Only the
+          region is blurred (plus the margin needed for the blur), so that
+          changing the focus doesn't require to blur the whole image. The
+          blurred regions are cached, so asking for the same blur on the same
+          region is fast.
+        level (0<=int): level of the pyramid of the fake image
+        sigma (float, float): standard deviation of the blur on Y and X in px
+          (of the level)
+        box (int, int, int, int): top, left, bottom, right (excluded) of the
+          region needed, in px of the level
+        return:
+          im (2D ndarray): the blurred image, containing at least the region.
+            It must not be modified.
+          origin (int, int): position of the top-left pixel of im in the level
+        """
+        sigma = tuple(round(s / BLUR_PRECISION) * BLUR_PRECISION for s in sigma)
+        src = self._img_pyramid[level]
+        if sigma == (0, 0):
+            return src, (0, 0)
+
+        # Extend the region by the size of the Gaussian kernel (4 sigma, as
+        # gaussian_filter() does by default), so that the blur of the region is
+        # the same as if the whole image was blurred.
+        my, mx = (int(4 * s + 0.5) for s in sigma)
+        t, l, b, r = box
+        t, l = max(0, t - my), max(0, l - mx)
+        b, r = min(src.shape[0], b + my), min(src.shape[1], r + mx)
+
+        key = (level, sigma, (t, l, b, r))
+        with self._blur_cache_lock:
+            try:
+                # Move it at the end, as the most recently used
+                im = self._blur_cache.pop(key)
+                self._blur_cache[key] = im
+                return im, (t, l)
+            except KeyError:
+                pass
+
+        logging.debug("Blurring image at level %d, region %s, with sigma %s",
+                      level, (t, l, b, r), sigma)
+        im = ndimage.gaussian_filter(src[t:b, l:r], sigma=sigma)
+        with self._blur_cache_lock:
+            self._blur_cache[key] = im
+            while len(self._blur_cache) > BLUR_CACHE_SIZE:
+                self._blur_cache.popitem(last=False)
+        return im, (t, l)
+
 
 class Scanner(model.Emitter):
     """
@@ -457,10 +542,14 @@ class Detector(model.Detector):
             lt = (center[0] + pxs_pos[0] - (res[0] / 2) * scale[0],
                   center[1] + pxs_pos[1] - (res[1] / 2) * scale[1])
             assert(lt[0] >= 0 and lt[1] >= 0)
-            # compute each row and column that will be included
-            coord = ([int(round(lt[0] + i * scale[0])) for i in range(res[0])],
-                     [int(round(lt[1] + i * scale[1])) for i in range(res[1])])
-            sim_img = self.fake_img[numpy.ix_(coord[1], coord[0])] # copy
+
+            if self.parent._focus:
+                # the defocus, as the blur in px of the scan
+                pos = self.parent._focus.position.value['z']
+                dist = abs(pos - self.parent._focus._good_focus) * 1e4
+            else:
+                dist = 0
+            sim_img = self._sampleImage(lt, res, scale, dist)
 
             # reduce image depth if requested
             bpp = self.bpp.value
@@ -475,12 +564,6 @@ class Detector(model.Detector):
 
             metadata[model.MD_BPP] = bpp
 
-            if self.parent._focus:
-                # apply the defocus
-                pos = self.parent._focus.position.value['z']
-                dist = abs(pos - self.parent._focus._good_focus) * 1e4
-                sim_img = ndimage.gaussian_filter(sim_img, sigma=dist)
-
             # update fake output metadata
             metadata[model.MD_POS] = updated_phy_pos
             metadata[model.MD_PIXEL_SIZE] = (pxs[0] * scale[0], pxs[1] * scale[1])
@@ -491,6 +574,80 @@ class Detector(model.Detector):
             metadata[model.MD_EBEAM_VOLTAGE] = scanner.accelVoltage.value
             return model.DataArray(sim_img, metadata)
 
+    def _sampleImage(self, lt, res, scale, blur):
+        """
+        Picks the pixels of the fake image corresponding to a scan
+        lt (float, float): position of the first pixel in the fake image (in px)
+        res (int, int): number of pixels of the scan
+        scale (float, float): distance between two pixels of the scan (in px
+          of the fake image)
+        blur (0<=float): standard deviation of the blur, in px of the scan
+        return (2D ndarray of shape res[1], res[0]): the image (a copy)
+        """
+        # Use the coarsest version of the fake image which is still precise
+        # enough: its pixels must be smaller than the pixels of the scan, or
+        # than the blur.
+        pyramid = self.parent._img_pyramid
+        size = min(scale)
+        if blur > 0:
+            size = max(size, blur * min(scale) / BLUR_MIN_SIGMA)
+        level = int(math.log(size, 2)) if size >= 1 else 0
+        level = min(level, len(pyramid) - 1)
+        f = 2 ** level
+        sigma = (blur * scale[1] / f, blur * scale[0] / f)
+        shape = pyramid[level].shape
+
+        # Position of the scan pixels, in px of the fake image
+        xs = lt[0] + numpy.arange(res[0]) * scale[0]
+        ys = lt[1] + numpy.arange(res[1]) * scale[1]
+        if f <= min(scale):
+            # Nearest pixel, of the level
+            xi = numpy.floor(xs + 0.5).astype(numpy.intp) // f
+            yi = numpy.floor(ys + 0.5).astype(numpy.intp) // f
+            numpy.clip(xi, 0, shape[1] - 1, out=xi)
+            numpy.clip(yi, 0, shape[0] - 1, out=yi)
+            box = (int(yi.min()), int(xi.min()), int(yi.max()) + 1, int(xi.max()) + 1)
+            src, (oy, ox) = self.parent._getBlurredImage(level, sigma, box)
+            return self._takeGrid(src, yi - oy, xi - ox)
+        else:
+            # The pixels of the level are bigger than the ones of the scan
+            # (because it's blurred anyway) => interpolate
+            xl = (xs - (f - 1) / 2) / f
+            yl = (ys - (f - 1) / 2) / f
+            # The linear interpolation needs the pixel after each position
+            t, l = (min(max(0, int(math.floor(c.min()))), n - 1)
+                    for c, n in ((yl, shape[0]), (xl, shape[1])))
+            b, r = (min(max(int(math.floor(c.max())) + 2, o + 1), n)
+                    for c, o, n in ((yl, t, shape[0]), (xl, l, shape[1])))
+            box = (t, l, b, r)
+            src, (oy, ox) = self.parent._getBlurredImage(level, sigma, box)
+            coords = numpy.meshgrid(yl - oy, xl - ox, indexing="ij")
+            return ndimage.map_coordinates(src, coords, order=1, mode="nearest")
+
+    @staticmethod
+    def _takeGrid(im, yi, xi):
+        """
+        Picks the pixels at the intersection of some rows and columns. When the
+          rows (or columns) are regularly spaced, it's done with a slice, which
+          is faster than indexing by an array.
+        im (2D ndarray): the image
+        yi (1D ndarray of int): the rows
+        xi (1D ndarray of int): the columns
+        return (2D ndarray of shape len(yi), len(xi)): the pixels (a copy)
+        """
+        slices = []
+        for idx in (yi, xi):
+            step = idx[1] - idx[0] if len(idx) > 1 else 1
+            if step > 0 and numpy.all(numpy.diff(idx) == step):
+                slices.append(slice(idx[0], idx[-1] + 1, step))
+            else:
+                slices.append(idx)
+
+        sy, sx = slices
+        if isinstance(sy, slice) and isinstance(sx, slice):
+            return im[sy, sx].copy()
+        return im[sy][:, sx] # copy
+
     def _acquire_thread(self, callback):
         """
         Thread that simulates the SEM acquisition. It calculates and updates the
@@ -24,8 +24,11 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 from __future__ import division
 
 import logging
+from odemis import model
 from odemis.driver import andorcam2
 import os
+import threading
+import time
 import unittest
 from unittest.case import skip
 
@@ -94,6 +97,66 @@ class TestSynchronized(VirtualTestSynchronized, unittest.TestCase):
     camera_kwargs = KWARGS
 
 
+class TestFakeTriggered(unittest.TestCase):
+    """
+    Test the synchronized acquisition with software trigger, on the simulator
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.ccd = CLASS_SIM(**KWARGS_SIM)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.ccd.terminate()
+
+    def setUp(self):
+        self.images = []
+        self.got_all = threading.Event()
+
+    def tearDown(self):
+        self.ccd.data.unsubscribe(self.receive_image)
+        self.ccd.data.synchronizedOn(None)
+
+    def receive_image(self, df, image):
+        self.images.append(image)
+        if len(self.images) >= self.nimages:
+            self.got_all.set()
+
+    def test_no_loss(self):
+        """
+        Check that all the events lead to an image, even if they arrive faster
+        than the camera acquires, and that the acquisition is set-up only once.
+        """
+        self.assertTrue(self.ccd._can_sw_trigger)
+
+        # Count how many times the acquisition is set-up
+        atcore = self.ccd.atcore
+        orig_start = atcore.StartAcquisition
+        nstarts = [0]
+        def count_start():
+            nstarts[0] += 1
+            orig_start()
+        atcore.StartAcquisition = count_start
+
+        try:
+            self.ccd.exposureTime.value = self.ccd.exposureTime.clip(0.01)  # s
+            self.nimages = 20
+            self.ccd.data.synchronizedOn(self.ccd.softwareTrigger)
+            self.ccd.data.subscribe(self.receive_image)
+            for i in range(self.nimages):
+                self.ccd.softwareTrigger.notify()
+                time.sleep(0.001)  # faster than the camera
+            self.assertTrue(self.got_all.wait(self.nimages * 0.5 + 5))
+            self.ccd.data.unsubscribe(self.receive_image)
+        finally:
+            del atcore.StartAcquisition
+
+        self.assertEqual(len(self.images), self.nimages)
+        self.assertEqual(nstarts[0], 1)
+        acq_dates = [im.metadata[model.MD_ACQ_DATE] for im in self.images]
+        self.assertEqual(acq_dates, sorted(acq_dates))
+
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -139,6 +139,54 @@ class TestController(unittest.TestCase):
         self.assertEqual(0, ctrl.GetErrorNum())
         ctrl.terminate()
 
+    def test_move_state(self):
+        """
+        Check the move state and position can be read together, with fewer
+        queries than separately
+        """
+        ctrl = pigcs.Controller(self.accesser, *self.config_ctrl)
+        speed = max(ctrl.speed_rng[1][0], ctrl.speed_rng[1][1] / 10)
+        ctrl.setSpeed(1, speed)
+
+        # Count the number of queries sent on the bus
+        nqueries = [0]
+        orig_query = self.accesser.sendQueryCommand
+        def count_query(*args, **kwargs):
+            nqueries[0] += 1
+            return orig_query(*args, **kwargs)
+        self.accesser.sendQueryCommand = count_query
+
+        ncheck_sep = 0
+        ctrl.moveRel(1, speed / 4) # should take 0.25s
+        nqueries[0] = 0
+        while ctrl.isMoving({1}):
+            ctrl.getPosition(1)
+            ncheck_sep += 1
+            time.sleep(0.01)
+        ctrl.getPosition(1)
+        ncheck_sep += 1
+        nq_sep = nqueries[0] / ncheck_sep
+
+        ncheck = 0
+        ctrl.moveRel(1, speed / 4)
+        nqueries[0] = 0
+        while True:
+            moving, pos = ctrl.getMoveState({1}, {1})
+            ncheck += 1
+            self.assertEqual(set(pos.keys()), {1})
+            if not moving:
+                break
+            time.sleep(0.01)
+        nq = nqueries[0] / ncheck
+        logging.debug("Took %g queries per check, instead of %g", nq, nq_sep)
+        self.assertLessEqual(nq, nq_sep)
+        self.assertFalse(ctrl.isMoving({1}))
+        self.assertAlmostEqual(pos[1], ctrl.getPosition(1), delta=speed * 0.01)
+
+        moving, pos = ctrl.getMoveState(set(), set())
+        self.assertEqual((moving, pos), (set(), {}))
+        ctrl.terminate()
+
 #@skip("faster")
 class TestFake(TestController):
     """
@@ -160,6 +208,36 @@ class TestFakeCL(TestController):
         self.config_ctrl = CONFIG_CTRL_CL
 
 
+class TestAnswerParser(unittest.TestCase):
+    """
+    Test the decoding of the answers, independently of how the data is received
+    """
+    def _parse(self, data, ncom, chunk):
+        parser = pigcs.AnswerParser("0 1 ", ncom, "test")
+        for i in range(0, len(data), chunk):
+            done = parser.feed(data[i:i + chunk])
+        self.assertTrue(done)
+        return parser.getAnswers()
+
+    def test_answers(self):
+        for chunk in (1, 3, 4096):
+            self.assertEqual(self._parse("0 1 1=0.012\n", 1, chunk), ["1=0.012"])
+            self.assertEqual(self._parse("0 1 1=3 \n2=4\n0 1 0\n", 2, chunk),
+                             [["1=3", "2=4"], "0"])
+            # Previous answer which was not read
+            self.assertEqual(self._parse("0 1 5\n0 1 6\n", 1, chunk), ["6"])
+
+        # Empty first line, followed by the actual answer
+        self.assertEqual(self._parse("0 1 \nBla bla \nBla\n", 1, 4096),
+                         [["Bla bla", "Bla"]])
+
+    def test_wrong_prefix(self):
+        parser = pigcs.AnswerParser("0 1 ", 1, "test")
+        self.assertFalse(parser.feed("0 1 1=3 \n0 1 2="))
+        with self.assertRaises(IOError):
+            parser.feed("4\n0 2 0\n")
+
+
 #@skip("faster")
 class TestActuator(unittest.TestCase):
 
@@ -32,6 +32,7 @@ import threading
 import time
 import unittest
 import gc
+import itertools
 
 
 # If you don't have a real DAQ comedi device, you can create one that can still
@@ -156,6 +157,49 @@ class TestSEMStatic(unittest.TestCase):
             comp = diffx >= 0 # must be decreasing
         self.assertTrue(comp.all())
 
+    @unittest.skipIf(semcomedi.oversample_fast is None, "Optimised functions not available")
+    def test_oversample_fast(self):
+        """
+        Check the progressive reduction gives exactly the same result as the
+        numpy conversion
+        """
+        shape = (5, 11)
+        for dtype in (numpy.uint16, numpy.uint32):
+            adtype_max = numpy.iinfo(dtype).max
+            for osr, dpr, margin, nchans in itertools.product((1, 2, 7, 64), (1, 3),
+                                                             (0, 1, 4), (1, 2)):
+                # The duplication is just the same as more oversampling
+                nosr = osr * dpr
+                adtype = semcomedi.get_best_dtype_for_acc(dtype, nosr)
+                # One more pixel, as read during the rest positioning
+                nscans = (shape[0] * (shape[1] + margin) + 1) * nosr
+                raw = numpy.random.randint(0, adtype_max + 1, size=(nscans, nchans),
+                                           dtype=numpy.uint64).astype(dtype)
+
+                exp = numpy.empty((nchans,) + shape, dtype=dtype)
+                for i in range(nchans):
+                    if dpr == 1:
+                        semcomedi.SEMComedi._scan_raw_to_lines(shape, margin, osr, 0,
+                                            raw[:-nosr, i], exp[i], adtype)
+                    else:
+                        pxs = raw[:-nosr, i].reshape(shape[0], shape[1] + margin, nosr)
+                        for x, y in numpy.ndindex(pxs.shape[:2]):
+                            semcomedi.SEMComedi._scan_raw_to_pixel(shape, margin, osr, dpr,
+                                            x, y, pxs[x, y], exp[i], adtype)
+
+                # Pass the data in blocks of any size (not aligned on pixels)
+                for bsize in (1, 13, 1000, raw.size):
+                    out = numpy.zeros((nchans,) + shape, dtype=dtype)
+                    reducer = semcomedi.oversample_fast.OversampleReducer(out, margin, nosr)
+                    flat = raw.ravel()
+                    for s in range(0, flat.size, bsize):
+                        reducer.add(flat[s:s + bsize])
+                    numpy.testing.assert_array_equal(out, exp)
+
+        # Not supported
+        with self.assertRaises(ValueError):
+            semcomedi.oversample_fast.OversampleReducer(numpy.empty((1, 2, 3), dtype=numpy.float32), 0, 2)
+
 #@unittest.skip("simple")
 class TestSEM(unittest.TestCase):
     """
@@ -317,6 +361,64 @@ class TestSEM(unittest.TestCase):
             else:
                 self.assertGreater(dpr, 1)
 
+    def test_scan_cache(self):
+        """
+        Check the scan arrays are reused when alternating between settings
+        """
+        self.scanner.dwellTime.value = 10e-6
+        self.scanner.resolution.value = (1, 1)
+        positions = [(x, y) for x in (-10, 0, 10) for y in (-10, 10)]
+        hits0 = self.scanner._scan_cache_hits
+        misses0 = self.scanner._scan_cache_misses
+
+        for i in range(4):
+            for p in positions:
+                self.scanner.translation.value = p
+                im = self.sed.data.get()
+                self.assertEqual(im.shape, (1, 1))
+
+        # Only the first pass needed to compute the arrays
+        self.assertEqual(self.scanner._scan_cache_misses - misses0, len(positions))
+        self.assertEqual(self.scanner._scan_cache_hits - hits0, 3 * len(positions))
+        self.assertGreater(self.scanner.get_scan_cache_hit_rate(), 0)
+        self.scanner.translation.value = (0, 0)
+
+    def test_scan_path(self):
+        """
+        Check the beam can be moved to a list of positions, in a single scan
+        """
+        self.scanner.dwellTime.value = 100e-6
+        path = numpy.array([(x, y) for x in range(-50, 50, 10) for y in range(-50, 50, 10)])
+        # Per-pixel overhead, when moving the beam one position at a time
+        self.scanner.resolution.value = (1, 1)
+        start = time.time()
+        for p in path[:10]:
+            self.scanner.translation.value = tuple(p)
+            self.sed.data.get()
+        dur_px = (time.time() - start) / 10
+        self.scanner.translation.value = (0, 0)
+
+        self.scanner.scanPath.value = path
+        try:
+            start = time.time()
+            im = self.sed.data.get()
+            dur_path = time.time() - start
+            self.assertEqual(im.shape, (1, len(path)))
+            self.assertGreaterEqual(dur_path, len(path) * self.scanner.dwellTime.value)
+            logging.info("Overhead per pixel: %g s with translation, %g s with scan path",
+                         dur_px - self.scanner.dwellTime.value,
+                         dur_path / len(path) - self.scanner.dwellTime.value)
+            self.assertLess(dur_path, dur_px * len(path))
+
+            # Positions outside of the scan area
+            with self.assertRaises(ValueError):
+                self.scanner.scanPath.value = [(0, 0), (1e6, 0)]
+        finally:
+            self.scanner.scanPath.value = None
+
+        im = self.sed.data.get()
+        self.assertEqual(im.shape, self.scanner.resolution.value[::-1])
+
 #     @unittest.skip("too long")
     def test_acquire_high_osr(self):
         """
@@ -413,6 +515,29 @@ class TestSEM(unittest.TestCase):
 
         self.assertEqual(self.left, 0)
 
+#     @unittest.skip("simple")
+    def test_continuous_flow(self):
+        """
+        Acquire many small frames in a row, which should be scanned without gap
+        """
+        self.scanner.resolution.value = (64, 32)
+        self.size = self.scanner.resolution.value
+        expected_duration = self.compute_expected_duration()
+
+        number = 20
+        self.left = number
+        start = time.time()
+        self.sed.data.subscribe(self.receive_image)
+        self.acq_done.wait(number * (2 + expected_duration * 1.1))
+        dur = time.time() - start
+        self.assertEqual(self.left, 0)
+
+        # Each frame has its own date, and the frames follow each other closely
+        # (the first frame is scanned separately, and the command setup is
+        # only paid once every few frames)
+        self.assertEqual(len(self.acq_dates[0]), number)
+        self.assertLess(dur, 0.5 + number * expected_duration * 1.2 + number * 0.02)
+
 #     @unittest.skip("simple")
     def test_acquire_with_va(self):
         """
@@ -437,5 +437,62 @@ class TestSEM(unittest.TestCase):
         f.result()
         self.assertEqual(self.focus.position.value, pos)
 
+    def test_defocus_cache(self):
+        """
+        Check the blurred images are reused as long as the focus doesn't change
+        """
+        pos = self.focus.position.value
+        self.focus.moveRel({"z": 1e-3}).result()  # ~10 px blur
+        im = self.sed.data.get()
+        self.assertEqual(im.shape, self.size[::-1])
+        ncached = len(self.sem._blur_cache)
+        self.assertGreater(ncached, 0)
+
+        im = self.sed.data.get()
+        self.assertEqual(im.shape, self.size[::-1])
+        self.assertEqual(len(self.sem._blur_cache), ncached)
+
+        # Very blurry => computed on a coarser version of the image
+        self.focus.moveRel({"z": 10e-3}).result()
+        im = self.sed.data.get()
+        self.assertEqual(im.shape, self.size[::-1])
+
+        self.focus.moveAbs(pos).result()
+
+    def test_defocus_region(self):
+        """
+        Check only the region scanned is blurred
+        """
+        pos = self.focus.position.value
+        self.scanner.resolution.value = (64, 64)
+        for i in range(3):  # Like an autofocus: a new blur every frame
+            self.focus.moveRel({"z": 0.2e-3}).result()
+            im = self.sed.data.get()
+            self.assertEqual(im.shape, (64, 64))
+
+        # The region blurred is much smaller than the whole image
+        for bim in self.sem._blur_cache.values():
+            self.assertLess(bim.size, self.sem.fake_img.size / 4)
+
+        self.focus.moveAbs(pos).result()
+
+    def test_pyramid(self):
+        """
+        Check the scans with large pixels use the coarser versions of the image
+        """
+        pyramid = self.sem._img_pyramid
+        self.assertGreater(len(pyramid), 1)
+        for prev, level in zip(pyramid[:-1], pyramid[1:]):
+            self.assertEqual(level.shape, (prev.shape[0] // 2, prev.shape[1] // 2))
+            self.assertEqual(level.dtype, prev.dtype)
+
+        self.scanner.scale.value = (16, 16)
+        res = self.scanner.resolution.value
+        im = self.sed.data.get()
+        self.assertEqual(im.shape, res[::-1])
+        # The mean intensity should be about the same as the whole image
+        self.assertAlmostEqual(im.mean(), self.sem.fake_img.mean(),
+                               delta=self.sem.fake_img.std())
+
 if __name__ == "__main__":
     unittest.main()
@@ -115,6 +115,24 @@ class TestStatic(unittest.TestCase):
         self.assertTrue(dev.selfTest(), "self test failed.")
         dev.terminate()
 
+    def test_axis_params(self):
+        """
+        Check that reading several parameters at once gives the same values
+        as reading them one at a time
+        """
+        dev = CLASS(**KWARGS_SIM)
+
+        params = [(1, 4), (1, 5), (2, 8), (2, 154)]
+        vals = dev.GetAxisParams(params)
+        self.assertEqual(vals, [dev.GetAxisParam(a, p) for a, p in params])
+
+        # A wrong instruction fails, but the replies to the other ones are
+        # still all read
+        with self.assertRaises(tmcm.TMCLError):
+            dev.GetAxisParams([(1, 4), (50, 4), (2, 154)])
+        self.assertEqual(dev.GetAxisParam(1, 5), vals[1])
+        dev.terminate()
+
 
 # @skip("faster")
 class TestActuator(unittest.TestCase):
@@ -163,6 +181,32 @@ class TestActuator(unittest.TestCase):
         self.assertRaises(futures.TimeoutError, f.result, timeout=0.001)
         f.cancel()
 
+    def test_move_instructions(self):
+        """
+        Check that the instructions to follow a move are sent grouped
+        """
+        ser = self.dev._serial
+        orig_write = ser.write
+        nwrites = [0]
+        ninstrs = [0]
+        def count_write(data):
+            nwrites[0] += 1
+            ninstrs[0] += len(data) // 9
+            return orig_write(data)
+
+        ser.write = count_write
+        try:
+            move = {'x': self.dev.speed.value["x"] * 0.5}  # should take ~0.5s
+            exp_pos = self.orig_pos["x"] + move["x"]
+            f = self.dev.moveRel(move)
+            f.result()
+        finally:
+            del ser.write
+
+        logging.debug("Sent %d instructions in %d transactions", ninstrs[0], nwrites[0])
+        self.assertLess(nwrites[0], ninstrs[0])
+        self.assertAlmostEqual(exp_pos, self.dev.position.value["x"], delta=move["x"] * 0.01)
+
     def test_linear_pos(self):
         """
         Check that the position reported during a move is always increasing
@@ -627,43 +627,97 @@ class TMCLController(model.Actuator):
             IOError: if problem with sending/receiving data over the serial port
             TMCLError: if status if bad
         """
-        msg = numpy.empty(9, dtype=numpy.uint8)
-        struct.pack_into('>BBBBiB', msg, 0, self._target, n, typ, mot, val, 0)
-        # compute the checksum (just the sum of all the bytes)
-        msg[-1] = numpy.sum(msg[:-1], dtype=numpy.uint8)
+        msg = self._buildInstruction(n, typ, mot, val)
         with self._ser_access:
             logging.debug("Sending %s", self._instr_to_str(msg))
             self._serial.write(msg)
             self._serial.flush()
-            while True:
-                res = self._serial.read(9)
-                if len(res) < 9: # TODO: TimeoutError?
-                    logging.warning("Received only %d bytes after %s, will fail the instruction",
-                                    len(res), self._instr_to_str(msg))
-                    raise IOError("Received only %d bytes after %s" %
-                                  (len(res), self._instr_to_str(msg)))
-                logging.debug("Received %s", self._reply_to_str(res))
-                ra, rt, status, rn, rval, chk = struct.unpack('>BBBBiB', res)
+            return self._readReply(msg, n)
 
-                # Check it's a valid message
-                npres = numpy.frombuffer(res, dtype=numpy.uint8)
-                good_chk = numpy.sum(npres[:-1], dtype=numpy.uint8)
-                if chk == good_chk:
-                    if self._target != 0 and self._target != rt:  # 0 means 'any device'
-                        logging.warning("Received a message from %d while expected %d",
-                                        rt, self._target)
-                    if rn != n:
-                        logging.info("Skipping a message about instruction %d (waiting for %d)",
-                                     rn, n)
-                        continue
-                    if status not in TMCL_OK_STATUS:
-                        raise TMCLError(status, rval, self._instr_to_str(msg))
-                else:
-                    # TODO: investigate more why once in a while (~1/1000 msg)
-                    # the message is garbled
-                    logging.warning("Message checksum incorrect (%d), will assume it's all fine", chk)
+    def SendInstructions(self, instrs):
+        """
+        Sends several instructions at once, and return all the replies.
+        As the controller processes the instructions in order, they are all
+        sent before reading the first reply. It avoids waiting for the round-trip
+        on the serial port for each instruction.
+        instrs (list of tuples of 4 ints): the arguments for SendInstruction
+        return (list of 0<=int<2**32): value of the reply of each instruction
+        raises:
+            IOError: if problem with sending/receiving data over the serial port
+            TMCLError: if status if bad (for the first instruction which failed)
+        """
+        msgs = [self._buildInstruction(*i) for i in instrs]
+        vals = []
+        error = None
+        with self._ser_access:
+            for msg in msgs:
+                logging.debug("Sending %s", self._instr_to_str(msg))
+            self._serial.write(numpy.concatenate(msgs))
+            self._serial.flush()
+            # Read all the replies, even if one instruction failed, so that no
+            # reply is left for the next instruction
+            for msg, (n, _, _, _) in zip(msgs, instrs):
+                try:
+                    vals.append(self._readReply(msg, n))
+                except TMCLError as ex:
+                    vals.append(None)
+                    if error is None:
+                        error = ex
+
+        if error is not None:
+            raise error
+        return vals
+
+    def _buildInstruction(self, n, typ=0, mot=0, val=0):
+        """
+        Create the message of an instruction (as in SendInstruction)
+        return (numpy.array of 9 uint8): the message to send
+        """
+        msg = numpy.empty(9, dtype=numpy.uint8)
+        struct.pack_into('>BBBBiB', msg, 0, self._target, n, typ, mot, val, 0)
+        # compute the checksum (just the sum of all the bytes)
+        msg[-1] = numpy.sum(msg[:-1], dtype=numpy.uint8)
+        return msg
 
-                return rval
+    def _readReply(self, msg, n):
+        """
+        Receive the reply of an instruction. Must be called with _ser_access.
+        msg (numpy.array of 9 uint8): the message sent (only used for logging)
+        n (0<=int<=255): instruction ID
+        return (0<=int<2**32): value of the reply (if status is good)
+        raises:
+            IOError: if problem with receiving data over the serial port
+            TMCLError: if status if bad
+        """
+        while True:
+            res = self._serial.read(9)
+            if len(res) < 9: # TODO: TimeoutError?
+                logging.warning("Received only %d bytes after %s, will fail the instruction",
+                                len(res), self._instr_to_str(msg))
+                raise IOError("Received only %d bytes after %s" %
+                              (len(res), self._instr_to_str(msg)))
+            logging.debug("Received %s", self._reply_to_str(res))
+            ra, rt, status, rn, rval, chk = struct.unpack('>BBBBiB', res)
+
+            # Check it's a valid message
+            npres = numpy.frombuffer(res, dtype=numpy.uint8)
+            good_chk = numpy.sum(npres[:-1], dtype=numpy.uint8)
+            if chk == good_chk:
+                if self._target != 0 and self._target != rt:  # 0 means 'any device'
+                    logging.warning("Received a message from %d while expected %d",
+                                    rt, self._target)
+                if rn != n:
+                    logging.info("Skipping a message about instruction %d (waiting for %d)",
+                                 rn, n)
+                    continue
+                if status not in TMCL_OK_STATUS:
+                    raise TMCLError(status, rval, self._instr_to_str(msg))
+            else:
+                # TODO: investigate more why once in a while (~1/1000 msg)
+                # the message is garbled
+                logging.warning("Message checksum incorrect (%d), will assume it's all fine", chk)
+
+            return rval
 
     # Low level functions
     def GetVersion(self):
@@ -688,6 +742,14 @@ class TMCLController(model.Actuator):
         val = self.SendInstruction(6, param, axis)
         return val
 
+    def GetAxisParams(self, params):
+        """
+        Read several axis/parameter settings from the RAM, at once
+        params (list of (0<=int<=5, 0<=int<=255)): axis number and parameter number
+        return (list of 0<=int): the value stored for each axis/parameter
+        """
+        return self.SendInstructions([(6, p, a, 0) for a, p in params])
+
     def SetAxisParam(self, axis, param, val):
         """
         Write the axis/parameter setting from the RAM
@@ -1226,21 +1288,50 @@ class TMCLController(model.Actuator):
         axes (set of str): names of the axes to update or None if all should be
           updated
         """
-        # uses the current values (converted to internal representation)
-        pos = self._applyInversion(self.position.value)
+        if axes is None:
+            axes = set(self._name_to_axis.keys())
+        _, npos = self._readAxesState(set(), axes)
+        self._reportPosition(npos)
+
+    def _readAxesState(self, axes, pos_axes):
+        """
+        Read which axes have reached their target, and the position of some
+        axes, in a single transaction (all the instructions are sent at once).
+        axes (set of int): the axes IDs to check whether they reached the target
+        pos_axes (set of str): names of the axes for which to read the position
+        return (set of int, dict str -> float): the axes (subset of axes) not yet
+          on target, and the position of each pos_axes (not inverted)
+        """
+        params = [(i, 8) for i in axes]  # 8 = target reached?
+        for n in pos_axes:
+            i = self._name_to_axis[n]
+            if self._abs_encoder[n]:
+                # param 209 = encoder position
+                # Note: it's almost like param 215 * 512 / param 210, but
+                # as long as the controller is turned on, it will remember
+                # multiple rotations.
+                params.append((i, 209))
+            else:
+                # param 1 = current position
+                params.append((i, 1))
+        if not params:
+            return set(), {}
 
-        for n, i in self._name_to_axis.items():
-            if axes is None or n in axes:
-                if self._abs_encoder[n]:
-                    # param 209 = encoder position
-                    # Note: it's almost like param 215 * 512 / param 210, but
-                    # as long as the controller is turned on, it will remember
-                    # multiple rotations.
-                    pos[n] = self.GetAxisParam(i, 209) * self._ustepsize[i]
-                else:
-                    # param 1 = current position
-                    pos[n] = self.GetAxisParam(i, 1) * self._ustepsize[i]
+        vals = self.GetAxisParams(params)
+        moving = set(i for (i, p), v in zip(params, vals) if p == 8 and v == 0)
+        npos = {}
+        for n, v in zip(pos_axes, vals[len(axes):]):
+            npos[n] = v * self._ustepsize[self._name_to_axis[n]]
+        return moving, npos
 
+    def _reportPosition(self, npos):
+        """
+        Update the position VA with some new positions
+        npos (dict str -> float): axis name -> position (not inverted)
+        """
+        # uses the current values (converted to internal representation)
+        pos = self._applyInversion(self.position.value)
+        pos.update(npos)
         pos = self._applyInversion(pos)
 
         logging.debug("Updated position to %s", pos)
@@ -1562,11 +1653,22 @@ class TMCLController(model.Actuator):
         logging.debug("Expecting a move of %g s, will wait up to %g s", dur, max_dur)
         timeout = last_upd + max_dur
         last_axes = moving_axes.copy()
+        pos_due = False
         try:
             while not future._must_stop.is_set():
-                for aid in moving_axes.copy(): # need copy to remove during iteration
-                    if self._isOnTarget(aid):
-                        moving_axes.discard(aid)
+                # Check the end of the move, and update the position from time
+                # to time (10 Hz), all in one transaction
+                if pos_due or time.time() - last_upd > 0.1:
+                    pos_names = set(n for n, i in self._name_to_axis.items() if i in last_axes)
+                else:
+                    pos_names = set()
+                moving_axes, npos = self._readAxesState(moving_axes, pos_names)
+                if pos_names:
+                    self._reportPosition(npos)
+                    last_upd = time.time()
+                    last_axes = moving_axes
+                # Some axes just stopped => report their final position
+                pos_due = (last_axes != moving_axes)
                 if not moving_axes:
                     # no more axes to wait for
                     break
@@ -1580,13 +1682,6 @@ class TMCLController(model.Actuator):
                                        "expected it takes only %g s" %
                                        (max_dur, dur))
 
-                # Update the position from time to time (10 Hz)
-                if now - last_upd > 0.1 or last_axes != moving_axes:
-                    last_names = set(n for n, i in self._name_to_axis.items() if i in last_axes)
-                    self._updatePosition(last_names)
-                    last_upd = time.time()
-                    last_axes = moving_axes.copy()
-
                 # Wait half of the time left (maximum 0.1 s)
                 left = end - time.time()
                 sleept = max(0.001, min(left / 2, 0.1))
@@ -118,15 +118,17 @@ Graphical data is drawn using the following sequence of method calls:
 
             * draw()
 
-                * _draw_background()
+                * _update_images_surface() (only on the regions of the images which changed)
 
-                * _draw_merged_images
+                    * _draw_background()
 
-                   * for all but last image:
-                        * _draw_image()
+                    * _draw_merged_images
 
-                    * for last image:
-                        * _draw_image()
+                       * for all but last image:
+                            * _draw_image()
+
+                        * for last image:
+                            * _draw_image()
 
             * Refresh/Update canvas
 
@@ -138,6 +140,7 @@ from abc import ABCMeta, abstractmethod
 import cairo
 from decorator import decorator
 import logging
+import math
 from odemis import util
 from odemis.gui import BLEND_DEFAULT, BLEND_SCREEN, BufferSizeEvent
 from odemis.gui.comp.overlay.base import WorldOverlay, ViewOverlay
@@ -783,6 +786,67 @@ class BufferedCanvas(wx.Panel):
         return wx.ImageFromBitmap(bitmap)
 
 
+def _union_rect(a, b):
+    """ Compute the smallest rectangle containing both rectangles
+
+    :param a: (None or float, float, float, float) left, top, width, height
+    :param b: (None or float, float, float, float) left, top, width, height
+
+    :return: (None or float, float, float, float) None only if both are None
+
+    """
+    if a is None:
+        return b
+    if b is None:
+        return a
+    l, t = min(a[0], b[0]), min(a[1], b[1])
+    r, btm = max(a[0] + a[2], b[0] + b[2]), max(a[1] + a[3], b[1] + b[3])
+    return l, t, r - l, btm - t
+
+
+def _is_same_image(a, b):
+    """ Check whether two images are the same objects
+
+    :param a: (DataArray or tuple of tuple of DataArray) image or tiles
+    :param b: (DataArray or tuple of tuple of DataArray) image or tiles
+
+    :return: (bool) True if they are the same image, or the same tiles
+
+    """
+    if a is b:
+        return True
+    if isinstance(a, tuple) and isinstance(b, tuple) and len(a) == len(b):
+        for ca, cb in zip(a, b):
+            if len(ca) != len(cb) or any(ta is not tb for ta, tb in zip(ca, cb)):
+                return False
+        return True
+    return False
+
+
+def _get_bounding_rect(rect, rotation, shear):
+    """ Compute the rectangle containing a rectangle after rotation and shear
+
+    Both transformations are around the center of the rectangle, as done by
+    apply_rotation() and apply_shear().
+
+    :param rect: (float, float, float, float) left, top, width, height
+    :param rotation: (None or float) rotation in radians
+    :param shear: (None or float) shear
+
+    :return: (float, float, float, float) left, top, width, height
+
+    """
+    x, y, w, h = rect
+    cx, cy = x + w / 2, y + h / 2
+    if shear:
+        # Whichever the axis, it doesn't extend more than this
+        w, h = w + abs(shear) * h, h + abs(shear) * w
+    if rotation:
+        c, s = abs(math.cos(rotation)), abs(math.sin(rotation))
+        w, h = w * c + h * s, w * s + h * c
+    return cx - w / 2, cy - h / 2, w, h
+
+
 class BitmapCanvas(BufferedCanvas):
     """
     A canvas that can display multiple overlapping images at various position
@@ -799,9 +863,20 @@ class BitmapCanvas(BufferedCanvas):
         self.scale = 1.0  # px/m
         self.margins = (0, 0)
 
+        # The background and the images are composited into a separate surface,
+        # which is kept between the draws. So only the region of the images
+        # which have changed has to be composited again (eg, when only an
+        # overlay changes, or just one stream is live).
+        self._images_surface = None  # cairo.ImageSurface of the size of the buffer
+        self._images_key = None  # drawing parameters common to all the images
+        self._images_layers = []  # (image, params, buffer rect) of each image drawn
+        # id(image or tile) -> (image or tile, format, cairo.ImageSurface)
+        self._im_surfaces = {}
+
     def clear(self):
         """ Remove the images and clear the canvas """
         self.images = [None]
+        self._images_key = None
         BufferedCanvas.clear(self)
 
     def set_images(self, im_args):
@@ -829,8 +904,6 @@ class BitmapCanvas(BufferedCanvas):
 
         # TODO:
         # * take an image composition tree (operator + images + scale + pos)
-        # * allow to indicate just one image has changed (and so the rest
-        #   doesn't need to be recomputed)
 
         images = []
 
@@ -893,11 +966,12 @@ class BitmapCanvas(BufferedCanvas):
 
         ctx = wxcairo.ContextFromDC(self._dc_buffer)
 
-        self._draw_background(ctx)
-        ctx.identity_matrix()  # Reset the transformation matrix
-
-        self._draw_merged_images(ctx, interpolate_data)
-        ctx.identity_matrix()  # Reset the transformation matrix
+        # Background + images, only recomposited where they changed
+        self._update_images_surface(interpolate_data)
+        ctx.set_source_surface(self._images_surface, 0, 0)
+        ctx.set_operator(cairo.OPERATOR_SOURCE)
+        ctx.paint()
+        ctx.set_operator(cairo.OPERATOR_OVER)
 
         # Remember that the device context being passed belongs to the *buffer* and the view
         # overlays are drawn in the `on_paint` method where the buffer is blitted to the device
@@ -907,6 +981,142 @@ class BitmapCanvas(BufferedCanvas):
             o.draw(ctx, self.p_buffer_center, self.scale)
             ctx.restore()
 
+    def _get_merge_ratio(self, i, n, md):
+        """ Compute the opacity of an image
+
+        :param i: (int) index of the image (among the images to be drawn)
+        :param n: (int) number of images to be drawn
+        :param md: (dict) metadata of the image (as set by set_images)
+
+        :return: (float) merge ratio [0..1]
+
+        """
+        if md['blend_mode'] == BLEND_SCREEN:
+            return 1.0
+        elif i == n - 1:  # last image
+            if n == 1:
+                return 1.0
+            else:
+                return self.merge_ratio
+        else:
+            return 1 - i / n
+
+    def _get_image_layers(self):
+        """ Compute how each image is drawn
+
+        :return: (list of (image, params, rect)): for each image to be drawn, the
+          image (DataArray or tuple of tuple of tiles), the parameters affecting
+          the drawing, and the bounding rectangle of the drawing in buffer
+          coordinates (left, top, width, height).
+
+        """
+        images = [im for im in self.images if im is not None]
+        n = len(images)
+        layers = []
+        for i, im in enumerate(images):
+            if isinstance(im, tuple):
+                md = im[0][0].metadata
+                im_shape = util.img.getTilesSize(im)
+                center = util.img.getCenterOfTiles(im, im_shape)
+            else:
+                md = im.metadata
+                im_shape = im.shape
+                center = md['dc_center']
+
+            params = (center, md['dc_scale'], md['dc_rotation'], md['dc_shear'],
+                      md['dc_flip'], md['dc_keepalpha'], md['blend_mode'],
+                      self._get_merge_ratio(i, n, md))
+            rect = self._calc_img_buffer_rect(im_shape[:2], md['dc_scale'], center)
+            rect = _get_bounding_rect(rect, md['dc_rotation'], md['dc_shear'])
+            layers.append((im, params, rect))
+
+        return layers
+
+    def _update_images_surface(self, interpolate_data=False):
+        """ Composite the background and the images into the images surface
+
+        Only the region of the images which have changed since the previous call
+        is composited. An image is considered changed if it's a different object,
+        or it's drawn differently (eg, different position or opacity).
+
+        :param interpolate_data: (boolean) Apply interpolation if True
+
+        """
+        key = (self._bmp_buffer_size, self.p_buffer_center, self.scale, interpolate_data,
+               self.background_brush, self.background_offset, id(self.background_img),
+               wxcol_to_frgb(self.BackgroundColour))
+        layers = self._get_image_layers()
+
+        # Forget the surfaces of the images not displayed anymore
+        ids = set()
+        for im, _, _ in layers:
+            if isinstance(im, tuple):
+                ids.update(id(t) for tc in im for t in tc)
+            else:
+                ids.add(id(im))
+        for k in self._im_surfaces.keys():
+            if k not in ids:
+                del self._im_surfaces[k]
+
+        surface = self._images_surface
+        if (surface is None or key != self._images_key or
+                len(layers) != len(self._images_layers)):
+            # Everything changed => full redraw
+            if surface is None or (surface.get_width(), surface.get_height()) != self._bmp_buffer_size:
+                surface = cairo.ImageSurface(cairo.FORMAT_RGB24, *self._bmp_buffer_size)
+                self._images_surface = surface
+            dirty = (0, 0) + self._bmp_buffer_size
+        else:
+            dirty = None
+            for (pim, pparams, prect), (im, params, rect) in zip(self._images_layers, layers):
+                if _is_same_image(pim, im) and pparams == params:
+                    continue
+                dirty = _union_rect(dirty, _union_rect(prect, rect))
+
+        self._images_key = key
+        self._images_layers = layers
+        if dirty is None:
+            return  # Nothing changed
+
+        ctx = cairo.Context(surface)
+        # Round outwards, and add a small margin for the interpolation
+        l, t = int(dirty[0]) - 2, int(dirty[1]) - 2
+        r, b = int(dirty[0] + dirty[2]) + 3, int(dirty[1] + dirty[3]) + 3
+        ctx.rectangle(l, t, r - l, b - t)
+        ctx.clip()
+
+        self._draw_background(ctx)
+        ctx.identity_matrix()  # Reset the transformation matrix
+        self._draw_merged_images(ctx, interpolate_data)
+
+    def _get_im_surface(self, im_data, im_format):
+        """ Get a cairo surface containing the image data
+
+        The surface is kept as long as the image is displayed, so that it's not
+        created again at each draw.
+
+        :param im_data: (DataArray of shape YXC) the image (or tile) data
+        :param im_format: (int) cairo.FORMAT_*
+
+        :return: (cairo.ImageSurface) the surface
+
+        """
+        try:
+            cim, cformat, surface = self._im_surfaces[id(im_data)]
+            if cim is im_data and cformat == im_format:
+                return surface
+        except KeyError:
+            pass
+
+        height, width, _ = im_data.shape
+        # Note: Stride calculation is done automatically when no stride parameter is provided.
+        stride = cairo.ImageSurface.format_stride_for_width(im_format, width)
+        # In Cairo a surface is a target that it can render to. Here we're going to use it as the
+        #  source for a pattern
+        surface = cairo.ImageSurface.create_for_data(im_data, im_format, width, height, stride)
+        self._im_surfaces[id(im_data)] = (im_data, im_format, surface)
+        return surface
+
     def _draw_merged_images(self, ctx, interpolate_data=False):
         """ Draw the images on the DC buffer, centred around their _dc_center, with their own
         scale and an opacity of "mergeratio" for im1.
@@ -955,15 +1165,7 @@ class BitmapCanvas(BufferedCanvas):
                 else:
                     md = im.metadata
 
-                if md['blend_mode'] == BLEND_SCREEN:
-                    merge_ratio = 1.0
-                elif i == n - 1: # last image
-                    if n == 1:
-                        merge_ratio = 1.0
-                    else:
-                        merge_ratio = self.merge_ratio
-                else:
-                    merge_ratio = 1 - i / n
+                merge_ratio = self._get_merge_ratio(i, n, md)
 
                 if isinstance(im, tuple):
                     self._draw_tiles(
@@ -1082,14 +1284,8 @@ class BitmapCanvas(BufferedCanvas):
             # save the transformation matrix to return to the top of the column
             ctx.save()
             for tile in tile_col:
-                tmd = tile.metadata
                 height, width, _ = tile.shape
-
-                # Note: Stride calculation is done automatically when no stride parameter is provided.
-                stride = cairo.ImageSurface.format_stride_for_width(im_format, width)
-                # In Cairo a surface is a target that it can render to. Here we're going to use it as the
-                #  source for a pattern
-                imgsurface = cairo.ImageSurface.create_for_data(tile, im_format, width, height, stride)
+                imgsurface = self._get_im_surface(tile, im_format)
 
                 # In Cairo a pattern is the 'paint' that it uses to draw
                 surfpat = cairo.SurfacePattern(imgsurface)
@@ -1177,6 +1373,7 @@ class BitmapCanvas(BufferedCanvas):
         if abs(total_scale_x - 1) < 1e-8 or abs(total_scale_y - 1) < 1e-8:
             total_scale = (1.0, 1.0)
 
+        is_sub_img = False
         if total_scale_x > 1.0 or total_scale_y > 1.0:
             # logging.debug("Up scaling required")
 
@@ -1185,6 +1382,7 @@ class BitmapCanvas(BufferedCanvas):
             if b_im_rect[2] > intersection[2] * 1.1 or b_im_rect[3] > intersection[3] * 1.1:
                 im_data, tl = get_sub_img(intersection, b_im_rect, im_data, total_scale)
                 b_im_rect = (tl[0], tl[1], b_im_rect[2], b_im_rect[3], )
+                is_sub_img = True
 
         # Render the image data to the context
 
@@ -1193,14 +1391,14 @@ class BitmapCanvas(BufferedCanvas):
         else:
             im_format = cairo.FORMAT_RGB24
 
-        height, width, _ = im_data.shape
         # logging.debug("Image data shape is %s", im_data.shape)
-
-        # Note: Stride calculation is done automatically when no stride parameter is provided.
-        stride = cairo.ImageSurface.format_stride_for_width(im_format, width)
-        # In Cairo a surface is a target that it can render to. Here we're going to use it as the
-        #  source for a pattern
-        imgsurface = cairo.ImageSurface.create_for_data(im_data, im_format, width, height, stride)
+        if is_sub_img:
+            # A new copy at each draw => no need to keep it
+            height, width, _ = im_data.shape
+            stride = cairo.ImageSurface.format_stride_for_width(im_format, width)
+            imgsurface = cairo.ImageSurface.create_for_data(im_data, im_format, width, height, stride)
+        else:
+            imgsurface = self._get_im_surface(im_data, im_format)
 
         # In Cairo a pattern is the 'paint' that it uses to draw
         surfpat = cairo.SurfacePattern(imgsurface)
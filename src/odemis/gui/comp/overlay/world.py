@@ -26,12 +26,14 @@ from __future__ import division
 import cairo
 import logging
 import math
+import numpy
 from odemis import model, util
 from odemis.acq.stream import UNDEFINED_ROI
 from odemis.gui import img
 from odemis.gui.comp.overlay.base import Vec, WorldOverlay, SelectionMixin, DragMixin, \
     PixelDataMixin, SEL_MODE_EDIT, SEL_MODE_CREATE, EDIT_MODE_BOX, EDIT_MODE_POINT, SpotModeBase
 from odemis.gui.util.raster import rasterize_line
+from odemis.gui.util.spatial import PointsIndex, bin_points, density_to_argb
 from odemis.util import clip_line
 import wx
 
@@ -41,6 +43,38 @@ import odemis.util.conversion as conversion
 import odemis.util.units as units
 
 
+def _draw_points_density(ctx, b_pos, buffer_size, colour):
+    """ Draw many points as a density map
+
+    Each buffer pixel is coloured according to the number of points it contains.
+    That's much faster than drawing each point, and looks the same when the
+    points are smaller than a pixel.
+
+    :param ctx: (cairo.Context) the context to draw on
+    :param b_pos: (numpy.array of shape Nx2) X/Y position of the points in buffer
+        coordinates (px)
+    :param buffer_size: (int, int) width and height of the buffer
+    :param colour: (float, float, float, float) RGBA colour of the dense areas
+
+    """
+    b_pos = numpy.asarray(b_pos).reshape(-1, 2)
+    if not len(b_pos):
+        return
+
+    # Only compute the image on the area containing points
+    l, t = numpy.clip(numpy.floor(b_pos.min(axis=0)), 0, buffer_size).astype(int)
+    r, b = numpy.clip(numpy.floor(b_pos.max(axis=0)) + 1, 0, buffer_size).astype(int)
+    if r <= l or b <= t:
+        return
+
+    counts = bin_points(b_pos - (l, t), (r - l, b - t))
+    argb = density_to_argb(counts, colour)
+    stride = cairo.ImageSurface.format_stride_for_width(cairo.FORMAT_ARGB32, r - l)
+    surface = cairo.ImageSurface.create_for_data(argb, cairo.FORMAT_ARGB32, r - l, b - t, stride)
+    ctx.set_source_surface(surface, l, t)
+    ctx.paint()
+
+
 class WorldSelectOverlay(WorldOverlay, SelectionMixin):
 
     def __init__(self, cnvs, colour=gui.SELECTION_COLOUR, center=(0, 0)):
@@ -282,8 +316,8 @@ class RepetitionSelectOverlay(WorldSelectOverlay):
             self._roa.subscribe(self.on_roa, init=True)
 
         self._bmp = None  # used to cache repetition with FILL_POINT
-        # ROI for which the bmp is valid
-        self._bmp_bpos = (None, None, None, None)
+        # ROI (and position of the first point) for which the bmp is valid
+        self._bmp_bpos = (None, None, None, None, None, None)
 
     @property
     def fill(self):
@@ -460,19 +494,22 @@ class RepetitionSelectOverlay(WorldSelectOverlay):
             ctx.fill()
             ctx.stroke()
         else:
+            # Only the points inside the buffer are drawn. When the selection
+            # extends beyond the buffer, the first visible point is not
+            # necessarily at the start of a step.
+            first_x = (step_x / 2 - (start_x - b_pos[0])) % step_x
+            first_y = (step_y / 2 - (start_y - b_pos[1])) % step_y
+
             # check whether the cache is still valid
-            cl_pos = (start_x, start_y, end_x, end_y)
+            cl_pos = (start_x, start_y, end_x, end_y, first_x, first_y)
             if not self._bmp or self._bmp_bpos != cl_pos:
                 # Cache the image as it's quite a lot of computations
-                half_step_x = step_x / 2
-                half_step_y = step_y / 2
 
                 # The number of repetitions that fits into the buffer
                 # clipped selection
-                buf_rep_x = int((end_x - start_x) / step_x)
-                buf_rep_y = int((end_y - start_y) / step_y)
+                buf_rep_x = max(0, int(math.ceil((end_x - start_x - first_x) / step_x)))
+                buf_rep_y = max(0, int(math.ceil((end_y - start_y - first_y) / step_y)))
 
-                # TODO: need to take into account shift, like drawGrid
                 logging.debug("Rendering %sx%s points", buf_rep_x, buf_rep_y)
 
                 point = img.getBitmap("dot.png")
@@ -488,7 +525,7 @@ class RepetitionSelectOverlay(WorldSelectOverlay):
 
                 blit = horz_dc.Blit
                 for i in range(buf_rep_x):
-                    x = i * step_x + half_step_x
+                    x = i * step_x + first_x
                     blit(x, 0, 3, 3, point_dc, 0, 0)
 
                 total_dc = wx.MemoryDC()
@@ -499,7 +536,7 @@ class RepetitionSelectOverlay(WorldSelectOverlay):
 
                 blit = total_dc.Blit
                 for j in range(buf_rep_y):
-                    y = j * step_y + half_step_y
+                    y = j * step_y + first_y
                     blit(0, y, int(end_x - start_x), 3, horz_dc, 0, 0)
 
                 self._bmp.SetMaskColour(wx.BLACK)
@@ -954,6 +991,10 @@ class SpectrumLineSelectOverlay(LineSelectOverlay, PixelDataMixin):
         self._width_colour = conversion.hex_to_frgba(gui.FG_COLOUR_HIGHLIGHT, 0.5)
         self._pixel_colour = conversion.hex_to_frgba(gui.FG_COLOUR_EDIT, 0.5)
 
+        # Cache of the rasterized line, as it's slow to compute for wide lines
+        self._line_points_key = None
+        self._line_points = None  # numpy.array of int of shape Nx2
+
     def connect_selection(self, selection_va, width_va, pixel_va=None):
         """ Connect the overlay to an external selection VA so it can update itself on value changes
 
@@ -1047,26 +1088,68 @@ class SpectrumLineSelectOverlay(LineSelectOverlay, PixelDataMixin):
         if (None, None) in (self.start_pixel, self.end_pixel):
             return
 
-        points = rasterize_line(self.start_pixel, self.end_pixel, self._selected_width_va.value)
-        # Clip points
+        points = self._get_line_points()
         w, h = self._data_resolution
-        points = [p for p in points if 0 <= p[0] < w and 0 <= p[1] < h]
 
         selected_pixel = self._selected_pixel_va.value if self._selected_pixel_va else None
         selected_pixels = self.get_selection_points(selected_pixel)
+        sel_keys = [py * w + px for px, py in selected_pixels]
+        is_selected = numpy.in1d(points[:, 1] * w + points[:, 0], sel_keys)
 
-        for point in set(points):
-            if point in selected_pixels:
-                ctx.set_source_rgba(*self._pixel_colour)
-            else:
-                ctx.set_source_rgba(*self._width_colour)
-            rect = self.pixel_to_rect(point, scale)
-            ctx.rectangle(*rect)
-            ctx.rectangle(*rect)
+        # Position of the top-left of each pixel in the buffer, computed as in
+        # pixel_to_rect(), but for all the pixels at once.
+        offset = self.cnvs.get_half_buffer_size()
+        b_pos = numpy.empty(points.shape, dtype=numpy.float64)
+        b_pos[:, 0] = self._pixel_data_p_rect[0] + points[:, 0] * self._data_mpp
+        b_pos[:, 1] = self._pixel_data_p_rect[3] - points[:, 1] * self._data_mpp
+        b_pos[:, 0] = numpy.round((b_pos[:, 0] - self.cnvs.p_buffer_center[0]) * self.cnvs.scale + offset[0])
+        b_pos[:, 1] = numpy.round(-(b_pos[:, 1] - self.cnvs.p_buffer_center[1]) * self.cnvs.scale + offset[1])
+        b_pixel_size = self._data_mpp * scale + 0.5
+
+        # Only the pixels visible in the buffer
+        b_w, b_h = self.cnvs.buffer_size
+        visible = ((-b_pixel_size <= b_pos[:, 0]) & (b_pos[:, 0] < b_w) &
+                   (-b_pixel_size <= b_pos[:, 1]) & (b_pos[:, 1] < b_h))
+
+        for colour, pxs in ((self._width_colour, b_pos[visible & ~is_selected]),
+                            (self._pixel_colour, b_pos[visible & is_selected])):
+            if b_pixel_size < 1.5:
+                # Data pixels smaller than the buffer pixels => just colour the
+                # buffer pixels containing at least one data pixel
+                _draw_points_density(ctx, pxs, (b_w, b_h), colour)
+                continue
+
+            ctx.set_source_rgba(*colour)
+            for b_x, b_y in pxs.tolist():
+                ctx.rectangle(b_x, b_y, b_pixel_size, b_pixel_size)
             ctx.fill()
 
         LineSelectOverlay.draw(self, ctx, shift, scale)
 
+    def _get_line_points(self):
+        """ Compute the data pixels of the selected line
+
+        :return: (numpy.array of int of shape Nx2) the X/Y position of each pixel
+            of the line (with its width) inside the data, each only once
+
+        """
+        key = (self.start_pixel, self.end_pixel, self._selected_width_va.value,
+               self._data_resolution)
+        if self._line_points_key != key:
+            points = rasterize_line(self.start_pixel, self.end_pixel, self._selected_width_va.value)
+            points = numpy.array(points, dtype=numpy.int64).reshape(-1, 2)
+            # Clip points
+            w, h = self._data_resolution
+            inside = ((0 <= points[:, 0]) & (points[:, 0] < w) &
+                      (0 <= points[:, 1]) & (points[:, 1] < h))
+            points = points[inside]
+            # Remove duplicates
+            keys = numpy.unique(points[:, 1] * w + points[:, 0])
+            self._line_points = numpy.column_stack((keys % w, keys // w))
+            self._line_points_key = key
+
+        return self._line_points
+
     def on_left_down(self, evt):
         """ Start drawing a selection line if the overlay is active """
 
@@ -1297,6 +1380,8 @@ class PointsOverlay(WorldOverlay):
 
     MAX_DOT_RADIUS = 25.5
     MIN_DOT_RADIUS = 3.5
+    # Below this distance between points (in px), they are drawn as a density map
+    MIN_POINT_SPACING = 3
 
     def __init__(self, cnvs):
         WorldOverlay.__init__(self, cnvs)
@@ -1305,6 +1390,9 @@ class PointsOverlay(WorldOverlay):
         self.point = None
         # The possible choices for point as a physical coordinates
         self.choices = set()
+        # Same points, as a list, and their spatial index
+        self._choices_list = []
+        self._choices_index = PointsIndex([])
 
         self.min_dist = None
 
@@ -1377,16 +1465,16 @@ class PointsOverlay(WorldOverlay):
 
                 b_hover_box = None
 
-                for p_pos in self.choices:
+                p_cursor = self.cnvs.buffer_to_phys((b_x, b_y), offset)
+                i = self._choices_index.nearest(p_cursor, self.dot_size / self.cnvs.scale)
+                if i is not None:
+                    p_pos = self._choices_list[i]
                     b_box_x, b_box_y = self.cnvs.phys_to_buffer(p_pos, offset)
-
-                    if abs(b_box_x - b_x) <= self.dot_size and abs(b_box_y - b_y) <= self.dot_size:
-                        # Calculate box in buffer coordinates
-                        b_hover_box = (b_box_x - self.dot_size,
-                                       b_box_y - self.dot_size,
-                                       b_box_x + self.dot_size,
-                                       b_box_y + self.dot_size)
-                        break
+                    # Calculate box in buffer coordinates
+                    b_hover_box = (b_box_x - self.dot_size,
+                                   b_box_y - self.dot_size,
+                                   b_box_x + self.dot_size,
+                                   b_box_y + self.dot_size)
 
                 if self.b_hover_box != b_hover_box:
                     self.b_hover_box = b_hover_box
@@ -1418,6 +1506,8 @@ class PointsOverlay(WorldOverlay):
             min_dist = 100e-9  # m
 
         self.choices = frozenset(choices)
+        self._choices_list = list(self.choices)
+        self._choices_index = PointsIndex(self._choices_list)
         self.min_dist = min_dist / 2  # radius
 
     def draw(self, ctx, shift=(0, 0), scale=1.0):
@@ -1431,31 +1521,52 @@ class PointsOverlay(WorldOverlay):
         p_cursor_over = None
         offset = self.cnvs.get_half_buffer_size()
 
-        for p_pos in self.choices:
-            b_x, b_y = self.cnvs.phys_to_buffer(p_pos, offset)
+        # Only the points visible in the buffer
+        b_w, b_h = self.cnvs.buffer_size
+        margin = self.dot_size + 1
+        p_l, p_t = self.cnvs.buffer_to_phys((-margin, -margin), offset)
+        p_r, p_b = self.cnvs.buffer_to_phys((b_w + margin, b_h + margin), offset)
+        visible = self._choices_index.query_rect((p_l, p_b, p_r, p_t))
+
+        if 2 * self.min_dist * self.cnvs.scale < self.MIN_POINT_SPACING:
+            # Too close to each other to be distinguished => just show where
+            # they are, and on top, the selected point and the one closest to
+            # the cursor (which can be selected).
+            p_pos = self._choices_index.points[visible]
+            b_pos = numpy.empty_like(p_pos)
+            b_pos[:, 0] = (p_pos[:, 0] - self.cnvs.p_buffer_center[0]) * self.cnvs.scale + offset[0]
+            b_pos[:, 1] = -(p_pos[:, 1] - self.cnvs.p_buffer_center[1]) * self.cnvs.scale + offset[1]
+            _draw_points_density(ctx, b_pos, (b_w, b_h), tuple(self.point_colour) + (1,))
+
+            if self.point.value in self.choices:
+                b_x, b_y = self.cnvs.phys_to_buffer(self.point.value, offset)
+                self._draw_dot(ctx, b_x, b_y, self.select_colour)
+
+            if self.b_hover_box and not self.cnvs.was_dragged:
+                # The hover box is centred on the point the closest to the cursor
+                b_x, b_y = (b_l + b_r) / 2, (b_t + b_b) / 2
+                p_hover = self.cnvs.buffer_to_phys((b_x, b_y), offset)
+                i = self._choices_index.nearest(p_hover, 1 / self.cnvs.scale)
+                if i is not None:
+                    p_cursor_over = self._choices_list[i]
+                    self._draw_dot(ctx, b_x, b_y, self.select_colour)
+
+            self.cursor_over_point = p_cursor_over
+            return
 
-            ctx.new_sub_path()
-            ctx.arc(b_x, b_y, self.dot_size, 0, 2 * math.pi)
+        for i in visible:
+            p_pos = self._choices_list[i]
+            b_x, b_y = self.cnvs.phys_to_buffer(p_pos, offset)
 
             # If the mouse is hovering over a dot (and we are not dragging)
             if (self.b_hover_box and (b_l <= b_x <= b_r and b_t <= b_y <= b_b) and
                     not self.cnvs.was_dragged):
                 p_cursor_over = p_pos
-                ctx.set_source_rgba(*self.select_colour)
+                self._draw_dot(ctx, b_x, b_y, self.select_colour)
             elif self.point.value == p_pos:
-                ctx.set_source_rgba(*self.select_colour)
+                self._draw_dot(ctx, b_x, b_y, self.select_colour)
             else:
-                ctx.set_source_rgba(*self.dot_colour)
-
-            ctx.fill()
-
-            ctx.arc(b_x, b_y, 2.0, 0, 2 * math.pi)
-            ctx.set_source_rgb(0.0, 0.0, 0.0)
-            ctx.fill()
-
-            ctx.arc(b_x, b_y, 1.5, 0, 2 * math.pi)
-            ctx.set_source_rgb(*self.point_colour)
-            ctx.fill()
+                self._draw_dot(ctx, b_x, b_y, self.dot_colour)
 
             # Draw hit boxes (for debugging purposes)
             # ctx.set_line_width(1)
@@ -1468,6 +1579,26 @@ class PointsOverlay(WorldOverlay):
 
         self.cursor_over_point = p_cursor_over
 
+    def _draw_dot(self, ctx, b_x, b_y, colour):
+        """ Draw one point, with a disc around it
+
+        b_x, b_y (float): position of the point in buffer coordinates
+        colour (float, float, float, float): RGBA colour of the disc
+
+        """
+        ctx.new_sub_path()
+        ctx.arc(b_x, b_y, self.dot_size, 0, 2 * math.pi)
+        ctx.set_source_rgba(*colour)
+        ctx.fill()
+
+        ctx.arc(b_x, b_y, 2.0, 0, 2 * math.pi)
+        ctx.set_source_rgb(0.0, 0.0, 0.0)
+        ctx.fill()
+
+        ctx.arc(b_x, b_y, 1.5, 0, 2 * math.pi)
+        ctx.set_source_rgb(*self.point_colour)
+        ctx.fill()
+
 
 class MirrorArcOverlay(WorldOverlay, DragMixin):
     """ Overlay showing a mirror arc that the user can position over a mirror camera feed """
@@ -29,8 +29,8 @@ of microscope images.
 
 from __future__ import division
 
-from concurrent import futures
 from concurrent.futures._base import CancelledError
+from functools import partial
 import logging
 import math
 from odemis import model, dataio, acq
@@ -48,6 +48,7 @@ from odemis.gui.util.widgets import ProgressiveFutureConnector, EllipsisAnimator
 from odemis.gui.win.acquisition import AcquisitionDialog, \
     ShowAcquisitionFileDialog
 from odemis.util import units
+from odemis.util.dataio import ExportQueue
 from odemis.util.img import mergeTiles
 from odemis.util.filename import guess_pattern, create_filename, update_counter
 import os
@@ -493,8 +494,9 @@ class SparcAcquiController(object):
         self.bmp_acq_status_info = self._tab_panel.bmp_acq_status_info
         self._acq_future_connector = None
 
-        # TODO: share an executor with the whole GUI.
-        self._executor = futures.ThreadPoolExecutor(max_workers=2)
+        # The files are saved in the background, so that the next acquisition
+        # can already start.
+        self._export_queue = ExportQueue()
 
         # Link buttons
         self.btn_acquire.Bind(wx.EVT_BUTTON, self.on_acquisition)
@@ -527,7 +529,7 @@ class SparcAcquiController(object):
         self._main_data_model.is_preparing.subscribe(self.on_preparation)
 
     def __del__(self):
-        self._executor.shutdown(wait=False)
+        self._export_queue.shutdown(wait=False)
 
     # black list of VAs name which are known to not affect the acquisition time
     VAS_NO_ACQUSITION_EFFECT = ("image", "autoBC", "intensityRange", "histogram",
@@ -750,48 +752,55 @@ class SparcAcquiController(object):
 
     def _export_to_file(self, acq_future):
         """
-        return (list of DataArray, filename): data exported and filename
+        Queue the data of the acquisition to be saved into the file.
+        It may block if too much data is already waiting to be saved, so it
+        should not be called from the main GUI thread.
+        return (Future): the future of the export, which returns the filename
         """
         streams = list(self._tab_data_model.acquisitionStreams)
         st = acq.stream.StreamTree(streams=streams)
         thumb = acq.computeThumbnail(st, acq_future)
         data, exp = acq_future.result()
 
-        if data:
-            filename = self.filename.value
-            exporter = dataio.get_converter(self.conf.last_format)
-            exporter.export(filename, data, thumb)
-            logging.info(u"Acquisition saved as file '%s'.", filename)
-        else:
-            logging.debug("Not saving into file '%s' as there is no data", filename)
-
-        return data, exp, filename
+        filename = self.filename.value
+        exporter = dataio.get_converter(self.conf.last_format)
+        return self._export_queue.export(exporter, filename, data, thumbnail=thumb)
 
     @call_in_wx_main
-    def on_acquisition_done(self, future):
+    def _end_acquisition(self, text=None, level=None, keep_filename=False, hide_gauge=True):
         """
-        Callback called when the acquisition is finished (either successfully or
-        cancelled)
+        Update the GUI after the end of the acquisition
+        text, level, keep_filename: see _reset_acquisition_gui()
+        hide_gauge (bool): if False, the progress bar is left as-is
         """
-        self.btn_cancel.Disable()
         self._main_data_model.is_acquiring.value = False
         self.acq_future = None  # To avoid holding the ref in memory
         self._acq_future_connector = None
+        if hide_gauge:
+            self.gauge_acq.Hide()
+        self._reset_acquisition_gui(text, level, keep_filename)
+
+    def on_acquisition_done(self, future):
+        """
+        Callback called when the acquisition is finished (either successfully or
+        cancelled). It runs in the thread of the acquisition, so that computing
+        the thumbnail and queuing the data to be saved doesn't block the GUI.
+        """
+        wx.CallAfter(self.btn_cancel.Disable)
 
         try:
             data, exp = future.result()
         except CancelledError:
             # hide progress bar (+ put pack estimated time)
-            self.gauge_acq.Hide()
             # don't change filename => we can reuse it
-            self._reset_acquisition_gui(keep_filename=True)
+            self._end_acquisition(keep_filename=True)
             return
         except Exception as exp:
             # leave the gauge, to give a hint on what went wrong.
             logging.exception("Acquisition failed")
-            self._reset_acquisition_gui("Acquisition failed (see log panel).",
-                                        level=logging.WARNING,
-                                        keep_filename=True)
+            self._end_acquisition("Acquisition failed (see log panel).",
+                                  level=logging.WARNING,
+                                  keep_filename=True, hide_gauge=False)
             return
 
         # Handle the case acquisition failed "a bit"
@@ -799,33 +808,63 @@ class SparcAcquiController(object):
             logging.error("Acquisition failed (after %d streams): %s",
                           len(data), exp)
 
+        if not data:
+            logging.debug("Not saving into file '%s' as there is no data", self.filename.value)
+            self._end_acquisition("Acquisition failed (see log panel).",
+                                  level=logging.WARNING,
+                                  keep_filename=True)
+            return
+
         # save result to file
-        self.lbl_acqestimate.SetLabel("Saving file...")
-        # on big acquisitions, it can take ~20s
-        sf = self._executor.submit(self._export_to_file, future)
-        sf.add_done_callback(self.on_file_export_done)
+        # On big acquisitions, it can take ~20s, so it's done in the background,
+        # and the GUI is immediately ready for the next acquisition.
+        try:
+            sf = self._export_to_file(future)
+        except Exception:
+            logging.exception("Failed to queue the acquisition for saving")
+            self._end_acquisition("Saving acquisition file failed (see log panel).",
+                                  level=logging.WARNING,
+                                  keep_filename=True)
+            return
+        # GUI reset first, so that the export is not mistaken for a new acquisition
+        self._end_acquisition("Saving file...")
+        sf.add_done_callback(partial(self.on_file_export_done, data, exp))
+
+    def terminate(self):
+        """
+        Called when the controller is not used any more. Blocks until all the
+        acquisitions are saved.
+        """
+        if self._export_queue.pending:
+            logging.info("Waiting for %d acquisitions to be saved", self._export_queue.pending)
+        self._export_queue.shutdown(wait=True)
 
     @call_in_wx_main
-    def on_file_export_done(self, future):
+    def on_file_export_done(self, data, exp, future):
         """
-        Callback called when the acquisition is finished (either successfully or
-        cancelled)
+        Callback called when the acquisition file is saved (or failed to)
+        data (list of DataArray): the data saved
+        exp (Exception or None): the exception raised during the acquisition
+        future (Future): the export future
         """
-        # hide progress bar
-        self.gauge_acq.Hide()
+        # If a new acquisition is already running, don't disturb it
+        acquiring = self._main_data_model.is_acquiring.value
 
         try:
-            data, exp, filename = future.result()
+            filename = future.result()
         except Exception:
             logging.exception("Saving acquisition failed")
-            self._reset_acquisition_gui("Saving acquisition file failed (see log panel).",
-                                        level=logging.WARNING)
+            if not acquiring:
+                self.lbl_acqestimate.SetLabel("Saving acquisition file failed (see log panel).")
+                self._show_status_icons(logging.WARNING)
+            return
+
+        logging.info(u"Acquisition saved as file '%s'.", filename)
+        if acquiring:
             return
 
         if exp is None:
-            # Needs to be done before changing tabs as it will play again the stream
-            # (and they will be immediately be stopped when changing tab).
-            self._reset_acquisition_gui()
+            self.update_acquisition_time()
 
             # TODO: we should add the file to the list of recently-used files
             # cf http://pyxdg.readthedocs.org/en/latest/recentfiles.html
@@ -833,9 +872,8 @@ class SparcAcquiController(object):
             # display in the analysis tab
             self._show_acquisition(data, open(filename))
         else:
-            self._reset_acquisition_gui("Acquisition failed (see log panel).",
-                                        level=logging.WARNING,
-                                        keep_filename=(not data))
+            self.lbl_acqestimate.SetLabel("Acquisition failed (see log panel).")
+            self._show_status_icons(logging.WARNING)
 
 
 # TODO: merge with AutoCenterController because they share too many GUI elements
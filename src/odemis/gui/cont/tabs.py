@@ -1152,6 +1152,8 @@ class SparcAcquisitionTab(Tab):
         # make sure the streams are stopped
         for s in self.tab_data_model.streams.value:
             s.is_active.value = False
+        # make sure all the acquisitions are saved
+        self._acquisition_controller.terminate()
 
     @classmethod
     def get_display_priority(cls, main_data):
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+"""
+:created: 2026-10-18
+:author: Delmic
+:copyright: © 2026 Delmic
+
+This file is part of Odemis.
+
+.. license::
+    Odemis is free software: you can redistribute it and/or modify it under the
+    terms of the GNU General Public License version 2 as published by the Free
+    Software Foundation.
+
+    Odemis is distributed in the hope that it will be useful, but WITHOUT ANY
+    WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+    PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License along with
+    Odemis. If not, see http://www.gnu.org/licenses/.
+
+
+Helpers for the overlays which display many elements (eg, points). They allow
+to only handle the elements which are visible (culling) or close to the cursor
+(hit-testing), and to display them as a density map when they are too small to
+be distinguished (level of detail).
+
+"""
+
+from __future__ import division
+
+import math
+import numpy
+
+
+class PointsIndex(object):
+    """ Spatial index of 2D points, based on a uniform grid
+
+    The points are sorted by cell, column by column, so that the points in
+    a rectangle are found by looking only at the columns of cells overlapping
+    the rectangle.
+
+    """
+
+    def __init__(self, points, cell_size=None):
+        """
+        :param points: (list of (float, float)) the X/Y coordinates of the points
+        :param cell_size: (None or 0<float) size of the cells of the grid. If None,
+            it's picked so that on average each cell contains a few points.
+
+        """
+        self.points = numpy.array(points, dtype=numpy.float64).reshape(-1, 2)
+        n = len(self.points)
+        if n:
+            self._origin = self.points.min(axis=0)
+            size = self.points.max(axis=0) - self._origin
+        else:
+            self._origin = numpy.zeros(2)
+            size = numpy.zeros(2)
+
+        if cell_size is None:
+            # ~4 points per cell, if they are uniformly distributed
+            area = size[0] * size[1]
+            if area > 0:
+                cell_size = math.sqrt(4 * area / n)
+            else:  # All points on a line (or just one point)
+                cell_size = max(size.max() / max(n / 4, 1), 1e-18)
+        elif cell_size <= 0:
+            raise ValueError("cell_size must be positive, got %s" % (cell_size,))
+        self.cell_size = cell_size
+
+        self._shape = (size // cell_size).astype(numpy.int64) + 1  # number of cells in X, Y
+        keys = self._get_cells(self.points)
+        keys = keys[:, 0] * self._shape[1] + keys[:, 1]
+        self._order = numpy.argsort(keys, kind="mergesort")
+        self._keys = keys[self._order]
+
+    def __len__(self):
+        return len(self.points)
+
+    def _get_cells(self, pos):
+        """
+        :param pos: (numpy.array of shape Nx2) positions
+        :return: (numpy.array of int64 of shape Nx2) the cell X/Y index of each position
+        """
+        cells = numpy.floor((pos - self._origin) / self.cell_size).astype(numpy.int64)
+        return numpy.clip(cells, 0, self._shape - 1)
+
+    def query_rect(self, rect):
+        """ Find the points inside a rectangle
+
+        :param rect: (float, float, float, float) left, bottom, right, top (borders included)
+
+        :return: (numpy.array of int) the indices of the points inside the rectangle
+
+        """
+        l, b, r, t = rect
+        if not len(self.points) or l > r or b > t:
+            return numpy.empty((0,), dtype=numpy.intp)
+
+        (cx0, cy0), (cx1, cy1) = self._get_cells(numpy.array([(l, b), (r, t)], dtype=numpy.float64))
+        ny = self._shape[1]
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) * 4 >= len(self.points):
+            # Most of the cells => faster to look at all the points at once
+            candidates = numpy.arange(len(self.points))
+        else:
+            cols = numpy.arange(cx0, cx1 + 1) * ny
+            starts = numpy.searchsorted(self._keys, cols + cy0, side="left")
+            ends = numpy.searchsorted(self._keys, cols + cy1, side="right")
+            candidates = numpy.concatenate([self._order[s:e] for s, e in zip(starts, ends)])
+
+        pts = self.points[candidates]
+        inside = ((l <= pts[:, 0]) & (pts[:, 0] <= r) &
+                  (b <= pts[:, 1]) & (pts[:, 1] <= t))
+        return candidates[inside]
+
+    def nearest(self, pos, max_dist):
+        """ Find the point the closest to a position
+
+        :param pos: (float, float) the X/Y position
+        :param max_dist: (0<=float) maximum distance on each axis between the point and
+            the position
+
+        :return: (None or int) the index of the closest point, or None if no point
+            is within max_dist
+
+        """
+        x, y = pos
+        idx = self.query_rect((x - max_dist, y - max_dist, x + max_dist, y + max_dist))
+        if not len(idx):
+            return None
+        pts = self.points[idx]
+        dist = numpy.hypot(pts[:, 0] - x, pts[:, 1] - y)
+        return int(idx[numpy.argmin(dist)])
+
+
+def bin_points(b_pos, shape):
+    """ Count the number of points in each pixel
+
+    :param b_pos: (numpy.array of shape Nx2) X/Y position of the points (in px)
+    :param shape: (int, int) width and height of the image (in px)
+
+    :return: (numpy.array of int of shape HxW) number of points in each pixel.
+        The points outside of the image are ignored.
+
+    """
+    w, h = shape
+    pxs = numpy.floor(b_pos).astype(numpy.int64).reshape(-1, 2)
+    inside = (0 <= pxs[:, 0]) & (pxs[:, 0] < w) & (0 <= pxs[:, 1]) & (pxs[:, 1] < h)
+    pxs = pxs[inside]
+    counts = numpy.bincount(pxs[:, 1] * w + pxs[:, 0], minlength=w * h)
+    return counts.reshape(h, w)
+
+
+def density_to_argb(counts, colour, max_count=1):
+    """ Convert a number of points per pixel into an image to be drawn over others
+
+    :param counts: (numpy.array of int of shape HxW) number of points per pixel
+    :param colour: (float, float, float, float) red, green, blue, alpha (0->1) of
+        the pixels with max_count (or more) points
+    :param max_count: (0<int) number of points at which the pixel is fully coloured.
+        Pixels with less points are proportionally more transparent.
+
+    :return: (numpy.array of uint32 of shape HxW) the image, in the pre-multiplied
+        ARGB format of cairo.FORMAT_ARGB32
+
+    """
+    r, g, b, a = colour
+    alpha = numpy.minimum(counts, max_count) * (a * 255 / max_count)
+    argb = numpy.rint(alpha).astype(numpy.uint32) << 24
+    for i, c in zip((16, 8, 0), (r, g, b)):
+        argb |= numpy.rint(alpha * c).astype(numpy.uint32) << i
+    return argb
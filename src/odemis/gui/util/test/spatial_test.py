@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: Delmic
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+from __future__ import division
+
+import numpy
+from odemis.gui.util.spatial import PointsIndex, bin_points, density_to_argb
+import unittest
+
+
+class TestPointsIndex(unittest.TestCase):
+
+    def test_query_rect(self):
+        numpy.random.seed(0)
+        pts = numpy.random.uniform(-1e-3, 1e-3, (10000, 2))
+        index = PointsIndex(pts.tolist())
+        self.assertEqual(len(index), 10000)
+
+        for rect in ((-1e-3, -1e-3, 1e-3, 1e-3),  # everything
+                     (0, 0, 1e-5, 2e-5),  # small
+                     (-2e-4, 5e-4, 3e-4, 9e-3),  # partly outside
+                     (2e-3, 2e-3, 3e-3, 3e-3),  # fully outside
+                     ):
+            l, b, r, t = rect
+            exp = numpy.nonzero((l <= pts[:, 0]) & (pts[:, 0] <= r) &
+                                (b <= pts[:, 1]) & (pts[:, 1] <= t))[0]
+            res = index.query_rect(rect)
+            self.assertEqual(sorted(res.tolist()), exp.tolist())
+
+    def test_nearest(self):
+        grid = [(x * 1e-6, y * 1e-6) for x in range(300) for y in range(300)]
+        index = PointsIndex(grid)
+        i = index.nearest((10.3e-6, 20.4e-6), 0.5e-6)
+        self.assertEqual(i, 10 * 300 + 20)
+        self.assertIsNone(index.nearest((10.5e-6, 400e-6), 0.5e-6))
+
+        # Degenerate cases
+        self.assertIsNone(PointsIndex([]).nearest((0, 0), 1))
+        self.assertEqual(PointsIndex([(1, 1)]).nearest((1.1, 1), 0.2), 0)
+        line = PointsIndex([(0, y) for y in range(100)])
+        self.assertEqual(line.query_rect((-1, 10, 1, 12)).tolist(), [10, 11, 12])
+
+
+class TestDensity(unittest.TestCase):
+
+    def test_bin_density(self):
+        b_pos = numpy.array([(0.5, 0.5), (0.7, 0.2), (3.2, 1.9), (-1, 0), (10, 1)])
+        counts = bin_points(b_pos, (4, 2))
+        exp = numpy.array([[2, 0, 0, 0],
+                           [0, 0, 0, 1]])
+        numpy.testing.assert_array_equal(counts, exp)
+
+        argb = density_to_argb(counts, (1, 0.5, 0, 1), max_count=2)
+        self.assertEqual(argb.dtype, numpy.uint32)
+        self.assertEqual(argb[0, 0], 0xffff8000)
+        self.assertEqual(argb[0, 1], 0)
+        self.assertEqual(argb[1, 3] >> 24, 128)  # half transparent
+
+
+if __name__ == "__main__":
+    unittest.main()
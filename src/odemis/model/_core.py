@@ -31,6 +31,8 @@ import os
 import threading
 import urllib
 
+from . import _profiling
+
 
 # Pyro4.config.COMMTIMEOUT = 30.0 # a bit of timeout
 # There is a problem with threadpool: threads have a timeout on waiting for a
@@ -256,6 +258,29 @@ class ContainerObject(Pyro4.core.DaemonObject):
         """
         return self.getObject(self.daemon.rootId)
 
+    def startProfiling(self, interval=0.01, timeout=600):
+        """
+        starts profiling all the code running in the container
+        interval (0<float): time (in s) between each sample of the profiler
+        timeout (None or 0<float): maximum duration (in s) of the profiling
+        """
+        self.daemon.startProfiling(interval, timeout)
+
+    def stopProfiling(self):
+        """
+        stops the profiling
+        returns (str, list of tuples): profiling statistics, in the pstats file
+          format, and the timings of the DataFlow listeners
+        """
+        return self.daemon.stopProfiling()
+
+    def getThreadStacks(self):
+        """
+        returns (dict str -> str): name of each thread of the container -> its
+          current stack
+        """
+        return _profiling.getThreadStacks()
+
 # Basically a wrapper around the Pyro Daemon
 class Container(Pyro4.core.Daemon):
     def __init__(self, name):
@@ -282,6 +307,10 @@ class Container(Pyro4.core.Daemon):
         # To be set by the user of the container
         self.rootId = None # objectId of a "Root" component
 
+        self._profiler = None  # SamplingProfiler, when profiling
+        self._profiler_timings = None  # CallbackTimings, when profiling
+        self._profiler_lock = threading.Lock()
+
     def run(self):
         """
         runs and serve the objects registered in the container.
@@ -339,6 +368,74 @@ class Container(Pyro4.core.Daemon):
             raise
         return comp
 
+    def startProfiling(self, interval=0.01, timeout=600):
+        """
+        starts profiling all the code running in the container: a sampling
+         profiler for the functions, and the timing of every DataFlow listener.
+        interval (0<float): time (in s) between each sample of the profiler
+        timeout (None or 0<float): maximum duration (in s) of the profiling,
+         after which the profiler and the timing of the listeners stop by
+         themselves (but the statistics are kept until stopProfiling() is
+         called, or the profiling is started again).
+        raises ValueError if the profiling is already running
+        """
+        with self._profiler_lock:
+            if self._profiler is not None:
+                if self._profiler.running:
+                    raise ValueError("Profiling already running on container %s" % (self._name,))
+                logging.info("Discarding the previous profiling, which has timed out")
+            profiler = _profiling.SamplingProfiler(interval)
+            self._profiler = profiler
+            self._profiler_timings = _profiling.CallbackTimings()
+            _profiling.callback_timings = self._profiler_timings
+            profiler.start(timeout, lambda: self._onProfilingTimeout(profiler))
+
+    def _onProfilingTimeout(self, profiler):
+        """
+        Called when the profiler stops by itself: stop timing the listeners too,
+         but keep the results for stopProfiling()
+        profiler (SamplingProfiler): the profiler which has stopped
+        """
+        with self._profiler_lock:
+            if self._profiler is profiler:
+                _profiling.callback_timings = None
+
+    def stopProfiling(self):
+        """
+        stops the profiling
+        returns (str, list of tuples): profiling statistics, in the pstats file
+          format, and the timings of the DataFlow listeners (see
+          CallbackTimings.getReport()).
+        raises ValueError if the profiling is not running (nor has timed out)
+        """
+        with self._profiler_lock:
+            if self._profiler is None:
+                raise ValueError("No profiling running on container %s" % (self._name,))
+            profiler, self._profiler = self._profiler, None
+            timings, self._profiler_timings = self._profiler_timings, None
+            _profiling.callback_timings = None
+
+        profiler.stop()
+        return profiler.dumps(), timings.getReport(self._getDataFlowNames())
+
+    def _getDataFlowNames(self):
+        """
+        returns (dict int -> str): id of each DataFlow of the components in the
+         container -> "component.dataflow"
+        """
+        # Import here, to avoid circular dependency
+        from ._components import ComponentBase, getDataFlows
+
+        names = {}
+        for obj in self.objectsById.values():
+            if isinstance(obj, ComponentBase):
+                try:
+                    for n, df in getDataFlows(obj).items():
+                        names[id(df)] = "%s.%s" % (obj.name, n)
+                except Exception:
+                    logging.debug("Failed to list the DataFlows of %s", obj, exc_info=True)
+        return names
+
     def setRoot(self, component):
         """
         sets the root object. It has to be one of the component handled by the
@@ -370,6 +467,23 @@ def getContainer(name, validate=True):
     return container
 
 
+def getContainerOf(obj):
+    """
+    returns (a proxy to) the container which runs the given object
+    obj (Pyro4.Proxy): a proxy to an object in a container (eg, a component)
+    raises ValueError if the object is not a proxy
+    """
+    try:
+        sockname = obj._pyroUri.sockname
+    except AttributeError:
+        raise ValueError("%s is not a remote object" % (obj,))
+
+    container = Pyro4.Proxy("PYRO:Pyro.Daemon@./u:" + sockname)
+    container._pyroTimeout = 120  # s
+    container._pyroOneway.add("terminate")
+    return container
+
+
 def getObject(container_name, object_name):
     """
     returns (a proxy to) the object with the given name in the given container
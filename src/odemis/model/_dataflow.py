@@ -37,7 +37,7 @@ import threading
 import time
 import zmq
 
-from . import _core
+from . import _core, _profiling
 
 
 class DataArray(numpy.ndarray):
@@ -178,7 +178,13 @@ class DataFlowBase(object):
         snapshot_listeners = frozenset(self._listeners)
         for l in snapshot_listeners:
             try:
-                l(self, data)
+                timings = _profiling.callback_timings
+                if timings is None:
+                    l(self, data)
+                else:
+                    start = time.time()
+                    l(self, data)
+                    timings.add(self, l, time.time() - start)
             except WeakRefLostError:
                 self.unsubscribe(l)
             except:
@@ -364,6 +370,9 @@ class DataFlow(DataFlowBase):
             # is gone (if there is a way to associate it)
 
             # TODO thread-safe for self.pipe ?
+            timings = _profiling.callback_timings
+            if timings is not None:
+                start = time.time()
             dformat = {"dtype": str(data.dtype), "shape": data.shape}
             self.pipe.send_pyobj(dformat, zmq.SNDMORE)
             self.pipe.send_pyobj(data.metadata, zmq.SNDMORE)
@@ -380,6 +389,8 @@ class DataFlow(DataFlowBase):
                 logging.debug("Failed to send data with zero-copy")
                 data = numpy.require(data, requirements=["C_CONTIGUOUS"])
                 self.pipe.send(numpy.getbuffer(data), copy=False)
+            if timings is not None:
+                timings.add(self, "<remote listeners>", time.time() - start)
 
         # publish locally
         DataFlowBase.notify(self, data)
@@ -76,6 +76,7 @@ MD_WL_LIST = "Wavelength list" # m... (list of float), wavelength for each pixel
 
 MD_PIXEL_DUR = "Pixel duration"  # Time duration of a 'pixel' along the time dimension
 MD_TIME_OFFSET = "Time offset"  # Time of the first 'pixel' in the time dimension (added to ACQ_DATE), default is 0
+MD_TIME_LIST = "Time list"  # s (list of float), time of each 'pixel' in the time dimension (added to ACQ_DATE). The list is the same length as the T dimension
 
 MD_ACQ_TYPE = "Acquisition type"  # the type of acquisition contained in the DataArray
 # The following tags are to be used as the values of MD_ACQ_TYPE
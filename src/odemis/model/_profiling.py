@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: Delmic
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+
+# On demand profiling of the code running in a process (ie, a container).
+# Nothing runs when the profiling is not active, so that it has no overhead.
+# The profiler is a sampling profiler, instead of a deterministic one (such as
+# cProfile), because in Python 2, cProfile can only be activated on the thread
+# calling it, while in a container all the interesting code runs in other
+# threads, which are already running.
+
+from __future__ import division
+
+import collections
+import logging
+import marshal
+import sys
+import threading
+import time
+import traceback
+import weakref
+
+
+class SamplingProfiler(object):
+    """
+    Statistical profiler: regularly looks at the stack of every thread of the
+    process. The time spent in each function is estimated from the number of
+    times it was seen in the stacks. Note that it's "wall-clock" time, so the
+    time spent waiting (eg, for an event or I/O) is counted too.
+    The statistics are provided in the same format as cProfile, so that they
+    can be analysed with the standard tools (eg, pstats).
+    """
+
+    def __init__(self, interval=0.01):
+        """
+        interval (0<float): time (in s) between each sample
+        """
+        if interval <= 0:
+            raise ValueError("interval must be positive, got %s" % (interval,))
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_time = None
+        self._end_time = None
+        self._nsamples = 0
+        # function -> [number of samples on top of the stack, number of samples in the stack]
+        self._counts = collections.defaultdict(lambda: [0, 0])
+        # (function, caller) -> number of samples
+        self._calls = collections.defaultdict(int)
+
+    @property
+    def running(self):
+        """
+        (bool): True if the profiler has been started and is still sampling
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, timeout=None, on_timeout=None):
+        """
+        Start to sample the threads, in a separate thread
+        timeout (None or 0<float): maximum duration (in s) of the profiling,
+          after which it stops automatically (to avoid slowing down the process
+          forever, if the caller never stops it).
+        on_timeout (None or callable): called (without argument), from the
+          profiler thread, when the profiling stops due to the timeout.
+        """
+        if self._thread is not None:
+            raise ValueError("Profiler already started")
+        self._start_time = time.time()
+        self._thread = threading.Thread(target=self._run, args=(timeout, on_timeout),
+                                        name="Sampling profiler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop sampling the threads. It's fine to call it if the profiler has
+        already stopped by itself.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self, timeout, on_timeout):
+        timedout = False
+        try:
+            logging.info("Starting sampling profiler, every %g s", self.interval)
+            end = None if timeout is None else self._start_time + timeout
+            own_id = threading.current_thread().ident
+            while not self._stop.wait(self.interval):
+                self._sample(own_id)
+                if end is not None and time.time() > end:
+                    logging.warning("Stopping profiler after %g s", timeout)
+                    timedout = True
+                    break
+        except Exception:
+            logging.exception("Failure in the sampling profiler")
+        finally:
+            self._end_time = time.time()
+            logging.info("Sampling profiler stopped after %d samples", self._nsamples)
+
+        if timedout and on_timeout is not None:
+            try:
+                on_timeout()
+            except Exception:
+                logging.exception("Failure in the profiler timeout callback")
+
+    def _sample(self, own_id):
+        """
+        Record the current stack of every thread
+        own_id (int): the id of the thread to skip (ie, the profiler thread)
+        """
+        names = dict((t.ident, t.name) for t in threading.enumerate())
+        for tid, frame in sys._current_frames().items():
+            if tid == own_id:
+                continue
+            # From the top (current function) to the bottom, with a fake
+            # function representing the thread, so that it's easy to see the
+            # time spent by each thread.
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            stack.append(("~", 0, "<thread %s>" % (names.get(tid, tid),)))
+
+            self._counts[stack[0]][0] += 1
+            for func in set(stack):  # once per sample, even if recursive
+                self._counts[func][1] += 1
+            for call in set(zip(stack[:-1], stack[1:])):
+                self._calls[call] += 1
+        self._nsamples += 1
+
+    def getStats(self):
+        """
+        Must be called after stopping the profiler
+        return (dict): the statistics of each function, in the same format as
+          pstats.Stats().stats (so that it can be passed to marshal.dump() to
+          create a pstats file).
+          The number of calls is actually the number of samples.
+        """
+        if self._nsamples:
+            # Estimate the actual period from the number of samples
+            period = (self._end_time - self._start_time) / self._nsamples
+        else:
+            period = self.interval
+
+        callers = collections.defaultdict(dict)
+        for (func, caller), n in self._calls.items():
+            callers[func][caller] = (n, n, 0, n * period)
+
+        stats = {}
+        for func, (ntop, nin) in self._counts.items():
+            stats[func] = (nin, nin, ntop * period, nin * period, callers[func])
+        return stats
+
+    def dumps(self):
+        """
+        return (str): the statistics, in the format of a pstats file
+        """
+        return marshal.dumps(self.getStats())
+
+
+def _describeListener(listener):
+    """
+    listener (callable or str): a listener of a DataFlow, typically a WeakMethod
+    return (str): human readable name of the listener
+    """
+    if isinstance(listener, basestring):
+        return listener
+
+    f = getattr(listener, "f", listener)  # WeakMethod -> function
+    if isinstance(f, weakref.ref):
+        f = f()
+    name = getattr(f, "__name__", repr(f))
+    ref = getattr(listener, "c", None)  # Weak reference to the instance
+    if ref is not None:
+        ref = ref()
+        if ref is not None:
+            name = "%s.%s" % (ref.__class__.__name__, name)
+    return name
+
+
+class CallbackTimings(object):
+    """
+    Records how long the listeners of the DataFlows take to process each data.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (id of the DataFlow, listener) -> [number of calls, total time, max time]
+        self._timings = {}
+        self._df_names = {}  # id of the DataFlow -> default name
+
+    def add(self, df, listener, dur):
+        """
+        Record one call to a listener
+        df (DataFlowBase): the DataFlow which called the listener
+        listener (callable or str): the listener called
+        dur (float): time (in s) spent in the listener
+        """
+        key = (id(df), listener)
+        with self._lock:
+            try:
+                t = self._timings[key]
+            except KeyError:
+                t = self._timings[key] = [0, 0, 0]
+                self._df_names[id(df)] = "%s@%x" % (df.__class__.__name__, id(df))
+            t[0] += 1
+            t[1] += dur
+            t[2] = max(t[2], dur)
+
+    def getReport(self, df_names=None):
+        """
+        df_names (None or dict int -> str): id of the DataFlow -> name to use
+        return (list of (str, str, int, float, float)): for each listener,
+          name of the DataFlow, name of the listener, number of calls, total time
+          and maximum time (in s). Sorted by decreasing total time.
+        """
+        df_names = df_names or {}
+        report = []
+        with self._lock:
+            for (dfid, listener), (n, tot, mx) in self._timings.items():
+                dfname = df_names.get(dfid, self._df_names[dfid])
+                report.append((dfname, _describeListener(listener), n, tot, mx))
+        report.sort(key=lambda r: r[3], reverse=True)
+        return report
+
+
+# The CallbackTimings used by the DataFlows, or None if the timings are not
+# recorded (the default, to not slow down).
+callback_timings = None
+
+
+def getThreadStacks():
+    """
+    Take a snapshot of the stack of every thread of the process
+    return (dict str -> str): name of the thread -> stack, formatted as in a
+      traceback
+    """
+    names = dict((t.ident, t.name) for t in threading.enumerate())
+    stacks = {}
+    for tid, frame in sys._current_frames().items():
+        name = "%s (%d)" % (names.get(tid, "unknown"), tid)
+        stacks[name] = "".join(traceback.format_stack(frame))
+    return stacks
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: Delmic
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+from __future__ import division
+
+import logging
+import numpy
+from odemis import model
+from odemis.model import _profiling
+import os
+import pstats
+import tempfile
+import threading
+import time
+import unittest
+
+
+logging.getLogger().setLevel(logging.DEBUG)
+
+
+def busy_function(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class TestSamplingProfiler(unittest.TestCase):
+
+    def test_stats(self):
+        stop = threading.Event()
+        t = threading.Thread(target=busy_function, args=(stop,), name="busy")
+        t.start()
+        try:
+            profiler = _profiling.SamplingProfiler(0.001)
+            profiler.start(timeout=10)
+            time.sleep(0.5)
+            profiler.stop()
+        finally:
+            stop.set()
+            t.join()
+
+        # Check it can be read by pstats
+        fd, fn = tempfile.mkstemp(suffix=".pstats")
+        os.close(fd)
+        try:
+            with open(fn, "wb") as f:
+                f.write(profiler.dumps())
+            ps = pstats.Stats(fn)
+        finally:
+            os.remove(fn)
+
+        busy = [v for k, v in ps.stats.items() if k[2] == "busy_function"]
+        self.assertEqual(len(busy), 1)
+        cc, nc, tt, ct, callers = busy[0]
+        # The thread was always running busy_function
+        self.assertGreater(nc, 10)
+        self.assertAlmostEqual(ct, 0.5, delta=0.2)
+        self.assertEqual([c[2] for c in callers], ["run"])
+
+    def test_timeout(self):
+        timedout = threading.Event()
+        profiler = _profiling.SamplingProfiler(0.01)
+        profiler.start(timeout=0.1, on_timeout=timedout.set)
+        self.assertTrue(profiler.running)
+        time.sleep(0.3)
+        self.assertFalse(profiler.running)
+        self.assertTrue(timedout.is_set())
+        profiler.stop()
+        self.assertTrue(profiler.getStats())
+
+    def test_thread_stacks(self):
+        stacks = _profiling.getThreadStacks()
+        name = "%s (%d)" % (threading.current_thread().name, threading.current_thread().ident)
+        self.assertIn("test_thread_stacks", stacks[name])
+
+
+class TestCallbackTimings(unittest.TestCase):
+
+    def on_data(self, df, data):
+        time.sleep(0.01)
+
+    def test_dataflow(self):
+        df = model.DataFlowBase()
+        df.subscribe(self.on_data)
+        data = model.DataArray(numpy.zeros((2, 2)))
+
+        df.notify(data)  # Not recorded
+        _profiling.callback_timings = _profiling.CallbackTimings()
+        try:
+            for i in range(3):
+                df.notify(data)
+            report = _profiling.callback_timings.getReport({id(df): "comp.data"})
+        finally:
+            _profiling.callback_timings = None
+        df.unsubscribe(self.on_data)
+
+        self.assertEqual(len(report), 1)
+        dfname, lname, n, tot, mx = report[0]
+        self.assertEqual(dfname, "comp.data")
+        self.assertEqual(lname, "TestCallbackTimings.on_data")
+        self.assertEqual(n, 3)
+        self.assertGreaterEqual(tot, 0.03)
+        self.assertGreaterEqual(mx, 0.01)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -31,6 +31,7 @@ from multiprocessing.process import Process
 import numpy
 from odemis import model
 from odemis.model import roattribute, oneway, isasync, VigilantAttributeBase
+from odemis.model import _profiling
 from odemis.util import mock, timeout, executeAsyncTask
 import os
 import pickle
@@ -100,6 +101,51 @@ class ContainerTest(unittest.TestCase):
         # we are not terminating the children, but this should be caught by the container
         container.terminate()
 
+    def test_profiling(self):
+        container, comp = model.createInNewContainer("testprof", MyComponent, {"name":"MyComp"})
+        cont = model.getContainerOf(comp)
+        cont.ping()
+
+        received = []
+        def receive_data(df, data):
+            received.append(data)
+
+        cont.startProfiling(0.001)
+        self.assertRaises(ValueError, cont.startProfiling)
+        comp.data.subscribe(receive_data)
+        time.sleep(0.5)
+        comp.data.unsubscribe(receive_data)
+        stats, timings = cont.stopProfiling()
+        self.assertRaises(ValueError, cont.stopProfiling)
+
+        self.assertGreater(len(received), 0)
+        self.assertTrue(stats)
+        self.assertEqual(timings[0][:2], ("MyComp.data", "<remote listeners>"))
+
+        stacks = cont.getThreadStacks()
+        self.assertIn("MainThread", "".join(stacks.keys()))
+
+        comp.terminate()
+        container.terminate()
+
+    def test_profiling_timeout(self):
+        # In a thread, to be able to check the state of the profiling module
+        container = model.createNewContainer("testproftimeout", in_own_process=False)
+        container.ping()
+
+        container.startProfiling(0.001, timeout=0.1)
+        self.assertIsNotNone(_profiling.callback_timings)
+        time.sleep(0.5)
+        # The listeners are not timed anymore, and it can be started again
+        self.assertIsNone(_profiling.callback_timings)
+        container.startProfiling(0.001, timeout=0.1)
+        time.sleep(0.5)
+        stats, timings = container.stopProfiling()
+        self.assertTrue(stats)
+        self.assertRaises(ValueError, container.stopProfiling)
+
+        container.terminate()
+
     def test_timeout(self):
         if Pyro4.config.COMMTIMEOUT == 0 or Pyro4.config.COMMTIMEOUT > 20:
             self.skipTest("Timeout too long (%d s) to test." % Pyro4.config.COMMTIMEOUT)
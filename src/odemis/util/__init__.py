@@ -31,6 +31,7 @@ import collections
 from concurrent.futures import CancelledError
 from decorator import decorator
 from functools import wraps
+import importlib
 import inspect
 import logging
 import math
@@ -38,6 +39,7 @@ import signal
 import sys
 import threading
 import time
+import types
 import weakref
 
 from . import weak
@@ -513,3 +515,62 @@ def bindFuture(future, fn, args=(), kwargs=None):
             future.set_exception(e)
     else:
         future.set_result(result)
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stand-in for a module, which is only imported the first time one of its
+    attributes is accessed. It's used for the modules which are slow to import
+    (eg, cv2, scipy), so that the programs which never use them don't pay for
+    it at start-up.
+    """
+
+    def __init__(self, name):
+        """
+        name (str): full name of the module (eg, "scipy.ndimage")
+        """
+        types.ModuleType.__init__(self, name)
+        self.__dict__["_lazy_module"] = None
+
+    def _load(self):
+        """
+        returns (module): the actual module, imported if needed
+        raises ImportError: if the module cannot be imported
+        """
+        mod = self.__dict__["_lazy_module"]
+        if mod is None:
+            logging.debug("Importing module %s on first use", self.__name__)
+            mod = importlib.import_module(self.__name__)
+            # Copy the content of the module, so that the next accesses are
+            # as fast as with the module (__getattr__() is only called if the
+            # attribute is not found).
+            self.__dict__.update(mod.__dict__)
+            self.__dict__["_lazy_module"] = mod
+        return mod
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __repr__(self):
+        if self.__dict__["_lazy_module"] is None:
+            return "<lazy module '%s' (not loaded)>" % (self.__name__,)
+        return repr(self.__dict__["_lazy_module"])
+
+
+def lazy_import(name):
+    """
+    Prepare the import of a module, which will actually happen on first use.
+    Typical usage, at the top of a module: cv2 = lazy_import("cv2")
+    Note that the ImportError (if the module is not available) is only raised
+    on first use.
+    name (str): full name of the module (eg, "scipy.ndimage")
+    returns (LazyModule): object behaving like the module
+    """
+    try:
+        # If it's already imported, no need to be lazy
+        mod = sys.modules[name]
+        if mod is not None:
+            return mod
+    except KeyError:
+        pass
+    return LazyModule(name)
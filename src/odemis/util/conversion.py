@@ -26,10 +26,13 @@ import re
 import yaml
 from odemis import model
 import numpy
-import cv2
+from odemis.util import lazy_import
 import math
 
 
+cv2 = lazy_import("cv2")
+
+
 # Inspired by code from:
 # http://codingmess.blogspot.nl/2009/05/conversion-of-wavelength-in-nanometers.html
 # based on:
@@ -22,12 +22,22 @@ see http://www.gnu.org/licenses/.
 
 from __future__ import division
 
+import base64
+from concurrent import futures
+import collections
+import json
 import logging
+import math
 import numpy
 from odemis import model
 from odemis.acq import stream
 from odemis import dataio
+from odemis.util import img
 import os
+import stat
+import tempfile
+import threading
+import time
 
 
 def data_to_static_streams(data):
@@ -239,3 +249,402 @@ def splitext(path):
 
     root = path[:len(path) - len(ext)]
     return root, ext
+
+
+# Name of the sidecar file (in each directory) which caches the information
+# about the acquisition files. Starts with a dot, to be hidden.
+INDEX_FILENAME = ".odemis-index.json"
+INDEX_VERSION = 1
+INDEX_THUMBNAIL_SIZE = (128, 128)  # px, maximum YX of the thumbnail stored
+
+# The metadata stored in the index, as they are the ones useful to browse
+# acquisitions. The rest requires to open the file.
+INDEX_METADATA = (model.MD_DESCRIPTION, model.MD_ACQ_DATE, model.MD_ACQ_TYPE,
+                  model.MD_DIMS, model.MD_PIXEL_SIZE, model.MD_POS,
+                  model.MD_ROTATION, model.MD_BINNING, model.MD_EXP_TIME,
+                  model.MD_DWELL_TIME, model.MD_IN_WL, model.MD_OUT_WL,
+                  model.MD_USER_TINT, model.MD_HW_NAME, model.MD_USER_NOTE)
+
+
+def _md_to_json(md):
+    """
+    Keep only the index metadata, converted to JSON compatible types
+    md (dict str->value): metadata of a DataArray
+    return (dict str->value)
+    """
+    jmd = {}
+    for k in INDEX_METADATA:
+        if k not in md:
+            continue
+        v = md[k]
+        if isinstance(v, (numpy.ndarray, numpy.generic)):
+            v = v.tolist()
+        elif isinstance(v, tuple):
+            v = list(v)
+        # Make sure it's really serializable (eg, no fancy objects)
+        try:
+            json.dumps(v)
+        except (TypeError, ValueError):
+            logging.debug("Skipping metadata %s of unsupported type", k)
+            continue
+        jmd[k] = v
+    return jmd
+
+
+def _md_from_json(jmd):
+    """
+    Convert back the metadata from the index into the standard types
+    return (dict str->value)
+    """
+    # lists are always tuples in the standard metadata
+    return {k: tuple(v) if isinstance(v, list) else v for k, v in jmd.items()}
+
+
+def _thumbnail_to_json(thumb):
+    """
+    Reduce the thumbnail into a small RGB image, stored as a dict
+    thumb (DataArray): greyscale or RGB (YXC or CYX) thumbnail
+    return (dict): shape and (base64) data of the RGB image as uint8
+    """
+    dims = thumb.metadata.get(model.MD_DIMS)
+    if thumb.ndim == 3 and (dims == "CYX" or
+                            (dims is None and thumb.shape[0] in (3, 4) and
+                             thumb.shape[-1] not in (3, 4))):
+        thumb = numpy.rollaxis(thumb, 0, 3)
+    elif thumb.ndim != 3:
+        thumb = img.ensure2DImage(thumb)
+
+    # Fast reduction by just taking one pixel out of N
+    step = max(1, int(math.ceil(max(s / m for s, m in zip(thumb.shape[:2],
+                                                           INDEX_THUMBNAIL_SIZE)))))
+    thumb = thumb[::step, ::step]
+
+    if thumb.ndim == 2:
+        thumb = img.DataArray2RGB(thumb)
+    elif thumb.dtype != numpy.uint8:
+        thumb = img.DataArray2RGB(thumb[..., 0])
+    thumb = numpy.ascontiguousarray(thumb[..., :3])
+    return {"shape": list(thumb.shape),
+            "data": base64.b64encode(thumb.tostring())}
+
+
+def _thumbnail_from_json(jthumb):
+    """
+    return (DataArray of shape YX3 and dtype uint8)
+    """
+    thumb = numpy.frombuffer(base64.b64decode(jthumb["data"]), dtype=numpy.uint8)
+    thumb = thumb.reshape(jthumb["shape"])
+    return model.DataArray(thumb, {model.MD_DIMS: "YXC"})
+
+
+def read_file_info(filename):
+    """
+    Read the information about an acquisition file needed to browse it: the
+    list of streams, with their shape and main metadata, and a small thumbnail.
+    The (large) data is not read, if the format allows it.
+    filename (str): path to the file
+    return (dict): "format" -> str, "streams" -> list of dict with "shape"
+      (tuple of int), "dtype" (str) and "metadata" (dict), "thumbnail" ->
+      None or dict (see _thumbnail_to_json())
+    raise:
+      LookupError: if no format can read the file
+      IOError: if the file cannot be read
+    """
+    converter = dataio.find_fittest_converter(filename, default=None, mode=os.O_RDONLY)
+    if converter is None:
+        raise LookupError("No format found to read %s" % (filename,))
+
+    if hasattr(converter, "open_data"):
+        # Only reads the metadata, and the thumbnails are read directly
+        acd = converter.open_data(filename)
+        content = acd.content
+        thumbs = acd.thumbnails
+    elif hasattr(converter, "read_metadata"):
+        content = converter.read_metadata(filename)
+        thumbs = converter.read_thumbnail(filename)
+    else:
+        content = converter.read_data(filename)
+        thumbs = converter.read_thumbnail(filename)
+
+    streams = []
+    for da in content:
+        streams.append({"shape": list(da.shape),
+                        "dtype": numpy.dtype(da.dtype).str,
+                        "metadata": _md_to_json(da.metadata)})
+
+    jthumb = None
+    if thumbs:
+        try:
+            thumb = thumbs[0]
+            if not isinstance(thumb, model.DataArray):  # DataArrayShadow
+                thumb = thumb.getData()
+            jthumb = _thumbnail_to_json(thumb)
+        except Exception:
+            logging.warning("Failed to read the thumbnail of %s", filename, exc_info=True)
+
+    return {"format": converter.FORMAT, "streams": streams, "thumbnail": jthumb}
+
+
+def _info_from_json(jinfo):
+    """
+    Convert the information of one file from the index into standard types
+    """
+    streams = [{"shape": tuple(s["shape"]),
+                "dtype": numpy.dtype(str(s["dtype"])),
+                "metadata": _md_from_json(s["metadata"])}
+               for s in jinfo["streams"]]
+    if jinfo["thumbnail"] is None:
+        thumb = None
+    else:
+        thumb = _thumbnail_from_json(jinfo["thumbnail"])
+    return {"format": jinfo["format"], "streams": streams, "thumbnail": thumb}
+
+
+def _load_index(dirname):
+    """
+    return (dict str -> dict): basename -> file information (as JSON), empty
+      if the index is not present or unreadable.
+    """
+    fn = os.path.join(dirname, INDEX_FILENAME)
+    try:
+        with open(fn, "r") as f:
+            index = json.load(f)
+        if index.get("version") != INDEX_VERSION:
+            logging.info("Index %s is version %s, will regenerate it", fn, index.get("version"))
+            return {}
+        return index["files"]
+    except IOError:
+        return {}
+    except Exception:
+        logging.warning("Failed to read index %s, will regenerate it", fn, exc_info=True)
+        return {}
+
+
+def _save_index(dirname, files):
+    """
+    Write atomically the index file (so that concurrent readers always see
+    a complete file). If the directory is not writable, the index is not saved.
+    """
+    fn = os.path.join(dirname, INDEX_FILENAME)
+    try:
+        fd, tmpfn = tempfile.mkstemp(prefix=INDEX_FILENAME, dir=dirname)
+    except OSError:
+        logging.info("Cannot write index for directory %s", dirname)
+        return
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump({"version": INDEX_VERSION, "files": files}, f)
+        # mkstemp() makes the file only accessible by the user. Instead, use
+        # the same permissions as the directory (without the execution), so
+        # that the index can be read (and updated) by the same users as the files.
+        os.chmod(tmpfn, stat.S_IMODE(os.stat(dirname).st_mode) & 0o666)
+        os.rename(tmpfn, fn)
+    except Exception:
+        logging.warning("Failed to write index %s", fn, exc_info=True)
+        try:
+            os.remove(tmpfn)
+        except OSError:
+            pass
+
+
+def index_directory(dirname, save=True):
+    """
+    Get the information of every acquisition file in a directory. The
+    information is cached in a sidecar file (INDEX_FILENAME), so only the files
+    which have been modified (according to their modification time and size)
+    since the previous call are actually opened.
+    dirname (str): path of the directory
+    save (bool): if True, the index file is updated (if anything changed)
+    return (dict str -> dict): file name (without directory) -> information
+      (see read_file_info(), but with "dtype" as numpy.dtype and "thumbnail" as
+      a DataArray of uint8 YXC, or None).
+      Files which cannot be read are not included.
+    """
+    fmts = dataio.get_available_formats(mode=os.O_RDONLY)
+    exts = tuple(e.lower() for es in fmts.values() for e in es)
+
+    prev_files = _load_index(dirname)
+    files = {}
+    updated = False
+    for bn in sorted(os.listdir(dirname)):
+        if bn.startswith(".") or not bn.lower().endswith(exts):
+            continue
+        fn = os.path.join(dirname, bn)
+        try:
+            st = os.stat(fn)
+        except OSError:
+            continue
+        if not os.path.isfile(fn):
+            continue
+
+        jinfo = prev_files.get(bn)
+        if (jinfo is None or jinfo.get("mtime") != st.st_mtime or
+            jinfo.get("size") != st.st_size):
+            try:
+                jinfo = read_file_info(fn)
+            except Exception:
+                logging.info("Skipping file %s which couldn't be read", fn, exc_info=True)
+                # Remember it, to not try again until the file changes
+                jinfo = {"error": True}
+            jinfo["mtime"] = st.st_mtime
+            jinfo["size"] = st.st_size
+            updated = True
+        files[bn] = jinfo
+
+    if set(files.keys()) != set(prev_files.keys()):
+        updated = True
+    if save and updated:
+        _save_index(dirname, files)
+
+    return {bn: _info_from_json(jinfo) for bn, jinfo in files.items()
+            if not jinfo.get("error")}
+
+
+def get_file_info(filename):
+    """
+    Get the information of one acquisition file, using the index of its
+    directory if it's up to date.
+    filename (str): path to the file
+    return (dict): see index_directory()
+    raise LookupError: if the file cannot be read
+    """
+    dirname, bn = os.path.split(os.path.abspath(filename))
+    st = os.stat(filename)
+    jinfo = _load_index(dirname).get(bn)
+    if (jinfo is None or jinfo.get("error") or jinfo.get("mtime") != st.st_mtime or
+        jinfo.get("size") != st.st_size):
+        jinfo = read_file_info(filename)
+    return _info_from_json(jinfo)
+
+
+EXPORT_QUEUE_MAX_SIZE = 2 * 1024 ** 3  # bytes, memory used by the data waiting to be saved
+
+
+def _get_data_size(data):
+    """
+    data (DataArray or list of DataArrays or None)
+    return (int): number of bytes used by the data
+    """
+    if data is None:
+        return 0
+    if isinstance(data, numpy.ndarray):
+        return data.nbytes
+    return sum(_get_data_size(d) for d in data)
+
+
+class ExportQueue(object):
+    """
+    Saves acquisition data into files in a background thread, so that the next
+    acquisition can already start while the data is being written. The files
+    are written in the order they were queued.
+    The memory usage is bounded: when too much data is waiting to be saved,
+    queueing new data blocks until enough data has been written.
+    """
+
+    def __init__(self, max_size=EXPORT_QUEUE_MAX_SIZE):
+        """
+        max_size (0<int): maximum number of bytes of data waiting to be saved.
+          A single data bigger than this is still accepted, if nothing else is
+          waiting.
+        """
+        self._max_size = max_size
+        self._queue = collections.deque()  # (Future, size, exporter, args, kwargs)
+        self._queued_size = 0  # bytes
+        self._cond = threading.Condition()
+        self._shutdown = False
+        # Not a daemon, so that the data queued is not lost when exiting. So
+        # shutdown() must always be called.
+        self._thread = threading.Thread(target=self._run, name="Export queue")
+        self._thread.start()
+
+    @property
+    def pending(self):
+        """
+        (int): number of exports not yet finished
+        """
+        with self._cond:
+            return len(self._queue)
+
+    def export(self, exporter, filename, data, *args, **kwargs):
+        """
+        Queue data to be saved into a file
+        exporter (module): the dataio exporter (eg, dataio.hdf5)
+        filename (unicode): the path of the file
+        data (list of DataArrays): the data to save. It must not be modified
+          afterwards.
+        args, kwargs: extra arguments passed to exporter.export()
+        return (Future): its result is the filename, once the data is saved.
+          If the export failed, the exception is raised when reading the result.
+        """
+        size = _get_data_size(data) + _get_data_size(kwargs.get("thumbnail"))
+        f = futures.Future()
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("Cannot export data after the queue is shutdown")
+            # Wait until there is enough space
+            while self._queue and self._queued_size + size > self._max_size:
+                logging.debug("Waiting for %d exports to complete before queueing %s",
+                              len(self._queue), filename)
+                self._cond.wait()
+            self._queue.append((f, size, exporter, (filename, data) + args, kwargs))
+            self._queued_size += size
+            self._cond.notify_all()
+        return f
+
+    def _run(self):
+        """
+        Main loop of the thread writing the data
+        """
+        while True:
+            with self._cond:
+                while not self._queue:
+                    if self._shutdown:
+                        return
+                    self._cond.wait()
+                # Keep it in the queue (so that it's counted as pending)
+                f, size, exporter, args, kwargs = self._queue[0]
+
+            if f.set_running_or_notify_cancel():
+                try:
+                    logging.debug("Exporting data to %s", args[0])
+                    exporter.export(*args, **kwargs)
+                except Exception as ex:
+                    logging.warning("Failed to export data to %s", args[0], exc_info=True)
+                    f.set_exception(ex)
+                else:
+                    f.set_result(args[0])
+
+            with self._cond:
+                self._queue.popleft()
+                self._queued_size -= size
+                self._cond.notify_all()
+
+    def wait(self, timeout=None):
+        """
+        Wait until all the data queued is saved
+        timeout (None or 0<float): maximum time to wait (s)
+        return (bool): True if all the data is saved, False if it timed out
+        """
+        if timeout is not None:
+            endt = time.time() + timeout
+        with self._cond:
+            while self._queue:
+                if timeout is None:
+                    self._cond.wait()
+                else:
+                    left = endt - time.time()
+                    if left <= 0:
+                        return False
+                    self._cond.wait(left)
+        return True
+
+    def shutdown(self, wait=True):
+        """
+        Stop the queue. The data already queued is still saved.
+        wait (bool): if True, block until all the data is saved
+        """
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        if wait:
+            self._thread.join()
@@ -28,11 +28,14 @@ import logging
 import math
 import numpy
 from odemis import model
-import scipy.ndimage
-import cv2
+from odemis.util import lazy_import
 from odemis.util.conversion import get_img_transformation_matrix
 
 
+# Slow to import, so only imported on first use
+ndimage = lazy_import("scipy.ndimage")
+cv2 = lazy_import("cv2")
+
 # See if the optimised (cython-based) functions are available
 try:
     from odemis.util import img_fast
@@ -492,7 +495,7 @@ def rescale_hq(data, shape):
         # Weird number of dimensions => default to the less pretty but more
         # generic scipy version
         out = numpy.empty(shape, dtype=data.dtype)
-        scipy.ndimage.interpolation.zoom(data, zoom=scale, output=out, order=1, prefilter=False)
+        ndimage.interpolation.zoom(data, zoom=scale, output=out, order=1, prefilter=False)
 
     # Update the metadata
     if hasattr(data, "metadata"):
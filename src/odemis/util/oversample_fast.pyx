@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: Delmic
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+# Optimised reduction of the raw data of a scan with oversampling (as read by
+# the semcomedi driver), into the final images. The raw data is reduced
+# progressively, while it's read, so it never needs to be held entirely in
+# memory.
+
+from __future__ import division
+import cython
+
+# import both numpy and the Cython declarations for numpy
+import numpy
+cimport numpy
+
+ctypedef numpy.uint16_t uint16_t
+ctypedef numpy.uint32_t uint32_t
+ctypedef numpy.uint64_t uint64_t
+
+ctypedef fused raw_t:
+    uint16_t
+    uint32_t
+
+
+# nogil allows multi-threading but prevents use of any Python objects or call
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void cReduce(raw_t[::1] data, raw_t[:, :, :] out, uint64_t[::1] acc,
+                  Py_ssize_t pos, Py_ssize_t margin, Py_ssize_t osr) nogil:
+    """
+    data: the raw values, interleaved by channel
+    out: the output arrays (channel, line, pixel)
+    acc: the sum of the samples of the current pixel, for each channel
+    pos: index of the first value of data in the whole stream
+    """
+    cdef Py_ssize_t nchans = out.shape[0]
+    cdef Py_ssize_t nlines = out.shape[1]
+    cdef Py_ssize_t linew = out.shape[2] + margin
+    cdef double dosr = <double>osr
+
+    # Position of the first value, in the scan
+    cdef Py_ssize_t scan = pos // nchans
+    cdef Py_ssize_t c = pos % nchans  # channel
+    cdef Py_ssize_t s = scan % osr  # sample within the pixel
+    cdef Py_ssize_t y = (scan // osr) % linew  # pixel within the line (margin included)
+    cdef Py_ssize_t x = (scan // osr) // linew  # line
+
+    cdef Py_ssize_t i, k
+    for i in range(data.shape[0]):
+        if x >= nlines:
+            break  # Extra data (eg, read during the rest positioning)
+
+        if y >= margin:
+            acc[c] += data[i]
+        c += 1
+        if c < nchans:
+            continue
+
+        # next scan
+        c = 0
+        s += 1
+        if s < osr:
+            continue
+
+        # pixel complete
+        s = 0
+        if y >= margin:
+            for k in range(nchans):
+                # Same computation as numpy.true_divide() + casting
+                out[k, x, y - margin] = <raw_t>(<double>acc[k] / dosr)
+                acc[k] = 0
+        y += 1
+        if y == linew:
+            y = 0
+            x += 1
+
+
+cdef class OversampleReducer(object):
+    """
+    Converts progressively the raw data of a scan with oversampling to 2D
+    arrays. Each pixel is the mean of the osr samples read for it, and the
+    margin pixels at the beginning of each line are dropped. The result is
+    bit-identical to the numpy-based conversion of the whole raw data at once.
+    """
+    cdef readonly object out
+    cdef readonly Py_ssize_t margin
+    cdef readonly Py_ssize_t osr
+    cdef readonly Py_ssize_t pos  # number of values received so far
+    cdef uint64_t[::1] _acc
+
+    def __init__(self, out, margin, osr):
+        """
+        out (3D ndarray of uint16 or uint32): the output arrays, of shape
+          channels x lines x pixels (margin not included), already allocated.
+        margin (0<=int): number of useless pixels at the beginning of each line
+        osr (1<=int): over-sampling rate, number of samples read per pixel
+        raise ValueError: if the arguments are not supported
+        """
+        if out.ndim != 3:
+            raise ValueError("Output must be a 3D array (got %d dims)" % (out.ndim,))
+        if out.dtype not in (numpy.uint16, numpy.uint32):
+            # Note: cython automatically detects such errors, but it's clearer
+            # to refuse it early.
+            raise ValueError("Optimised version only works on uint16 and uint32 (got %s)" %
+                             (out.dtype,))
+        if margin < 0 or osr < 1:
+            raise ValueError("Margin (%s) and osr (%s) must be positive" % (margin, osr))
+        if int(numpy.iinfo(out.dtype).max) * osr > numpy.iinfo(numpy.uint64).max:
+            raise ValueError("osr %d is too large to accumulate the values" % (osr,))
+
+        self.out = out
+        self.margin = margin
+        self.osr = osr
+        self.pos = 0
+        self._acc = numpy.zeros(out.shape[0], dtype=numpy.uint64)
+
+    def add(self, data):
+        """
+        Reduce the next part of the raw data
+        data (1D ndarray): the values, in the order they are read, with all the
+          channels interleaved. It can have any length. Values received after
+          the last pixel are ignored.
+        """
+        if data.dtype != self.out.dtype:
+            raise ValueError("Data of type %s while expected %s" % (data.dtype, self.out.dtype))
+        data = numpy.ascontiguousarray(data).ravel()
+
+        cdef uint16_t[::1] d16
+        cdef uint16_t[:, :, :] o16
+        cdef uint32_t[::1] d32
+        cdef uint32_t[:, :, :] o32
+        if data.dtype == numpy.uint16:
+            d16 = data
+            o16 = self.out
+            with nogil:
+                cReduce(d16, o16, self._acc, self.pos, self.margin, self.osr)
+        else:
+            d32 = data
+            o32 = self.out
+            with nogil:
+                cReduce(d32, o32, self._acc, self.pos, self.margin, self.osr)
+        self.pos += data.shape[0]
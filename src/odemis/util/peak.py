@@ -21,10 +21,13 @@ from itertools import izip
 import logging
 import numpy
 from odemis import model
-from scipy.optimize import curve_fit
+from odemis.util import lazy_import
 import threading
 import time
 
+
+optimize = lazy_import("scipy.optimize")
+
 # TODO: this code is full of reliance on numpy being quite lax with wrong
 # computation, and easily triggers numpy warnings. To force numpy to be
 # stricter:
@@ -265,7 +268,7 @@ class PeakFitter(object):
 
                 try:
                     # => in scipy 0.17, curve_fit() supports the 'bounds' parameter
-                    params, _ = curve_fit(FitFunction, wavelength, spectrum, p0=fit_list)
+                    params, _ = optimize.curve_fit(FitFunction, wavelength, spectrum, p0=fit_list)
                     break
                 except Exception:
                     window_size = int(round(window_size * 1.2))
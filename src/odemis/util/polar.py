@@ -17,14 +17,16 @@ You should have received a copy of the GNU General Public License along with Ode
 from __future__ import division
 
 import math
-from matplotlib.delaunay import Triangulation
-from matplotlib.delaunay.triangulate import DuplicatePointWarning
 from numpy import ma
 import numpy
 from odemis import model
+from odemis.util import lazy_import
 import warnings
 
 
+triangulate = lazy_import("matplotlib.delaunay.triangulate")
+
+
 # Functions to convert/manipulate Angle resolved image to polar projection
 # Based on matlab script created by Ernst Jan Vesseur (from AMOLF).
 # The main differences are:
@@ -124,8 +126,8 @@ def AngleResolved2Polar(data, output_size, hole=True, dtype=None):
     with warnings.catch_warnings():
         # Some points might be so close that they are identical (within float
         # precision). It's fine, no need to generate a warning.
-        warnings.simplefilter("ignore", DuplicatePointWarning)
-        triang = Triangulation(theta_data.flat, phi_data.flat)  # FIXME: Leaks memory when run in a separate thread
+        warnings.simplefilter("ignore", triangulate.DuplicatePointWarning)
+        triang = triangulate.Triangulation(theta_data.flat, phi_data.flat)  # FIXME: Leaks memory when run in a separate thread
     interp = triang.linear_interpolator(omega_data.flat, default_value=0)
     qz = interp[-h_output_size:h_output_size:complex(0, output_size),  # Y
                 - h_output_size:h_output_size:complex(0, output_size)]  # X
@@ -218,8 +220,8 @@ def AngleResolved2Rectangular(data, output_size, hole=True, dtype=None):
     with warnings.catch_warnings():
         # Some points might be so close that they are identical (within float
         # precision). It's fine, no need to generate a warning.
-        warnings.simplefilter("ignore", DuplicatePointWarning)
-        triang = Triangulation(phi_data.flat, theta_data.flat)
+        warnings.simplefilter("ignore", triangulate.DuplicatePointWarning)
+        triang = triangulate.Triangulation(phi_data.flat, theta_data.flat)
     interp = triang.linear_interpolator(ARdata.flat, default_value=0)
     qz = interp[0:numpy.pi / 2:complex(0, output_size[0]),
                 0:2 * numpy.pi:complex(0, output_size[1])]
@@ -19,11 +19,13 @@ from __future__ import division
 import logging
 import numpy
 from odemis import model
-from odemis.util import img
-import scipy.signal
+from odemis.util import img, lazy_import
 import warnings
 
 
+signal = lazy_import("scipy.signal")
+
+
 def _SubtractBackground(data, background=None):
     # We actually want to make really sure that only real signal is > 0.
     if background is not None:
@@ -157,8 +159,8 @@ def FindCenterCoordinates(image):
     # TODO: explain why it's ok to catch these warnings
     with warnings.catch_warnings():
         warnings.simplefilter("ignore", numpy.ComplexWarning)
-        dIdu = scipy.signal.convolve2d(dIdu, h, mode='same', fillvalue=0)
-        dIdv = scipy.signal.convolve2d(dIdv, h, mode='same', fillvalue=0)
+        dIdu = signal.convolve2d(dIdu, h, mode='same', fillvalue=0)
+        dIdv = signal.convolve2d(dIdv, h, mode='same', fillvalue=0)
 
     # Calculate intensity gradient in xy coordinate system
     dIdx = dIdu - dIdv
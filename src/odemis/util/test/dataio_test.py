@@ -20,9 +20,13 @@ from __future__ import division
 import numpy
 from odemis import model
 from odemis.acq import stream
-from odemis.dataio import tiff
+from odemis.dataio import tiff, hdf5
+from odemis.util import dataio
 from odemis.util.dataio import data_to_static_streams, open_acquisition, \
-    splitext
+    splitext, index_directory, get_file_info, INDEX_FILENAME, ExportQueue
+import os
+import shutil
+import tempfile
 import time
 import unittest
 
@@ -223,6 +227,132 @@ class TestDataIO(unittest.TestCase):
             self.assertEqual(ao, eo, "Unexpected output for '%s': %s" % (inp, ao))
 
 
+    def test_index_directory(self):
+        """
+        Check the index is created, and only updated files are read again
+        """
+        dirname = tempfile.mkdtemp()
+        try:
+            md = {model.MD_DESCRIPTION: "sem",
+                  model.MD_ACQ_DATE: time.time(),
+                  model.MD_PIXEL_SIZE: (1e-7, 1e-7),
+                  model.MD_POS: (1e-3, -30e-3),
+                  }
+            data = model.DataArray(numpy.zeros((512, 256), numpy.uint16), md)
+            thumb = model.DataArray(numpy.zeros((300, 400, 3), numpy.uint8))
+            thumb[:, :, 1] = 255
+            tiff.export(os.path.join(dirname, u"a.ome.tiff"), data, thumb)
+            hdf5.export(os.path.join(dirname, u"b.h5"), [data, data[:100, :100]])
+            with open(os.path.join(dirname, u"c.h5"), "w") as f:
+                f.write("not an HDF5 file")
+            with open(os.path.join(dirname, u"notes.txt"), "w") as f:
+                f.write("not an acquisition")
+
+            os.chmod(dirname, 0o750)
+            index = index_directory(dirname)
+            self.assertTrue(os.path.exists(os.path.join(dirname, INDEX_FILENAME)))
+            # Same permissions as the directory
+            st = os.stat(os.path.join(dirname, INDEX_FILENAME))
+            self.assertEqual(st.st_mode & 0o777, 0o640)
+            self.assertEqual(set(index.keys()), {"a.ome.tiff", "b.h5"})
+            infoa = index["a.ome.tiff"]
+            self.assertEqual(len(infoa["streams"]), 1)
+            self.assertEqual(infoa["streams"][0]["shape"][-2:], data.shape)
+            self.assertEqual(infoa["streams"][0]["dtype"], data.dtype)
+            rmd = infoa["streams"][0]["metadata"]
+            self.assertEqual(rmd[model.MD_DESCRIPTION], "sem")
+            self.assertEqual(rmd[model.MD_POS], md[model.MD_POS])
+            rthumb = infoa["thumbnail"]
+            self.assertEqual(rthumb.dtype, numpy.uint8)
+            self.assertLessEqual(rthumb.shape[0], dataio.INDEX_THUMBNAIL_SIZE[0])
+            self.assertLessEqual(rthumb.shape[1], dataio.INDEX_THUMBNAIL_SIZE[1])
+            self.assertEqual(tuple(rthumb[0, 0]), (0, 255, 0))
+            self.assertEqual(len(index["b.h5"]["streams"]), 2)
+            self.assertIsNone(index["b.h5"]["thumbnail"])
+
+            # No file changed => no file should be opened
+            orig_read_file_info = dataio.read_file_info
+            read_fns = []
+
+            def counting_read_file_info(fn):
+                read_fns.append(os.path.basename(fn))
+                return orig_read_file_info(fn)
+
+            dataio.read_file_info = counting_read_file_info
+            try:
+                index2 = index_directory(dirname)
+                self.assertEqual(read_fns, [])
+                self.assertEqual(index2["a.ome.tiff"]["streams"], infoa["streams"])
+
+                # Change one file => only this one is read again
+                hdf5.export(os.path.join(dirname, u"b.h5"), data)
+                index3 = index_directory(dirname)
+                self.assertEqual(read_fns, ["b.h5"])
+                self.assertEqual(len(index3["b.h5"]["streams"]), 1)
+
+                del read_fns[:]
+                info = get_file_info(os.path.join(dirname, u"a.ome.tiff"))
+                self.assertEqual(read_fns, [])
+                self.assertEqual(info["streams"], infoa["streams"])
+            finally:
+                dataio.read_file_info = orig_read_file_info
+        finally:
+            shutil.rmtree(dirname)
+
+
+class SlowExporter(object):
+    """
+    Imitates an exporter module, which takes time to export
+    """
+    def __init__(self, dur):
+        self.dur = dur
+        self.exported = []
+
+    def export(self, filename, data, thumbnail=None):
+        time.sleep(self.dur)
+        if filename.startswith("bad"):
+            raise IOError("Failed to write %s" % (filename,))
+        self.exported.append(filename)
+
+
+class TestExportQueue(unittest.TestCase):
+
+    def test_order(self):
+        """
+        Files are saved in order, without blocking the caller
+        """
+        exporter = SlowExporter(0.2)
+        eq = ExportQueue()
+        data = [model.DataArray(numpy.zeros((16, 16), dtype=numpy.uint16))]
+        startt = time.time()
+        fs = [eq.export(exporter, "f%d" % i, data) for i in range(5)]
+        self.assertLess(time.time() - startt, 0.2)
+        self.assertGreater(eq.pending, 0)
+
+        fbad = eq.export(exporter, "bad", data)
+        self.assertTrue(eq.wait(5))
+        self.assertEqual(eq.pending, 0)
+        self.assertEqual([f.result() for f in fs], ["f%d" % i for i in range(5)])
+        self.assertEqual(exporter.exported, ["f%d" % i for i in range(5)])
+        self.assertRaises(IOError, fbad.result)
+        eq.shutdown()
+
+    def test_max_size(self):
+        """
+        When too much data is queued, it blocks
+        """
+        exporter = SlowExporter(0.2)
+        data = [model.DataArray(numpy.zeros((16, 16), dtype=numpy.uint16))]
+        eq = ExportQueue(max_size=data[0].nbytes * 2)
+        startt = time.time()
+        for i in range(4):
+            eq.export(exporter, "f%d" % i, data)
+        # Had to wait for at least one export
+        self.assertGreaterEqual(time.time() - startt, 0.2)
+        eq.shutdown(wait=True)
+        self.assertEqual(len(exporter.exported), 4)
+
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -28,6 +28,8 @@ from odemis import util
 from odemis.model import CancellableFuture
 from odemis.util import limit_invocation, TimeoutError, executeAsyncTask
 from odemis.util import timeout
+import subprocess
+import sys
 import time
 import unittest
 import weakref
@@ -291,5 +293,29 @@ class CanvasTestCase(unittest.TestCase):
             self.assertEqual(clipped, clip(*orig))
 
 
+class LazyImportTestCase(unittest.TestCase):
+
+    def test_lazy_module(self):
+        if "wave" in sys.modules:
+            self.skipTest("Module wave already imported")
+        wave = util.lazy_import("wave")
+        self.assertNotIn("wave", sys.modules)
+        self.assertTrue(callable(wave.open))  # Imports it
+        self.assertIn("wave", sys.modules)
+        self.assertIs(wave.open, sys.modules["wave"].open)
+
+        # Already imported => the normal module
+        self.assertIs(util.lazy_import("wave"), sys.modules["wave"])
+
+    def test_img_import(self):
+        """
+        Importing odemis.util.img shouldn't import the slow modules
+        """
+        code = ("import sys; import odemis.util.img; "
+                "print(' '.join(m for m in ('cv2', 'scipy.ndimage') if m in sys.modules))")
+        out = subprocess.check_output([sys.executable, "-c", code])
+        self.assertEqual(out.strip(), "")
+
+
 if __name__ == "__main__":
     unittest.main()